@@ -0,0 +1,125 @@
+"""
+數據增強吞吐量對比：ImageDataGenerator 逐張增強 vs tf.data 中整批增強 vs BatchAugmentation 層
+用合成的 224x224 圖像批次，只測增強本身（不含讀盤和解碼），參數取自各層配置（configs/level*.yaml）的 data.augmentation。
+
+- numpy:  ImageDataGenerator.random_transform 逐張處理（與 flow_from_directory 相同），
+          按 model.fit(workers=4) 的方式多線程並行處理多個批次
+- batch:  augment_images 在 tf.function 中對整批執行（tf.data 管道的 --augment batch）
+- layers: BatchAugmentation(training=True)（--augment layers，有 GPU 時在 GPU 上執行）
+
+用法：
+    python train/benchmark_augmentation.py --level 2
+    python train/benchmark_augmentation.py --level 1 --batches 100 --batch-size 64 --output aug.json
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from utils.augmentation import BatchAugmentation, augment_images
+from utils.train_config import load_level_config
+
+MODES = ('numpy', 'batch', 'layers')
+
+
+def synthetic_batch(batch_size, image_size, seed=42):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(batch_size, image_size, image_size, 3), dtype=np.uint8).astype(np.float32)
+
+
+def _timed(run_batch, batches, warmup_batches=2, workers=1):
+    for _ in range(warmup_batches):
+        run_batch()
+    started = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            images = sum(pool.map(lambda _: run_batch(), range(batches)))
+    else:
+        images = sum(run_batch() for _ in range(batches))
+    seconds = time.perf_counter() - started
+    return {
+        'images': images,
+        'seconds': round(seconds, 3),
+        'images_per_sec': round(images / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def numpy_runner(batch, augmentation):
+    datagen = keras.preprocessing.image.ImageDataGenerator(fill_mode='nearest', **augmentation)
+
+    def run():
+        out = np.empty_like(batch)
+        for i, image in enumerate(batch):
+            out[i] = datagen.random_transform(image)
+        return len(out)
+    return run
+
+
+def batch_runner(batch, augmentation):
+    images = tf.constant(batch)
+    augment = tf.function(lambda x: augment_images(x, augmentation, 255.0))
+
+    def run():
+        augment(images).numpy()
+        return int(images.shape[0])
+    return run
+
+
+def layers_runner(batch, augmentation):
+    images = tf.constant(batch / 255.0, dtype=tf.float32)
+    layer = BatchAugmentation(augmentation)
+    augment = tf.function(lambda x: layer(x, training=True))
+
+    def run():
+        augment(images).numpy()
+        return int(images.shape[0])
+    return run
+
+
+RUNNERS = {'numpy': numpy_runner, 'batch': batch_runner, 'layers': layers_runner}
+
+
+def benchmark(augmentation, modes, batches, batch_size, image_size, workers):
+    batch = synthetic_batch(batch_size, image_size)
+    results = {'augmentation': augmentation}
+    for mode in modes:
+        run = RUNNERS[mode](batch, augmentation)
+        results[mode] = _timed(run, batches, workers=workers if mode == 'numpy' else 1)
+        print(f"[INFO] {mode:6s}: {results[mode]['images_per_sec']} images/sec")
+    baseline = results.get('numpy', {}).get('images_per_sec')
+    if baseline:
+        results['speedup'] = {mode: round(results[mode]['images_per_sec'] / baseline, 2)
+                              for mode in modes if mode != 'numpy'}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='數據增強吞吐量對比')
+    parser.add_argument('--level', type=int, choices=(1, 2, 3), default=1, help='使用該層配置的增強參數')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--batches', type=int, default=50, help='計時的批次數')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--workers', type=int, default=4, help='numpy 方式並行處理批次的線程數（同 model.fit）')
+    parser.add_argument('--output', help='結果 JSON 路徑')
+    args = parser.parse_args()
+
+    gpus = tf.config.list_physical_devices('GPU')
+    print(f"[INFO] 設備: {'GPU x' + str(len(gpus)) if gpus else 'CPU'}，批次 {args.batch_size}，"
+          f"圖像 {args.image_size}x{args.image_size}")
+    results = benchmark(load_level_config(args.level)['data']['augmentation'], args.modes, args.batches,
+                        args.batch_size, args.image_size, args.workers)
+    for mode, speedup in results.get('speedup', {}).items():
+        print(f"[INFO] {mode} / numpy: {speedup}x")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] 結果已寫入: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+輸入管道吞吐量對比：ImageDataGenerator（workers=4，與 model.fit 相同）vs tf.data vs 打包分片 vs tar 流式讀取
+只迭代數據、不訓練，測量每秒能產出多少張預處理好的訓練圖片。
+
+用法：
+    python train/benchmark_pipeline.py --level 1
+    python train/benchmark_pipeline.py --level 3 --country chinese --batches 100
+    python train/benchmark_pipeline.py --level 1 --pipelines tfdata packed tar   # 需先運行 pack_dataset.py / make_tar_shards.py
+"""
+import argparse
+import json
+from pathlib import Path
+
+from tensorflow import keras
+
+from utils.throughput import measure_input_throughput
+from utils.train_config import load_level_config
+from utils.trainer import load_data
+
+PIPELINES = ('generator', 'tfdata', 'packed', 'tar')
+
+
+def level_data_dir(level, country):
+    project_root = Path(__file__).resolve().parent.parent.parent
+    if level == 1:
+        return project_root / 'data' / 'level1-food-detection'
+    if level == 2:
+        return project_root / 'data' / 'level2-country-classification'
+    return project_root / 'data' / 'level3-fine-grained' / country
+
+
+def generator_batches(generator, workers=4):
+    """與 model.fit(workers=4, use_multiprocessing=False) 相同的多線程預取"""
+    enqueuer = keras.utils.OrderedEnqueuer(generator, use_multiprocessing=False, shuffle=True)
+    enqueuer.start(workers=workers, max_queue_size=10)
+    return enqueuer, enqueuer.get()
+
+
+def benchmark(level, data_dir, pipelines, batches, epochs):
+    data_config = load_level_config(level)['data']
+    results = {}
+    for pipeline in pipelines:
+        train, _ = load_data(data_config, str(data_dir), pipeline)
+        runs = []
+        for epoch in range(epochs):
+            if pipeline != 'generator':
+                runs.append(measure_input_throughput(train.dataset.repeat(), batches))
+            else:
+                enqueuer, iterator = generator_batches(train)
+                try:
+                    runs.append(measure_input_throughput(iterator, batches))
+                finally:
+                    enqueuer.stop()
+            print(f"[INFO] {pipeline:9s} 第 {epoch + 1} 輪: {runs[-1]['images_per_sec']} images/sec")
+        results[pipeline] = {
+            'runs': runs,
+            'best_images_per_sec': max(run['images_per_sec'] for run in runs),
+        }
+    if 'generator' in results and 'tfdata' in results and results['generator']['best_images_per_sec']:
+        results['speedup'] = round(
+            results['tfdata']['best_images_per_sec'] / results['generator']['best_images_per_sec'], 2)
+    if 'packed' in results and 'tfdata' in results and results['tfdata']['best_images_per_sec']:
+        results['packed_speedup'] = round(
+            results['packed']['best_images_per_sec'] / results['tfdata']['best_images_per_sec'], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='訓練輸入管道吞吐量對比')
+    parser.add_argument('--level', type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument('--country', default='chinese', help='第三層的國家/菜系')
+    parser.add_argument('--data-dir', help='數據目錄（默認按 level 推斷）')
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument('--batches', type=int, default=50, help='每輪計時的批次數')
+    parser.add_argument('--epochs', type=int, default=2, help='測量輪數（tf.data 的驗證集緩存等在首輪之後生效）')
+    parser.add_argument('--output', help='結果 JSON 路徑')
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir) if args.data_dir else level_data_dir(args.level, args.country)
+    if not data_dir.exists():
+        print(f"[ERROR] 數據目錄不存在: {data_dir}")
+        return
+
+    results = benchmark(args.level, data_dir, args.pipelines, args.batches, args.epochs)
+    if 'speedup' in results:
+        print(f"[INFO] tf.data / ImageDataGenerator: {results['speedup']}x")
+    if 'packed_speedup' in results:
+        print(f"[INFO] 打包分片 / tf.data: {results['packed_speedup']}x")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] 結果已寫入: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+更新數據集清單（路徑、大小、修改時間、內容哈希、類別、尺寸），打印變化和完全重複的圖片
+
+打包（pack_dataset.py）和特徵緩存（--pipeline features）會自動更新清單，這裡可單獨運行查看數據變化。
+
+用法：
+    python train/build_manifest.py --level 1
+    python train/build_manifest.py --level 3 --country chinese --verify
+    python train/build_manifest.py data/level2-country-classification --workers 8
+"""
+import argparse
+from pathlib import Path
+
+from utils.manifest import default_manifest_path, describe_changes, duplicate_groups, update_manifest
+
+
+def level_data_dir(level, country):
+    project_root = Path(__file__).resolve().parent.parent.parent
+    if level == 1:
+        return project_root / 'data' / 'level1-food-detection'
+    if level == 2:
+        return project_root / 'data' / 'level2-country-classification'
+    return project_root / 'data' / 'level3-fine-grained' / country
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量更新數據集清單')
+    parser.add_argument('data_dir', nargs='?', help='數據目錄（默認按 --level 推斷）')
+    parser.add_argument('--level', type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument('--country', default='chinese', help='第三層的國家/菜系')
+    parser.add_argument('--manifest', help='清單路徑（默認 data/.manifest/<數據集名>.json）')
+    parser.add_argument('--workers', type=int, help='計算哈希的進程數（默認 CPU 核數）')
+    parser.add_argument('--verify', action='store_true', help='忽略大小和修改時間，重新計算所有哈希')
+    parser.add_argument('--show', type=int, default=10, help='每類變化最多列出的文件數')
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir) if args.data_dir else level_data_dir(args.level, args.country)
+    if not data_dir.exists():
+        print(f"[ERROR] 數據目錄不存在: {data_dir}")
+        return
+    manifest_path = Path(args.manifest) if args.manifest else default_manifest_path(data_dir)
+
+    manifest, changes = update_manifest(data_dir, manifest_path, workers=args.workers, verify=args.verify)
+    print(f"[INFO] 清單: {manifest_path}（{len(manifest['files'])} 張圖片，{len(manifest['class_names'])} 個類別）")
+    print(f"[INFO] {describe_changes(changes)}")
+    for kind in ('added', 'changed', 'removed'):
+        for relative in changes[kind][:args.show]:
+            print(f"  {kind:8s} {relative}")
+
+    errors = [(relative, entry['error']) for relative, entry in manifest['files'].items() if 'error' in entry]
+    for relative, error in errors[:args.show]:
+        print(f"[WARN] 無法識別: {relative}（{error}）")
+    groups = duplicate_groups(manifest)
+    if groups:
+        extra = sum(len(group) - 1 for group in groups)
+        print(f"[WARN] {len(groups)} 組內容完全相同的圖片（多出 {extra} 張）")
+        for group in groups[:args.show]:
+            print(f"  {' = '.join(group)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+本機啟動多個 worker 進程做分布式訓練（train.py --distributed，MultiWorkerMirroredStrategy），並統計擴展效率
+
+- 每個 worker 一個進程，TF_CONFIG 指向本機的空閒端口，輸出寫入 <運行目錄>/workers-<N>/worker-<i>.log
+- 每個 worker 的 CPU 線程數相同（默認 CPU 核數 / 最大 worker 數），模擬逐台增加同樣大小的節點
+- --workers 1 2 4 依次用 1、2、4 個 worker 訓練同一個任務，按 chief 報告的穩態 images/sec 計算
+  加速比和擴展效率（加速比 / worker 數倍數），寫入 <運行目錄>/scaling.json
+- 任何一個 worker 異常退出時終止其餘 worker（其他 worker 會在集合通信中一直等待）
+
+`--` 之後的參數原樣傳給 train.py（需要只有一個任務，數據管道為 tfdata、packed 或 tar）。
+
+用法：
+    python train/launch_workers.py --workers 2 -- --level 3 --countries chinese --pipeline packed
+    python train/launch_workers.py --workers 1 2 4 -- --level 1 --pipeline tfdata --set training.epochs=3
+多台機器上不需要這個腳本：在每台機器上設置各自的 TF_CONFIG 後運行 train.py --distributed。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from utils.distributed import local_tf_configs, scaling_report
+from utils.scheduler import default_threads_per_job, thread_environment, write_summary
+from utils.train_config import PROJECT_ROOT
+
+TRAIN_SCRIPT = Path(__file__).resolve().parent / 'train.py'
+
+
+def launch(num_workers, train_args, threads, run_dir, timeout=None):
+    """
+    啟動 num_workers 個本地 worker 並等待結束
+
+    Returns:
+        {"workers", "status", "exit_codes", "wall_seconds", "images_per_sec", "summary"}
+    """
+    run_dir.mkdir(parents=True, exist_ok=True)
+    processes, logs = [], []
+    started = time.perf_counter()
+    for index, tf_config in enumerate(local_tf_configs(num_workers)):
+        env = dict(os.environ, TF_CONFIG=tf_config, **thread_environment(threads))
+        log = open(run_dir / f"worker-{index}.log", 'w', encoding='utf-8')
+        command = [sys.executable, str(TRAIN_SCRIPT), *train_args, '--distributed',
+                   '--run-dir', str(run_dir), '--threads-per-job', str(threads)]
+        processes.append(subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT))
+        logs.append(log)
+    print(f"[INFO] 已啟動 {num_workers} 個 worker（每個 {threads} 線程），日誌: {run_dir}")
+
+    status = 'ok'
+    try:
+        while any(process.poll() is None for process in processes):
+            failed = [i for i, process in enumerate(processes) if process.returncode not in (None, 0)]
+            if failed:
+                status = 'failed'
+                print(f"[ERROR] worker {failed[0]} 退出碼 {processes[failed[0]].returncode}，終止其餘 worker"
+                      f"（見 {run_dir / f'worker-{failed[0]}.log'}）")
+                break
+            if timeout and time.perf_counter() - started > timeout:
+                status = 'timeout'
+                print(f"[ERROR] 超過 {timeout}s，終止所有 worker")
+                break
+            time.sleep(1.0)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+        for log in logs:
+            log.close()
+
+    exit_codes = [process.returncode for process in processes]
+    if status == 'ok' and any(exit_codes):
+        status = 'failed'
+    result = {
+        'workers': num_workers,
+        'threads_per_worker': threads,
+        'status': status,
+        'exit_codes': exit_codes,
+        'wall_seconds': round(time.perf_counter() - started, 1),
+        'images_per_sec': None,
+        'summary': None,
+    }
+    summary_path = run_dir / 'summary.json'
+    if status == 'ok' and summary_path.exists():
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            job = json.load(f)['jobs'][0]
+        result.update(images_per_sec=(job.get('images_per_sec') or {}).get('steady'),
+                      global_batch_size=job.get('global_batch_size'), summary=str(summary_path))
+    return result
+
+
+def main():
+    argv = sys.argv[1:]
+    split = argv.index('--') if '--' in argv else len(argv)
+    own_args, train_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description='本機啟動多個 worker 做分布式訓練並統計擴展效率')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2],
+                        help='worker 數；給出多個時依次運行並計算擴展效率（如 1 2 4）')
+    parser.add_argument('--threads-per-worker', type=int, help='每個 worker 的 CPU 線程數（默認 CPU 核數 / 最大 worker 數）')
+    parser.add_argument('--run-dir', help='日誌和結果目錄（默認 models/runs/distributed-<時間>）')
+    parser.add_argument('--timeout', type=float, help='每次運行的超時秒數')
+    args = parser.parse_args(own_args)
+    if not train_args:
+        parser.error('請在 -- 之後給出 train.py 的參數，如 -- --level 3 --countries chinese --pipeline packed')
+
+    threads = args.threads_per_worker or default_threads_per_job(max(args.workers))
+    base_dir = Path(args.run_dir) if args.run_dir else (
+        PROJECT_ROOT / 'models' / 'runs' / f"distributed-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    print(f"[INFO] train.py 參數: {' '.join(train_args)}")
+    if len(args.workers) > 1 and threads * max(args.workers) > (os.cpu_count() or 1):
+        print(f"[WARN] {max(args.workers)} 個 worker x {threads} 線程超過本機 {os.cpu_count()} 個核心，擴展效率會偏低")
+
+    runs = []
+    for num_workers in args.workers:
+        result = launch(num_workers, train_args, threads, base_dir / f"workers-{num_workers}", args.timeout)
+        print(f"[INFO] {num_workers} 個 worker: {result['status']}，{result['wall_seconds']}s，"
+              f"穩態 {result['images_per_sec']} images/sec")
+        runs.append(result)
+
+    report = scaling_report(runs)
+    print("[INFO] 擴展效率（相對於最少 worker 的運行）:")
+    print(f"  {'workers':>7s} {'images/sec':>10s} {'加速比':>6s} {'效率':>6s}  狀態")
+    for run in report:
+        print(f"  {run['workers']:7d} {run['images_per_sec'] or '-'!s:>10s} {run['speedup'] or '-'!s:>6s} "
+              f"{run['efficiency'] or '-'!s:>6s}  {run['status']}")
+    write_summary(base_dir / 'scaling.json', {'train_args': train_args, 'runs': report})
+    print(f"[INFO] 結果已寫入: {base_dir / 'scaling.json'}")
+    if any(run['status'] != 'ok' for run in report):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+生成 tar 分片（之後用 --pipeline tar 直接從分片訓練）
+
+- 數據目錄 → data/.tar-shards/<數據集名>/shard-*.tar（打亂後切分，遵守隔離列表）
+- 大壓縮包（如 Food-101 的 food-101.tar.gz，不必解壓）→ 多個未壓縮分片，便於並行讀取
+
+用法：
+    python train/make_tar_shards.py --level 1
+    python train/make_tar_shards.py data/raw/food-101/food-101.tar.gz --out data/.tar-shards/food-101
+    python train/make_tar_shards.py --level 3 --country chinese --shard-size 1000
+"""
+import argparse
+from pathlib import Path
+
+from utils.tar_shards import default_tar_dir, write_tar_shards
+
+
+def level_data_dir(level, country):
+    project_root = Path(__file__).resolve().parent.parent.parent
+    if level == 1:
+        return project_root / 'data' / 'level1-food-detection'
+    if level == 2:
+        return project_root / 'data' / 'level2-country-classification'
+    return project_root / 'data' / 'level3-fine-grained' / country
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成 tar 分片')
+    parser.add_argument('source', nargs='?', help='數據目錄或壓縮包（默認按 --level 推斷數據目錄）')
+    parser.add_argument('--level', type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument('--country', default='chinese', help='第三層的國家/菜系')
+    parser.add_argument('--out', help='輸出目錄（數據目錄來源時默認 data/.tar-shards/<數據集名>）')
+    parser.add_argument('--shard-size', type=int, default=2000, help='每個分片的圖片數')
+    parser.add_argument('--prefix', help='壓縮包中類別目錄的上級路徑（默認自動識別，如 food-101/images/）')
+    parser.add_argument('--workers', type=int, default=4, help='數據目錄來源時並行寫入的線程數')
+    args = parser.parse_args()
+
+    source = Path(args.source) if args.source else level_data_dir(args.level, args.country)
+    if not source.exists():
+        print(f"[ERROR] 來源不存在: {source}")
+        return
+    if source.is_file() and not args.out:
+        print("[ERROR] 從壓縮包重新分片時需要 --out")
+        return
+    out_dir = Path(args.out) if args.out else default_tar_dir(source)
+
+    print(f"[INFO] {source} → {out_dir}")
+    shards = write_tar_shards(source, out_dir, shard_size=args.shard_size, prefix=args.prefix,
+                              workers=args.workers)
+    print(f"[INFO] 完成: {len(shards)} 個分片")
+
+
+if __name__ == '__main__':
+    main()
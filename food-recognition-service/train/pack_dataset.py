@@ -0,0 +1,55 @@
+"""
+把訓練圖片一次性解碼、縮放並打包成 uint8 分片（之後用 --pipeline packed 訓練）
+
+用法：
+    python train/pack_dataset.py --level 1
+    python train/pack_dataset.py --level 3 --country chinese --format tfrecord
+    python train/pack_dataset.py data/level2-country-classification --shard-size 2048 --workers 8
+再次運行時只打包新增和修改的圖片（npy），--full 全部重新打包。
+"""
+import argparse
+from pathlib import Path
+
+from utils.packing import PACK_FORMATS, default_pack_dir, pack_dataset
+
+
+def level_data_dir(level, country):
+    project_root = Path(__file__).resolve().parent.parent.parent
+    if level == 1:
+        return project_root / 'data' / 'level1-food-detection'
+    if level == 2:
+        return project_root / 'data' / 'level2-country-classification'
+    return project_root / 'data' / 'level3-fine-grained' / country
+
+
+def main():
+    parser = argparse.ArgumentParser(description='打包訓練圖片為 uint8 分片')
+    parser.add_argument('data_dir', nargs='?', help='數據目錄（默認按 --level 推斷）')
+    parser.add_argument('--level', type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument('--country', default='chinese', help='第三層的國家/菜系')
+    parser.add_argument('--format', choices=PACK_FORMATS, default='npy',
+                        help='npy（未壓縮，mmap 讀取最快）或 tfrecord（GZIP 壓縮，適合網絡盤）')
+    parser.add_argument('--out', help='輸出目錄（默認 data/.packed/<數據集名>，訓練腳本從這裡讀取）')
+    parser.add_argument('--size', type=int, default=224, help='縮放後的邊長')
+    parser.add_argument('--shard-size', type=int, default=4096, help='每個分片的圖片數')
+    parser.add_argument('--workers', type=int, help='解碼進程數（默認 CPU 核數）')
+    parser.add_argument('--full', action='store_true', help='忽略上一次的打包結果，全部重新打包')
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir) if args.data_dir else level_data_dir(args.level, args.country)
+    if not data_dir.exists():
+        print(f"[ERROR] 數據目錄不存在: {data_dir}")
+        return
+    out_dir = Path(args.out) if args.out else default_pack_dir(data_dir)
+
+    print(f"[INFO] 打包 {data_dir} → {out_dir}（{args.format}，{args.size}×{args.size}）")
+    index = pack_dataset(data_dir, out_dir, fmt=args.format, target_size=(args.size, args.size),
+                         shard_size=args.shard_size, workers=args.workers, incremental=not args.full)
+    for item in index['failed'][:20]:
+        print(f"[WARN] 無法解碼，已跳過: {item['path']}（{item['error']}）")
+    if len(index['failed']) > 20:
+        print(f"[WARN] ……共 {len(index['failed'])} 張無法解碼，詳見 {out_dir / 'index.json'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+數據集清洗：檢查壞圖、規範化問題格式、找出重複圖和訓練 / 驗證集洩漏，生成隔離列表
+
+隔離列表寫入 data/.quarantine/<數據集名>.json，所有數據管道（generator、tfdata、packed、features）
+和打包工具都會跳過其中的文件。每次運行重新生成隔離列表（已修復的圖片自動解除隔離）。
+
+用法：
+    python train/scrub_dataset.py --level 1
+    python train/scrub_dataset.py --level 3 --country chinese --fix          # 把 CMYK / 透明 / WebP 等轉為 RGB
+    python train/scrub_dataset.py data/level2-country-classification --threshold 4 --dry-run
+"""
+import argparse
+import json
+from pathlib import Path
+
+from utils.dataset_files import default_quarantine_path
+from utils.scrubber import DEFAULT_THRESHOLD, scrub_dataset
+
+
+def level_data_dir(level, country):
+    project_root = Path(__file__).resolve().parent.parent.parent
+    if level == 1:
+        return project_root / 'data' / 'level1-food-detection'
+    if level == 2:
+        return project_root / 'data' / 'level2-country-classification'
+    return project_root / 'data' / 'level3-fine-grained' / country
+
+
+def main():
+    parser = argparse.ArgumentParser(description='數據集清洗與重複圖檢測')
+    parser.add_argument('data_dir', nargs='?', help='數據目錄（默認按 --level 推斷）')
+    parser.add_argument('--level', type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument('--country', default='chinese', help='第三層的國家/菜系')
+    parser.add_argument('--workers', type=int, help='檢查進程數（默認 CPU 核數）')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD,
+                        help='pHash 漢明距離閾值（0~64，越小越嚴格；0 只匹配畫面完全相同的圖片）')
+    parser.add_argument('--validation-split', type=float, default=0.2, help='與訓練腳本一致，用於判斷跨劃分洩漏')
+    parser.add_argument('--fix', action='store_true', help='把問題格式轉為 RGB 寫回原文件（原文件先備份）')
+    parser.add_argument('--dry-run', action='store_true', help='只輸出報告，不寫任何文件（隔離列表、數據清單、檢查緩存）')
+    parser.add_argument('--report', help='完整報告 JSON 路徑')
+    parser.add_argument('--show', type=int, default=10, help='每類問題最多列出的條目數')
+    args = parser.parse_args()
+    if args.dry_run and args.fix:
+        parser.error('--dry-run 不能與 --fix 同時使用（--fix 會改寫圖片文件）')
+
+    data_dir = Path(args.data_dir) if args.data_dir else level_data_dir(args.level, args.country)
+    if not data_dir.exists():
+        print(f"[ERROR] 數據目錄不存在: {data_dir}")
+        return
+
+    report = scrub_dataset(data_dir, workers=args.workers, threshold=args.threshold,
+                           validation_split=args.validation_split, fix=args.fix, write=not args.dry_run)
+
+    print(f"[INFO] 共 {report['images']} 張圖片，隔離 {len(report['entries'])} 張: "
+          + ('、'.join(f"{reason} {count}" for reason, count in sorted(report['quarantined'].items())) or '無'))
+    fixed = [item for item in report['format_issues'] if item['fixed']]
+    pending = [item for item in report['format_issues'] if not item['fixed']]
+    if fixed:
+        print(f"[INFO] 已規範化 {len(fixed)} 張圖片（原文件備份在 {default_quarantine_path(data_dir).parent}）")
+    if pending:
+        print(f"[WARN] {len(pending)} 張圖片格式有問題（加 --fix 轉為 RGB）")
+        for item in pending[:args.show]:
+            print(f"  {item['path']}: {', '.join(item['issues'])}")
+    for path, entry in sorted(report['entries'].items()):
+        if entry['reason'] in ('corrupt', 'truncated'):
+            print(f"[WARN] {entry['reason']}: {path}（{entry['detail']}）")
+
+    groups = report['duplicate_groups']
+    if groups:
+        print(f"[WARN] {len(groups)} 組重複圖片，其中 {report['cross_split_groups']} 組跨訓練 / 驗證集，"
+              f"{report['label_conflict_groups']} 組跨類別")
+        for group in sorted(groups, key=lambda g: (len(g['labels']) == 1, len(g['splits']) == 1))[:args.show]:
+            print(f"  [{'/'.join(group['labels'])} | {'/'.join(group['splits'])} | 距離 ≤{group['max_distance']}] "
+                  f"{' = '.join(group['paths'])}")
+
+    if args.dry_run:
+        print("[INFO] --dry-run：未寫入隔離列表、數據清單和檢查緩存")
+    else:
+        print(f"[INFO] 隔離列表: {default_quarantine_path(data_dir)}")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] 報告已寫入: {args.report}")
+
+
+if __name__ == '__main__':
+    main()
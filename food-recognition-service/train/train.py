@@ -0,0 +1,133 @@
+"""
+統一訓練入口：按 YAML 配置（train/configs/level*.yaml）訓練，第三層可以同時訓練多個國家
+
+- 每個任務（第三層每個國家一個）在獨立進程中運行，--parallel 個同時運行，
+  每個任務的 CPU 線程數受 --threads-per-job 限制（默認按 CPU 核數均分），避免多個任務爭搶核心
+- 多個任務時各任務的輸出寫入 models/runs/<運行名>/<任務名>.log
+- 結束時打印並保存匯總（models/runs/<運行名>/summary.json）：每個任務的耗時、吞吐量和最佳指標
+- --distributed：當前進程是 TF_CONFIG 描述的集群中的一個 worker，與其他 worker 一起訓練一個任務
+  （MultiWorkerMirroredStrategy；本機試運行用 launch_workers.py 啟動多個 worker）
+- --resume：各任務從 <model_dir>/checkpoints 中最新的完整狀態檢查點繼續（被搶佔或中斷後用同樣的參數重新運行；
+  已完成的任務跳過）
+
+用法：
+    python train/train.py --level 1
+    python train/train.py --level 3                                     # 所有國家，按配置中的 run.parallel 並行
+    python train/train.py --level 3 --countries chinese japanese --parallel 2 --threads-per-job 4
+    python train/train.py train/configs/level2.yaml --pipeline packed --set training.epochs=10
+    python train/train.py --level 3 --parallel 2 --gpus 0 1             # 兩個任務各用一塊 GPU
+    python train/train.py --level 3 --resume                            # 中斷後繼續
+    TF_CONFIG='{"cluster": {"worker": ["host1:12345", "host2:12345"]}, "task": {"type": "worker", "index": 0}}' \
+        python train/train.py --level 3 --countries chinese --pipeline packed --distributed
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from utils.distributed import is_chief, worker_count
+from utils.scheduler import default_threads_per_job, format_summary, run_jobs, write_summary
+from utils.train_config import (PROJECT_ROOT, add_pipeline_arguments, apply_overrides, expand_jobs,
+                                feature_options_from_args, level_config_path, load_config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按配置訓練模型（支持多個任務並行）')
+    parser.add_argument('config', nargs='?', help='配置文件（默認 train/configs/level<--level>.yaml）')
+    parser.add_argument('--level', type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument('--countries', nargs='+', help='第三層：只訓練這些國家（默認使用配置中的 countries）')
+    parser.add_argument('--parallel', type=int, help='同時運行的任務數（默認使用配置中的 run.parallel）')
+    parser.add_argument('--threads-per-job', type=int, help='每個任務的 CPU 線程數（默認 CPU 核數 / 並行數）')
+    parser.add_argument('--gpus', nargs='+', help='GPU 編號；同時運行的任務輪流分配（默認不限制）')
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='KEY=VALUE',
+                        help='覆蓋配置項，如 training.epochs=5（可重複）')
+    parser.add_argument('--run-dir', help='日誌和匯總目錄（默認 models/runs/<配置名>-<時間>）')
+    parser.add_argument('--dry-run', action='store_true', help='只列出任務和線程分配，不訓練')
+    parser.add_argument('--distributed', action='store_true',
+                        help='作為 TF_CONFIG 集群中的一個 worker 訓練（只能有一個任務）')
+    parser.add_argument('--resume', action='store_true',
+                        help='從各任務最新的檢查點繼續訓練（已完成的任務跳過）')
+    add_pipeline_arguments(parser)
+    args = parser.parse_args()
+
+    config_path = Path(args.config) if args.config else level_config_path(args.level)
+    try:
+        config = apply_overrides(load_config(config_path), args.overrides)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] 無法加載配置: {e}")
+        sys.exit(1)
+    jobs = expand_jobs(config, countries=args.countries, pipeline=args.pipeline, augment=args.augment,
+                       tar_source=args.tar_source, feature_options=feature_options_from_args(args),
+                       resume=args.resume)
+    if not jobs:
+        print(f"[ERROR] 配置中沒有可訓練的任務: {config_path}")
+        sys.exit(1)
+
+    if args.distributed:
+        run_distributed(args, config, config_path, jobs)
+        return
+
+    parallel = max(1, min(args.parallel or config['run']['parallel'], len(jobs)))
+    threads = args.threads_per_job or config['run']['threads_per_job'] or default_threads_per_job(parallel)
+    run_name = f"{config['name']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    run_dir = Path(args.run_dir) if args.run_dir else PROJECT_ROOT / 'models' / 'runs' / run_name
+    print(f"[INFO] 配置: {config_path}，{len(jobs)} 個任務，並行 {parallel}，每個任務 {threads} 線程")
+    for job in jobs:
+        print(f"  {job['name']}: {job['data_dir']} → {job['model_dir']}（{job['pipeline']}）")
+    if args.dry_run:
+        return
+
+    started = time.perf_counter()
+    summaries = run_jobs(jobs, parallel=parallel, threads_per_job=threads, gpus=args.gpus, log_dir=run_dir)
+    lines, totals = format_summary(summaries, time.perf_counter() - started)
+    print("[INFO] 訓練匯總:")
+    for line in lines:
+        print(f"  {line}")
+    write_summary(run_dir / 'summary.json', {
+        'config': str(config_path),
+        'parallel': parallel,
+        'threads_per_job': threads,
+        'overrides': args.overrides,
+        'totals': totals,
+        'jobs': summaries,
+    })
+    print(f"[INFO] 匯總已寫入: {run_dir / 'summary.json'}")
+    if any(summary['status'] in ('failed', 'preempted') for summary in summaries):
+        sys.exit(1)
+
+
+def run_distributed(args, config, config_path, jobs):
+    """在當前進程中作為多 worker 集群的一員訓練一個任務；chief 寫匯總"""
+    if len(jobs) != 1:
+        print(f"[ERROR] --distributed 只能訓練一個任務（當前 {len(jobs)} 個，用 --countries 指定一個國家）")
+        sys.exit(1)
+    job = dict(jobs[0], threads=args.threads_per_job or config['run']['threads_per_job'])
+    print(f"[INFO] 配置: {config_path}，任務 {job['name']}，集群 {worker_count()} 個 worker")
+    if args.dry_run:
+        return
+
+    from utils.trainer import configure_runtime, create_strategy, train_job
+
+    configure_runtime(job['threads'])
+    strategy = create_strategy(config['distributed']['communication'])
+    started = time.perf_counter()
+    summary = train_job(job, strategy)
+    summary['wall_seconds'] = round(time.perf_counter() - started, 1)
+    if is_chief():
+        run_dir = Path(args.run_dir) if args.run_dir else (
+            PROJECT_ROOT / 'models' / 'runs' / f"{config['name']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        write_summary(run_dir / 'summary.json', {
+            'config': str(config_path),
+            'workers': worker_count(),
+            'threads_per_worker': job['threads'],
+            'overrides': args.overrides,
+            'jobs': [summary],
+        })
+        print(f"[INFO] 匯總已寫入: {run_dir / 'summary.json'}")
+    if summary['status'] != 'ok':
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+批量數據增強（圖內執行，替代 ImageDataGenerator 逐張的 NumPy / SciPy 變換）
+
+參數與 ImageDataGenerator 同名、語義相同（rotation_range、width_shift_range、height_shift_range、
+zoom_range、horizontal_flip、brightness_range，邊緣按 fill_mode='nearest' 填充），
+各層配置（configs/level*.yaml）的 data.augmentation 在所有路徑上通用。
+
+增強方式（訓練腳本的 --augment）：
+- numpy:  ImageDataGenerator 逐張增強（原有方式，只用於 generator 管道）
+- batch:  在 tf.data 管道中對整批執行（tfdata / packed / tar 管道）
+- layers: 作為模型的第一層（BatchAugmentation）在訓練時對整批執行，有 GPU 時在 GPU 上；任何圖像管道可用
+- off:    不增強
+"""
+import math
+
+import tensorflow as tf
+from tensorflow import keras
+
+from .train_config import AUGMENT_MODES
+
+
+def random_affine_transforms(batch_size, height, width, augmentation):
+    """
+    按 ImageDataGenerator 的參數語義生成每張圖的隨機仿射變換（旋轉、平移、縮放），
+    返回 ImageProjectiveTransformV3 使用的 [batch_size, 8] 矩陣（輸出座標 → 輸入座標）
+    """
+    height = tf.cast(height, tf.float32)
+    width = tf.cast(width, tf.float32)
+
+    rotation = augmentation.get('rotation_range', 0) * math.pi / 180.0
+    theta = tf.random.uniform([batch_size], -rotation, rotation) if rotation else tf.zeros([batch_size])
+
+    width_shift = augmentation.get('width_shift_range', 0)
+    height_shift = augmentation.get('height_shift_range', 0)
+    tx = tf.random.uniform([batch_size], -width_shift, width_shift) * width if width_shift else tf.zeros([batch_size])
+    ty = tf.random.uniform([batch_size], -height_shift, height_shift) * height if height_shift else tf.zeros([batch_size])
+
+    zoom = augmentation.get('zoom_range', 0)
+    if zoom:
+        zoom_x = tf.random.uniform([batch_size], 1.0 - zoom, 1.0 + zoom)
+        zoom_y = tf.random.uniform([batch_size], 1.0 - zoom, 1.0 + zoom)
+    else:
+        zoom_x = zoom_y = tf.ones([batch_size])
+
+    center_x = (width - 1.0) / 2.0
+    center_y = (height - 1.0) / 2.0
+    cos, sin = tf.cos(theta), tf.sin(theta)
+    a0, a1 = zoom_x * cos, -zoom_x * sin
+    b0, b1 = zoom_y * sin, zoom_y * cos
+    a2 = center_x - a0 * center_x - a1 * center_y + tx
+    b2 = center_y - b0 * center_x - b1 * center_y + ty
+    zeros = tf.zeros([batch_size])
+    return tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+
+def has_augmentation(augmentation):
+    return bool(augmentation) and any(
+        augmentation.get(key) for key in
+        ('rotation_range', 'width_shift_range', 'height_shift_range', 'zoom_range',
+         'horizontal_flip', 'brightness_range')
+    )
+
+
+def augment_images(images, augmentation, max_value=255.0):
+    """
+    對一批 float32 圖像（[N, H, W, 3]）做隨機增強：一次仿射變換 + 翻轉 + 亮度，全部是整批張量運算
+
+    Args:
+        images: 圖像批次（取值 0~max_value）
+        augmentation: ImageDataGenerator 同名參數
+        max_value: 像素最大值（0~255 的圖像為 255，已歸一化的為 1）
+    """
+    shape = tf.shape(images)
+    batch_size, height, width = shape[0], shape[1], shape[2]
+
+    if any(augmentation.get(key) for key in ('rotation_range', 'width_shift_range', 'height_shift_range', 'zoom_range')):
+        images = tf.raw_ops.ImageProjectiveTransformV3(
+            images=images,
+            transforms=random_affine_transforms(batch_size, height, width, augmentation),
+            output_shape=shape[1:3],
+            fill_value=0.0,
+            interpolation='BILINEAR',
+            fill_mode='NEAREST',
+        )
+    if augmentation.get('horizontal_flip'):
+        flip = tf.random.uniform([batch_size, 1, 1, 1]) < 0.5
+        images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+    brightness = augmentation.get('brightness_range')
+    if brightness:
+        factor = tf.random.uniform([batch_size, 1, 1, 1], brightness[0], brightness[1])
+        images = tf.clip_by_value(images * factor, 0.0, max_value)
+    return images
+
+
+class BatchAugmentation(keras.layers.Layer):
+    """
+    訓練時對整批輸入做 augment_images（推理和驗證時原樣返回）
+
+    輸入為已歸一化到 [0, 1] 的圖像（與各數據管道的輸出一致）。
+    """
+
+    def __init__(self, augmentation, max_value=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.augmentation = dict(augmentation)
+        self.max_value = max_value
+
+    def call(self, images, training=None):
+        if not training:
+            return images
+        return augment_images(images, self.augmentation, self.max_value)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(augmentation=self.augmentation, max_value=self.max_value)
+        return config
+
+
+def with_augmentation_layers(model, augmentation):
+    """
+    在模型前接一個 BatchAugmentation，返回只用於 fit 的訓練模型
+
+    與原模型共享全部層（訓練即更新原模型的權重），編譯參數相同；
+    保存和轉換仍使用原模型，不包含增強層。配合 feature_cache.redirect_checkpoints 使用。
+    """
+    inputs = keras.Input(shape=model.input_shape[1:])
+    outputs = model(BatchAugmentation(augmentation, name='batch_augmentation')(inputs))
+    augmented = keras.Model(inputs, outputs, name=f"{model.name}_augmented")
+    augmented.compile_from_config(model.get_compile_config())
+    return augmented
+
+
+def resolve_augment_mode(pipeline, mode='auto'):
+    """
+    確定數據增強方式
+
+    Args:
+        pipeline: 數據管道（generator、tfdata、packed、tar、features）
+        mode: AUGMENT_MODES 之一；auto 時 generator 為 numpy，其他圖像管道為 batch
+
+    Returns:
+        numpy、batch、layers 或 off（features 管道總是 off：特徵管道用預提取的增強視圖）
+    """
+    if mode not in AUGMENT_MODES:
+        raise ValueError(f"未知的增強方式: {mode}（可選 {', '.join(AUGMENT_MODES)}）")
+    if pipeline == 'features':
+        if mode not in ('auto', 'off'):
+            print(f"[WARN] features 管道在特徵上訓練，忽略 --augment {mode}（使用 --feature-views 生成增強視圖）")
+        return 'off'
+    if mode == 'auto':
+        return 'numpy' if pipeline == 'generator' else 'batch'
+    if mode == 'numpy' and pipeline != 'generator':
+        raise ValueError("numpy 增強（ImageDataGenerator）只能用於 generator 管道")
+    if mode == 'batch' and pipeline == 'generator':
+        raise ValueError("batch 增強在 tf.data 管道中執行，generator 管道請用 layers")
+    return mode
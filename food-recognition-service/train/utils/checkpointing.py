@@ -0,0 +1,346 @@
+"""
+完整訓練狀態的檢查點：可搶佔的機器上訓練，中斷後用 --resume 從中斷處繼續
+
+每個檢查點是 <model_dir>/checkpoints/ 下的一個目錄 ckpt-<epoch>-<批次>：
+- state.*：模型權重和優化器狀態（Adam 動量、iterations、當前學習率），tf.train.Checkpoint 格式
+- state.json：數據位置（epoch、epoch 內已完成的批次數、訓練樣本數；generator 管道另有該 epoch 的樣本順序）、
+  其他回調的狀態（EarlyStopping / ReduceLROnPlateau 的計數和最佳值、ModelCheckpoint 的最佳值、吞吐量記錄）
+  和此前各 epoch 的歷史
+- early_stopping.npz：EarlyStopping(restore_best_weights=True) 記住的最佳權重
+先寫到臨時目錄，完整寫完後改名，再原子地替換 latest.json；中途被殺不會留下半個檢查點。
+
+保存時機：每個 epoch 結束、每 every_steps 個批次，以及收到 SIGTERM / SIGINT 時（在當前批次結束後保存並中止訓練）。
+數據位置按批次記錄：從 epoch 中間恢復時，該 epoch 按中斷前的順序只再跑剩餘的批次，之後的 epoch 與不中斷時相同。
+tf.data 管道每個 epoch 的打亂順序只取決於 (seed, epoch)（tf_dataset.EpochStream），跳過的樣本不讀取不解碼；
+generator 管道每個 epoch 開始時按 (seed, epoch) 設定 Sequence 的樣本順序，並保存在 state.json 中。
+恢復前校驗該 epoch 已訓練和剩餘的樣本互不重疊、合起來正好是全部訓練樣本；該 epoch 的訓練指標只統計剩餘批次。
+"""
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from .throughput import ThroughputCallback
+
+CHECKPOINT_VERSION = 2
+LATEST_FILE = 'latest.json'
+
+# 需要跨中斷保留的回調屬性（fit 開始時這些回調會重置自己的計數）
+CALLBACK_STATE = (
+    (keras.callbacks.EarlyStopping, ('wait', 'stopped_epoch', 'best', 'best_epoch')),
+    (keras.callbacks.ReduceLROnPlateau, ('wait', 'cooldown_counter', 'best')),
+    (keras.callbacks.ModelCheckpoint, ('best', 'epochs_since_last_save')),
+    (ThroughputCallback, ('images_per_sec',)),
+)
+
+
+class TrainingInterrupted(Exception):
+    """收到終止信號，已保存檢查點並中止 fit"""
+
+    def __init__(self, epoch, step, path):
+        super().__init__(f"訓練已中斷（epoch {epoch + 1}，已完成 {step} 個批次），檢查點: {path}")
+        self.epoch = epoch
+        self.step = step
+        self.path = path
+
+
+def default_checkpoint_dir(model_dir):
+    return Path(model_dir) / 'checkpoints'
+
+
+def _to_json(value):
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def _atomic_json(path, payload):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_latest(directory):
+    """
+    讀取最新的檢查點信息
+
+    Returns:
+        state.json 的內容（另加 path：檢查點目錄）；沒有可用的檢查點時返回 None
+    """
+    directory = Path(directory)
+    try:
+        with open(directory / LATEST_FILE, 'r', encoding='utf-8') as f:
+            latest = json.load(f)
+        path = directory / latest['checkpoint']
+        with open(path / 'state.json', 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError, KeyError):
+        return None
+    if state.get('version') != CHECKPOINT_VERSION:
+        print(f"[WARN] 檢查點版本不兼容，忽略: {path}")
+        return None
+    return dict(state, path=str(path), completed=latest.get('completed', False))
+
+
+def clear_checkpoints(directory):
+    """刪除上一次運行留下的檢查點（不續訓時從頭開始）"""
+    directory = Path(directory)
+    if directory.exists():
+        shutil.rmtree(directory)
+
+
+def epoch_order(seed, epoch, count):
+    """generator 管道第 epoch 個 epoch 的樣本順序（只取決於 seed 和 epoch）"""
+    return np.random.default_rng([seed, epoch]).permutation(count)
+
+
+def mark_completed(directory):
+    """訓練正常結束（final_model 已保存）後在 latest.json 中標記，之後 --resume 不再重複訓練"""
+    path = Path(directory) / LATEST_FILE
+    if not path.exists():
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        latest = json.load(f)
+    latest['completed'] = True
+    _atomic_json(str(path), latest)
+
+
+class TrainingCheckpoint(keras.callbacks.Callback):
+    """
+    定期保存完整訓練狀態，並在恢復時把狀態套回各回調
+
+    必須是 callbacks 列表中的最後一個：epoch 結束時其他回調已經更新完狀態；
+    fit 開始時其他回調先重置，再由這裡套用保存的狀態。
+
+    Args:
+        directory: 檢查點目錄
+        model: 要保存權重的完整模型
+        optimizer: 訓練模型（fit 的模型）的優化器
+        callbacks_list: 其他回調（按 CALLBACK_STATE 保存狀態）
+        every_steps: 每多少個批次額外保存一次（None 表示只在 epoch 結束時保存）
+        keep: 保留最近幾個檢查點
+        chief: 是否寫入 directory（多 worker 時非 chief 寫到臨時目錄後刪除）
+        handle_signals: 收到 SIGTERM / SIGINT 時保存並中止（多 worker 時各 worker 收到信號的時機不同，不處理）
+        samples: 訓練樣本數（恢復時訓練集有變化則 epoch 內的位置不再有效）
+        sequence: generator 管道的訓練 Sequence（DirectoryIterator）：每個 epoch 開始時按 (seed, epoch) 設定
+                  樣本順序，不再由 Sequence 在 epoch 結束時自行打亂
+        seed: generator 管道樣本順序的隨機種子
+    """
+
+    def __init__(self, directory, model, optimizer, callbacks_list, every_steps=None, keep=2, chief=True,
+                 handle_signals=True, samples=None, sequence=None, seed=42):
+        super().__init__()
+        self.directory = Path(directory)
+        self.full_model = model
+        self.optimizer = optimizer
+        self.tracked = [callback for callback in callbacks_list if self._state_attributes(callback)]
+        self.every_steps = every_steps
+        self.keep = max(1, keep)
+        self.chief = chief
+        self.handle_signals = handle_signals
+        self.checkpoint = tf.train.Checkpoint(model=model, optimizer=optimizer)
+        self.samples = samples
+        self.sequence = sequence
+        self.seed = seed
+        if sequence is not None:
+            # 樣本順序由 on_epoch_begin 設定；Keras 可能在最後幾個批次還沒訓練時就調用 on_epoch_end，
+            # 若仍由 Sequence 自行重新打亂，epoch 末尾保存的順序會是下一個 epoch 的
+            sequence.on_epoch_end = lambda: None
+        self._resume_order = None
+        self.history = {}
+        self.epoch = 0
+        self.step = 0
+        self._step_offset = 0
+        self._carry = None
+        self._signal = None
+        self._previous_handlers = {}
+        self._restore_status = None
+
+    @staticmethod
+    def _state_attributes(callback):
+        for callback_type, attributes in CALLBACK_STATE:
+            if isinstance(callback, callback_type):
+                return [name for name in attributes if hasattr(callback, name)]
+        return []
+
+    def _capture(self):
+        states, best_weights = [], None
+        for callback in self.tracked:
+            states.append({name: _to_json(getattr(callback, name)) for name in self._state_attributes(callback)})
+            if isinstance(callback, keras.callbacks.EarlyStopping) and getattr(callback, 'best_weights', None):
+                best_weights = callback.best_weights
+        return {'callbacks': states, 'best_weights': best_weights}
+
+    def _apply(self, carry):
+        for callback, state in zip(self.tracked, carry['callbacks']):
+            for name, value in state.items():
+                setattr(callback, name, value)
+            if isinstance(callback, keras.callbacks.EarlyStopping) and carry.get('best_weights') is not None:
+                callback.best_weights = carry['best_weights']
+
+    def restore(self, state, trainable_variables):
+        """
+        從 load_latest 的結果恢復權重、優化器、數據位置、回調狀態和歷史（在 fit 之前、strategy.scope() 中調用）
+
+        Args:
+            state: load_latest 的返回值
+            trainable_variables: 訓練模型的可訓練變量（先建好優化器的動量變量再恢復）
+        """
+        self.optimizer.build(trainable_variables)
+        self._restore_status = self.checkpoint.read(os.path.join(state['path'], 'state'))
+        self._restore_status.assert_existing_objects_matched()
+        best_weights = None
+        weights_path = Path(state['path']) / 'early_stopping.npz'
+        if weights_path.exists():
+            with np.load(weights_path) as weights:
+                best_weights = [weights[f"w{i}"] for i in range(len(weights.files))]
+        if len(state['callbacks']) != len(self.tracked):
+            print("[WARN] 檢查點中的回調與當前配置不一致，回調狀態不恢復")
+        else:
+            self._carry = {'callbacks': state['callbacks'], 'best_weights': best_weights}
+        self.history = {key: list(values) for key, values in state['history'].items()}
+        self.epoch, self.step = state['epoch'], state['step']
+        if state.get('index_array') is not None:
+            self._resume_order = np.asarray(state['index_array'], dtype=np.int64)
+        print(f"[INFO] 從檢查點恢復: epoch {self.epoch + 1}，已完成 {self.step} 個批次（{state['path']}）")
+
+    def begin_partial_epoch(self, completed_steps):
+        """下一個 epoch 從第 completed_steps 個批次之後繼續（fit 的 steps_per_epoch 為剩餘批次數）"""
+        self._step_offset = completed_steps
+
+    def check_resume_order(self, completed_steps, batch_size):
+        """
+        generator 管道的恢復校驗：保存的樣本順序是當前訓練集的一個排列，
+        已訓練的前 completed_steps 個批次和剩餘批次互不重疊、合起來正好是全部訓練樣本
+
+        Returns:
+            (已訓練的樣本數, 剩餘的樣本數)
+
+        Raises:
+            RuntimeError: 檢查點中沒有樣本順序或與當前訓練集不一致
+        """
+        order = self._resume_order
+        count = self.sequence.n
+        if order is None or len(order) != count or not np.array_equal(np.sort(order), np.arange(count)):
+            raise RuntimeError("恢復校驗失敗：檢查點中的樣本順序與當前訓練集不一致")
+        visited = min(completed_steps * batch_size, count)
+        return visited, count - visited
+
+    def _on_signal(self, signum, frame):
+        self._signal = signum
+        print(f"[WARN] 收到信號 {signal.Signals(signum).name}，將在當前批次結束後保存檢查點並中止")
+
+    def on_train_begin(self, logs=None):
+        if self._carry is not None:
+            self._apply(self._carry)
+        if self.handle_signals:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    self._previous_handlers[signum] = signal.signal(signum, self._on_signal)
+                except ValueError:
+                    # 不在主線程中（無法安裝信號處理），只做定期保存
+                    break
+
+    def on_train_end(self, logs=None):
+        # 同一次訓練的下一次 fit 開始時各回調會重置，帶上當前狀態
+        self._carry = self._capture()
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers = {}
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.step = self._step_offset
+        if self.sequence is not None:
+            # 從 epoch 中間恢復時沿用中斷前的順序
+            resumed = self._step_offset and self._resume_order is not None
+            self.sequence.index_array = (self._resume_order if resumed
+                                         else epoch_order(self.seed, epoch, self.sequence.n))
+            self._resume_order = None
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step = self._step_offset + batch + 1
+        if batch + 1 >= (self.params.get('steps') or float('inf')):
+            # epoch 的最後一個批次：驗證和 epoch 結束的回調之後再保存（on_epoch_end）
+            return
+        if self._signal is not None:
+            path = self.save()
+            raise TrainingInterrupted(self.epoch, self.step, path)
+        if self.every_steps and self.step % self.every_steps == 0:
+            self.save()
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(_to_json(value))
+        self.epoch, self.step, self._step_offset = epoch + 1, 0, 0
+        path = self.save()
+        if self._signal is not None:
+            raise TrainingInterrupted(self.epoch, self.step, path)
+
+    def save(self):
+        """
+        寫一個檢查點（臨時目錄 → 改名 → 更新 latest.json）
+
+        Returns:
+            檢查點目錄（非 chief 時為 None）
+        """
+        carry = self._capture()
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'epoch': self.epoch,
+            'step': self.step,
+            'iterations': int(self.optimizer.iterations.numpy()),
+            'learning_rate': float(keras.backend.get_value(self.optimizer.learning_rate)),
+            'samples': self.samples,
+            'callbacks': carry['callbacks'],
+            'history': self.history,
+            'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        if self.sequence is not None and self.step and self.sequence.index_array is not None:
+            state['index_array'] = self.sequence.index_array.tolist()
+        if self.chief:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        else:
+            tmp_dir = tempfile.mkdtemp(prefix='worker-ckpt-')
+        self.checkpoint.write(os.path.join(tmp_dir, 'state'))
+        if carry['best_weights'] is not None:
+            np.savez(os.path.join(tmp_dir, 'early_stopping.npz'),
+                     **{f"w{i}": weight for i, weight in enumerate(carry['best_weights'])})
+        with open(os.path.join(tmp_dir, 'state.json'), 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        if not self.chief:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+
+        name = f"ckpt-{self.epoch:04d}-{self.step:06d}"
+        final_dir = self.directory / name
+        if final_dir.exists():
+            shutil.rmtree(final_dir)
+        os.replace(tmp_dir, final_dir)
+        _atomic_json(str(self.directory / LATEST_FILE), {'checkpoint': name, 'epoch': self.epoch, 'step': self.step})
+        for old in sorted(path for path in self.directory.glob('ckpt-*') if path.name != name)[:-(self.keep - 1) or None]:
+            shutil.rmtree(old, ignore_errors=True)
+        # 之前保存到一半被殺留下的臨時目錄
+        for stale in self.directory.glob('.tmp-*'):
+            if stale.is_dir():
+                shutil.rmtree(stale, ignore_errors=True)
+            else:
+                stale.unlink(missing_ok=True)
+        return str(final_dir)
@@ -7,7 +7,23 @@ import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 
-def load_image_dataset(data_dir, target_size=(224, 224), batch_size=32, validation_split=0.2):
+from .augmentation import resolve_augment_mode
+from .dataset_files import filter_directory_iterator
+from .scrubber import to_rgb
+from .tf_dataset import load_folder_datasets
+
+# 訓練集數據增強（ImageDataGenerator、tf.data 管道和 BatchAugmentation 層共用）
+AUGMENTATION = dict(
+    rotation_range=30,
+    width_shift_range=0.3,
+    height_shift_range=0.3,
+    horizontal_flip=True,
+    zoom_range=0.2,
+    brightness_range=[0.8, 1.2],
+)
+
+def load_image_dataset(data_dir, target_size=(224, 224), batch_size=32, validation_split=0.2,
+                       pipeline='generator', augment='auto'):
     """
     加載圖像數據集
     
@@ -16,25 +32,37 @@ def load_image_dataset(data_dir, target_size=(224, 224), batch_size=32, validati
         target_size: 目標圖像大小
         batch_size: 批次大小
         validation_split: 驗證集比例
+        pipeline: 'generator'（ImageDataGenerator）或 'tfdata'（並行解碼的 tf.data 管道，見 tf_dataset.py）
+        augment: 'auto'、'numpy'、'batch'、'layers' 或 'off'（見 augmentation.py）；
+                 layers 時這裡不做增強，由調用方用 with_augmentation_layers 包裝模型
         
     Returns:
-        (train_generator, val_generator, class_indices)
+        (train_generator, val_generator, class_indices)；tfdata 時前兩項為 FolderDataset
     """
     data_dir = Path(data_dir)
     
     if not data_dir.exists():
         raise ValueError(f"數據目錄不存在: {data_dir}")
     
+    augment = resolve_augment_mode(pipeline, augment)
+    augmentation = AUGMENTATION if augment in ('numpy', 'batch') else None
+    
+    if pipeline == 'tfdata':
+        train, val = load_folder_datasets(
+            data_dir,
+            class_mode='categorical',
+            target_size=target_size,
+            batch_size=batch_size,
+            validation_split=validation_split,
+            augmentation=augmentation
+        )
+        return train, val, train.class_indices
+    
     # 數據增強（訓練集）
     train_datagen = keras.preprocessing.image.ImageDataGenerator(
         rescale=1./255,
-        rotation_range=30,
-        width_shift_range=0.3,
-        height_shift_range=0.3,
-        horizontal_flip=True,
-        zoom_range=0.2,
-        brightness_range=[0.8, 1.2],
-        validation_split=validation_split
+        validation_split=validation_split,
+        **(augmentation or {})
     )
     
     # 僅縮放（驗證集）
@@ -61,6 +89,10 @@ def load_image_dataset(data_dir, target_size=(224, 224), batch_size=32, validati
         shuffle=False
     )
     
+    # 跳過 scrub_dataset.py 隔離的壞圖和重複圖
+    filter_directory_iterator(train_generator, data_dir)
+    filter_directory_iterator(val_generator, data_dir)
+    
     return train_generator, val_generator, train_generator.class_indices
 
 def load_single_image(image_path, target_size=(224, 224)):
@@ -74,16 +106,11 @@ def load_single_image(image_path, target_size=(224, 224)):
     Returns:
         預處理後的圖片數組
     """
-    img = Image.open(image_path)
+    # 灰度、CMYK、透明通道、16 位等統一轉為 RGB（與 scrub_dataset.py 的規範化一致）
+    img = to_rgb(Image.open(image_path))
     img = img.resize(target_size)
     img_array = np.array(img) / 255.0
     
-    # 如果是灰度圖，轉換為 RGB
-    if len(img_array.shape) == 2:
-        img_array = np.stack([img_array] * 3, axis=-1)
-    elif img_array.shape[2] == 4:
-        img_array = img_array[:, :, :3]
-    
     # 添加批次維度
     img_array = np.expand_dims(img_array, axis=0)
     
@@ -0,0 +1,133 @@
+"""
+數據目錄的文件列舉和訓練 / 驗證集劃分（不依賴 TensorFlow，打包工具和各數據管道共用）
+
+劃分按文件相對路徑的 CRC32 決定歸屬：同一文件每次運行都落在同一側，新增圖片不會打亂已有劃分。
+scrub_dataset.py 寫入的隔離列表（壞圖、重複圖）中的文件在列舉時跳過。
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+
+
+def split_bucket(relative_path):
+    """相對路徑映射到 [0, 1) 的桶值；桶值小於 validation_split 的屬於驗證集"""
+    return zlib.crc32(relative_path.replace(os.sep, '/').encode('utf-8')) / 0x100000000
+
+
+def in_validation_split(relative_path, validation_split):
+    """按相對路徑的 CRC32 決定是否屬於驗證集（確定性，與文件列舉順序無關）"""
+    if validation_split <= 0:
+        return False
+    return split_bucket(relative_path) < validation_split
+
+
+# 與 flow_from_directory 一致的圖片擴展名（tf.io.decode_image 支持的部分）
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def default_quarantine_path(data_dir):
+    """隔離列表路徑：數據目錄旁的 .quarantine/<數據集名>.json"""
+    data_dir = Path(data_dir).resolve()
+    return data_dir.parent / '.quarantine' / f"{data_dir.name}.json"
+
+
+def load_quarantine(data_dir):
+    """
+    讀取隔離列表
+
+    Returns:
+        {相對路徑: 原因}；沒有隔離列表時為空
+    """
+    try:
+        with open(default_quarantine_path(data_dir), 'r', encoding='utf-8') as f:
+            entries = json.load(f)['entries']
+    except FileNotFoundError:
+        return {}
+    return {relative: entry['reason'] for relative, entry in entries.items()}
+
+
+def list_image_files(data_dir, class_names=None, skip_quarantined=True):
+    """
+    列出 data_dir/<類別>/ 下的圖片（遞歸子目錄）
+
+    Args:
+        data_dir: 數據目錄
+        class_names: 類別列表；None 時按子目錄名排序（與 flow_from_directory 相同）
+        skip_quarantined: 跳過隔離列表中的文件
+
+    Returns:
+        (paths, labels, class_indices)
+    """
+    data_dir = Path(data_dir)
+    quarantined = load_quarantine(data_dir) if skip_quarantined else {}
+    if class_names is None:
+        class_names = sorted(
+            entry.name for entry in data_dir.iterdir() if entry.is_dir() and not entry.name.startswith('.')
+        )
+    class_indices = {name: index for index, name in enumerate(class_names)}
+
+    paths, labels = [], []
+    for name in class_names:
+        for root, dirs, files in os.walk(data_dir / name):
+            dirs.sort()
+            for filename in sorted(files):
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, filename)
+                if quarantined and os.path.relpath(path, data_dir).replace(os.sep, '/') in quarantined:
+                    continue
+                paths.append(path)
+                labels.append(class_indices[name])
+    return paths, labels, class_indices
+
+
+def split_files(data_dir, paths, labels, validation_split):
+    """
+    確定性地劃分訓練 / 驗證集
+
+    Returns:
+        ((train_paths, train_labels), (val_paths, val_labels))
+    """
+    train, val = ([], []), ([], [])
+    for path, label in zip(paths, labels):
+        relative = os.path.relpath(path, data_dir)
+        target = val if in_validation_split(relative, validation_split) else train
+        target[0].append(path)
+        target[1].append(label)
+    return train, val
+
+
+def shard_items(items, shard):
+    """
+    多 worker 訓練時取本 worker 的一份（按序號取模，各 worker 互不重疊）
+
+    Args:
+        items: 列表（圖片路徑、標籤、樣本序號等，各 worker 上順序相同）
+        shard: (worker 數, 本 worker 序號)；None 時原樣返回
+    """
+    if not shard or shard[0] <= 1:
+        return items
+    count, index = shard
+    return items[index::count]
+
+
+def filter_directory_iterator(iterator, data_dir):
+    """
+    從 flow_from_directory 返回的 DirectoryIterator 中去掉隔離列表中的文件（原地修改）
+
+    flow_from_directory 沒有排除文件的參數，這裡在迭代開始前改寫它的文件列表。
+    """
+    quarantined = load_quarantine(data_dir)
+    if not quarantined:
+        return iterator
+    keep = [i for i, name in enumerate(iterator.filenames) if name.replace(os.sep, '/') not in quarantined]
+    if len(keep) == len(iterator.filenames):
+        return iterator
+    print(f"[INFO] 跳過隔離列表中的 {len(iterator.filenames) - len(keep)} 張圖片")
+    iterator.filenames = [iterator.filenames[i] for i in keep]
+    iterator._filepaths = [iterator._filepaths[i] for i in keep]
+    iterator.classes = iterator.classes[keep]
+    iterator.samples = iterator.n = len(keep)
+    iterator.index_array = None
+    return iterator
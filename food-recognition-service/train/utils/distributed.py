@@ -0,0 +1,98 @@
+"""
+多 worker 分布式訓練的集群信息（TF_CONFIG）、本地集群和擴展效率統計
+
+TF_CONFIG 格式（每個 worker 進程相同的 cluster，不同的 task.index）：
+    {"cluster": {"worker": ["host1:12345", "host2:12345"]}, "task": {"type": "worker", "index": 0}}
+index 0 的 worker 為 chief（負責寫模型、歷史和匯總；其他 worker 的輸出寫到臨時目錄後刪除）。
+
+不導入 TensorFlow：啟動器只生成 TF_CONFIG 和匯總結果。
+"""
+import json
+import os
+import socket
+
+
+def read_tf_config():
+    """當前進程的 TF_CONFIG（未設置時返回 {}）"""
+    raw = os.environ.get('TF_CONFIG')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"TF_CONFIG 不是有效的 JSON: {e}")
+
+
+def worker_count(tf_config=None):
+    """集群中的 worker 數（含 chief；未配置 TF_CONFIG 時為 1）"""
+    cluster = (read_tf_config() if tf_config is None else tf_config).get('cluster', {})
+    return max(1, len(cluster.get('worker', [])) + len(cluster.get('chief', [])))
+
+
+def worker_index(tf_config=None):
+    """當前進程在所有 worker（chief 排第一）中的序號，用於數據分片"""
+    tf_config = read_tf_config() if tf_config is None else tf_config
+    task = tf_config.get('task', {})
+    has_chief = bool(tf_config.get('cluster', {}).get('chief'))
+    if task.get('type') == 'chief':
+        return 0
+    return int(task.get('index', 0)) + (1 if has_chief else 0)
+
+
+def is_chief(tf_config=None):
+    """是否為 chief（顯式的 chief 任務，或沒有 chief 時的 worker 0；單進程訓練總是 chief）"""
+    return worker_index(tf_config) == 0
+
+
+def free_ports(count, host='localhost'):
+    """向系統申請 count 個空閒端口（本地集群用）"""
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind((host, 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def local_tf_configs(num_workers, host='localhost'):
+    """
+    本機 num_workers 個 worker 進程的 TF_CONFIG
+
+    Returns:
+        JSON 字符串列表，第 i 個給 worker i
+    """
+    workers = [f"{host}:{port}" for port in free_ports(num_workers, host)]
+    return [
+        json.dumps({'cluster': {'worker': workers}, 'task': {'type': 'worker', 'index': index}})
+        for index in range(num_workers)
+    ]
+
+
+def scaling_report(runs):
+    """
+    擴展效率：相對於 worker 數最少的一次運行，吞吐量的加速比和效率（加速比 / worker 數倍數）
+
+    Args:
+        runs: [{"workers": N, "images_per_sec": 穩態吞吐量, ...}]
+
+    Returns:
+        按 worker 數排序的列表，每項加上 speedup 和 efficiency
+    """
+    measured = sorted((run for run in runs if run.get('images_per_sec')), key=lambda run: run['workers'])
+    if not measured:
+        return [dict(run, speedup=None, efficiency=None) for run in runs]
+    base = measured[0]
+    report = []
+    for run in sorted(runs, key=lambda run: run['workers']):
+        rate = run.get('images_per_sec')
+        speedup = rate / base['images_per_sec'] if rate else None
+        report.append(dict(
+            run,
+            speedup=round(speedup, 2) if speedup else None,
+            efficiency=round(speedup / (run['workers'] / base['workers']), 3) if speedup else None,
+        ))
+    return report
@@ -0,0 +1,360 @@
+"""
+凍結骨幹的特徵緩存（bottleneck features）
+
+三層模型都是 MobileNetV2（base_model.trainable = False）+ GlobalAveragePooling2D + 全連接分類頭，
+每個 epoch 重跑整個骨幹前向幾乎佔滿訓練時間。這裡對每張圖片只跑一次骨幹，
+把池化後的特徵（MobileNetV2 為 1280 維）按文件內容哈希存入內存映射的 .npy 分片；
+之後分類頭直接在特徵上訓練，每個 epoch 只需數秒。
+
+增強後的視圖：
+- augmented_views > 0 時額外為每張圖提取若干個隨機增強視圖（與圖像增強參數相同），
+  訓練時每個 epoch 為每個樣本隨機選一個視圖（含原圖）；refresh=True 時重新生成這些視圖
+- feature_noise > 0 時在特徵上加乘性高斯噪聲（特徵空間增強）
+
+存儲結構：
+    <cache_dir>/<骨幹>-<高>x<寬>/
+        index.json                  {"feature_dim", "entries": {鍵: [分片, 行]}}
+        shard-<pid>-<隨機>.npy      float16 [行數, feature_dim]
+        .lock                       寫入時的文件鎖
+鍵為文件 SHA-1（原圖）或 "<SHA-1>#<增強配置哈希>#<視圖序號>"（增強視圖），
+重命名或跨層級重複的圖片共用同一份特徵。文件 SHA-1 取自 manifest 增量清單，未變化的圖片不再重新讀取。
+
+多個訓練進程可以共用一個存儲（如並行訓練的第三層各菜系）：分片名唯一，不會互相覆蓋；
+更新索引時持有 .lock 文件鎖，在鎖內重讀 index.json 合併後再寫回，不會丟失其他進程寫入的條目。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows 不加鎖（不支持多進程共用存儲）
+    fcntl = None
+from tensorflow import keras
+from tensorflow.keras import layers
+from tensorflow.keras.applications import MobileNetV2
+
+from .dataset_files import list_image_files, split_files
+from .manifest import describe_changes, file_hashes, update_manifest
+from .augmentation import augment_images
+from .tf_dataset import AUTOTUNE, EpochStream, FolderDataset, decode_and_resize
+
+# 每提取這麼多行寫一個分片（中斷後已寫入的部分不必重算）
+SHARD_ROWS = 2048
+
+
+def augmentation_key(augmentation):
+    """增強配置的短哈希：配置變化後舊的增強視圖不再被使用"""
+    payload = json.dumps(augmentation or {}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:8]
+
+
+def _atomic_write(path, write):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class FeatureStore:
+    """
+    按鍵存取特徵向量的分片存儲（分片以 mmap 方式讀取）
+
+    Args:
+        directory: 存儲目錄（一個骨幹 + 輸入尺寸一個目錄）
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / 'index.json'
+        self.lock_path = self.directory / '.lock'
+        self.feature_dim = None
+        self.entries = {}
+        self._reload()
+        self._shards = {}
+
+    def _reload(self):
+        """從磁盤重讀索引（其他進程可能已寫入新條目）"""
+        if self.index_path.exists():
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            self.feature_dim = self.feature_dim or index.get('feature_dim')
+            self.entries = index.get('entries', {})
+
+    @contextmanager
+    def _locked(self):
+        """持有存儲目錄的排他文件鎖，期間先重讀索引"""
+        with open(self.lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._reload()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def missing(self, keys):
+        return [key for key in keys if key not in self.entries]
+
+    @staticmethod
+    def _new_shard_name():
+        return f"shard-{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+    def add(self, keys, features):
+        """寫入一個新分片並在文件鎖內合併更新索引（分片和索引都先寫臨時文件再原子替換）"""
+        features = np.asarray(features, dtype=np.float16)
+        shard = self._new_shard_name()
+        _atomic_write(str(self.directory / f"{shard}.npy"), lambda f: np.save(f, features))
+        with self._locked():
+            if self.feature_dim is None:
+                self.feature_dim = int(features.shape[1])
+            for row, key in enumerate(keys):
+                self.entries[key] = [shard, row]
+            self._save_index()
+
+    def discard(self, keys):
+        """從索引中移除（分片中的舊數據不再被引用）"""
+        with self._locked():
+            for key in keys:
+                self.entries.pop(key, None)
+            self._save_index()
+
+    def _save_index(self):
+        index = {'feature_dim': self.feature_dim, 'entries': self.entries}
+        _atomic_write(str(self.index_path), lambda f: f.write(json.dumps(index).encode('utf-8')))
+
+    def _shard(self, name):
+        if name not in self._shards:
+            self._shards[name] = np.load(self.directory / f"{name}.npy", mmap_mode='r')
+        return self._shards[name]
+
+    def get(self, keys):
+        """
+        按鍵讀取特徵
+
+        Returns:
+            float32 [len(keys), feature_dim]
+        """
+        result = np.empty((len(keys), self.feature_dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            shard, row = self.entries[key]
+            result[i] = self._shard(shard)[row]
+        return result
+
+
+@lru_cache(maxsize=None)
+def build_backbone(input_shape=(224, 224, 3)):
+    """與訓練腳本相同的凍結骨幹 + 全局平均池化（輸入為 [0, 1] 的圖像，與 rescale=1/255 一致；同一進程只構建一次）"""
+    base_model = MobileNetV2(input_shape=input_shape, include_top=False, weights='imagenet')
+    base_model.trainable = False
+    return keras.Sequential([base_model, layers.GlobalAveragePooling2D()])
+
+
+def extract_features(store, paths, keys, backbone, target_size=(224, 224), batch_size=64, augmentation=None):
+    """
+    對 paths 跑一次骨幹並把特徵寫入 store（每 SHARD_ROWS 行一個分片）
+
+    Args:
+        store: FeatureStore
+        paths: 圖片路徑
+        keys: 對應的存儲鍵
+        backbone: build_backbone 的結果
+        target_size: (高, 寬)
+        batch_size: 推理批次大小
+        augmentation: 非 None 時先做隨機增強（生成增強視圖）
+    """
+    if not paths:
+        return
+    dataset = tf.data.Dataset.from_tensor_slices(list(paths))
+    dataset = dataset.map(lambda path: tf.cast(decode_and_resize(path, target_size), tf.float32),
+                          num_parallel_calls=AUTOTUNE)
+    dataset = dataset.batch(batch_size)
+    if augmentation:
+        dataset = dataset.map(lambda images: augment_images(images, augmentation), num_parallel_calls=AUTOTUNE)
+    dataset = dataset.map(lambda images: images / 255.0).prefetch(AUTOTUNE)
+
+    pending_keys, pending = [], []
+    offset = 0
+    for images in dataset:
+        features = backbone(images, training=False).numpy()
+        pending_keys.extend(keys[offset:offset + len(features)])
+        pending.append(features)
+        offset += len(features)
+        if len(pending_keys) >= SHARD_ROWS:
+            store.add(pending_keys, np.concatenate(pending))
+            pending_keys, pending = [], []
+        print(f"\r[INFO] 提取特徵: {offset}/{len(paths)}", end='', flush=True)
+    if pending_keys:
+        store.add(pending_keys, np.concatenate(pending))
+    print()
+
+
+def ensure_features(store, paths, hashes, target_size=(224, 224), batch_size=64,
+                    augmentation=None, augmented_views=0, refresh=False):
+    """
+    只為缺失的圖片（和增強視圖）提取特徵（骨幹僅在有缺失時構建）
+
+    Returns:
+        每張圖片的視圖鍵列表 [[原圖鍵, 增強視圖鍵...], ...]
+    """
+    aug_key = augmentation_key(augmentation)
+    view_keys = [[digest] + [f"{digest}#{aug_key}#{view}" for view in range(augmented_views)] for digest in hashes]
+
+    if refresh and augmented_views:
+        store.discard([key for keys in view_keys for key in keys[1:]])
+
+    todo = {}
+    for path, keys in zip(paths, view_keys):
+        for view, key in enumerate(keys):
+            if key not in store and key not in todo:
+                todo[key] = (path, view)
+    if todo:
+        backbone = build_backbone(tuple(target_size) + (3,))
+        clean = [(key, path) for key, (path, view) in todo.items() if view == 0]
+        augmented = [(key, path) for key, (path, view) in todo.items() if view > 0]
+        print(f"[INFO] 特徵緩存: 需要提取 {len(clean)} 個原圖特徵、{len(augmented)} 個增強視圖")
+        if clean:
+            extract_features(store, [p for _, p in clean], [k for k, _ in clean], backbone, target_size, batch_size)
+        if augmented:
+            extract_features(store, [p for _, p in augmented], [k for k, _ in augmented], backbone,
+                             target_size, batch_size, augmentation=augmentation)
+    else:
+        print(f"[INFO] 特徵緩存: 全部 {len(paths)} 張圖片已命中")
+    return view_keys
+
+
+def default_cache_dir(data_dir):
+    """默認放在數據目錄旁（data/.feature-cache），各層級共用（按內容哈希去重）"""
+    return Path(data_dir).resolve().parent / '.feature-cache'
+
+
+def _encode_labels(labels, num_classes, class_mode):
+    labels = np.asarray(labels)
+    if class_mode == 'categorical':
+        return np.eye(num_classes, dtype=np.float32)[labels]
+    if class_mode == 'binary':
+        return labels.astype(np.float32)
+    return labels
+
+
+def load_feature_datasets(data_dir, class_mode='categorical', target_size=(224, 224), batch_size=32,
+                          validation_split=0.2, augmentation=None, augmented_views=0, feature_noise=0.0,
+                          refresh=False, cache_dir=None, seed=42):
+    """
+    在緩存的骨幹特徵上構造訓練和驗證集（劃分方式與 tf_dataset.load_folder_datasets 相同）
+
+    Args:
+        data_dir: 數據目錄（data_dir/<類別>/）
+        class_mode: 'categorical'、'binary' 或 'sparse'
+        target_size: 骨幹輸入尺寸
+        batch_size: 批次大小
+        validation_split: 驗證集比例
+        augmentation: 生成增強視圖時使用的圖像增強參數
+        augmented_views: 每張訓練圖片的增強視圖數（0 表示只用原圖）
+        feature_noise: 特徵乘性高斯噪聲的標準差（0 表示不加）
+        refresh: 重新生成增強視圖
+        cache_dir: 特徵緩存目錄（默認 default_cache_dir）
+        seed: 打亂順序的隨機種子
+
+    Returns:
+        (train: FolderDataset, val: FolderDataset)，元素為 (features float32 [N, D], labels)
+    """
+    paths, labels, class_indices = list_image_files(data_dir)
+    if not paths:
+        raise ValueError(f"數據目錄中沒有圖片: {data_dir}")
+    # 內容哈希來自增量清單：只有新增或修改過的圖片需要重新計算
+    manifest, changes = update_manifest(data_dir)
+    print(f"[INFO] 數據清單: {describe_changes(changes)}")
+    hashes = dict(zip(paths, file_hashes(manifest, Path(data_dir).resolve(), paths)))
+    unreadable = [path for path in paths if hashes[path] is None]
+    if unreadable:
+        print(f"[WARN] {len(unreadable)} 個文件無法讀取，已跳過（如 {unreadable[0]}）")
+        kept = [(path, label) for path, label in zip(paths, labels) if hashes[path] is not None]
+        paths, labels = [path for path, _ in kept], [label for _, label in kept]
+    (train_paths, train_labels), (val_paths, val_labels) = split_files(data_dir, paths, labels, validation_split)
+    num_classes = len(class_indices)
+
+    cache_dir = Path(cache_dir) if cache_dir else default_cache_dir(data_dir)
+    store = FeatureStore(cache_dir / f"mobilenetv2-{target_size[0]}x{target_size[1]}")
+    train_keys = ensure_features(store, train_paths, [hashes[p] for p in train_paths], target_size,
+                                 augmentation=augmentation, augmented_views=augmented_views, refresh=refresh)
+    val_keys = ensure_features(store, val_paths, [hashes[p] for p in val_paths], target_size)
+
+    views = 1 + augmented_views
+    train_features = store.get([key for keys in train_keys for key in keys]).reshape(len(train_paths), views, -1)
+    val_features = store.get([keys[0] for keys in val_keys])
+
+    train_x = tf.convert_to_tensor(train_features)
+    train_y = tf.convert_to_tensor(_encode_labels(train_labels, num_classes, class_mode))
+    val_y = _encode_labels(val_labels, num_classes, class_mode)
+
+    def pick_view(features, label):
+        # 每個 epoch 為每個樣本隨機選一個視圖（原圖或增強視圖）
+        view = tf.random.uniform([], 0, views, dtype=tf.int32)
+        chosen = features[view]
+        if feature_noise > 0:
+            chosen = chosen * tf.random.normal(tf.shape(chosen), 1.0, feature_noise)
+        return chosen, label
+
+    def one_pass(pass_seed, skip, keys_only):
+        # 每輪按輪種子打亂樣本序號（樣本鍵），恢復時跳過已訓練的序號
+        count = len(train_paths)
+        dataset = tf.data.Dataset.range(count).shuffle(max(1, count), seed=pass_seed).skip(skip)
+        if keys_only:
+            return dataset
+        dataset = dataset.map(lambda i: pick_view(tf.gather(train_x, i), tf.gather(train_y, i)),
+                              num_parallel_calls=AUTOTUNE)
+        return dataset.batch(batch_size)
+
+    stream = EpochStream(one_pass, len(train_paths), batch_size, seed, lambda dataset: dataset.prefetch(AUTOTUNE))
+    val = tf.data.Dataset.from_tensor_slices((val_features, val_y)).batch(batch_size).prefetch(AUTOTUNE)
+    return (
+        FolderDataset(stream.first_pass(), len(train_paths), class_indices, batch_size, stream),
+        FolderDataset(val, len(val_paths), class_indices, batch_size),
+    )
+
+
+def build_head_model(model):
+    """
+    從 build_*_model 構造的完整模型（骨幹 + 池化 + 分類頭）中取出分類頭，接到特徵輸入上
+
+    分類頭與完整模型共享層對象，在特徵上訓練頭部即更新完整模型的權重，之後照常 model.save。
+    編譯參數（優化器、損失、指標）與完整模型相同。
+    """
+    pooling_index = next(
+        i for i, layer in enumerate(model.layers) if isinstance(layer, layers.GlobalAveragePooling2D)
+    )
+    inputs = keras.Input(shape=model.layers[pooling_index].output_shape[1:])
+    x = inputs
+    for layer in model.layers[pooling_index + 1:]:
+        x = layer(x)
+    head = keras.Model(inputs, x, name=f"{model.name}_head")
+    head.compile_from_config(model.get_compile_config())
+    return head
+
+
+def redirect_checkpoints(callbacks_list, full_model):
+    """讓 ModelCheckpoint 保存完整模型（而不是只有分類頭的訓練模型），best_model.h5 仍可直接用於推理"""
+    for callback in callbacks_list:
+        if isinstance(callback, keras.callbacks.ModelCheckpoint):
+            callback.set_model = lambda _model, callback=callback: keras.callbacks.Callback.set_model(
+                callback, full_model)
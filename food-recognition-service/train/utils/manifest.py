@@ -0,0 +1,182 @@
+"""
+數據集清單（manifest）：每張圖片的路徑、大小、修改時間、內容哈希、類別和尺寸，增量更新
+
+再次運行時只對大小或修改時間變化的文件重新計算哈希（多進程並行），
+下游（打包分片、特徵緩存、去重）按返回的 added / changed / removed 只處理變化的圖片。
+
+清單文件（默認 data/.manifest/<數據集名>.json）：
+    {
+        "version", "source": 數據目錄, "updated_at", "class_names": [類別],
+        "files": {相對路徑: {"label": 類別名, "size", "mtime_ns", "sha1", "width", "height"}}
+    }
+無法識別的圖片 width / height 為 None，並帶 "error"；讀取失敗的文件沒有 "sha1"。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from pathlib import Path
+
+from PIL import Image
+
+from .dataset_files import list_image_files
+
+MANIFEST_VERSION = 1
+
+
+def default_manifest_path(data_dir):
+    """默認清單路徑：數據目錄旁的 .manifest/<數據集名>.json（如 data/.manifest/level1-food-detection.json）"""
+    data_dir = Path(data_dir).resolve()
+    return data_dir.parent / '.manifest' / f"{data_dir.name}.json"
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _scan_task(path):
+    """計算內容哈希並只讀取圖片頭獲得尺寸（不解碼像素）"""
+    entry = {}
+    try:
+        entry['sha1'] = file_sha1(path)
+    except OSError as e:
+        entry.update(width=None, height=None, error=f"{type(e).__name__}: {e}")
+        return entry
+    try:
+        with Image.open(path) as image:
+            entry['width'], entry['height'] = image.size
+    except Exception as e:
+        entry.update(width=None, height=None, error=f"{type(e).__name__}: {e}")
+    return entry
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_manifest(manifest_path):
+    """讀取清單；不存在或版本不兼容時返回 None（下次更新時全量掃描）"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest_path, manifest):
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=manifest_path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def update_manifest(data_dir, manifest_path=None, workers=None, verify=False, save=True):
+    """
+    掃描數據目錄並增量更新清單
+
+    Args:
+        data_dir: 數據目錄（data_dir/<類別>/）
+        manifest_path: 清單路徑（默認 default_manifest_path）
+        workers: 計算哈希的進程數（默認 CPU 核數）
+        verify: 忽略大小 / 修改時間，重新計算所有文件的哈希
+        save: 有變化時寫回清單（False 時只返回結果）
+
+    Returns:
+        (manifest, changes)；changes 為 {"added", "changed", "removed": [相對路徑], "unchanged": 數量}，
+        只是修改時間變化而內容哈希不變的文件算作 unchanged
+    """
+    data_dir = Path(data_dir).resolve()
+    manifest_path = Path(manifest_path) if manifest_path else default_manifest_path(data_dir)
+    previous = load_manifest(manifest_path)
+    old_files = previous['files'] if previous else {}
+
+    # 清單包含隔離列表中的文件（scrub_dataset.py 每次重新檢查它們）
+    paths, labels, class_indices = list_image_files(data_dir, skip_quarantined=False)
+    class_names = list(class_indices)
+    relatives = [os.path.relpath(path, data_dir).replace(os.sep, '/') for path in paths]
+    # stat 在網絡盤上也有往返延遲，用線程並行
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        stats = list(pool.map(_stat, paths))
+
+    files, todo = {}, []
+    for path, relative, label, stat in zip(paths, relatives, labels, stats):
+        if stat is None:
+            continue  # 列舉後被刪除
+        size, mtime_ns = stat
+        entry = {'label': class_names[label], 'size': size, 'mtime_ns': mtime_ns}
+        old = old_files.get(relative)
+        if not verify and old and old['size'] == size and old['mtime_ns'] == mtime_ns and 'sha1' in old:
+            entry.update((key, old[key]) for key in ('sha1', 'width', 'height', 'error') if key in old)
+        else:
+            todo.append((relative, path))
+        files[relative] = entry
+
+    started = time.perf_counter()
+    if todo:
+        with Pool(processes=workers) as pool:
+            scanned = pool.imap(_scan_task, [path for _, path in todo], chunksize=16)
+            for (relative, _), result in zip(todo, scanned):
+                files[relative].update(result)
+        elapsed = time.perf_counter() - started
+        print(f"[INFO] 清單：掃描 {len(todo)} 張圖片，{elapsed:.1f}s（{len(todo) / max(elapsed, 1e-9):.1f} images/sec）")
+
+    changes = {'added': [], 'changed': [], 'removed': sorted(set(old_files) - set(files)), 'unchanged': 0}
+    for relative, entry in files.items():
+        old = old_files.get(relative)
+        if old is None:
+            changes['added'].append(relative)
+        elif old.get('sha1') != entry.get('sha1') or old['label'] != entry['label']:
+            changes['changed'].append(relative)
+        else:
+            changes['unchanged'] += 1
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'source': str(data_dir),
+        'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'class_names': class_names,
+        'files': files,
+    }
+    if save and (todo or changes['removed'] or previous is None or previous.get('class_names') != class_names):
+        save_manifest(manifest_path, manifest)
+    return manifest, changes
+
+
+def file_hashes(manifest, data_dir, paths):
+    """按絕對路徑取清單中的內容哈希（讀取失敗的文件為 None）"""
+    files = manifest['files']
+    return [files.get(os.path.relpath(path, data_dir).replace(os.sep, '/'), {}).get('sha1') for path in paths]
+
+
+def duplicate_groups(manifest):
+    """內容完全相同的圖片分組（每組至少兩個相對路徑）"""
+    groups = {}
+    for relative, entry in manifest['files'].items():
+        if entry.get('sha1'):
+            groups.setdefault(entry['sha1'], []).append(relative)
+    return [sorted(group) for group in groups.values() if len(group) > 1]
+
+
+def describe_changes(changes):
+    return (f"新增 {len(changes['added'])}、修改 {len(changes['changed'])}、"
+            f"刪除 {len(changes['removed'])}、未變 {changes['unchanged']}")
@@ -0,0 +1,236 @@
+"""
+讀取 packing.pack_dataset 打包的數據集（tf.data）
+
+- npy: mmap 分片，按批次收集行（同一分片內按行號排序，盡量順序訪問），不再解碼
+- tfrecord: 並行讀取 GZIP 分片，按索引中的劃分桶值過濾，訓練集用打亂緩衝區
+訓練 / 驗證劃分與 tf_dataset 相同（按相對路徑哈希），增強在整批上執行。
+訓練集是 tf_dataset.EpochStream：每輪順序只取決於 (seed, 輪次)，恢復時跳過已訓練的樣本。
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+from .dataset_files import load_quarantine, shard_items
+from .manifest import update_manifest
+from .packing import default_pack_dir, read_index
+from .tf_dataset import AUTOTUNE, EpochStream, FolderDataset, finish_batches
+
+# TFRecord 訓練集的打亂緩衝區（張數）和並行讀取的分片數（固定值：輸出順序與機器核數無關）
+SHUFFLE_BUFFER = 4096
+READERS = 4
+
+
+def _encode_labels(labels, num_classes, class_mode):
+    if class_mode == 'categorical':
+        return tf.one_hot(labels, num_classes)
+    if class_mode == 'binary':
+        return tf.cast(labels, tf.float32)
+    return labels
+
+
+def check_stale(index, data_dir):
+    """源目錄的圖片與打包時不一致（按增量清單比較內容哈希）時提示重新打包"""
+    if not data_dir or not os.path.isdir(data_dir):
+        return
+    manifest, _ = update_manifest(data_dir)
+    quarantined = load_quarantine(data_dir)
+    current = {relative: entry.get('sha1') for relative, entry in manifest['files'].items()
+               if relative not in quarantined}
+    packed = {sample['path']: sample['sha1'] for sample in index['samples']}
+    packed.update((item['path'], item.get('sha1')) for item in index.get('failed', []))
+    added = len(current.keys() - packed.keys())
+    removed = len(packed.keys() - current.keys())
+    changed = sum(1 for relative in current.keys() & packed.keys() if current[relative] != packed[relative])
+    if added or removed or changed:
+        print(f"[WARN] 打包數據已過期：新增 {added}、修改 {changed}、刪除 {removed} 張圖片"
+              f"（打包於 {index.get('packed_at')}），請重新運行 pack_dataset.py（只會處理變化的圖片）")
+
+
+class _NpyGather:
+    """按全局樣本序號從 mmap 分片中收集一批圖像"""
+
+    def __init__(self, pack_dir, index, sample_ids):
+        self.shards = [np.load(os.path.join(pack_dir, shard['file']), mmap_mode='r') for shard in index['shards']]
+        samples = index['samples']
+        self.shard_of = np.array([samples[i]['shard'] for i in sample_ids], dtype=np.int64)
+        self.row_of = np.array([samples[i]['row'] for i in sample_ids], dtype=np.int64)
+        self.image_shape = tuple(index['image_size']) + (3,)
+
+    def __call__(self, positions):
+        out = np.empty((len(positions),) + self.image_shape, dtype=np.uint8)
+        shard_ids = self.shard_of[positions]
+        for shard in np.unique(shard_ids):
+            selected = np.nonzero(shard_ids == shard)[0]
+            rows = self.row_of[positions[selected]]
+            order = np.argsort(rows)
+            out[selected[order]] = self.shards[shard][rows[order]]
+        return out
+
+
+def _npy_loader(pack_dir, index, sample_ids, num_classes, class_mode):
+    """按批次位置（sample_ids 中的序號）收集圖像和標籤"""
+    gather = _NpyGather(pack_dir, index, sample_ids)
+    labels = np.array([index['samples'][i]['label'] for i in sample_ids], dtype=np.int64)
+    image_shape = gather.image_shape
+
+    def load(positions):
+        images = tf.numpy_function(gather, [positions], tf.uint8)
+        images.set_shape((None,) + image_shape)
+        return images, _encode_labels(tf.gather(labels, positions), num_classes, class_mode)
+
+    return load
+
+
+def _npy_dataset(pack_dir, index, sample_ids, num_classes, class_mode, batch_size):
+    """驗證集：按順序讀取"""
+    load = _npy_loader(pack_dir, index, sample_ids, num_classes, class_mode)
+    dataset = tf.data.Dataset.range(len(sample_ids))
+    return finish_batches(dataset.batch(batch_size).map(load, num_parallel_calls=AUTOTUNE), False, None)
+
+
+def _npy_stream(pack_dir, index, sample_ids, num_classes, class_mode, batch_size, augmentation, seed):
+    """訓練集：每輪按輪種子打亂樣本序號（樣本鍵），跳過已訓練的序號後再收集圖像"""
+    load = _npy_loader(pack_dir, index, sample_ids, num_classes, class_mode)
+    count = len(sample_ids)
+
+    def one_pass(pass_seed, skip, keys_only):
+        dataset = tf.data.Dataset.range(count).shuffle(max(1, count), seed=pass_seed).skip(skip)
+        if keys_only:
+            return dataset
+        return dataset.batch(batch_size).map(load, num_parallel_calls=AUTOTUNE)
+
+    return EpochStream(one_pass, count, batch_size, seed, lambda dataset: finish_batches(dataset, True, augmentation))
+
+
+def _tfrecord_parser(index):
+    height, width = index['image_size']
+    features = {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.int64),
+        'bucket': tf.io.FixedLenFeature([], tf.float32),
+    }
+
+    def parse(record):
+        example = tf.io.parse_single_example(record, features)
+        image = tf.reshape(tf.io.decode_raw(example['image'], tf.uint8), (height, width, 3))
+        return image, example['label'], example['bucket']
+
+    return parse
+
+
+def _tfrecord_dataset(pack_dir, index, validation_split, num_classes, class_mode, batch_size, shard=None):
+    """驗證集：讀取全部分片，按劃分桶值過濾後緩存"""
+    files = [os.path.join(pack_dir, shard['file']) for shard in index['shards']]
+    files_dataset = tf.data.Dataset.from_tensor_slices(files)
+    if shard and shard[0] > 1:
+        # 每個分片內按記錄序號取本 worker 的一份（與讀取順序無關，各 worker 互不重疊）
+        dataset = files_dataset.interleave(
+            lambda path: tf.data.TFRecordDataset(path, compression_type='GZIP').shard(*shard),
+            cycle_length=READERS, num_parallel_calls=AUTOTUNE)
+    else:
+        dataset = tf.data.TFRecordDataset(files_dataset, compression_type='GZIP', num_parallel_reads=AUTOTUNE)
+    dataset = dataset.map(_tfrecord_parser(index), num_parallel_calls=AUTOTUNE)
+    dataset = dataset.filter(lambda image, label, bucket: bucket < validation_split)
+    dataset = dataset.map(lambda image, label, bucket: (image, label)).cache()
+    dataset = dataset.batch(batch_size).map(
+        lambda images, labels: (images, _encode_labels(labels, num_classes, class_mode)))
+    return finish_batches(dataset, False, None)
+
+
+def _tfrecord_stream(pack_dir, index, validation_split, num_classes, class_mode, batch_size, augmentation, seed,
+                     shard=None):
+    """
+    訓練集：每輪按輪種子打亂分片順序，固定數量的分片並行順序讀取，經打亂緩衝區後跳過已訓練的樣本
+
+    樣本鍵為 分片序號 << 32 | 行號。校驗時按索引中各分片的行號和劃分桶值重放同樣的讀取順序，不讀取分片。
+    """
+    files = tf.constant([os.path.join(pack_dir, shard['file']) for shard in index['shards']])
+    workers, worker = shard if shard and shard[0] > 1 else (1, 0)
+    parse = _tfrecord_parser(index)
+    # 每個分片的記錄與索引中的行號一一對應（打包時按行號順序寫入）
+    by_file = sorted((sample['shard'], sample['row'], sample['bucket']) for sample in index['samples'])
+    starts = tf.constant(np.searchsorted([number for number, _, _ in by_file], np.arange(len(index['shards']) + 1)),
+                         dtype=tf.int64)
+    keys = tf.constant([(number << 32) | row for number, row, _ in by_file], dtype=tf.int64)
+    buckets = np.array([bucket for _, _, bucket in by_file], dtype=np.float32)
+    # 與記錄中的 float32 劃分桶值按同樣的精度比較
+    in_train = buckets >= np.float32(validation_split)
+    samples = int(sum(1 for (_, row, _), train in zip(by_file, in_train) if train and row % workers == worker))
+    buckets = tf.constant(buckets)
+
+    def records(number):
+        dataset = tf.data.TFRecordDataset(files[number], compression_type='GZIP').enumerate()
+        dataset = dataset.shard(workers, worker).map(
+            lambda row, record: (tf.bitwise.bitwise_or(tf.bitwise.left_shift(number, 32), row),) + parse(record))
+        return dataset.filter(lambda key, image, label, bucket: bucket >= validation_split)
+
+    def record_keys(number):
+        dataset = tf.data.Dataset.range(starts[number], starts[number + 1]).shard(workers, worker)
+        dataset = dataset.map(lambda i: (tf.gather(keys, i), tf.gather(buckets, i)))
+        return dataset.filter(lambda key, bucket: bucket >= validation_split)
+
+    def one_pass(pass_seed, skip, keys_only):
+        numbers = tf.data.Dataset.range(len(index['shards'])).shuffle(len(index['shards']), seed=pass_seed)
+        dataset = numbers.interleave(record_keys if keys_only else records, cycle_length=READERS,
+                                     num_parallel_calls=AUTOTUNE)
+        dataset = dataset.shuffle(SHUFFLE_BUFFER, seed=pass_seed).skip(skip)
+        if keys_only:
+            return dataset.map(lambda key, bucket: key)
+        dataset = dataset.map(lambda key, image, label, bucket: (image, label))
+        return dataset.batch(batch_size).map(
+            lambda images, labels: (images, _encode_labels(labels, num_classes, class_mode)))
+
+    return EpochStream(one_pass, samples, batch_size, seed, lambda dataset: finish_batches(dataset, True, augmentation))
+
+
+def load_packed_datasets(pack_dir, class_mode='categorical', batch_size=32, validation_split=0.2,
+                         augmentation=None, data_dir=None, seed=42, shard=None):
+    """
+    從打包目錄構造訓練和驗證集
+
+    Args:
+        pack_dir: 打包目錄（pack_dataset.py 的輸出）
+        class_mode: 'categorical'、'binary' 或 'sparse'
+        batch_size: 批次大小
+        validation_split: 驗證集比例（與 tf_dataset 的劃分一致）
+        augmentation: 訓練集增強參數（ImageDataGenerator 同名參數，整批執行）
+        data_dir: 源數據目錄（提供時檢查打包是否過期）
+        seed: 打亂順序的隨機種子
+        shard: 多 worker 訓練時的 (worker 數, 本 worker 序號)；samples 仍為全部樣本數
+
+    Returns:
+        (train: FolderDataset, val: FolderDataset)
+    """
+    pack_dir = str(pack_dir)
+    index = read_index(pack_dir)
+    check_stale(index, data_dir)
+    class_indices = index['class_indices']
+    num_classes = len(class_indices)
+
+    samples = index['samples']
+    val_ids = [i for i, sample in enumerate(samples) if sample['bucket'] < validation_split]
+    train_ids = [i for i, sample in enumerate(samples) if sample['bucket'] >= validation_split]
+
+    if index['format'] == 'npy':
+        stream = _npy_stream(pack_dir, index, shard_items(train_ids, shard), num_classes, class_mode, batch_size,
+                             augmentation, seed)
+        val = _npy_dataset(pack_dir, index, shard_items(val_ids, shard), num_classes, class_mode, batch_size)
+    else:
+        stream = _tfrecord_stream(pack_dir, index, validation_split, num_classes, class_mode, batch_size,
+                                  augmentation, seed, shard)
+        val = _tfrecord_dataset(pack_dir, index, validation_split, num_classes, class_mode, batch_size, shard)
+    return (
+        FolderDataset(stream.first_pass(), len(train_ids), class_indices, batch_size, stream),
+        FolderDataset(val, len(val_ids), class_indices, batch_size),
+    )
+
+
+def load_packed_for(data_dir, **kwargs):
+    """按數據目錄找到默認打包目錄（packing.default_pack_dir）並讀取"""
+    pack_dir = default_pack_dir(data_dir)
+    if not (Path(pack_dir) / 'index.json').exists():
+        raise FileNotFoundError(
+            f"找不到打包數據: {pack_dir}，請先運行 python train/pack_dataset.py {data_dir}")
+    return load_packed_datasets(pack_dir, data_dir=data_dir, **kwargs)
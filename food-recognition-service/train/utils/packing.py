@@ -0,0 +1,311 @@
+"""
+數據集打包：把 data_dir/<類別>/ 下的零散圖片一次性解碼、縮放，寫成分片和索引
+
+訓練時每個 epoch 都要重新讀盤、解碼 JPEG 並縮放到 224×224，在網絡盤上尤其慢。
+打包後讀取只是順序 / mmap 訪問，epoch 時間由計算決定。
+
+兩種格式：
+- npy: 未壓縮 uint8 [N, H, W, 3] 分片，mmap 讀取，最快（每張 224×224 約 147KB）
+- tfrecord: GZIP 壓縮的 TFRecord，每條記錄為 uint8 像素，體積小，適合網絡盤（需要 TensorFlow）
+
+再次打包（npy）時按 manifest 增量清單只解碼新增和修改的圖片，寫入新分片；未變化的圖片保留在原分片中。
+
+打包目錄結構：
+    <out_dir>/
+        index.json            見 pack_dataset 的返回值
+        shard-00000.npy | shard-00000.tfrecord.gz
+"""
+import json
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .dataset_files import load_quarantine, split_bucket
+from .manifest import describe_changes, update_manifest
+
+PACK_FORMATS = ('npy', 'tfrecord')
+INDEX_VERSION = 2
+# 增量打包時失效行超過此比例則整體重打包
+COMPACT_RATIO = 0.3
+
+
+def default_pack_dir(data_dir):
+    """默認打包目錄：數據目錄旁的 .packed/<數據集名>（如 data/.packed/level1-food-detection）"""
+    data_dir = Path(data_dir).resolve()
+    return data_dir.parent / '.packed' / data_dir.name
+
+
+def load_image_uint8(path, target_size):
+    """
+    解碼並縮放為 uint8 RGB（灰度、RGBA、CMYK、調色板圖片統一轉換）
+
+    Args:
+        path: 圖片路徑
+        target_size: (高, 寬)
+
+    Returns:
+        uint8 [高, 寬, 3]
+    """
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        image = image.resize((target_size[1], target_size[0]), Image.BILINEAR)
+        return np.asarray(image, dtype=np.uint8)
+
+
+def _load_task(args):
+    path, target_size = args
+    try:
+        return load_image_uint8(path, target_size), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _atomic_path(final_path):
+    """在目標目錄創建臨時文件路徑（寫完後 os.replace 到 final_path）"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), prefix='.tmp-')
+    os.close(fd)
+    return tmp_path
+
+
+class _NpyShardWriter:
+    suffix = '.npy'
+
+    def __init__(self, path, count, target_size):
+        self.path = path
+        self.tmp_path = _atomic_path(path)
+        self.array = np.lib.format.open_memmap(
+            self.tmp_path, mode='w+', dtype=np.uint8, shape=(count, target_size[0], target_size[1], 3))
+
+    def write(self, row, image, label, relative_path):
+        self.array[row] = image
+
+    def close(self, count):
+        self.array.flush()
+        if count < self.array.shape[0]:
+            # 有圖片解碼失敗時，截斷為實際寫入的行數
+            truncated = _atomic_path(self.path)
+            with open(truncated, 'wb') as f:
+                np.save(f, np.ascontiguousarray(self.array[:count]))
+            del self.array
+            os.unlink(self.tmp_path)
+            os.replace(truncated, self.path)
+        else:
+            del self.array
+            os.replace(self.tmp_path, self.path)
+
+
+class _TFRecordShardWriter:
+    suffix = '.tfrecord.gz'
+
+    def __init__(self, path, count, target_size):
+        import tensorflow as tf
+
+        self.tf = tf
+        self.path = path
+        self.tmp_path = _atomic_path(path)
+        self.writer = tf.io.TFRecordWriter(self.tmp_path, options='GZIP')
+
+    def write(self, row, image, label, relative_path):
+        tf = self.tf
+        feature = {
+            'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+            'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+            'bucket': tf.train.Feature(float_list=tf.train.FloatList(value=[split_bucket(relative_path)])),
+        }
+        example = tf.train.Example(features=tf.train.Features(feature=feature))
+        self.writer.write(example.SerializeToString())
+
+    def close(self, count):
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def write_index(out_dir, index):
+    path = os.path.join(out_dir, 'index.json')
+    tmp_path = _atomic_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_index(pack_dir):
+    with open(os.path.join(pack_dir, 'index.json'), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError(f"打包索引版本不兼容: {index.get('version')}（需要 {INDEX_VERSION}），請重新打包")
+    return index
+
+
+def _write_shards(out_dir, writer_class, jobs, first_shard, target_size, shard_size, workers):
+    """
+    解碼 jobs（[(相對路徑, 絕對路徑, 類別索引)]）並寫入新分片
+
+    Returns:
+        (shards: [{"file", "count"}], placed: {相對路徑: (分片文件, 行)}, failed: {相對路徑: 錯誤})
+    """
+    shards, placed, failed = [], {}, {}
+    if not jobs:
+        return shards, placed, failed
+    with Pool(processes=workers) as pool:
+        for offset, start in enumerate(range(0, len(jobs), shard_size)):
+            chunk = jobs[start:start + shard_size]
+            name = f"shard-{first_shard + offset:05d}{writer_class.suffix}"
+            writer = writer_class(str(out_dir / name), len(chunk), target_size)
+            row = 0
+            tasks = [(path, tuple(target_size)) for _, path, _ in chunk]
+            for (relative, _, label), (image, error) in zip(chunk, pool.imap(_load_task, tasks, chunksize=16)):
+                if error is not None:
+                    failed[relative] = error
+                    continue
+                writer.write(row, image, label, relative)
+                placed[relative] = (name, row)
+                row += 1
+            writer.close(row)
+            shards.append({'file': name, 'count': row})
+            print(f"[INFO] 分片 {name}: {row} 張（累計 {start + len(chunk)}/{len(jobs)}）")
+    return shards, placed, failed
+
+
+def _reusable_rows(previous, files, fmt, target_size):
+    """
+    上一次打包中可以原樣保留的行：格式和尺寸相同、內容哈希未變
+
+    TFRecord 讀取時會遍歷分片中的全部記錄，無法跳過已刪除 / 修改的舊記錄，因此總是全量重打包。
+
+    Returns:
+        ({相對路徑: (分片文件, 行)}, {相對路徑: 錯誤}) 或 None（需要全量打包）
+    """
+    if not previous or fmt != 'npy' or previous['format'] != fmt or previous['image_size'] != list(target_size):
+        return None
+    shard_files = [shard['file'] for shard in previous['shards']]
+    reuse = {
+        sample['path']: (shard_files[sample['shard']], sample['row'])
+        for sample in previous['samples']
+        if files.get(sample['path'], {}).get('sha1') == sample['sha1']
+    }
+    failed = {
+        item['path']: item['error'] for item in previous['failed']
+        if item.get('sha1') and files.get(item['path'], {}).get('sha1') == item['sha1']
+    }
+    # 失效行（已刪除或修改的圖片）太多時整體重打包，避免分片中大量無用數據
+    total_rows = sum(shard['count'] for shard in previous['shards'])
+    if total_rows and total_rows - len(reuse) > COMPACT_RATIO * total_rows:
+        print(f"[INFO] 分片中 {total_rows - len(reuse)}/{total_rows} 行已失效，重新打包全部圖片")
+        return None
+    return reuse, failed
+
+
+def pack_dataset(data_dir, out_dir=None, fmt='npy', target_size=(224, 224), shard_size=4096, workers=None,
+                 incremental=True):
+    """
+    打包數據集
+
+    Args:
+        data_dir: 數據目錄（data_dir/<類別>/）
+        out_dir: 輸出目錄（默認 default_pack_dir）
+        fmt: 'npy' 或 'tfrecord'
+        target_size: (高, 寬)
+        shard_size: 每個分片的圖片數
+        workers: 解碼進程數（默認 CPU 核數）
+        incremental: 按 manifest 清單只打包新增和修改的圖片，寫入新分片（僅 npy）；
+                     已刪除 / 修改圖片的舊行留在原分片中不再被索引引用
+
+    Returns:
+        index（另寫入 out_dir/index.json）：
+        {
+            "version", "format", "image_size": [高, 寬], "source": 數據目錄, "class_indices",
+            "shards": [{"file", "count"}],
+            "samples": [{"path": 相對路徑, "label", "bucket": 劃分桶值, "sha1", "shard", "row"}],
+            "failed": [{"path", "sha1", "error"}]
+        }
+    """
+    if fmt not in PACK_FORMATS:
+        raise ValueError(f"不支持的打包格式: {fmt}（可選 {', '.join(PACK_FORMATS)}）")
+    data_dir = Path(data_dir).resolve()
+    out_dir = Path(out_dir) if out_dir else default_pack_dir(data_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    manifest, changes = update_manifest(data_dir, workers=workers)
+    print(f"[INFO] 數據清單: {describe_changes(changes)}")
+    quarantined = load_quarantine(data_dir)
+    files = {relative: entry for relative, entry in manifest['files'].items() if relative not in quarantined}
+    if quarantined:
+        print(f"[INFO] 跳過隔離列表中的 {len(manifest['files']) - len(files)} 張圖片")
+    if not files:
+        raise ValueError(f"數據目錄中沒有圖片: {data_dir}")
+    class_indices = {name: index for index, name in enumerate(manifest['class_names'])}
+
+    previous = None
+    if incremental and (out_dir / 'index.json').exists():
+        try:
+            previous = read_index(str(out_dir))
+        except ValueError as e:
+            print(f"[INFO] {e}")
+    reusable = _reusable_rows(previous, files, fmt, target_size)
+    reuse, old_failed = reusable if reusable else ({}, {})
+
+    jobs = [
+        (relative, str(data_dir / relative), class_indices[entry['label']])
+        for relative, entry in files.items()
+        if 'sha1' in entry and relative not in reuse and relative not in old_failed
+    ]
+    if reusable:
+        print(f"[INFO] 增量打包：保留 {len(reuse)} 張，需要打包 {len(jobs)} 張")
+
+    writer_class = _NpyShardWriter if fmt == 'npy' else _TFRecordShardWriter
+    kept_files = sorted({shard_file for shard_file, _ in reuse.values()})
+    counts = {shard['file']: shard['count'] for shard in previous['shards']} if reusable else {}
+    used_numbers = [int(name.split('-')[1].split('.')[0]) for name in kept_files]
+    first_shard = max(used_numbers) + 1 if used_numbers else 0
+    new_shards, placed, failed = _write_shards(out_dir, writer_class, jobs, first_shard, target_size,
+                                               shard_size, workers)
+
+    shards = [{'file': name, 'count': counts[name]} for name in kept_files] + new_shards
+    shard_numbers = {shard['file']: number for number, shard in enumerate(shards)}
+    placed.update(reuse)
+    failed.update(old_failed)
+    samples, failed_list = [], []
+    for relative, entry in files.items():
+        if relative in placed:
+            shard_file, row = placed[relative]
+            samples.append({
+                'path': relative,
+                'label': class_indices[entry['label']],
+                'bucket': split_bucket(relative),
+                'sha1': entry['sha1'],
+                'shard': shard_numbers[shard_file],
+                'row': row,
+            })
+        else:
+            failed_list.append({'path': relative, 'sha1': entry.get('sha1'),
+                                'error': failed.get(relative) or entry.get('error', 'unreadable')})
+
+    index = {
+        'version': INDEX_VERSION,
+        'format': fmt,
+        'image_size': list(target_size),
+        'source': str(data_dir),
+        'class_indices': class_indices,
+        'packed_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'shards': shards,
+        'samples': samples,
+        'failed': failed_list,
+    }
+    write_index(str(out_dir), index)
+
+    # 先寫索引再清理：不再被引用的舊分片（上一次打包或全部行已失效）
+    current = {shard['file'] for shard in shards}
+    for entry in os.listdir(out_dir):
+        if entry.startswith('shard-') and entry not in current:
+            os.unlink(out_dir / entry)
+
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] 打包完成: {len(samples)} 張（本次解碼 {len(jobs)} 張），{len(failed_list)} 張無法解碼，"
+          f"{elapsed:.1f}s")
+    return index
@@ -0,0 +1,173 @@
+"""
+並行訓練調度：每個任務在獨立的子進程（spawn）中運行，同時運行的任務數和每個任務的 CPU 線程數受限
+
+- 子進程在導入 TensorFlow 之前設置線程相關的環境變量（OMP / MKL / OpenBLAS / TF_NUM_*_THREADS），
+  之後 trainer.configure_runtime 和 tf.data 私有線程池按同一預算限制，多個任務不會爭搶全部核心
+- 每個任務一個全新進程：結束後 TensorFlow 佔用的內存和線程全部釋放
+- 多個任務時各自的輸出寫入日誌文件，調度進程只打印開始 / 結束和最後的匯總
+- 不導入 TensorFlow（調度進程本身不初始化 TensorFlow 運行時）
+"""
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import traceback
+from pathlib import Path
+
+# 中斷時等待子進程保存檢查點的秒數，超時後強制結束
+TERMINATE_TIMEOUT = 60
+
+
+def default_threads_per_job(parallel, cpu_count=None):
+    """同時運行 parallel 個任務時每個任務的 CPU 線程預算（均分 CPU 核數，至少 1）"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return max(1, cpu_count // max(1, parallel))
+
+
+def thread_environment(threads):
+    """限制數值庫和 TensorFlow 線程池大小的環境變量（必須在導入這些庫之前設置）"""
+    threads = str(threads)
+    return {
+        'OMP_NUM_THREADS': threads,
+        'MKL_NUM_THREADS': threads,
+        'OPENBLAS_NUM_THREADS': threads,
+        'TF_NUM_INTRAOP_THREADS': threads,
+        'TF_NUM_INTEROP_THREADS': str(max(1, int(threads) // 4)),
+    }
+
+
+def _job_main(job, log_path, results):
+    """子進程入口：設置線程預算 → 重定向輸出 → 初始化 TensorFlow → 訓練"""
+    os.environ.update(thread_environment(job['threads']))
+    if job.get('gpu') is not None:
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(job['gpu'])
+    if log_path:
+        log = open(log_path, 'w', encoding='utf-8', buffering=1)
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        sys.stdout = sys.stderr = log
+    try:
+        from .trainer import configure_runtime, train_job
+
+        configure_runtime(job['threads'])
+        summary = train_job(job)
+    except BaseException as e:
+        traceback.print_exc()
+        summary = {'name': job['name'], 'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+    sys.stdout.flush()
+    results.put((job['name'], summary))
+
+
+def run_jobs(jobs, parallel=1, threads_per_job=None, gpus=None, log_dir=None):
+    """
+    並行運行訓練任務
+
+    Args:
+        jobs: train_config.expand_jobs 的結果
+        parallel: 同時運行的任務數
+        threads_per_job: 每個任務的 CPU 線程數（None 時按 CPU 核數均分）
+        gpus: GPU 編號列表；同時運行的任務按槽位輪流分配（None 時不設置 CUDA_VISIBLE_DEVICES）
+        log_dir: 日誌目錄；多個任務時每個任務寫入 <log_dir>/<任務名>.log，單個任務時直接輸出到終端
+
+    Returns:
+        按 jobs 順序的任務摘要列表（train_job 的返回值，另加 wall_seconds、threads、log、exitcode）
+    """
+    parallel = max(1, min(parallel, len(jobs)))
+    threads = threads_per_job or default_threads_per_job(parallel)
+    to_log = log_dir is not None and len(jobs) > 1
+    if to_log:
+        Path(log_dir).mkdir(parents=True, exist_ok=True)
+
+    context = mp.get_context('spawn')
+    results = context.Queue()
+    pending = list(jobs)
+    running = {}  # 任務名 → (進程, 槽位, 開始時間, 日誌路徑)
+    free_slots = list(range(parallel))
+    summaries = {}
+
+    def finish(name, summary):
+        process, slot, started, log_path = running.pop(name)
+        process.join()
+        free_slots.append(slot)
+        summary = dict(summary or {'name': name, 'status': 'failed', 'error': f"進程退出碼 {process.exitcode}"})
+        summary.update(wall_seconds=round(time.perf_counter() - started, 1), threads=threads,
+                       log=log_path, exitcode=process.exitcode)
+        summaries[name] = summary
+        detail = summary.get('error') or summary.get('reason') or ''
+        print(f"[INFO] 完成 {name}: {summary['status']}，{summary['wall_seconds']}s"
+              + (f"（{detail}）" if detail else '') + f"  [{len(summaries)}/{len(jobs)}]")
+
+    try:
+        while pending or running:
+            while pending and free_slots:
+                job = dict(pending.pop(0))
+                slot = free_slots.pop(0)
+                job.update(threads=threads, gpu=gpus[slot % len(gpus)] if gpus else None,
+                           verbose=2 if to_log else 1)
+                log_path = str(Path(log_dir) / f"{job['name']}.log") if to_log else None
+                process = context.Process(target=_job_main, args=(job, log_path, results), name=job['name'])
+                process.start()
+                running[job['name']] = (process, slot, time.perf_counter(), log_path)
+                print(f"[INFO] 開始 {job['name']}（{threads} 線程"
+                      + (f"，GPU {job['gpu']}" if job['gpu'] is not None else '')
+                      + (f"，日誌 {log_path}" if log_path else '') + '）')
+            try:
+                name, summary = results.get(timeout=1.0)
+                if name in running:
+                    finish(name, summary)
+            except queue.Empty:
+                # 子進程異常退出（如被 OOM 終止）時不會返回結果
+                for name, (process, *_rest) in list(running.items()):
+                    if not process.is_alive() and process.exitcode != 0:
+                        finish(name, None)
+    except KeyboardInterrupt:
+        print("[WARN] 已中斷，終止所有訓練進程（各任務保存檢查點後退出，用 --resume 繼續）")
+        for process, *_rest in running.values():
+            process.terminate()
+        # 給子進程時間寫完當前批次的檢查點
+        for process, *_rest in running.values():
+            process.join(timeout=TERMINATE_TIMEOUT)
+            if process.is_alive():
+                process.kill()
+        raise
+    return [summaries[job['name']] for job in jobs]
+
+
+def format_summary(summaries, wall_seconds):
+    """
+    匯總表：每個任務的狀態、耗時、epoch 數、穩態訓練吞吐量、最佳指標，以及整體吞吐量
+
+    Returns:
+        (文本行列表, 整體統計字典)
+    """
+    lines = [f"{'任務':24s} {'狀態':8s} {'耗時(s)':>9s} {'epochs':>6s} {'images/sec':>10s}  最佳指標"]
+    for summary in summaries:
+        rate = (summary.get('images_per_sec') or {}).get('steady')
+        best = ', '.join(f"{key}={value:.4f}" for key, value in (summary.get('best') or {}).items())
+        lines.append(f"{summary['name']:24s} {summary['status']:8s} {summary['wall_seconds']:9.1f} "
+                     f"{summary.get('epochs', '-')!s:>6s} {rate if rate is not None else '-'!s:>10s}  {best}")
+    images = sum(summary.get('train_images', 0) for summary in summaries)
+    serial_seconds = sum(summary['wall_seconds'] for summary in summaries)
+    totals = {
+        'jobs': len(summaries),
+        'succeeded': sum(1 for summary in summaries if summary['status'] == 'ok'),
+        'wall_seconds': round(wall_seconds, 1),
+        'sum_job_seconds': round(serial_seconds, 1),
+        # 各任務耗時之和 / 總耗時：並行帶來的加速
+        'concurrency': round(serial_seconds / wall_seconds, 2) if wall_seconds > 0 else None,
+        'train_images': images,
+        'images_per_sec': round(images / wall_seconds, 1) if wall_seconds > 0 else None,
+    }
+    lines.append(f"總耗時 {totals['wall_seconds']}s（各任務合計 {totals['sum_job_seconds']}s，"
+                 f"並行度 {totals['concurrency']}x），整體訓練吞吐量 {totals['images_per_sec']} images/sec，"
+                 f"成功 {totals['succeeded']}/{totals['jobs']}")
+    return lines, totals
+
+
+def write_summary(path, payload):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,374 @@
+"""
+數據集清洗：多進程檢查每張圖片能否完整解碼、規範化問題格式，用感知哈希找出重複圖和訓練 / 驗證集洩漏
+
+- 完整解碼（verify + load），截斷的 JPEG、損壞的文件進入隔離列表
+- CMYK、帶透明通道、調色板、16 位等格式：fix=True 時轉為 RGB 按擴展名重新編碼（原文件備份），
+  TensorFlow 解碼不了的格式（如擴展名為 .jpg 的 WebP）未修復時進入隔離列表
+- 64 位 pHash（32×32 灰度 DCT 的低頻 8×8），分塊向量化計算所有圖片兩兩之間的漢明距離，
+  距離不超過閾值的視為重複：同類別重複只保留分辨率最高的一張，跨類別重複（標籤衝突）全部隔離
+- 檢查結果按內容 SHA-1 緩存，再次運行只檢查 manifest 中新增或修改的圖片
+
+輸出的隔離列表（dataset_files.default_quarantine_path）被 list_image_files、打包和
+filter_directory_iterator（ImageDataGenerator 路徑）共同遵守。
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .dataset_files import default_quarantine_path, in_validation_split
+from .manifest import describe_changes, update_manifest
+
+SCAN_CACHE_VERSION = 1
+# 默認的重複判定閾值（64 位 pHash 的漢明距離）
+DEFAULT_THRESHOLD = 6
+# tf.io.decode_image 支持的格式
+TF_FORMATS = ('JPEG', 'PNG', 'BMP', 'GIF')
+# 按擴展名重新編碼時使用的格式
+EXTENSION_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.bmp': 'BMP', '.gif': 'GIF'}
+# 這些問題可以通過轉 RGB 重新編碼修復
+FIXABLE_ISSUES = ('cmyk', 'alpha', 'palette', 'high_bit_depth', 'unusual_mode', 'unsupported_format')
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix(size=32):
+    """DCT-II 正交矩陣：D = C @ X @ C.T"""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def perceptual_hash(image):
+    """
+    64 位 pHash
+
+    Args:
+        image: PIL RGB 圖像
+
+    Returns:
+        16 位十六進制字符串
+    """
+    gray = np.asarray(image.convert('L').resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    matrix = _dct_matrix(32)
+    low = (matrix @ gray @ matrix.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).tobytes().hex()
+
+
+def _format_issues(image):
+    mode = image.mode
+    issues = []
+    if mode == 'CMYK':
+        issues.append('cmyk')
+    elif mode in ('RGBA', 'LA', 'PA') or (mode == 'P' and 'transparency' in image.info):
+        issues.append('alpha')
+    elif mode == 'P':
+        issues.append('palette')
+    elif mode in ('I', 'I;16', 'I;16B', 'I;16L', 'F'):
+        issues.append('high_bit_depth')
+    elif mode not in ('RGB', 'L', '1'):
+        issues.append('unusual_mode')
+    if image.format not in TF_FORMATS:
+        issues.append('unsupported_format')
+    return issues
+
+
+def to_rgb(image):
+    """問題格式統一轉為 8 位 RGB（透明區域按白色背景合成）"""
+    if image.mode in ('I', 'I;16', 'I;16B', 'I;16L', 'F'):
+        array = np.asarray(image, dtype=np.float64)
+        peak = array.max() or 1.0
+        scale = 255.0 / (65535.0 if peak > 255 else 255.0)
+        image = Image.fromarray(np.clip(array * scale, 0, 255).astype(np.uint8), 'L')
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA', 'PA'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert('RGB')
+
+
+def _normalize_file(path, relative, image, backup_dir):
+    """備份原文件，把 RGB 圖像按擴展名對應的格式原子寫回原路徑"""
+    backup = Path(backup_dir) / relative
+    backup.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(path, backup)
+    fmt = EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), 'JPEG')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, format=fmt, **({'quality': 95} if fmt == 'JPEG' else {}))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _failure(error):
+    """
+    打開或解碼失敗的檢查結果
+
+    PIL 對截斷的文件在 verify 時報 "Truncated File Read"，在 load 時報 "image file is truncated"，都歸為 truncated
+    """
+    kind = 'truncated' if isinstance(error, OSError) and 'truncated' in str(error).lower() else 'corrupt'
+    return {'issues': [kind], 'phash': None, 'fixed': False, 'error': f"{type(error).__name__}: {error}"}
+
+
+def inspect_image(path, relative=None, fix=False, backup_dir=None):
+    """
+    檢查一張圖片
+
+    Args:
+        path: 圖片路徑
+        relative: 相對路徑（fix 時用於備份路徑）
+        fix: 把問題格式轉為 RGB 寫回原文件
+        backup_dir: fix 時原文件的備份目錄
+
+    Returns:
+        {"issues": [問題], "phash": 十六進制或 None, "fixed": bool, "error"?}
+        issues 可能包含 corrupt、truncated 和 FIXABLE_ISSUES 中的格式問題
+    """
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with Image.open(path) as image:
+            image.load()
+            issues = _format_issues(image)
+            rgb = to_rgb(image)
+    except Exception as e:
+        return _failure(e)
+
+    fixed = False
+    if fix and issues:
+        _normalize_file(path, relative or os.path.basename(path), rgb, backup_dir)
+        fixed = True
+    return {'issues': issues, 'phash': perceptual_hash(rgb), 'fixed': fixed}
+
+
+def _inspect_task(args):
+    return inspect_image(*args)
+
+
+@lru_cache(maxsize=1)
+def _popcount16():
+    values = np.arange(1 << 16, dtype=np.uint32)
+    table = np.zeros(1 << 16, dtype=np.uint8)
+    for bit in range(16):
+        table += ((values >> bit) & 1).astype(np.uint8)
+    return table
+
+
+def hamming_pairs(hashes, threshold, block_elements=1 << 22):
+    """
+    找出漢明距離不超過 threshold 的所有哈希對（i < j）
+
+    按行分塊，每塊與其後所有哈希做異或並查表計算 popcount，峰值內存約 block_elements × 25 字節。
+
+    Args:
+        hashes: uint64 數組
+        threshold: 距離閾值
+        block_elements: 每塊異或矩陣的元素數上限
+
+    Returns:
+        (i, j, distance) 三個數組
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    count = len(hashes)
+    table = _popcount16()
+    rows = max(1, block_elements // max(count, 1))
+    found_i, found_j, found_d = [], [], []
+    for start in range(0, count, rows):
+        stop = min(start + rows, count)
+        xor = hashes[start:stop, None] ^ hashes[None, start:]
+        distance = np.zeros(xor.shape, dtype=np.uint8)
+        for shift in (0, 16, 32, 48):
+            distance += table[(xor >> np.uint64(shift)) & np.uint64(0xFFFF)]
+        row, column = np.nonzero(distance <= threshold)
+        column_global = column + start
+        row_global = row + start
+        keep = column_global > row_global
+        found_i.append(row_global[keep])
+        found_j.append(column_global[keep])
+        found_d.append(distance[row[keep], column[keep]])
+    if not found_i:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.uint8)
+    return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+
+
+def _group_pairs(count, pairs_i, pairs_j):
+    """並查集：重複對合併為組"""
+    parent = list(range(count))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in zip(pairs_i.tolist(), pairs_j.tolist()):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    groups = {}
+    for i in set(pairs_i.tolist()) | set(pairs_j.tolist()):
+        groups.setdefault(find(i), []).append(i)
+    return [sorted(members) for members in groups.values()]
+
+
+def default_scan_cache_path(data_dir):
+    path = default_quarantine_path(data_dir)
+    return path.with_name(f"{Path(data_dir).resolve().name}.scan.json")
+
+
+def _load_scan_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache['results'] if cache.get('version') == SCAN_CACHE_VERSION else {}
+
+
+def _atomic_json(path, payload):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def scrub_dataset(data_dir, workers=None, threshold=DEFAULT_THRESHOLD, validation_split=0.2, fix=False,
+                  write=True):
+    """
+    檢查數據集並生成隔離列表
+
+    Args:
+        data_dir: 數據目錄（data_dir/<類別>/）
+        workers: 檢查進程數（默認 CPU 核數）
+        threshold: pHash 漢明距離閾值（0 只找完全相同的畫面）
+        validation_split: 用於判斷重複圖是否跨訓練 / 驗證集（與訓練腳本一致）
+        fix: 把問題格式轉為 RGB 寫回原文件（原文件備份到 <隔離目錄>/<數據集名>-originals/）
+        write: 寫入隔離列表、數據清單和檢查結果緩存（False 時不寫任何文件，只返回報告）
+
+    Returns:
+        報告 {"images", "quarantined": {原因: 數量}, "format_issues": [...], "duplicate_groups": [...],
+              "cross_split_groups", "label_conflict_groups", "entries": 隔離列表}
+    """
+    data_dir = Path(data_dir).resolve()
+    quarantine_path = default_quarantine_path(data_dir)
+    backup_dir = quarantine_path.parent / f"{data_dir.name}-originals"
+    manifest, changes = update_manifest(data_dir, workers=workers, save=write)
+    print(f"[INFO] 數據清單: {describe_changes(changes)}")
+    files = manifest['files']
+
+    cache_path = default_scan_cache_path(data_dir)
+    cache = _load_scan_cache(cache_path)
+    results, todo = {}, []
+    for relative, entry in files.items():
+        sha1 = entry.get('sha1')
+        if sha1 is None:
+            results[relative] = {'issues': ['corrupt'], 'phash': None, 'fixed': False,
+                                 'error': entry.get('error', 'unreadable')}
+            continue
+        cached = cache.get(sha1)
+        if cached is None or (fix and any(issue in FIXABLE_ISSUES for issue in cached['issues'])):
+            todo.append(relative)
+        else:
+            results[relative] = cached
+
+    started = time.perf_counter()
+    if todo:
+        tasks = [(str(data_dir / relative), relative, fix, str(backup_dir)) for relative in todo]
+        with Pool(processes=workers) as pool:
+            for relative, result in zip(todo, pool.imap(_inspect_task, tasks, chunksize=8)):
+                results[relative] = result
+                if not result['fixed']:
+                    cache[files[relative]['sha1']] = result
+        elapsed = time.perf_counter() - started
+        print(f"[INFO] 檢查 {len(todo)} 張圖片，{elapsed:.1f}s（{len(todo) / max(elapsed, 1e-9):.1f} images/sec）")
+    if write:
+        live_hashes = {entry.get('sha1') for entry in files.values()}
+        _atomic_json(cache_path, {
+            'version': SCAN_CACHE_VERSION,
+            'results': {sha1: result for sha1, result in cache.items() if sha1 in live_hashes},
+        })
+
+    entries, format_issues = {}, []
+    for relative, result in results.items():
+        issues = result['issues']
+        sha1 = files[relative].get('sha1')
+        if 'corrupt' in issues or 'truncated' in issues:
+            entries[relative] = {'reason': issues[0], 'detail': result.get('error'), 'sha1': sha1}
+        elif issues:
+            format_issues.append({'path': relative, 'issues': issues, 'fixed': result['fixed']})
+            if 'unsupported_format' in issues and not result['fixed']:
+                entries[relative] = {'reason': 'unsupported_format', 'detail': ', '.join(issues), 'sha1': sha1}
+
+    # 感知哈希重複（已隔離的壞圖不參與）
+    candidates = [relative for relative, result in results.items()
+                  if result['phash'] and relative not in entries]
+    hashes = np.array([int(results[relative]['phash'], 16) for relative in candidates], dtype=np.uint64)
+    pairs_i, pairs_j, distances = hamming_pairs(hashes, threshold)
+    member_groups = _group_pairs(len(candidates), pairs_i, pairs_j)
+    group_of = {i: number for number, members in enumerate(member_groups) for i in members}
+    max_distances = [0] * len(member_groups)
+    for i, distance in zip(pairs_i.tolist(), distances.tolist()):
+        max_distances[group_of[i]] = max(max_distances[group_of[i]], distance)
+
+    groups, cross_split, label_conflicts = [], 0, 0
+    for members, max_distance in zip(member_groups, max_distances):
+        paths = [candidates[i] for i in members]
+        labels = sorted({files[path]['label'] for path in paths})
+        splits = sorted({'val' if in_validation_split(path, validation_split) else 'train' for path in paths})
+        group = {'paths': paths, 'labels': labels, 'splits': splits, 'max_distance': max_distance}
+        if len(labels) > 1:
+            # 同一畫面出現在不同類別：無法判斷哪個標籤正確，全部隔離
+            label_conflicts += 1
+            for path in paths:
+                entries[path] = {'reason': 'label_conflict', 'detail': paths, 'sha1': files[path]['sha1']}
+        else:
+            keep = min(paths, key=lambda path: (-(files[path].get('width') or 0) * (files[path].get('height') or 0),
+                                                 path))
+            group['kept'] = keep
+            for path in paths:
+                if path != keep:
+                    entries[path] = {'reason': 'duplicate', 'detail': keep, 'sha1': files[path]['sha1']}
+        if len(splits) > 1:
+            cross_split += 1
+        groups.append(group)
+
+    reasons = {}
+    for entry in entries.values():
+        reasons[entry['reason']] = reasons.get(entry['reason'], 0) + 1
+    if write:
+        _atomic_json(quarantine_path, {
+            'version': 1,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'source': str(data_dir),
+            'threshold': threshold,
+            'entries': dict(sorted(entries.items())),
+        })
+    return {
+        'images': len(files),
+        'quarantined': reasons,
+        'format_issues': format_issues,
+        'duplicate_groups': groups,
+        'cross_split_groups': cross_split,
+        'label_conflict_groups': label_conflicts,
+        'entries': entries,
+    }
@@ -0,0 +1,195 @@
+"""
+從 tar / tar.gz 分片流式讀取訓練數據（tf.data）
+
+- 多個分片由 interleave 並行順序讀取（cycle_length = readers），每個 epoch 打亂分片順序
+- 訓練集經過打亂緩衝區（shuffle_buffer 張），驗證集解碼後以 uint8 緩存在內存
+- 訓練 / 驗證劃分按 "<類別>/<文件名>" 相對路徑哈希，與 tfdata 管道對同一批圖片的劃分一致
+- 訓練集是 tf_dataset.EpochStream：分片順序和打亂緩衝區按輪種子確定，讀取順序固定，
+  恢復時按同樣的順序跳過已訓練的樣本（跳過的圖片只讀取不解碼）
+"""
+import tensorflow as tf
+
+from .dataset_files import in_validation_split
+from .tar_shards import index_tar, iter_shard, resolve_shards, scan_shards, split_member
+from .tf_dataset import AUTOTUNE, EpochStream, FolderDataset, decode_bytes_and_resize, finish_batches
+
+# 訓練集打亂緩衝區（張數）和並行讀取的分片數
+SHUFFLE_BUFFER = 2048
+READERS = 4
+
+
+def _encode_label(label, num_classes, class_mode):
+    if class_mode == 'categorical':
+        return tf.one_hot(label, num_classes)
+    if class_mode == 'binary':
+        return tf.cast(label, tf.float32)
+    return label
+
+
+def _shard_members(shards, prefix, class_indices, training, validation_split, shard):
+    """
+    按壓縮包索引列出各分片中屬於本劃分、本 worker 的圖片（順序與 iter_shard 讀取時相同，不讀取圖片）
+
+    多 worker 時每個 tar 分片內按成員序號取本 worker 的一份，各 worker 互不重疊。
+
+    Returns:
+        每個分片一個 [(相對路徑, 類別索引)] 列表
+    """
+    workers, worker = shard if shard else (1, 0)
+    members = []
+    for path in shards:
+        kept, position = [], 0
+        for name in index_tar(path):
+            relative, label = split_member(name, prefix)
+            if relative is None:
+                continue
+            if ((workers <= 1 or position % workers == worker) and label in class_indices
+                    and in_validation_split(relative, validation_split) != training):
+                kept.append((relative, class_indices[label]))
+            position += 1
+        members.append(kept)
+    return members
+
+
+def make_tar_dataset(shards, prefix, class_indices, class_mode='categorical', target_size=(224, 224),
+                     batch_size=32, training=True, validation_split=0.2, augmentation=None,
+                     shuffle_buffer=SHUFFLE_BUFFER, readers=READERS, seed=42, shard=None):
+    """
+    構造一個劃分的流式數據集：分片 → 並行順序讀取 →（打亂緩衝區）→ 並行解碼縮放 → 分批 → 增強 / 歸一化
+
+    訓練集返回 make_tar_stream 的第一輪。
+
+    Args:
+        shards: 分片路徑列表
+        prefix: 成員路徑前綴
+        class_indices: {類別名: 索引}
+        class_mode: 'categorical'、'binary' 或 'sparse'
+        target_size: (高, 寬)
+        batch_size: 批次大小
+        training: 訓練集（打亂、增強）或驗證集（緩存）
+        validation_split: 驗證集比例
+        augmentation: ImageDataGenerator 同名參數（僅訓練集，整批執行）
+        shuffle_buffer: 打亂緩衝區大小
+        readers: 並行讀取的分片數
+        seed: 隨機種子
+        shard: 多 worker 訓練時的 (worker 數, 本 worker 序號)
+
+    Returns:
+        tf.data.Dataset，元素為 (images float32 [N, H, W, 3], labels)
+    """
+    if training:
+        return make_tar_stream(shards, prefix, class_indices, class_mode, target_size, batch_size, validation_split,
+                               augmentation, shuffle_buffer, readers, seed, shard).first_pass()
+    members = _shard_members(shards, prefix, class_indices, training, validation_split, shard)
+    wanted = set(relative for kept in members for relative, _ in kept)
+    num_classes = len(class_indices)
+
+    def read(path):
+        for relative, label, data in iter_shard(path.decode('utf-8'), prefix):
+            if relative in wanted:
+                yield data, class_indices[label]
+
+    signature = (tf.TensorSpec((), tf.string), tf.TensorSpec((), tf.int64))
+    dataset = tf.data.Dataset.from_tensor_slices(list(shards)).interleave(
+        lambda path: tf.data.Dataset.from_generator(read, output_signature=signature, args=(path,)),
+        cycle_length=max(1, min(readers, len(shards))),
+        num_parallel_calls=AUTOTUNE,
+    )
+
+    def load(data, label):
+        return decode_bytes_and_resize(data, target_size), _encode_label(label, num_classes, class_mode)
+
+    dataset = dataset.map(load, num_parallel_calls=AUTOTUNE).cache()
+    return finish_batches(dataset.batch(batch_size), False, None)
+
+
+def make_tar_stream(shards, prefix, class_indices, class_mode='categorical', target_size=(224, 224), batch_size=32,
+                    validation_split=0.2, augmentation=None, shuffle_buffer=SHUFFLE_BUFFER, readers=READERS,
+                    seed=42, shard=None):
+    """
+    訓練集的逐輪數據流：按輪種子打亂分片順序 → 固定數量的分片並行順序讀取 → 打亂緩衝區 → 跳過已訓練的樣本
+    → 並行解碼縮放 → 分批 → 增強 / 歸一化
+
+    校驗時用壓縮包索引代替讀取（_shard_members），經過同樣的交錯和打亂緩衝區重放順序。
+
+    Returns:
+        EpochStream，樣本鍵為相對路徑
+    """
+    members = _shard_members(shards, prefix, class_indices, True, validation_split, shard)
+    wanted = [set(relative for relative, _ in kept) for kept in members]
+    num_classes = len(class_indices)
+
+    def read(number):
+        # 只產出本劃分、本 worker 的圖片（見 _shard_members），其他成員不解碼
+        for relative, label, data in iter_shard(shards[number], prefix):
+            if relative in wanted[number]:
+                yield relative, data, class_indices[label]
+
+    def read_keys(number):
+        for relative, label in members[number]:
+            yield relative, b'', label
+
+    signature = (tf.TensorSpec((), tf.string), tf.TensorSpec((), tf.string), tf.TensorSpec((), tf.int64))
+
+    def load(relative, data, label):
+        return decode_bytes_and_resize(data, target_size), _encode_label(label, num_classes, class_mode)
+
+    def one_pass(pass_seed, skip, keys_only):
+        source = read_keys if keys_only else read
+        numbers = tf.data.Dataset.range(len(shards)).shuffle(len(shards), seed=pass_seed)
+        dataset = numbers.interleave(
+            lambda number: tf.data.Dataset.from_generator(source, output_signature=signature, args=(number,)),
+            cycle_length=max(1, min(readers, len(shards))),
+            num_parallel_calls=AUTOTUNE,
+        )
+        dataset = dataset.shuffle(shuffle_buffer, seed=pass_seed).skip(skip)
+        if keys_only:
+            return dataset.map(lambda relative, data, label: relative)
+        return dataset.map(load, num_parallel_calls=AUTOTUNE).batch(batch_size)
+
+    samples = sum(len(kept) for kept in members)
+    return EpochStream(one_pass, samples, batch_size, seed, lambda dataset: finish_batches(dataset, True, augmentation))
+
+
+def load_tar_datasets(source, class_mode='categorical', target_size=(224, 224), batch_size=32,
+                      validation_split=0.2, augmentation=None, prefix=None, shuffle_buffer=SHUFFLE_BUFFER,
+                      readers=READERS, seed=42, shard=None):
+    """
+    從 tar 分片構造訓練和驗證集
+
+    Args:
+        source: 分片目錄、單個壓縮包（如 food-101.tar.gz）、glob 模式或路徑列表
+        class_mode: 'categorical'、'binary' 或 'sparse'
+        target_size: (高, 寬)
+        batch_size: 批次大小
+        validation_split: 驗證集比例
+        augmentation: 訓練集增強參數
+        prefix: 成員路徑前綴（None 時自動識別）
+        shuffle_buffer: 訓練集打亂緩衝區大小
+        readers: 並行讀取的分片數
+        seed: 隨機種子
+        shard: 多 worker 訓練時的 (worker 數, 本 worker 序號)；samples 仍為全部樣本數
+
+    Returns:
+        (train: FolderDataset, val: FolderDataset)
+    """
+    shards = resolve_shards(source)
+    if not shards:
+        raise FileNotFoundError(f"找不到 tar 分片: {source}（可用 python train/make_tar_shards.py 生成）")
+    prefix, class_names, samples = scan_shards(shards, prefix)
+    if not samples:
+        raise ValueError(f"tar 分片中沒有圖片: {source}")
+    class_indices = {name: index for index, name in enumerate(class_names)}
+    val_count = sum(1 for relative, _ in samples if in_validation_split(relative, validation_split))
+    if len(shards) < readers:
+        print(f"[INFO] 只有 {len(shards)} 個分片，並行讀取受限（可用 make_tar_shards.py 重新切分）")
+
+    common = dict(class_mode=class_mode, target_size=target_size, batch_size=batch_size,
+                  validation_split=validation_split, shuffle_buffer=shuffle_buffer, readers=readers, seed=seed,
+                  shard=shard)
+    stream = make_tar_stream(shards, prefix, class_indices, augmentation=augmentation, **common)
+    val = make_tar_dataset(shards, prefix, class_indices, training=False, **common)
+    return (
+        FolderDataset(stream.first_pass(), len(samples) - val_count, class_indices, batch_size, stream),
+        FolderDataset(val, val_count, class_indices, batch_size),
+    )
@@ -0,0 +1,259 @@
+"""
+tar 分片（WebDataset 風格）：直接從 tar / tar.gz 順序讀取圖片，不必解壓成數萬個小文件
+
+成員路徑為 [前綴]<類別>/.../<文件名>，類別取前綴之後的第一級目錄
+（Food-101 原始壓縮包為 food-101/images/<類別>/<id>.jpg，前綴自動識別為 food-101/images/）。
+每個壓縮包旁緩存一份成員索引（<壓縮包>.index.json），只在首次使用時完整讀一遍，
+之後用於確定類別列表、樣本數和訓練 / 驗證劃分。
+
+write_tar_shards 把數據目錄或大壓縮包重新切成若干個未壓縮 tar 分片（類別打散），
+以便多個讀取器並行順序讀取。
+"""
+import io
+import json
+import math
+import os
+import random
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .dataset_files import IMAGE_EXTENSIONS, list_image_files
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+TAR_INDEX_VERSION = 1
+
+
+def default_tar_dir(data_dir):
+    """默認分片目錄：數據目錄旁的 .tar-shards/<數據集名>"""
+    data_dir = Path(data_dir).resolve()
+    return data_dir.parent / '.tar-shards' / data_dir.name
+
+
+def resolve_shards(source):
+    """
+    解析分片來源
+
+    Args:
+        source: 目錄（其中所有 .tar / .tar.gz / .tgz）、單個壓縮包、glob 模式或路徑列表
+
+    Returns:
+        排序後的分片路徑列表
+    """
+    if isinstance(source, (list, tuple)):
+        return sorted(str(path) for path in source)
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(path) for path in source.iterdir() if path.name.endswith(TAR_SUFFIXES))
+    if source.exists():
+        return [str(source)]
+    return sorted(str(path) for path in source.parent.glob(source.name))
+
+
+def _is_image_member(member):
+    name = member.name
+    return (member.isfile() and name.lower().endswith(IMAGE_EXTENSIONS)
+            and not any(part.startswith('.') for part in name.split('/')))
+
+
+def _index_path(shard):
+    return f"{shard}.index.json"
+
+
+def index_tar(shard):
+    """
+    讀取（或首次生成）壓縮包的圖片成員索引
+
+    Returns:
+        成員路徑列表（按壓縮包中的順序）
+    """
+    stat = os.stat(shard)
+    try:
+        with open(_index_path(shard), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if (index.get('version') == TAR_INDEX_VERSION and index['size'] == stat.st_size
+                and index['mtime_ns'] == stat.st_mtime_ns):
+            return index['members']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    print(f"[INFO] 生成壓縮包索引: {shard}（只需一次）")
+    with tarfile.open(shard, 'r|*') as tar:
+        members = [member.name for member in tar if _is_image_member(member)]
+    _write_index(shard, members)
+    return members
+
+
+def _write_index(shard, members):
+    stat = os.stat(shard)
+    index = {'version': TAR_INDEX_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'members': members}
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(shard)), prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, _index_path(shard))
+    except OSError as e:
+        # 壓縮包所在目錄只讀時不緩存，下次重新掃描
+        print(f"[WARN] 無法寫入壓縮包索引: {e}")
+
+
+def common_prefix(members):
+    """
+    所有圖片成員共同的目錄前綴（類別目錄的上一級），如 "food-101/images/"
+
+    所有圖片都在同一目錄時，該目錄本身就是唯一的類別。
+    """
+    directories = {os.path.dirname(name) for name in members}
+    if not directories:
+        return ''
+    prefix = os.path.commonpath(list(directories)).replace(os.sep, '/')
+    if prefix in directories:
+        prefix = os.path.dirname(prefix)
+    return f"{prefix}/" if prefix else ''
+
+
+def split_member(name, prefix):
+    """成員路徑 → (相對路徑 "<類別>/...", 類別)；不在前綴下時返回 (None, None)"""
+    if not name.startswith(prefix):
+        return None, None
+    relative = name[len(prefix):]
+    if '/' not in relative:
+        return None, None
+    return relative, relative.split('/', 1)[0]
+
+
+def scan_shards(shards, prefix=None):
+    """
+    彙總各分片的索引
+
+    Args:
+        shards: 分片路徑列表
+        prefix: 成員路徑前綴（None 時自動識別）
+
+    Returns:
+        (prefix, class_names, samples)；samples 為 [(相對路徑, 類別名)]
+    """
+    members = []
+    for shard in shards:
+        members.extend(index_tar(shard))
+    if prefix is None:
+        prefix = common_prefix(members)
+    samples = []
+    for name in members:
+        relative, label = split_member(name, prefix)
+        if relative is not None:
+            samples.append((relative, label))
+    class_names = sorted({label for _, label in samples})
+    return prefix, class_names, samples
+
+
+def iter_shard(shard, prefix):
+    """
+    順序讀取一個分片中的圖片
+
+    Yields:
+        (相對路徑, 類別名, 圖片字節)
+    """
+    with tarfile.open(shard, 'r|*') as tar:
+        for member in tar:
+            if not _is_image_member(member):
+                continue
+            relative, label = split_member(member.name, prefix)
+            if relative is None:
+                continue
+            yield relative, label, tar.extractfile(member).read()
+
+
+def _atomic_tar(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    os.close(fd)
+    return tmp_path
+
+
+def _write_folder_shard(args):
+    path, items = args
+    tmp_path = _atomic_tar(path)
+    with tarfile.open(tmp_path, 'w') as tar:
+        for source_path, relative in items:
+            tar.add(source_path, arcname=relative, recursive=False)
+    os.replace(tmp_path, path)
+    _write_index(path, [relative for _, relative in items])
+    return path, len(items)
+
+
+def write_tar_shards(source, out_dir=None, shard_size=2000, prefix=None, seed=42, workers=4):
+    """
+    把數據目錄或壓縮包重新寫成未壓縮的 tar 分片（shard-00000.tar ...），成員為 <類別>/<文件名>
+
+    - 數據目錄：按固定種子打亂後切分（遵守隔離列表），多線程並行寫入各分片
+    - 壓縮包：順序讀一遍，第 i 張圖寫入第 i % 分片數 個分片，使每個分片都包含各個類別
+
+    Args:
+        source: 數據目錄（data_dir/<類別>/）或壓縮包路徑 / 目錄 / glob
+        out_dir: 輸出目錄（數據目錄來源時默認 default_tar_dir）
+        shard_size: 每個分片的圖片數
+        prefix: 壓縮包成員的路徑前綴（None 時自動識別）
+        seed: 數據目錄來源時打亂順序的隨機種子
+        workers: 數據目錄來源時並行寫入的線程數
+
+    Returns:
+        分片路徑列表
+    """
+    source_path = Path(source)
+    from_folder = source_path.is_dir() and not resolve_shards(source_path)
+    if out_dir is None:
+        if not from_folder:
+            raise ValueError("從壓縮包重新分片時需要指定輸出目錄")
+        out_dir = default_tar_dir(source_path)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    if from_folder:
+        paths, _, _ = list_image_files(source_path)
+        items = [(path, os.path.relpath(path, source_path).replace(os.sep, '/')) for path in paths]
+        random.Random(seed).shuffle(items)
+        count = math.ceil(len(items) / shard_size)
+        jobs = [(str(out_dir / f"shard-{i:05d}.tar"), items[i * shard_size:(i + 1) * shard_size])
+                for i in range(count)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, written in pool.map(_write_folder_shard, jobs):
+                print(f"[INFO] 分片 {os.path.basename(path)}: {written} 張")
+        written_paths = [path for path, _ in jobs]
+    else:
+        archives = resolve_shards(source)
+        prefix, _, samples = scan_shards(archives, prefix)
+        count = max(1, math.ceil(len(samples) / shard_size))
+        written_paths = [str(out_dir / f"shard-{i:05d}.tar") for i in range(count)]
+        tmp_paths = [_atomic_tar(path) for path in written_paths]
+        writers = [tarfile.open(path, 'w') for path in tmp_paths]
+        members = [[] for _ in range(count)]
+        try:
+            position = 0
+            for archive in archives:
+                for relative, _, data in iter_shard(archive, prefix):
+                    shard = position % count
+                    info = tarfile.TarInfo(relative)
+                    info.size = len(data)
+                    writers[shard].addfile(info, fileobj=io.BytesIO(data))
+                    members[shard].append(relative)
+                    position += 1
+                    if position % 5000 == 0:
+                        print(f"[INFO] 已寫入 {position}/{len(samples)} 張")
+        finally:
+            for writer in writers:
+                writer.close()
+        for tmp_path, path, names in zip(tmp_paths, written_paths, members):
+            os.replace(tmp_path, path)
+            _write_index(path, names)
+        print(f"[INFO] 寫入 {count} 個分片，共 {sum(len(names) for names in members)} 張")
+
+    # 清理上一次留下的多餘分片
+    current = {os.path.basename(path) for path in written_paths}
+    for entry in os.listdir(out_dir):
+        if entry.startswith('shard-') and entry.endswith('.tar') and entry not in current:
+            os.unlink(out_dir / entry)
+            if os.path.exists(out_dir / f"{entry}.index.json"):
+                os.unlink(out_dir / f"{entry}.index.json")
+    return written_paths
+
@@ -0,0 +1,253 @@
+"""
+tf.data 輸入管道（替代 ImageDataGenerator.flow_from_directory）
+
+- 並行讀取、解碼和縮放（num_parallel_calls=AUTOTUNE），不再是單線程 Python 逐張處理
+- 按文件路徑哈希劃分訓練 / 驗證集：同一文件每次運行都落在同一側，新增圖片不會打亂已有劃分
+- 驗證集不做增強，解碼縮放後以 uint8 緩存（內存或 cache_file），第二個 epoch 起不再讀盤解碼
+- 數據增強參數與 ImageDataGenerator 同名（rotation_range、width_shift_range 等），分批後整批執行（見 augmentation.py）
+- 訓練集是逐輪數據流（EpochStream）：每輪的打亂順序只取決於 (seed, 輪次)，輸出順序確定，
+  從檢查點恢復時可以從任意批次位置繼續，跳過的樣本不讀取也不解碼
+"""
+import math
+
+import tensorflow as tf
+
+from .augmentation import augment_images, has_augmentation
+from .dataset_files import list_image_files, shard_items, split_files
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# 逐輪數據流拼接的輪數上限（實際由 fit 的 epochs 和 steps_per_epoch 決定取多少批次）
+MAX_PASSES = 1 << 20
+
+
+class FolderDataset:
+    """
+    一個劃分（訓練或驗證）的 tf.data.Dataset 及其元信息
+
+    屬性與 DirectoryIterator 同名（samples、class_indices、batch_size），訓練腳本的打印和類別權重計算可以不變。
+    訓練集另有 stream（EpochStream），dataset 為其第一輪。
+    """
+
+    def __init__(self, dataset, samples, class_indices, batch_size, stream=None):
+        self.dataset = dataset
+        self.samples = samples
+        self.class_indices = class_indices
+        self.batch_size = batch_size
+        self.stream = stream
+
+    def __len__(self):
+        return math.ceil(self.samples / self.batch_size)
+
+
+class EpochStream:
+    """
+    訓練集的逐輪數據流：第 n 輪的打亂順序只取決於 (seed, n)，可以從任意批次位置開始
+
+    從檢查點恢復時，中斷的那一輪按同樣的順序跳過已訓練的樣本（在讀取和解碼之前跳過），
+    之後各輪與不中斷時完全相同。
+
+    Args:
+        one_pass: one_pass(輪種子, 跳過的樣本數, keys_only) -> 一輪的數據集；keys_only=False 時為分批後的
+                  (圖像 uint8, 標籤)，True 時為按訓練順序排列的樣本鍵（不讀取圖片，用於恢復校驗）
+        samples: 本 worker 每輪的樣本數
+        batch_size: 批次大小
+        seed: 基礎隨機種子
+        finish: 分批之後的處理（增強、歸一化、預取）
+    """
+
+    def __init__(self, one_pass, samples, batch_size, seed, finish):
+        self.one_pass = one_pass
+        self.samples = samples
+        self.batch_size = batch_size
+        self.seed = seed
+        self.finish = finish
+        self.batches = max(1, math.ceil(samples / batch_size))
+
+    def pass_seed(self, index):
+        """第 index 輪的打亂種子"""
+        return tf.cast(self.seed, tf.int64) * 1000003 + tf.cast(index, tf.int64)
+
+    def locate(self, position):
+        """全局批次位置 → (輪次, 該輪已完成的批次數)；多 worker 時各 worker 的每輪批次數可能不同"""
+        return divmod(position, self.batches)
+
+    def first_pass(self):
+        """第一輪（單輪的 tf.data.Dataset）"""
+        return self.finish(self.one_pass(self.pass_seed(0), 0, False))
+
+    def from_position(self, position=0):
+        """
+        從第 position 個批次開始的數據流（不會結束，fit 時需要指定 steps_per_epoch）
+
+        Args:
+            position: 已經訓練過的批次總數（epoch * steps_per_epoch + epoch 內已完成的批次數）
+        """
+        first, done = self.locate(position)
+        skip = done * self.batch_size
+
+        def one_pass(index):
+            return self.one_pass(self.pass_seed(index), tf.where(index == first, tf.constant(skip, tf.int64),
+                                                                 tf.constant(0, tf.int64)), False)
+
+        return self.finish(tf.data.Dataset.range(first, first + MAX_PASSES).flat_map(one_pass))
+
+    def check_resume(self, position):
+        """
+        校驗從 position 恢復時中斷的那一輪：已訓練和將要訓練的樣本互不重疊，合起來正好是該輪的全部樣本
+
+        Returns:
+            (已訓練的樣本數, 剩餘的樣本數)
+
+        Raises:
+            RuntimeError: 恢復後的順序與中斷前不一致
+        """
+        index, done = self.locate(position)
+        seed = self.pass_seed(index)
+        full = list(self.one_pass(seed, 0, True).as_numpy_iterator())
+        remaining = list(self.one_pass(seed, done * self.batch_size, True).as_numpy_iterator())
+        visited = full[:len(full) - len(remaining)]
+        if len(full) != self.samples or len(set(full)) != len(full) or remaining != full[len(visited):]:
+            raise RuntimeError(f"恢復校驗失敗：第 {index + 1} 輪的樣本順序無法重現"
+                               f"（{len(full)} 個樣本，預期 {self.samples} 個）")
+        return len(visited), len(remaining)
+
+
+def decode_bytes_and_resize(data, target_size):
+    """解碼圖片字節（灰度 / RGBA 統一轉為 3 通道），縮放到 target_size，返回 uint8"""
+    image = tf.io.decode_image(data, channels=3, expand_animations=False)
+    image = tf.image.resize(image, target_size)
+    return tf.cast(tf.clip_by_value(tf.round(image), 0.0, 255.0), tf.uint8)
+
+
+def decode_and_resize(path, target_size):
+    """讀取並解碼圖片文件，縮放到 target_size，返回 uint8"""
+    return decode_bytes_and_resize(tf.io.read_file(path), target_size)
+
+
+def _encode_label(label, num_classes, class_mode):
+    if class_mode == 'categorical':
+        return tf.one_hot(label, num_classes)
+    if class_mode == 'binary':
+        return tf.cast(label, tf.float32)
+    return label  # sparse
+
+
+def finish_batches(dataset, training, augmentation):
+    """
+    uint8 圖像批次 →（訓練集整批增強）→ 歸一化到 [0, 1] → 預取
+
+    Args:
+        dataset: 元素為 (images uint8 [N, H, W, 3], labels) 的已分批數據集
+        training: 訓練集做增強
+        augmentation: ImageDataGenerator 同名參數
+    """
+    augment = training and has_augmentation(augmentation)
+
+    def finish(images, labels):
+        images = tf.cast(images, tf.float32)
+        if augment:
+            images = augment_images(images, augmentation)
+        return images / 255.0, labels
+
+    # 保持批次順序：從檢查點恢復時按位置跳過的批次必須與中斷前訓練過的一致
+    return dataset.map(finish, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+
+def make_dataset(paths, labels, num_classes, class_mode='categorical', target_size=(224, 224),
+                 batch_size=32, training=True, augmentation=None, cache=True, cache_file=None, seed=42):
+    """
+    構造 tf.data 管道：讀取 → 並行解碼縮放 →（驗證集緩存）→ 分批 → 整批增強 → 歸一化到 [0, 1] → 預取
+
+    訓練集返回 make_stream 的第一輪。
+
+    Args:
+        paths: 圖片路徑列表
+        labels: 類別索引列表
+        num_classes: 類別數
+        class_mode: 'categorical'（one-hot）、'binary'（float 0/1）或 'sparse'（整數）
+        target_size: (高, 寬)
+        batch_size: 批次大小
+        training: 訓練集打亂並做增強；驗證集保持順序
+        augmentation: ImageDataGenerator 同名參數（僅訓練集使用）
+        cache: 驗證集是否緩存解碼後的 uint8 圖像
+        cache_file: 緩存文件前綴（None 時緩存在內存）
+        seed: 打亂順序的隨機種子
+
+    Returns:
+        tf.data.Dataset，元素為 (images float32 [N, H, W, 3], labels)
+    """
+    if training:
+        return make_stream(paths, labels, num_classes, class_mode, target_size, batch_size, augmentation,
+                           seed).first_pass()
+
+    def load(path, label):
+        return decode_and_resize(path, target_size), _encode_label(label, num_classes, class_mode)
+
+    dataset = tf.data.Dataset.from_tensor_slices((list(paths), list(labels)))
+    dataset = dataset.map(load, num_parallel_calls=AUTOTUNE)
+    if cache:
+        dataset = dataset.cache(cache_file or '')
+    return finish_batches(dataset.batch(batch_size), False, None)
+
+
+def make_stream(paths, labels, num_classes, class_mode='categorical', target_size=(224, 224), batch_size=32,
+                augmentation=None, seed=42):
+    """
+    訓練集的逐輪數據流：按輪種子打亂路徑 → 跳過已訓練的樣本 → 並行解碼縮放 → 分批 → 整批增強 → 歸一化
+
+    Returns:
+        EpochStream，樣本鍵為圖片路徑
+    """
+    paths_tensor = tf.constant(list(paths), dtype=tf.string)
+    labels_tensor = tf.constant(list(labels), dtype=tf.int64)
+    count = len(paths)
+
+    def load(path, label):
+        return decode_and_resize(path, target_size), _encode_label(label, num_classes, class_mode)
+
+    def one_pass(seed, skip, keys_only):
+        dataset = tf.data.Dataset.from_tensor_slices((paths_tensor, labels_tensor))
+        dataset = dataset.shuffle(max(1, count), seed=seed).skip(skip)
+        if keys_only:
+            return dataset.map(lambda path, label: path)
+        # 先分批再增強：一次仿射變換處理整批，而不是逐張調用
+        return dataset.map(load, num_parallel_calls=AUTOTUNE).batch(batch_size)
+
+    return EpochStream(one_pass, count, batch_size, seed, lambda dataset: finish_batches(dataset, True, augmentation))
+
+
+def load_folder_datasets(data_dir, class_mode='categorical', target_size=(224, 224), batch_size=32,
+                         validation_split=0.2, augmentation=None, cache_file=None, seed=42, shard=None):
+    """
+    從 data_dir/<類別>/ 構造訓練和驗證集（flow_from_directory 的 tf.data 版本）
+
+    Args:
+        data_dir: 數據目錄
+        class_mode: 'categorical'、'binary' 或 'sparse'
+        target_size: (高, 寬)
+        batch_size: 批次大小
+        validation_split: 驗證集比例（按路徑哈希劃分）
+        augmentation: 訓練集的增強參數（ImageDataGenerator 同名參數）
+        cache_file: 驗證集緩存文件前綴（None 時緩存在內存）
+        seed: 打亂順序的隨機種子
+        shard: 多 worker 訓練時的 (worker 數, 本 worker 序號)，只讀取和解碼本 worker 的一份；
+               samples 仍為全部樣本數（各 worker 據此算出相同的步數）
+
+    Returns:
+        (train: FolderDataset, val: FolderDataset)
+    """
+    paths, labels, class_indices = list_image_files(data_dir)
+    if not paths:
+        raise ValueError(f"數據目錄中沒有圖片: {data_dir}")
+    (train_paths, train_labels), (val_paths, val_labels) = split_files(data_dir, paths, labels, validation_split)
+    num_classes = len(class_indices)
+
+    stream = make_stream(shard_items(train_paths, shard), shard_items(train_labels, shard), num_classes, class_mode,
+                         target_size, batch_size, augmentation=augmentation, seed=seed)
+    val = make_dataset(shard_items(val_paths, shard), shard_items(val_labels, shard), num_classes, class_mode,
+                       target_size, batch_size, training=False, cache_file=cache_file, seed=seed)
+    return (
+        FolderDataset(stream.first_pass(), len(train_paths), class_indices, batch_size, stream),
+        FolderDataset(val, len(val_paths), class_indices, batch_size),
+    )
@@ -0,0 +1,78 @@
+"""
+訓練吞吐量統計（images/sec）
+"""
+import time
+
+from tensorflow import keras
+
+
+class ThroughputCallback(keras.callbacks.Callback):
+    """
+    每個 epoch 結束時打印訓練階段的 images/sec（不含驗證）
+
+    Args:
+        samples: 每個 epoch 的訓練樣本數
+    """
+
+    def __init__(self, samples):
+        super().__init__()
+        self.samples = samples
+        self.images_per_sec = []
+        self._started = None
+        self._train_seconds = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._train_seconds = None
+
+    def on_test_begin(self, logs=None):
+        # fit 在每個 epoch 的訓練步驟之後才跑驗證
+        if self._started is not None and self._train_seconds is None:
+            self._train_seconds = time.perf_counter() - self._started
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = self._train_seconds or (time.perf_counter() - self._started)
+        rate = self.samples / seconds if seconds > 0 else 0.0
+        self.images_per_sec.append(rate)
+        if logs is not None:
+            logs['images_per_sec'] = rate
+        print(f"[INFO] Epoch {epoch + 1}: 訓練 {rate:.1f} images/sec（{seconds:.1f}s）")
+
+    def summary(self):
+        """首個 epoch 含圖構建和緩存預熱，穩態吞吐量取其餘 epoch 的平均"""
+        steady = self.images_per_sec[1:] or self.images_per_sec
+        return {
+            'first_epoch': round(self.images_per_sec[0], 1) if self.images_per_sec else None,
+            'steady': round(sum(steady) / len(steady), 1) if steady else None,
+        }
+
+
+def measure_input_throughput(batches, max_batches=50, warmup_batches=2):
+    """
+    只迭代輸入管道（不訓練），測量 images/sec
+
+    Args:
+        batches: 可迭代的批次（tf.data.Dataset 或 keras 生成器的迭代器），元素為 (images, labels)
+        max_batches: 計時的批次數
+        warmup_batches: 預熱批次數（不計時）
+
+    Returns:
+        {"images": 圖片數, "seconds": 耗時, "images_per_sec": 吞吐量}
+    """
+    iterator = iter(batches)
+    for _ in range(warmup_batches):
+        next(iterator)
+    images = 0
+    started = time.perf_counter()
+    for _ in range(max_batches):
+        try:
+            batch_images, _ = next(iterator)
+        except StopIteration:
+            break
+        images += len(batch_images)
+    seconds = time.perf_counter() - started
+    return {
+        'images': images,
+        'seconds': round(seconds, 3),
+        'images_per_sec': round(images / seconds, 1) if seconds > 0 else 0.0,
+    }
@@ -0,0 +1,212 @@
+"""
+訓練配置（YAML）：加載、默認值合併、命令行覆蓋和展開為訓練任務
+
+不導入 TensorFlow：調度進程只讀配置和分配任務，TensorFlow 只在各訓練進程中初始化。
+"""
+import copy
+from pathlib import Path
+
+import yaml
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+CONFIG_DIR = Path(__file__).resolve().parents[1] / 'configs'
+
+PIPELINES = ('generator', 'tfdata', 'packed', 'tar', 'features')
+AUGMENT_MODES = ('auto', 'numpy', 'batch', 'layers', 'off')
+
+# 配置中未寫的字段
+DEFAULTS = {
+    'description': None,
+    'countries': None,
+    'data': {
+        'class_mode': 'categorical',
+        'target_size': [224, 224],
+        'batch_size': 32,
+        'validation_split': 0.2,
+        'pipeline': 'generator',
+        'augment': 'auto',
+        'augmentation': {},
+    },
+    'model': {
+        'head': [],
+        'learning_rate': 0.001,
+        'metrics': ['accuracy'],
+    },
+    'training': {
+        'epochs': 20,
+        'checkpoint_monitor': 'val_accuracy',
+        'early_stopping': None,
+        'reduce_lr': None,
+        'class_weights': False,
+        'restore_best': False,
+        # generator 管道 model.fit 的數據加載線程數（不超過任務的線程預算）
+        'generator_workers': 4,
+        # 完整訓練狀態的檢查點（<model_dir>/checkpoints，見 utils/checkpointing.py）：每個 epoch 結束時保存，
+        # every_steps 另外每多少個批次保存一次（null 表示只按 epoch）；--resume 從最新的檢查點繼續
+        'checkpoint': {
+            'enabled': True,
+            'every_steps': None,
+            'keep': 2,
+        },
+    },
+    'run': {
+        'parallel': 1,
+        'threads_per_job': None,
+    },
+    # train.py --distributed（TF_CONFIG 中有多個 worker 時）
+    'distributed': {
+        # 集合通信：auto、ring（CPU）或 nccl（GPU）
+        'communication': 'auto',
+        # 全局批次隨副本數放大，學習率同比例放大（線性縮放）
+        'scale_learning_rate': True,
+    },
+}
+
+
+def _merge(defaults, values):
+    merged = copy.deepcopy(defaults)
+    for key, value in (values or {}).items():
+        if isinstance(merged.get(key), dict) and isinstance(value, dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def level_config_path(level):
+    """第 level 層的默認配置 configs/level<N>.yaml"""
+    return CONFIG_DIR / f"level{level}.yaml"
+
+
+def load_config(path):
+    """
+    加載 YAML 配置並合併默認值
+
+    Args:
+        path: 配置文件路徑
+
+    Returns:
+        配置字典
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        values = yaml.safe_load(f) or {}
+    for key in ('name', 'data_dir', 'model_dir'):
+        if key not in values:
+            raise ValueError(f"配置缺少字段 {key}: {path}")
+    config = _merge(DEFAULTS, values)
+    if config['data']['pipeline'] not in PIPELINES:
+        raise ValueError(f"未知的數據管道: {config['data']['pipeline']}（可選 {', '.join(PIPELINES)}）")
+    if config['data']['augment'] not in AUGMENT_MODES:
+        raise ValueError(f"未知的增強方式: {config['data']['augment']}（可選 {', '.join(AUGMENT_MODES)}）")
+    return config
+
+
+def load_level_config(level):
+    return load_config(level_config_path(level))
+
+
+def apply_overrides(config, assignments):
+    """
+    按 "a.b.c=值" 覆蓋配置（值按 YAML 解析，如 training.epochs=5、data.augmentation.zoom_range=0.1）
+
+    Returns:
+        新的配置字典
+    """
+    config = copy.deepcopy(config)
+    for assignment in assignments or []:
+        key, sep, raw = assignment.partition('=')
+        if not sep or not key:
+            raise ValueError(f"覆蓋參數格式應為 key=value: {assignment}")
+        *parents, leaf = key.strip().split('.')
+        target = config
+        for part in parents:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        target[leaf] = yaml.safe_load(raw)
+    return config
+
+
+def resolve_path(template, country=None):
+    """配置中的路徑（相對於項目根目錄，可含 {country}）→ 絕對路徑"""
+    path = Path(template.format(country=country) if country is not None else template)
+    return path if path.is_absolute() else PROJECT_ROOT / path
+
+
+def list_countries(config):
+    """
+    配置中的國家列表；countries 為 all 時列出 data_dir 中 {country} 所在目錄的所有子目錄
+
+    Returns:
+        國家名列表（不按國家劃分的配置返回 [None]）
+    """
+    countries = config.get('countries')
+    if not countries:
+        return [None]
+    if countries != 'all':
+        return list(countries)
+    root = resolve_path(config['data_dir'].split('{country}')[0])
+    if not root.is_dir():
+        return []
+    return sorted(entry.name for entry in root.iterdir() if entry.is_dir() and not entry.name.startswith('.'))
+
+
+def expand_jobs(config, countries=None, pipeline=None, augment=None, tar_source=None, feature_options=None,
+                resume=False):
+    """
+    把配置展開為訓練任務（第三層每個國家一個任務）
+
+    Args:
+        config: load_config 的結果
+        countries: 只訓練這些國家（None 時使用配置中的 countries）
+        pipeline: 覆蓋 data.pipeline
+        augment: 覆蓋 data.augment
+        tar_source: tar 管道的分片目錄或壓縮包
+        feature_options: features 管道的參數（augmented_views、feature_noise、refresh）
+        resume: 從各任務最新的檢查點繼續訓練
+
+    Returns:
+        任務字典列表（只含可序列化的值，可以傳給子進程）
+    """
+    jobs = []
+    for country in (countries or list_countries(config)):
+        name = f"{config['name']}-{country}" if country else config['name']
+        description = config.get('description') or name
+        jobs.append({
+            'name': name,
+            'title': description.format(country=country) if country else description,
+            'country': country,
+            'data_dir': str(resolve_path(config['data_dir'], country)),
+            'model_dir': str(resolve_path(config['model_dir'], country)),
+            'data': copy.deepcopy(config['data']),
+            'model': copy.deepcopy(config['model']),
+            'training': copy.deepcopy(config['training']),
+            'distributed': copy.deepcopy(config['distributed']),
+            'pipeline': pipeline or config['data']['pipeline'],
+            'augment': augment or config['data']['augment'],
+            'tar_source': tar_source,
+            'feature_options': dict(feature_options or {}),
+            'resume': resume,
+        })
+    return jobs
+
+
+def add_pipeline_arguments(parser):
+    """各訓練腳本共用的數據管道參數（默認值為 None：使用配置中的值）"""
+    parser.add_argument('--pipeline', choices=PIPELINES,
+                        help='數據管道（默認使用配置中的值）：generator（ImageDataGenerator）、'
+                             'tfdata（並行解碼，驗證集緩存）、packed（讀取 pack_dataset.py 打包的分片，不再解碼）、'
+                             'tar（從 tar 分片順序流式讀取）或 features（骨幹特徵只提取一次，只訓練分類頭）')
+    parser.add_argument('--augment', choices=AUGMENT_MODES,
+                        help='數據增強：auto（generator 用 numpy，其他用 batch）、numpy（ImageDataGenerator 逐張）、'
+                             'batch（tf.data 中整批）、layers（模型第一層整批，可在 GPU 上）或 off')
+    parser.add_argument('--tar-source', help='tar：分片目錄、壓縮包或 glob（默認 data/.tar-shards/<數據集名>）')
+    parser.add_argument('--feature-views', type=int, default=0, help='features：每張訓練圖片的增強視圖數')
+    parser.add_argument('--feature-noise', type=float, default=0.0, help='features：特徵乘性高斯噪聲標準差')
+    parser.add_argument('--refresh-features', action='store_true', help='features：重新生成增強視圖')
+
+
+def feature_options_from_args(args):
+    return dict(augmented_views=args.feature_views, feature_noise=args.feature_noise,
+                refresh=args.refresh_features)
+
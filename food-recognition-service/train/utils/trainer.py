@@ -0,0 +1,507 @@
+"""
+統一的訓練流程：按配置（configs/level*.yaml，見 train_config.py）加載數據、構建模型、訓練並保存
+
+三層模型共用同一流程，差異（分類頭、損失、回調、類別權重等）都在配置中。
+train_level*.py 在當前進程中調用 train_job；train.py 通過 scheduler.py 在子進程中並行調用；
+train.py --distributed 在 TF_CONFIG 描述的多個 worker 進程中各調用一次（MultiWorkerMirroredStrategy）。
+"""
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers, callbacks
+from tensorflow.keras.applications import MobileNetV2
+
+from .augmentation import resolve_augment_mode, with_augmentation_layers
+from .checkpointing import (TrainingCheckpoint, TrainingInterrupted, clear_checkpoints, default_checkpoint_dir,
+                            load_latest, mark_completed)
+from .dataset_files import filter_directory_iterator, list_image_files
+from .distributed import is_chief, worker_count, worker_index
+from .feature_cache import build_head_model, load_feature_datasets, redirect_checkpoints
+from .packed_dataset import load_packed_for
+from .tar_dataset import load_tar_datasets
+from .tar_shards import default_tar_dir
+from .tf_dataset import load_folder_datasets
+from .throughput import ThroughputCallback
+
+# 配置中的指標名 → Keras 指標（其餘名稱原樣交給 compile）
+METRICS = {
+    'precision': lambda: keras.metrics.Precision(name='precision'),
+    'recall': lambda: keras.metrics.Recall(name='recall'),
+}
+
+
+def configure_runtime(threads=None):
+    """
+    設置 GPU 內存增長和 TensorFlow 線程數（必須在第一個 TensorFlow 運算之前調用）
+
+    Args:
+        threads: 本任務的 CPU 線程預算（None 表示不限制，由 TensorFlow 按核數決定）
+    """
+    gpus = tf.config.list_physical_devices('GPU')
+    try:
+        for gpu in gpus:
+            tf.config.experimental.set_memory_growth(gpu, True)
+        if threads:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 4))
+    except RuntimeError as e:
+        # 運行時已初始化（同一進程中的第二個任務），沿用已有設置
+        print(f"[WARN] {e}")
+
+
+def create_strategy(communication='auto'):
+    """
+    按 TF_CONFIG 創建 MultiWorkerMirroredStrategy（同步數據並行，每步 all-reduce 梯度）
+
+    必須在 configure_runtime 之後、任何其他 TensorFlow 運算之前調用。
+
+    Args:
+        communication: 集合通信實現，'auto'、'ring'（CPU 上用 gRPC 環形 all-reduce）或 'nccl'（GPU）
+
+    Returns:
+        多 worker 策略；未設置 TF_CONFIG 或只有一個 worker 時返回默認策略
+    """
+    if worker_count() <= 1:
+        return tf.distribute.get_strategy()
+    implementation = tf.distribute.experimental.CommunicationImplementation[communication.upper()]
+    options = tf.distribute.experimental.CommunicationOptions(implementation=implementation)
+    return tf.distribute.MultiWorkerMirroredStrategy(communication_options=options)
+
+
+class SkipBatches(keras.utils.Sequence):
+    """generator 管道從 epoch 中間恢復：跳過 Sequence 的前 offset 個批次（按當前樣本順序）"""
+
+    def __init__(self, sequence, offset):
+        super().__init__()
+        self.sequence = sequence
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.sequence) - self.offset
+
+    def __getitem__(self, index):
+        return self.sequence[index + self.offset]
+
+
+def distributed_input(dataset):
+    """
+    多 worker 時的輸入：各 worker 已經只讀取自己的一份（load_data 的 shard），關閉自動分片；
+    重複數據集並由調用方指定每個 epoch 的步數，分片大小略有差異時各 worker 的步數仍然一致
+    """
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    return dataset.with_options(options).repeat()
+
+
+def limit_dataset_threads(dataset, threads):
+    """tf.data 管道使用私有線程池（threads 個線程），不與同時運行的其他任務爭搶全部核心"""
+    options = tf.data.Options()
+    options.threading.private_threadpool_size = threads
+    options.threading.max_intra_op_parallelism = 1
+    return dataset.with_options(options)
+
+
+def build_model(model_config, class_mode, num_classes, input_shape=(224, 224, 3), learning_rate_scale=1):
+    """
+    構建並編譯模型：MobileNetV2（凍結）+ 全局平均池化 + 配置中的全連接層 + 輸出層
+
+    Args:
+        model_config: 配置的 model 部分（head、learning_rate、metrics）
+        class_mode: binary 時輸出 1 個 sigmoid，否則 num_classes 個 softmax
+        num_classes: 分類數量
+        input_shape: 輸入圖像形狀
+        learning_rate_scale: 學習率倍數（多 worker 訓練時按全局批次放大）
+
+    Returns:
+        編譯好的模型
+    """
+    base_model = MobileNetV2(
+        input_shape=input_shape,
+        include_top=False,
+        weights='imagenet'
+    )
+    base_model.trainable = False
+
+    model_layers = [base_model, layers.GlobalAveragePooling2D()]
+    for spec in model_config['head']:
+        model_layers.append(layers.Dense(spec['units'], activation=spec.get('activation', 'relu')))
+        if spec.get('dropout'):
+            model_layers.append(layers.Dropout(spec['dropout']))
+    binary = class_mode == 'binary'
+    model_layers.append(layers.Dense(1, activation='sigmoid') if binary
+                        else layers.Dense(num_classes, activation='softmax'))
+    model = keras.Sequential(model_layers)
+
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=model_config['learning_rate'] * learning_rate_scale),
+        loss='binary_crossentropy' if binary else 'categorical_crossentropy',
+        metrics=[METRICS[name]() if name in METRICS else name for name in model_config['metrics']]
+    )
+    return model
+
+
+def load_data(data_config, data_dir, pipeline='generator', feature_options=None, tar_source=None, augment='auto',
+              shard=None):
+    """
+    加載訓練數據
+
+    Args:
+        data_config: 配置的 data 部分（class_mode、target_size、batch_size、validation_split、augmentation）
+        data_dir: 數據目錄路徑
+        pipeline: 'generator'（ImageDataGenerator）、'tfdata'（並行解碼的 tf.data 管道）、
+                  'packed'（pack_dataset.py 預先打包的 uint8 分片）、'tar'（從 tar 分片流式讀取）
+                  或 'features'（緩存的骨幹特徵，只訓練分類頭）
+        feature_options: features 管道的參數（augmented_views、feature_noise、refresh）
+        tar_source: tar 管道的分片目錄或壓縮包（默認 make_tar_shards.py 的輸出目錄）
+        augment: 數據增強方式；只有 numpy / batch 在數據管道中增強（layers 由調用方包裝模型）
+        shard: 多 worker 訓練時的 (worker 數, 本 worker 序號)；只支持 tfdata、packed 和 tar 管道
+
+    Returns:
+        (train_dataset, val_dataset)；generator 以外為 FolderDataset（.dataset 交給 model.fit）
+    """
+    augmentation = data_config['augmentation']
+    augment = resolve_augment_mode(pipeline, augment)
+    pipeline_augmentation = augmentation if augment in ('numpy', 'batch') else None
+    common = dict(
+        class_mode=data_config['class_mode'],
+        batch_size=data_config['batch_size'],
+        validation_split=data_config['validation_split'],
+    )
+    target_size = tuple(data_config['target_size'])
+    if shard and shard[0] > 1:
+        if pipeline not in ('tfdata', 'packed', 'tar'):
+            raise ValueError(f"多 worker 訓練需要 tfdata、packed 或 tar 管道（{pipeline} 不支持數據分片）")
+        common['shard'] = shard
+
+    if pipeline == 'features':
+        # 增強視圖總是用配置中的增強參數
+        return load_feature_datasets(data_dir, target_size=target_size, augmentation=augmentation,
+                                     **common, **(feature_options or {}))
+    if pipeline == 'tar':
+        # 默認讀取 make_tar_shards.py 的輸出目錄
+        return load_tar_datasets(tar_source or default_tar_dir(data_dir), target_size=target_size,
+                                 augmentation=pipeline_augmentation, **common)
+    if pipeline == 'packed':
+        return load_packed_for(data_dir, augmentation=pipeline_augmentation, **common)
+    if pipeline == 'tfdata':
+        return load_folder_datasets(data_dir, target_size=target_size, augmentation=pipeline_augmentation,
+                                    **common)
+
+    train_datagen = keras.preprocessing.image.ImageDataGenerator(
+        rescale=1./255,
+        fill_mode='nearest',
+        validation_split=data_config['validation_split'],
+        **(pipeline_augmentation or {})
+    )
+    train_generator = train_datagen.flow_from_directory(
+        data_dir,
+        target_size=target_size,
+        batch_size=data_config['batch_size'],
+        class_mode=data_config['class_mode'],
+        subset='training'
+    )
+    val_generator = train_datagen.flow_from_directory(
+        data_dir,
+        target_size=target_size,
+        batch_size=data_config['batch_size'],
+        class_mode=data_config['class_mode'],
+        subset='validation'
+    )
+
+    # 跳過 scrub_dataset.py 隔離的壞圖和重複圖
+    filter_directory_iterator(train_generator, data_dir)
+    filter_directory_iterator(val_generator, data_dir)
+    return train_generator, val_generator
+
+
+def compute_class_weights(data_dir, class_indices):
+    """
+    按各類別圖片數計算平衡的類別權重：總樣本數 / (類別數 * 該類別樣本數)
+
+    Returns:
+        {類別索引: 權重}
+    """
+    _, labels, _ = list_image_files(data_dir, class_names=list(class_indices))
+    counts = np.bincount(labels, minlength=len(class_indices)) if labels else np.zeros(len(class_indices), int)
+    total = int(counts.sum())
+    class_weights = {}
+    print("[INFO] 類別數據分布和權重:")
+    for class_name, class_idx in class_indices.items():
+        count = int(counts[class_idx])
+        weight = total / (len(class_indices) * count) if count > 0 else 1.0
+        class_weights[class_idx] = weight
+        print(f"  {class_name}: {count} 張, 權重: {weight:.2f}")
+    return class_weights
+
+
+def build_callbacks(training_config, model_dir):
+    """ModelCheckpoint（best_model.h5）+ 配置中的 EarlyStopping / ReduceLROnPlateau"""
+    callbacks_list = [
+        callbacks.ModelCheckpoint(
+            str(model_dir / 'best_model.h5'),
+            monitor=training_config['checkpoint_monitor'],
+            save_best_only=True,
+            verbose=1
+        )
+    ]
+    early_stopping = training_config.get('early_stopping')
+    if early_stopping:
+        callbacks_list.append(callbacks.EarlyStopping(restore_best_weights=True, verbose=1, **early_stopping))
+    reduce_lr = training_config.get('reduce_lr')
+    if reduce_lr:
+        callbacks_list.append(callbacks.ReduceLROnPlateau(verbose=1, **reduce_lr))
+    return callbacks_list
+
+
+def convert_to_serializable(obj):
+    """將 numpy 類型轉換為 Python 原生類型"""
+    if isinstance(obj, (np.integer, np.floating)):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: convert_to_serializable(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_to_serializable(item) for item in obj]
+    return obj
+
+
+def train_job(job, strategy=None):
+    """
+    訓練一個任務（train_config.expand_jobs 的一項）
+
+    Args:
+        job: 任務字典；調度器另外加入 threads（CPU 線程預算）和 verbose（fit 的輸出方式）
+        strategy: create_strategy 的結果；多 worker 時每個 worker 讀取自己的一份數據，
+                  全局批次 = 配置的 batch_size（每個副本）x 副本數，只有 chief 寫模型和歷史
+
+    Returns:
+        任務摘要：status（ok / skipped / preempted）、樣本數、epoch 數、訓練吞吐量、最佳指標、耗時等
+    """
+    started = time.perf_counter()
+    strategy = strategy or tf.distribute.get_strategy()
+    threads = job.get('threads')
+    data_config, training_config = dict(job['data']), job['training']
+    data_dir = Path(job['data_dir'])
+    model_dir = Path(job['model_dir'])
+    summary = {'name': job['name'], 'model_dir': str(model_dir)}
+    workers, replicas, chief = worker_count(), strategy.num_replicas_in_sync, is_chief()
+    shard = (workers, worker_index()) if workers > 1 else None
+    if replicas > 1:
+        # 每個 worker 的數據集按全局批次分批，由策略拆給各副本
+        data_config['batch_size'] = job['data']['batch_size'] * replicas
+
+    print(f"[INFO] 開始訓練{job['title']}")
+    if not data_dir.exists():
+        print(f"[ERROR] 數據目錄不存在: {data_dir}")
+        print("請先準備訓練數據")
+        return dict(summary, status='skipped', reason=f"數據目錄不存在: {data_dir}")
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    checkpoint_config = training_config['checkpoint']
+    checkpoint_dir = default_checkpoint_dir(model_dir)
+    resume_state = None
+    if job.get('resume'):
+        resume_state = load_latest(checkpoint_dir)
+        if resume_state is None:
+            print(f"[WARN] {checkpoint_dir} 中沒有可恢復的檢查點，從頭訓練")
+        elif resume_state['completed']:
+            print(f"[INFO] 上一次運行已經完成（{model_dir / 'final_model'}），不再重複訓練")
+            return dict(summary, status='skipped', reason='已完成')
+        elif not checkpoint_config['enabled']:
+            print("[WARN] 配置中關閉了檢查點（training.checkpoint.enabled），忽略 --resume")
+            resume_state = None
+    elif chief and checkpoint_dir.exists():
+        print(f"[INFO] 清除上一次運行的檢查點: {checkpoint_dir}（從中斷處繼續請加 --resume）")
+        clear_checkpoints(checkpoint_dir)
+
+    print("[INFO] 加載訓練數據...")
+    pipeline = job['pipeline']
+    augment = resolve_augment_mode(pipeline, job['augment'])
+    print(f"[INFO] 數據管道: {pipeline}，數據增強: {augment}" + (f"，線程預算: {threads}" if threads else ''))
+    if workers > 1:
+        print(f"[INFO] 分布式訓練: worker {worker_index()}/{workers}{'（chief）' if chief else ''}，"
+              f"{replicas} 個副本，全局批次 {data_config['batch_size']}")
+    train_gen, val_gen = load_data(data_config, str(data_dir), pipeline, job.get('feature_options'),
+                                   job.get('tar_source'), augment, shard)
+
+    num_classes = len(train_gen.class_indices)
+    print(f"分類數量: {num_classes}")
+    print(f"類別: {train_gen.class_indices}")
+    print(f"訓練樣本數: {train_gen.samples}")
+    print(f"驗證樣本數: {val_gen.samples}")
+
+    class_weights = None
+    if training_config['class_weights']:
+        # 計算類別權重（處理數據不平衡）
+        class_weights = compute_class_weights(data_dir, train_gen.class_indices)
+
+    # 保存類別映射
+    if chief:
+        with open(model_dir / 'class_indices.json', 'w') as f:
+            json.dump(train_gen.class_indices, f, indent=2)
+
+    print("[INFO] 構建模型...")
+    target_size = tuple(data_config['target_size'])
+    learning_rate_scale = replicas if replicas > 1 and job.get('distributed', {}).get('scale_learning_rate') else 1
+    if learning_rate_scale > 1:
+        print(f"[INFO] 學習率按副本數放大 {learning_rate_scale} 倍（線性縮放）")
+    with strategy.scope():
+        model = build_model(job['model'], data_config['class_mode'], num_classes, input_shape=(*target_size, 3),
+                            learning_rate_scale=learning_rate_scale)
+    model.summary()
+
+    callbacks_list = build_callbacks(training_config, model_dir)
+    throughput = ThroughputCallback(train_gen.samples)
+    callbacks_list.append(throughput)
+
+    print("[INFO] 開始訓練...")
+    early_stopping = training_config.get('early_stopping')
+    if early_stopping:
+        print(f"[INFO] 使用早停機制：如果 {early_stopping['monitor']} "
+              f"{early_stopping['patience']} 個 epoch 沒有提升，將自動停止訓練")
+    else:
+        print("[INFO] 未使用早停機制，將訓練完所有 epoch")
+    fit_model = model
+    if pipeline == 'features':
+        # 骨幹已凍結：只在緩存的特徵上訓練分類頭（與 model 共享權重，best_model.h5 仍保存完整模型）
+        with strategy.scope():
+            fit_model = build_head_model(model)
+        redirect_checkpoints(callbacks_list, model)
+    elif augment == 'layers':
+        # 增強作為訓練模型的第一層對整批執行；保存的仍是不含增強層的 model
+        with strategy.scope():
+            fit_model = with_augmentation_layers(model, data_config['augmentation'])
+        redirect_checkpoints(callbacks_list, model)
+    # 多 worker 時步數按全部樣本和全局批次計算，各 worker 相同
+    steps_per_epoch = len(train_gen)
+    if pipeline != 'generator':
+        # tf.data 自行並行解碼和預取；有線程預算時使用私有線程池
+        val_data = val_gen.dataset
+        if threads:
+            val_data = limit_dataset_threads(val_data, threads)
+        fit_kwargs = dict(validation_data=val_data, steps_per_epoch=steps_per_epoch)
+        if workers > 1:
+            fit_kwargs.update(validation_data=distributed_input(val_data), validation_steps=len(val_gen))
+
+        def train_input(epoch, step=0):
+            # 逐輪數據流：從 epoch 的第 step 個批次開始，每輪順序只取決於 seed 和輪次
+            data = train_gen.stream.from_position(epoch * steps_per_epoch + step)
+            if threads:
+                data = limit_dataset_threads(data, threads)
+            return distributed_input(data) if workers > 1 else data
+    else:
+        # CPU 多線程數據加載（不超過線程預算）
+        generator_workers = training_config['generator_workers']
+        fit_kwargs = dict(
+            validation_data=val_gen,
+            workers=min(generator_workers, threads) if threads else generator_workers,
+            use_multiprocessing=False,  # Windows 上建議設為 False
+            shuffle=False  # 樣本已按 epoch 打亂；批次順序固定，恢復時才能按位置跳過
+        )
+
+        def train_input(epoch, step=0):
+            return SkipBatches(train_gen, step) if step else train_gen
+
+    state_checkpoint = None
+    if checkpoint_config['enabled']:
+        # 多 worker 時各 worker 收到終止信號的時機不同，只靠定期保存
+        state_checkpoint = TrainingCheckpoint(
+            checkpoint_dir, model, fit_model.optimizer, callbacks_list,
+            every_steps=checkpoint_config['every_steps'], keep=checkpoint_config['keep'],
+            chief=chief, handle_signals=workers == 1, samples=train_gen.samples,
+            sequence=train_gen if pipeline == 'generator' else None)
+        if resume_state:
+            with strategy.scope():
+                state_checkpoint.restore(resume_state, fit_model.trainable_variables)
+        # 必須是最後一個回調（見 TrainingCheckpoint）
+        callbacks_list.append(state_checkpoint)
+
+    num_epochs = training_config['epochs']
+    initial_epoch, completed_steps = (resume_state['epoch'], resume_state['step']) if resume_state else (0, 0)
+    if completed_steps and resume_state.get('samples') != train_gen.samples:
+        print(f"[WARN] 訓練樣本數在中斷後有變化（{resume_state.get('samples')} → {train_gen.samples}），"
+              f"無法從 epoch 中間恢復，epoch {initial_epoch + 1} 從頭開始")
+        completed_steps = 0
+    if completed_steps and initial_epoch < num_epochs:
+        # 中斷的 epoch 按同樣的順序重放：已訓練和剩餘的樣本互不重疊、合起來正好是全部訓練樣本
+        if pipeline == 'generator':
+            visited, left = state_checkpoint.check_resume_order(completed_steps, train_gen.batch_size)
+        else:
+            visited, left = train_gen.stream.check_resume(initial_epoch * steps_per_epoch + completed_steps)
+        print(f"[INFO] 恢復校驗通過：epoch {initial_epoch + 1} 已訓練 {visited} 個樣本，剩餘 {left} 個")
+    fit_args = dict(callbacks=callbacks_list, class_weight=class_weights, verbose=job.get('verbose', 1), **fit_kwargs)
+    history, stopped = {}, False
+    try:
+        if completed_steps and initial_epoch < num_epochs:
+            # 從 epoch 中間恢復：先只跑該 epoch 剩餘的批次，之後的 epoch 照常
+            remaining = steps_per_epoch - completed_steps
+            state_checkpoint.begin_partial_epoch(completed_steps)
+            throughput.samples = train_gen.samples * remaining / steps_per_epoch
+            fit_model.fit(x=train_input(initial_epoch, completed_steps), epochs=initial_epoch + 1,
+                          initial_epoch=initial_epoch, **dict(fit_args, steps_per_epoch=remaining))
+            throughput.samples = train_gen.samples
+            initial_epoch += 1
+            stopped = fit_model.stop_training
+        if not stopped and initial_epoch < num_epochs:
+            history = fit_model.fit(x=train_input(initial_epoch), epochs=num_epochs, initial_epoch=initial_epoch,
+                                    **fit_args).history
+    except TrainingInterrupted as e:
+        print(f"[WARN] {e}")
+        print("[INFO] 用同樣的命令加 --resume 從中斷處繼續")
+        return dict(summary, status='preempted', epoch=e.epoch, step=e.step, checkpoint=e.path,
+                    seconds=round(time.perf_counter() - started, 1))
+    if state_checkpoint:
+        # 含恢復之前的 epoch
+        history = state_checkpoint.history
+    print(f"[INFO] 訓練吞吐量（images/sec）: {throughput.summary()}")
+
+    best_model_path = model_dir / 'best_model.h5'
+    if training_config['restore_best'] and chief and best_model_path.exists():
+        # 沒有早停自動恢復最佳權重時，保存前加載最佳模型
+        print("[INFO] 加載最佳模型權重...")
+        model.load_weights(str(best_model_path))
+        print(f"[INFO] 已加載最佳模型（從 {best_model_path}）")
+
+    print("[INFO] 保存模型...")
+    if chief:
+        model.save(str(model_dir / 'final_model'))
+    else:
+        # 多 worker 時所有 worker 都要參與保存，非 chief 寫到臨時目錄後刪除
+        scratch = tempfile.mkdtemp(prefix='worker-save-')
+        model.save(str(Path(scratch) / 'final_model'))
+        shutil.rmtree(scratch, ignore_errors=True)
+    if state_checkpoint and chief:
+        mark_completed(checkpoint_dir)
+
+    # 保存訓練歷史（轉換 numpy 類型為 Python 原生類型）
+    serializable_history = convert_to_serializable(history)
+    if chief:
+        with open(model_dir / 'training_history.json', 'w') as f:
+            json.dump(serializable_history, f, indent=2)
+
+    print("[SUCCESS] 訓練完成！")
+    print(f"模型保存在: {model_dir / 'final_model'}")
+
+    monitor = training_config['checkpoint_monitor']
+    monitored = serializable_history.get(monitor) or []
+    epochs = len(serializable_history.get('loss') or [])
+    return dict(
+        summary,
+        status='ok',
+        samples=train_gen.samples,
+        val_samples=val_gen.samples,
+        epochs=epochs,
+        workers=workers,
+        global_batch_size=data_config['batch_size'],
+        train_images=train_gen.samples * epochs,
+        images_per_sec=throughput.summary(),
+        best={monitor: (min if 'loss' in monitor else max)(monitored)} if monitored else {},
+        seconds=round(time.perf_counter() - started, 1),
+    )
@@ -0,0 +1,117 @@
+"""
+Node ↔ OCR 服務傳輸方式基準測試
+比較 multipart（現有路徑）、raw body、本機路徑引用，以及 TCP 與 Unix domain socket 的延遲
+
+用法：
+    # 先啟動服務（同時監聽 TCP 和 UDS，並允許讀取圖片所在目錄）
+    OCR_SERVICE_UDS=/tmp/ocr.sock OCR_LOCAL_PATH_ROOTS=/path/to/images python main.py
+
+    python bench_transport.py --image /path/to/images/receipt.jpg --uds /tmp/ocr.sock -n 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """計算百分位數（最近秩法）"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def send(client: httpx.Client, mode: str, image_path: str, content: bytes, params: Dict[str, str]) -> None:
+    """按指定方式發送一次請求"""
+    if mode == "multipart":
+        files = {"file": (os.path.basename(image_path), content, "image/jpeg")}
+        response = client.post("/ocr", files=files, params=params)
+    elif mode == "raw":
+        response = client.post(
+            "/ocr/raw",
+            content=content,
+            headers={"Content-Type": "application/octet-stream"},
+            params=params,
+        )
+    elif mode == "path":
+        response = client.post("/ocr/path", json={"path": os.path.abspath(image_path)}, params=params)
+    else:
+        raise ValueError(f"未知模式: {mode}")
+    response.raise_for_status()
+    _ = response.content
+
+
+def run_case(client: httpx.Client, mode: str, image_path: str, n: int, warmup: int, params: Dict[str, str]) -> Dict[str, float]:
+    """執行一組測試，返回延遲統計（毫秒）"""
+    # 與 Node 端一致：每次請求都重新讀取文件
+    for _ in range(warmup):
+        with open(image_path, "rb") as f:
+            send(client, mode, image_path, f.read(), params)
+
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        with open(image_path, "rb") as f:
+            send(client, mode, image_path, f.read(), params)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    return {
+        "n": n,
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR 服務傳輸方式基準測試")
+    parser.add_argument("--image", required=True, help="測試圖片路徑")
+    parser.add_argument("--url", default=os.getenv("OCR_SERVICE_URL", "http://localhost:8000"), help="TCP 地址")
+    parser.add_argument("--uds", default=os.getenv("OCR_SERVICE_UDS"), help="Unix domain socket 路徑（可選）")
+    parser.add_argument("--modes", default="multipart,raw,path", help="逗號分隔的傳輸方式")
+    parser.add_argument("-n", type=int, default=30, help="每組請求次數")
+    parser.add_argument("--warmup", type=int, default=3, help="每組預熱次數")
+    parser.add_argument("--fields", default="text", help="?fields= 參數（默認只取 text，減少響應大小的干擾）")
+    parser.add_argument("--output", help="將結果寫入 JSON 文件")
+    args = parser.parse_args()
+
+    transports = {"tcp": httpx.Client(base_url=args.url, timeout=120.0)}
+    if args.uds:
+        transports["uds"] = httpx.Client(
+            base_url="http://ocr",
+            transport=httpx.HTTPTransport(uds=args.uds),
+            timeout=120.0,
+        )
+
+    params = {"fields": args.fields} if args.fields else {}
+    results = {}
+    for transport_name, client in transports.items():
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            key = f"{transport_name}/{mode}"
+            try:
+                results[key] = run_case(client, mode, args.image, args.n, args.warmup, params)
+            except httpx.HTTPError as e:
+                results[key] = {"error": str(e)}
+            print(f"{key:16s} {results[key]}")
+        client.close()
+
+    baseline = results.get("tcp/multipart", {})
+    if "p50_ms" in baseline:
+        print("\n相對 tcp/multipart（現有路徑）的 p50 差異:")
+        for key, stats in results.items():
+            if "p50_ms" in stats:
+                print(f"  {key:16s} {stats['p50_ms'] - baseline['p50_ms']:+.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"image": args.image, "size_bytes": os.path.getsize(args.image), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""
+OCR 服務性能基準測試
+
+- corpus: 生成可重現的合成收據圖片語料（不同尺寸、長度、語言組合）
+- drivers: 進程內（直接驅動 worker 池和調度器）與 HTTP 兩種壓測方式
+- resources: 採樣被測進程樹的 CPU 時間和峰值 RSS
+- report: 匯總 p50 / p95 / p99、吞吐量，並與保存的基線比較
+
+用法見 ocr-service/README.md「性能基準測試」一節，或 python -m benchmark --help
+"""
@@ -0,0 +1,298 @@
+"""
+python -m benchmark 命令行入口（在 ocr-service 目錄下運行）
+
+    # 生成語料（3 尺寸 × 3 長度 × 3 語言 × 2 張）
+    python -m benchmark corpus --out bench-corpus
+
+    # 進程內壓測，並與基線比較（退化超過 10% 時退出碼為 1）
+    python -m benchmark run --mode inproc --workers 2 --concurrency 4 --requests 100 \\
+        --output bench-results/current.json --baseline bench-results/baseline.json
+
+    # 壓測運行中的服務（服務端應設置 OCR_RESULT_CACHE_SIZE=0 OCR_PHASH_MODE=off）
+    python -m benchmark run --mode http --url http://localhost:8000 --pid <服務進程 pid>
+
+    # 比較兩次結果
+    python -m benchmark compare bench-results/current.json bench-results/baseline.json
+
+    # 用樁引擎啟動服務，跑突增場景（數秒內完成，不需要 PaddleOCR）
+    python -m benchmark load --spawn-stub --scenario spike --rate 10 --duration 10 \
+        --baseline bench-results/spike-baseline.json
+
+    # 請求路徑上日誌調用的阻塞時間（同步 handler vs 隊列），模擬寫出變慢 1ms
+    python -m benchmark logging --sink-delay-ms 1
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from benchmark.corpus import generate_corpus, load_corpus
+from benchmark.drivers import HTTPDriver, InProcessDriver, run_load
+from benchmark.logging_overhead import MODES as LOGGING_MODES, measure_logging
+from benchmark.loadgen import StubService, build_phases, make_payloads, run_scenario, summarize
+from benchmark.report import build_report, compare_any, format_comparison, load_json, run_meta, save_json
+from benchmark.resources import ResourceSampler
+
+logger = logging.getLogger("benchmark")
+
+
+async def run_benchmark(args) -> dict:
+    if not os.path.isdir(args.corpus):
+        print(f"[INFO] 語料目錄不存在，按默認參數生成: {args.corpus}")
+        generate_corpus(args.corpus, font=args.font)
+    items = load_corpus(args.corpus)
+    if not items:
+        raise SystemExit(f"語料目錄中沒有圖片: {args.corpus}")
+
+    if args.mode == "inproc":
+        driver = InProcessDriver(workers=args.workers)
+        pid = os.getpid()
+    else:
+        driver = HTTPDriver(url=args.url, uds=args.uds, lane=args.lane)
+        pid = args.pid
+
+    print(f"[INFO] 模式: {args.mode}，語料: {len(items)} 張，並發: {args.concurrency}，請求: {args.requests}")
+    await driver.start()
+    sampler = ResourceSampler(pid) if pid else None
+    try:
+        if sampler:
+            # 預熱不計入 CPU 統計
+            if args.warmup:
+                await run_load(driver, items, args.corpus, 1, args.warmup)
+            sampler.start()
+            result = await run_load(driver, items, args.corpus, args.concurrency, args.requests)
+            sampler.stop()
+        else:
+            result = await run_load(driver, items, args.corpus, args.concurrency, args.requests, args.warmup)
+    finally:
+        await driver.close()
+
+    meta = {
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "workers": args.workers if args.mode == "inproc" else None,
+        "corpus": os.path.abspath(args.corpus),
+        "corpus_size": len(items),
+    }
+    if sampler is None or not sampler.supported:
+        print("[WARN] 未採樣 CPU / RSS（HTTP 模式需要 --pid；非 Linux 平台需要安裝 psutil）")
+    return build_report(
+        result["samples"],
+        result["elapsed_s"],
+        meta,
+        resources=sampler.report() if sampler else None,
+        service=driver.service_metrics(),
+    )
+
+
+async def run_load_scenario(args) -> dict:
+    phases = build_phases(args.scenario, args.rate, args.duration, args.spike_multiplier, args.spike_duration)
+    # 泊松到達的請求數有波動，多生成一些以免 --distinct 足夠大時仍然出現重複
+    expected = int(sum(p.rate * p.duration_s for p in phases) * 1.5) + 16
+    payloads = make_payloads(min(args.distinct, expected), args.seed)
+    service = None
+    url = args.url
+    if args.spawn_stub:
+        service = StubService(workers=args.workers, latency=args.stub_latency, seed=args.seed,
+                              env={"OCR_MAX_QUEUE": str(args.max_queue)})
+        await service.start()
+        url = service.url
+        print(f"[INFO] 樁服務已啟動: {url}（workers={args.workers}，延遲 {args.stub_latency}）")
+    print(f"[INFO] 場景: {args.scenario}，" + "，".join(
+        f"{p.name} {p.rate:g} rps × {p.duration_s:g}s" for p in phases))
+    try:
+        result = await run_scenario(url, phases, payloads, seed=args.seed, timeout_ms=args.timeout_ms,
+                                    lane=args.lane, uds=None if args.spawn_stub else args.uds)
+    finally:
+        if service:
+            service.stop()
+
+    return {
+        "meta": run_meta({
+            "scenario": args.scenario,
+            "rate": args.rate,
+            "duration_s": args.duration,
+            "spike_multiplier": args.spike_multiplier if args.scenario == "spike" else None,
+            "timeout_ms": args.timeout_ms,
+            "distinct": args.distinct,
+            "seed": args.seed,
+            "workers": args.workers if args.spawn_stub else None,
+            "stub_latency": args.stub_latency if args.spawn_stub else None,
+        }),
+        "elapsed_s": round(result["elapsed_s"], 3),
+        "summary": summarize(result["outcomes"], phases, result["elapsed_s"]),
+        "timeline": result["timeline"],
+    }
+
+
+def print_load_summary(report: dict) -> None:
+    summary = report["summary"]
+    for name, stats in [("overall", summary["overall"])] + list(summary["phases"].items()):
+        latency = stats["latency_ms"]
+        print(f"[INFO] {name:9s} 請求 {stats['requests']:5d}  狀態 {stats['status']}  "
+              f"降載 {stats['shed_rate']:.1%}  goodput {stats['goodput_rps']} rps  "
+              f"p50={latency.get('p50', '-')} p99={latency.get('p99', '-')}")
+    peak = max((point["queued"] or 0 for point in report["timeline"]), default=0)
+    print(f"[INFO] 峰值排隊: {peak}")
+
+
+def run_logging_benchmark(args) -> dict:
+    print(f"[INFO] 日誌調用: {args.calls} 次 × {len(args.modes)} 種配置，"
+          f"並發 {args.concurrency}，寫出延遲 {args.sink_delay_ms}ms")
+    modes = measure_logging(args.calls, args.concurrency, args.sink_delay_ms, args.modes)
+    return {
+        "meta": run_meta({
+            "benchmark": "logging",
+            "calls": args.calls,
+            "concurrency": args.concurrency,
+            "sink_delay_ms": args.sink_delay_ms,
+        }),
+        "modes": modes,
+    }
+
+
+def print_logging_summary(report: dict) -> None:
+    for mode, stats in report["modes"].items():
+        call = stats["call_us"]
+        print(f"[INFO] {mode:6s} 每次調用 µs: p50={call['p50']} p99={call['p99']} max={call['max']}  "
+              f"{stats['calls_per_s']} 次/s  寫出 {stats['written']}  丟棄 {stats['dropped']}")
+
+
+def finish(parser, args, report: dict) -> int:
+    """與基線比較並寫出結果"""
+    exit_code = 0
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        result = compare_any(report, load_json(args.baseline), args.tolerance)
+        report["baseline_comparison"] = result
+        print("[INFO] 與基線比較:")
+        print(format_comparison(result))
+        if result["regressions"]:
+            print(f"[ERROR] 性能退化: {', '.join(result['regressions'])}")
+            exit_code = 1
+    if args.output:
+        save_json(args.output, report)
+        print(f"[INFO] 結果已寫入: {args.output}")
+    if args.save_baseline:
+        if not args.baseline:
+            parser.error("--save-baseline 需要同時指定 --baseline")
+        save_json(args.baseline, report)
+        print(f"[INFO] 基線已寫入: {args.baseline}")
+    elif not args.output:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return exit_code
+
+
+def add_result_arguments(parser) -> None:
+    parser.add_argument("--output", help="結果 JSON 路徑")
+    parser.add_argument("--baseline", help="基線 JSON 路徑（存在時比較）")
+    parser.add_argument("--save-baseline", action="store_true", help="將本次結果寫入 --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允許的相對退化（默認 10%%）")
+
+
+def print_summary(report: dict) -> None:
+    latency = report["latency_ms"]
+    print(f"[INFO] 請求: {report['requests']}，錯誤: {sum(report['errors'].values())}，"
+          f"吞吐量: {report['throughput_img_s']} img/s")
+    if latency.get("count"):
+        print(f"[INFO] 延遲 ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+    for size, stats in report["latency_ms_by_size"].items():
+        print(f"       {size:8s} p50={stats['p50']} p95={stats['p95']} (n={stats['count']})")
+    if report["resources"]:
+        resources = report["resources"]
+        print(f"[INFO] CPU: {resources['cpu_seconds']}s（{resources['cpu_cores']} 核），"
+              f"峰值 RSS: {resources['peak_rss_mb']} MB（{resources['processes']} 個進程）")
+    if report["total_accuracy"] is not None:
+        print(f"[INFO] 總額識別正確率: {report['total_accuracy']:.1%}")
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="OCR 服務性能基準測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    corpus = sub.add_parser("corpus", help="生成合成收據語料")
+    corpus.add_argument("--out", default="bench-corpus", help="輸出目錄")
+    corpus.add_argument("--per-combination", type=int, default=2, help="每個（尺寸, 長度, 語言）組合的圖片數")
+    corpus.add_argument("--seed", type=int, default=42)
+    corpus.add_argument("--font", help="中文字體路徑（默認自動查找，也可用 OCR_BENCH_FONT）")
+
+    run = sub.add_parser("run", help="執行壓測")
+    run.add_argument("--mode", choices=("inproc", "http"), default="inproc")
+    run.add_argument("--corpus", default="bench-corpus", help="語料目錄（不存在時自動生成）")
+    run.add_argument("--font", help="自動生成語料時使用的中文字體")
+    run.add_argument("--workers", type=int, default=int(os.getenv("OCR_WORKERS", "1")), help="inproc 模式的 worker 數")
+    run.add_argument("--url", default=os.getenv("OCR_SERVICE_URL", "http://localhost:8000"))
+    run.add_argument("--uds", default=os.getenv("OCR_SERVICE_UDS"), help="http 模式使用 Unix domain socket")
+    run.add_argument("--lane", help="http 模式的優先級通道")
+    run.add_argument("--pid", type=int, help="http 模式下被測服務的進程 pid（採樣 CPU / RSS）")
+    run.add_argument("--concurrency", type=int, default=4)
+    run.add_argument("--requests", type=int, default=100, help="計入統計的請求數")
+    run.add_argument("--warmup", type=int, default=5)
+    add_result_arguments(run)
+
+    load = sub.add_parser("load", help="開環負載場景（soak / spike）")
+    load.add_argument("--scenario", choices=("soak", "spike"), default="soak")
+    load.add_argument("--rate", type=float, default=5.0, help="基線到達率（請求/秒，泊松到達）")
+    load.add_argument("--duration", type=float, default=20.0, help="soak 總時長；spike 的基線段 + 恢復段時長（秒）")
+    load.add_argument("--spike-multiplier", type=float, default=5.0, help="突增倍數")
+    load.add_argument("--spike-duration", type=float, default=5.0, help="突增持續時間（秒）")
+    load.add_argument("--timeout-ms", type=int, help="每個請求的預算（X-Request-Timeout）")
+    load.add_argument("--distinct", type=int, default=100000,
+                      help="不同圖片的數量（小於請求數時會重複，觸發結果緩存）")
+    load.add_argument("--seed", type=int, default=42, help="到達時間和樁引擎的隨機種子")
+    load.add_argument("--url", default=os.getenv("OCR_SERVICE_URL", "http://localhost:8000"))
+    load.add_argument("--uds", default=os.getenv("OCR_SERVICE_UDS"), help="使用 Unix domain socket")
+    load.add_argument("--lane", help="優先級通道")
+    load.add_argument("--spawn-stub", action="store_true", help="啟動使用樁引擎的服務子進程（忽略 --url）")
+    load.add_argument("--workers", type=int, default=2, help="--spawn-stub 的 worker 數")
+    load.add_argument("--stub-latency", default="lognormal:300:0.3", help="--spawn-stub 的延遲分佈")
+    load.add_argument("--max-queue", type=int, default=64, help="--spawn-stub 的 OCR_MAX_QUEUE")
+    add_result_arguments(load)
+
+    log_parser = sub.add_parser("logging", help="請求路徑上日誌調用的開銷")
+    log_parser.add_argument("--calls", type=int, default=20000, help="每種配置的日誌調用次數")
+    log_parser.add_argument("--concurrency", type=int, default=32, help="同時進行的模擬請求數")
+    log_parser.add_argument("--sink-delay-ms", type=float, default=0.0, help="每次寫出的模擬延遲（毫秒）")
+    log_parser.add_argument("--modes", nargs="+", choices=LOGGING_MODES, default=list(LOGGING_MODES))
+    add_result_arguments(log_parser)
+
+    cmp_parser = sub.add_parser("compare", help="比較兩次結果")
+    cmp_parser.add_argument("current")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("--tolerance", type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == "corpus":
+        generate_corpus(args.out, per_combination=args.per_combination, seed=args.seed, font=args.font)
+        return 0
+
+    if args.command == "compare":
+        result = compare_any(load_json(args.current), load_json(args.baseline), args.tolerance)
+        print(format_comparison(result))
+        return 1 if result["regressions"] else 0
+
+    if args.command == "load":
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        report = asyncio.run(run_load_scenario(args))
+        print_load_summary(report)
+        return finish(parser, args, report)
+
+    if args.command == "logging":
+        report = run_logging_benchmark(args)
+        print_logging_summary(report)
+        return finish(parser, args, report)
+
+    report = asyncio.run(run_benchmark(args))
+    print_summary(report)
+    return finish(parser, args, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
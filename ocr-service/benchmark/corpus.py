@@ -0,0 +1,255 @@
+"""
+合成收據語料
+按固定種子生成收據圖片（參考 scripts/generate-receipt-images.js 的收據樣式），
+覆蓋不同圖片尺寸、菜品數量和語言組合，並在 manifest.json 中記錄期望的總額。
+"""
+
+import json
+import logging
+import os
+import random
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+# 最長邊（像素）：聊天軟件壓縮圖 / 一般手機照片 / 原圖
+SIZES = {"small": 800, "medium": 1600, "large": 3200}
+# 菜品數量
+LENGTHS = {"short": 4, "medium": 12, "long": 30}
+LANGUAGES = ("zh", "en", "mixed")
+
+# 常見系統的中文字體，按順序嘗試
+CJK_FONT_CANDIDATES = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "C:/Windows/Fonts/msjh.ttc",
+    "C:/Windows/Fonts/msyh.ttc",
+)
+
+RESTAURANTS = {
+    "zh": ["大排檔", "金龍酒家", "翠華餐廳", "好運茶餐廳", "海港火鍋"],
+    "en": ["Harbour Grill", "Golden Dragon", "Blue Bistro", "Noodle House", "Corner Cafe"],
+}
+DISHES = {
+    "zh": ["乾炒牛河", "揚州炒飯", "白切雞", "咕嚕肉", "蒸魚", "燒鵝", "菜心", "蝦餃", "燒賣", "凍檸茶", "奶茶", "西多士"],
+    "en": ["Fried Rice", "Roast Duck", "Spring Rolls", "Beef Noodles", "Caesar Salad", "Fish Fillet",
+           "Dim Sum Set", "Iced Lemon Tea", "Milk Tea", "French Toast", "Garlic Bread", "Steamed Fish",
+           # 名稱含有表頭 / 服務費關鍵字的子串，版面解析不能把它們當成表頭或服務費
+           "Special Price Set", "Self-service Coffee", "Multiple Grain Rice", "Daily Item Combo"],
+}
+LABELS = {
+    "zh": {"subtotal": "小計", "service": "服務費 10%", "total": "總計", "date": "日期"},
+    "en": {"subtotal": "Subtotal", "service": "Service Charge 10%", "total": "Total", "date": "Date"},
+}
+
+
+@dataclass
+class CorpusItem:
+    """語料中的一張圖片"""
+
+    file: str
+    size: str
+    length: str
+    language: str
+    width: int
+    height: int
+    bytes: int
+    items: int
+    subtotal: float
+    total: float
+
+
+def find_cjk_font(explicit: Optional[str] = None) -> Optional[str]:
+    """查找可用的中文字體（--font 參數或 OCR_BENCH_FONT 優先）"""
+    for path in (explicit, os.getenv("OCR_BENCH_FONT"), *CJK_FONT_CANDIDATES):
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def _load_font(path: Optional[str], size: int):
+    if path:
+        return ImageFont.truetype(path, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 的默認字體不支持縮放
+        return ImageFont.load_default()
+
+
+def _pick(rng: random.Random, language: str, table: Dict[str, List[str]]) -> str:
+    if language == "mixed":
+        language = rng.choice(("zh", "en"))
+    return rng.choice(table[language])
+
+
+def render_receipt(
+    rng: random.Random,
+    language: str,
+    item_count: int,
+    font_path: Optional[str],
+) -> Tuple[Image.Image, float, float]:
+    """
+    繪製一張收據（紙面，未做拍照效果）
+
+    Returns:
+        (圖片, 小計, 總計)
+    """
+    labels = LABELS["zh" if language in ("zh", "mixed") else "en"]
+    width = 600
+    line_height = 40
+    height = 260 + (item_count + 4) * line_height
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    title_font = _load_font(font_path, 34)
+    font = _load_font(font_path, 24)
+
+    y = 30
+    draw.text((width // 2, y), _pick(rng, language, RESTAURANTS), fill="#1f2937", font=title_font, anchor="mt")
+    y += 70
+    day = date(2025, 1, 1) + timedelta(days=rng.randrange(365))
+    draw.text((40, y), f"{labels['date']}: {day.isoformat()}", fill="#374151", font=font)
+    y += line_height + 10
+    draw.line((30, y, width - 30, y), fill="#d1d5db", width=2)
+    y += 20
+
+    subtotal = 0.0
+    for _ in range(item_count):
+        price = float(rng.randrange(18, 320))
+        subtotal += price
+        draw.text((40, y), _pick(rng, language, DISHES), fill="#111827", font=font)
+        draw.text((width - 40, y), f"{price:.2f}", fill="#111827", font=font, anchor="ra")
+        y += line_height
+
+    y += 10
+    draw.line((30, y, width - 30, y), fill="#d1d5db", width=2)
+    y += 20
+    service = round(subtotal * 0.1, 2)
+    total = round(subtotal + service, 2)
+    for label, amount in ((labels["subtotal"], subtotal), (labels["service"], service), (labels["total"], total)):
+        draw.text((40, y), label, fill="#111827", font=font)
+        draw.text((width - 40, y), f"{amount:.2f}", fill="#111827", font=font, anchor="ra")
+        y += line_height
+    return image, subtotal, total
+
+
+def photograph(rng: random.Random, receipt: Image.Image, long_side: int) -> np.ndarray:
+    """模擬手機拍攝：放到桌面背景上、輕微旋轉、光照不均和噪點，縮放到指定最長邊"""
+    paper = cv2.cvtColor(np.asarray(receipt), cv2.COLOR_RGB2BGR)
+    h, w = paper.shape[:2]
+    canvas_h, canvas_w = int(h * 1.25), int(w * 1.6)
+    canvas = np.full((canvas_h, canvas_w, 3), rng.randrange(60, 140), dtype=np.uint8)
+    top, left = (canvas_h - h) // 2, (canvas_w - w) // 2
+    canvas[top:top + h, left:left + w] = paper
+
+    angle = rng.uniform(-4, 4)
+    matrix = cv2.getRotationMatrix2D((canvas_w / 2, canvas_h / 2), angle, 1.0)
+    canvas = cv2.warpAffine(canvas, matrix, (canvas_w, canvas_h), borderMode=cv2.BORDER_REPLICATE)
+
+    gradient = np.linspace(rng.uniform(0.75, 0.95), rng.uniform(1.0, 1.1), canvas_w, dtype=np.float32)
+    noise = np.random.default_rng(rng.randrange(1 << 30)).normal(0, 4, canvas.shape).astype(np.float32)
+    canvas = np.clip(canvas.astype(np.float32) * gradient[None, :, None] + noise, 0, 255).astype(np.uint8)
+
+    scale = long_side / max(canvas.shape[:2])
+    return cv2.resize(canvas, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+
+
+def generate_corpus(
+    output_dir: str,
+    per_combination: int = 2,
+    sizes: Sequence[str] = tuple(SIZES),
+    lengths: Sequence[str] = tuple(LENGTHS),
+    languages: Sequence[str] = LANGUAGES,
+    seed: int = 42,
+    font: Optional[str] = None,
+) -> List[CorpusItem]:
+    """
+    生成語料並寫入 manifest.json
+
+    Args:
+        output_dir: 輸出目錄
+        per_combination: 每個（尺寸, 長度, 語言）組合生成的圖片數
+        seed: 隨機種子（相同參數和字體下生成的圖片逐字節一致）
+        font: 中文字體路徑；找不到時中文和混合語料退化為英文
+
+    Returns:
+        語料列表
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    font_path = find_cjk_font(font)
+    if font_path is None:
+        logger.warning("找不到中文字體（可用 --font 或 OCR_BENCH_FONT 指定），中文語料將以英文生成")
+
+    rng = random.Random(seed)
+    items: List[CorpusItem] = []
+    for size in sizes:
+        for length in lengths:
+            for language in languages:
+                effective = language if font_path else "en"
+                for index in range(per_combination):
+                    receipt, subtotal, total = render_receipt(rng, effective, LENGTHS[length], font_path)
+                    photo = photograph(rng, receipt, SIZES[size])
+                    name = f"{size}-{length}-{language}-{index:02d}.jpg"
+                    path = os.path.join(output_dir, name)
+                    cv2.imwrite(path, photo, [cv2.IMWRITE_JPEG_QUALITY, 88])
+                    items.append(CorpusItem(
+                        file=name,
+                        size=size,
+                        length=length,
+                        language=effective,
+                        width=photo.shape[1],
+                        height=photo.shape[0],
+                        bytes=os.path.getsize(path),
+                        items=LENGTHS[length],
+                        subtotal=subtotal,
+                        total=total,
+                    ))
+
+    manifest = {
+        "seed": seed,
+        "per_combination": per_combination,
+        "font": os.path.basename(font_path) if font_path else None,
+        "items": [asdict(item) for item in items],
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"已生成 {len(items)} 張收據圖片: {output_dir}")
+    return items
+
+
+def load_corpus(corpus_dir: str) -> List[CorpusItem]:
+    """
+    讀取語料
+
+    有 manifest.json 時按清單讀取；否則把目錄中的圖片當作未標註語料（用真實收據照片壓測）
+    """
+    manifest_path = os.path.join(corpus_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return [CorpusItem(**item) for item in json.load(f)["items"]]
+
+    items = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if os.path.splitext(name)[1].lower() not in (".jpg", ".jpeg", ".png", ".bmp", ".webp"):
+            continue
+        path = os.path.join(corpus_dir, name)
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            continue
+        items.append(CorpusItem(
+            file=name, size="unknown", length="unknown", language="unknown",
+            width=image.shape[1], height=image.shape[0], bytes=os.path.getsize(path),
+            items=0, subtotal=0.0, total=0.0,
+        ))
+    return items
@@ -0,0 +1,215 @@
+"""
+壓測驅動
+- InProcessDriver: 在當前進程中啟動 worker 池和調度器，直接提交圖片（不含 HTTP 開銷）
+- HTTPDriver: 向運行中的服務發送 /ocr/raw 請求（TCP 或 Unix domain socket）
+兩者都由 run_load 按固定並發驅動。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from benchmark.corpus import CorpusItem
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Sample:
+    """單次請求的結果"""
+
+    file: str
+    size: str
+    language: str
+    latency_ms: float
+    ok: bool
+    error: Optional[str] = None
+    total_match: Optional[bool] = None  # 語料有標註時，識別出的總額是否與期望一致
+
+
+def _total_matches(expected: float, recognized: Any) -> Optional[bool]:
+    if not expected:
+        return None
+    try:
+        return recognized is not None and abs(float(recognized) - expected) < 0.01
+    except (TypeError, ValueError):
+        return False
+
+
+class InProcessDriver:
+    """
+    進程內驅動：直接使用 OCRWorkerPool + OCRScheduler
+
+    Args:
+        workers: worker 進程數
+        engine_options: 傳給 ocr_engine.create_engine 的參數（默認按環境變數，OCR_ENGINE=stub 時使用樁引擎）
+    """
+
+    name = "inproc"
+
+    def __init__(self, workers: int = 1, engine_options: Optional[Dict[str, Any]] = None):
+        from ocr_engine import engine_options_from_env
+
+        self.workers = workers
+        self.engine_options = engine_options or engine_options_from_env()
+        self.pool = None
+        self.scheduler = None
+
+    async def start(self) -> None:
+        from scheduler import OCRScheduler
+        from worker_pool import OCRWorkerPool
+
+        # 壓測期間不回收 worker，避免預熱時間混入延遲
+        self.pool = OCRWorkerPool(self.workers, self.engine_options, max_requests=0, max_rss_mb=0)
+        await self.pool.start()
+        self.scheduler = OCRScheduler(self.pool, max_queue=1 << 20)
+        await self.scheduler.start()
+
+    async def recognize(self, item: CorpusItem, path: str, content: bytes) -> Optional[bool]:
+        from receipt_layout import parse_receipt_layout
+
+        lines, _ = await self.scheduler.submit(path)
+        return _total_matches(item.total, parse_receipt_layout(lines)["total"])
+
+    async def close(self) -> None:
+        if self.scheduler:
+            await self.scheduler.close()
+        if self.pool:
+            await self.pool.close()
+
+    def service_metrics(self) -> Optional[Dict[str, Any]]:
+        return {"pool": self.pool.metrics(), "scheduler": self.scheduler.metrics()} if self.pool else None
+
+
+class HTTPDriver:
+    """
+    HTTP 驅動：POST /ocr/raw?fields=total
+
+    測的是服務的完整路徑；服務端應關閉結果緩存和近似重複復用
+    （OCR_RESULT_CACHE_SIZE=0 OCR_PHASH_MODE=off），否則重複圖片不會觸發推理。
+
+    Args:
+        url: 服務地址
+        uds: Unix domain socket 路徑（可選）
+        lane: 優先級通道（可選）
+    """
+
+    name = "http"
+
+    def __init__(self, url: str = "http://localhost:8000", uds: Optional[str] = None, lane: Optional[str] = None):
+        self.url = url
+        self.uds = uds
+        self.lane = lane
+        self.client = None
+        self._metrics_before: Optional[Dict[str, Any]] = None
+        self._metrics_after: Optional[Dict[str, Any]] = None
+
+    async def _fetch_metrics(self) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self.client.get("/metrics")
+            return response.json() if response.status_code == 200 else None
+        except Exception:
+            return None
+
+    async def start(self) -> None:
+        import httpx
+
+        transport = httpx.AsyncHTTPTransport(uds=self.uds) if self.uds else None
+        self.client = httpx.AsyncClient(
+            base_url="http://ocr" if self.uds else self.url,
+            transport=transport,
+            timeout=300.0,
+            limits=httpx.Limits(max_connections=256, max_keepalive_connections=256),
+        )
+        self._metrics_before = await self._fetch_metrics()
+
+    async def recognize(self, item: CorpusItem, path: str, content: bytes) -> Optional[bool]:
+        params = {"fields": "total"}
+        if self.lane:
+            params["lane"] = self.lane
+        response = await self.client.post(
+            "/ocr/raw",
+            content=content,
+            params=params,
+            headers={"Content-Type": "image/jpeg"},
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return _total_matches(item.total, response.json().get("total"))
+
+    async def close(self) -> None:
+        if self.client:
+            self._metrics_after = await self._fetch_metrics()
+            await self.client.aclose()
+
+    def service_metrics(self) -> Optional[Dict[str, Any]]:
+        after = self._metrics_after
+        if not after:
+            return None
+        before = self._metrics_before or {}
+        hits = ((after.get("result_cache") or {}).get("hits", 0)
+                - (before.get("result_cache") or {}).get("hits", 0))
+        reused = ((after.get("near_duplicates") or {}).get("reused", 0)
+                  - (before.get("near_duplicates") or {}).get("reused", 0))
+        if hits or reused:
+            logger.warning(f"壓測期間有 {hits} 次結果緩存命中、{reused} 次近似重複復用，延遲會偏低")
+        return {"cache_hits": hits, "near_duplicate_reuses": reused, "scheduler": after.get("scheduler")}
+
+
+async def run_load(
+    driver,
+    items: List[CorpusItem],
+    corpus_dir: str,
+    concurrency: int,
+    requests: int,
+    warmup: int = 0,
+) -> Dict[str, Any]:
+    """
+    按固定並發驅動壓測
+
+    Args:
+        driver: InProcessDriver 或 HTTPDriver（已 start）
+        items: 語料（按順序循環使用）
+        corpus_dir: 語料目錄
+        concurrency: 同時在途的請求數
+        requests: 計入統計的請求總數
+        warmup: 預熱請求數（串行執行，不計入統計）
+
+    Returns:
+        {"samples": [Sample...], "elapsed_s": 牆鐘時間}
+    """
+    paths = [os.path.join(corpus_dir, item.file) for item in items]
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+
+    for i in range(warmup):
+        index = i % len(items)
+        try:
+            await driver.recognize(items[index], paths[index], contents[index])
+        except Exception as e:
+            logger.warning(f"預熱請求失敗: {e}")
+
+    samples: List[Sample] = []
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        for i in counter:
+            index = i % len(items)
+            item = items[index]
+            started = time.perf_counter()
+            try:
+                total_match = await driver.recognize(item, paths[index], contents[index])
+                samples.append(Sample(item.file, item.size, item.language,
+                                      (time.perf_counter() - started) * 1000.0, True, total_match=total_match))
+            except Exception as e:
+                samples.append(Sample(item.file, item.size, item.language,
+                                      (time.perf_counter() - started) * 1000.0, False, error=str(e)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return {"samples": samples, "elapsed_s": time.perf_counter() - started}
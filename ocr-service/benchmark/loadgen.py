@@ -0,0 +1,300 @@
+"""
+開環負載生成器（soak / spike 場景）
+按泊松到達向 /ocr/raw 發送請求，不等待前一個請求完成，
+用於觀察調度器在過載時的排隊、截止時間和降載行為。
+
+配合樁引擎（OCR_ENGINE=stub）可以在數秒內重現，結果只取決於種子和延遲分佈。
+"""
+
+import asyncio
+import io
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from benchmark.report import latency_summary
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Phase:
+    """一段恆定到達率的負載"""
+
+    name: str
+    rate: float  # 每秒請求數
+    duration_s: float
+
+
+@dataclass
+class Outcome:
+    """單次請求的結果"""
+
+    phase: str
+    sent_at: float  # 相對壓測開始的秒數
+    latency_ms: float
+    status: int  # HTTP 狀態碼；連接錯誤為 0
+
+
+@dataclass
+class Timeline:
+    """每秒採樣的服務端 /metrics"""
+
+    points: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def build_phases(scenario: str, rate: float, duration_s: float,
+                 spike_multiplier: float = 5.0, spike_s: float = 5.0) -> List[Phase]:
+    """
+    構造場景
+
+    Args:
+        scenario: soak（恆定速率持續 duration_s）或 spike（基線 → 突增 → 恢復）
+        rate: 基線到達率（請求/秒）
+        duration_s: soak 的總時長；spike 的基線段和恢復段各佔一半
+        spike_multiplier: 突增倍數
+        spike_s: 突增持續時間
+    """
+    if scenario == "soak":
+        return [Phase("soak", rate, duration_s)]
+    if scenario == "spike":
+        half = duration_s / 2
+        return [
+            Phase("baseline", rate, half),
+            Phase("spike", rate * spike_multiplier, spike_s),
+            Phase("recovery", rate, half),
+        ]
+    raise ValueError(f"未知場景: {scenario}（可選 soak, spike）")
+
+
+def make_payloads(distinct: int, seed: int) -> List[bytes]:
+    """
+    生成 distinct 張互不相同的小圖片（JPEG）
+
+    樁引擎不看像素，圖片只需要能被解碼；張數決定結果緩存的命中率
+    （distinct 小於請求數時會重複發送）。
+    """
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(max(1, distinct)):
+        image = Image.new("L", (320, 240), 255)
+        draw = ImageDraw.Draw(image)
+        draw.text((10, 10), f"LOAD {seed}-{i}", fill=0)
+        for _ in range(12):
+            x, y = rng.randrange(300), rng.randrange(220)
+            draw.rectangle((x, y, x + rng.randrange(4, 20), y + 3), fill=rng.randrange(160))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        payloads.append(buffer.getvalue())
+    return payloads
+
+
+def arrival_schedule(phases: List[Phase], seed: int) -> List[Tuple[float, str]]:
+    """按泊松過程預先計算所有請求的發送時刻（相對秒數）"""
+    rng = random.Random(seed)
+    schedule = []
+    start = 0.0
+    for phase in phases:
+        if phase.rate > 0:
+            t = start + rng.expovariate(phase.rate)
+            while t < start + phase.duration_s:
+                schedule.append((t, phase.name))
+                t += rng.expovariate(phase.rate)
+        start += phase.duration_s
+    return schedule
+
+
+async def _poll_metrics(client, timeline: Timeline, started: float, stop: asyncio.Event,
+                        interval: float = 1.0) -> None:
+    while not stop.is_set():
+        try:
+            response = await client.get("/metrics")
+            if response.status_code == 200:
+                data = response.json()
+                scheduler = data.get("scheduler") or {}
+                timeline.points.append({
+                    "t": round(time.perf_counter() - started, 2),
+                    "queued": scheduler.get("queued"),
+                    "service_time_s": scheduler.get("service_time_s"),
+                    "shed_total": sum((scheduler.get("shed_total") or {}).values()),
+                    # 日誌隊列已滿時丟棄的記錄數：非零說明日誌寫出跟不上請求速率
+                    "log_dropped": (data.get("logging") or {}).get("dropped_full"),
+                })
+        except Exception as e:
+            logger.debug(f"採樣 /metrics 失敗: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_scenario(
+    url: str,
+    phases: List[Phase],
+    payloads: List[bytes],
+    seed: int = 42,
+    timeout_ms: Optional[int] = None,
+    lane: Optional[str] = None,
+    uds: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    執行場景
+
+    Args:
+        url: 服務地址
+        phases: build_phases 的結果
+        payloads: 圖片內容（按順序循環使用）
+        seed: 到達時間的隨機種子
+        timeout_ms: 每個請求的預算（X-Request-Timeout），None 時使用服務端默認值
+        lane: 優先級通道
+        uds: Unix domain socket 路徑
+
+    Returns:
+        {"outcomes": [Outcome...], "timeline": [...], "elapsed_s": 牆鐘時間}
+    """
+    import httpx
+
+    schedule = arrival_schedule(phases, seed)
+    headers = {"Content-Type": "image/jpeg"}
+    if timeout_ms:
+        headers["X-Request-Timeout"] = str(timeout_ms)
+    params = {"fields": "total"}
+    if lane:
+        params["lane"] = lane
+
+    transport = httpx.AsyncHTTPTransport(uds=uds) if uds else None
+    outcomes: List[Outcome] = []
+    timeline = Timeline()
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(
+        base_url="http://ocr" if uds else url,
+        transport=transport,
+        timeout=300.0,
+        limits=httpx.Limits(max_connections=1024, max_keepalive_connections=256),
+    ) as client:
+
+        async def send(offset: float, phase: str, payload: bytes) -> None:
+            sent = time.perf_counter()
+            try:
+                response = await client.post("/ocr/raw", content=payload, params=params, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            outcomes.append(Outcome(phase, round(offset, 3), (time.perf_counter() - sent) * 1000.0, status))
+
+        started = time.perf_counter()
+        poller = asyncio.create_task(_poll_metrics(client, timeline, started, stop))
+        tasks = []
+        for i, (offset, phase) in enumerate(schedule):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(offset, phase, payloads[i % len(payloads)])))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await poller
+
+    return {"outcomes": outcomes, "timeline": timeline.points, "elapsed_s": elapsed}
+
+
+def summarize(outcomes: List[Outcome], phases: List[Phase], elapsed_s: float) -> Dict[str, Any]:
+    """按階段匯總狀態碼、延遲和降載率"""
+
+    def stats(subset: List[Outcome], duration_s: float) -> Dict[str, Any]:
+        statuses = Counter(o.status for o in subset)
+        ok = [o.latency_ms for o in subset if o.status == 200]
+        return {
+            "requests": len(subset),
+            "status": {str(code): count for code, count in sorted(statuses.items())},
+            "ok_rate": round(len(ok) / len(subset), 4) if subset else 0.0,
+            # 503（排隊已滿或預計超時）與 504（排隊期間超時）都算作降載
+            "shed_rate": round((statuses[503] + statuses[504]) / len(subset), 4) if subset else 0.0,
+            "goodput_rps": round(len(ok) / duration_s, 3) if duration_s else 0.0,
+            "latency_ms": latency_summary(ok),
+        }
+
+    return {
+        "overall": stats(outcomes, elapsed_s),
+        "phases": {
+            phase.name: dict(stats([o for o in outcomes if o.phase == phase.name], phase.duration_s),
+                             offered_rps=phase.rate, duration_s=phase.duration_s)
+            for phase in phases
+        },
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StubService:
+    """
+    啟動使用樁引擎的服務子進程（uvicorn main:app）
+
+    Args:
+        workers: OCR worker 數
+        latency: 樁引擎延遲分佈（見 stub_engine.LatencyDistribution）
+        seed: 樁引擎隨機種子
+        env: 額外的環境變數（例如 OCR_MAX_QUEUE、OCR_RESULT_CACHE_SIZE）
+    """
+
+    def __init__(self, workers: int = 2, latency: str = "lognormal:300:0.3", seed: int = 0,
+                 env: Optional[Dict[str, str]] = None):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(
+            os.environ,
+            OCR_ENGINE="stub",
+            OCR_WORKERS=str(workers),
+            OCR_STUB_LATENCY=latency,
+            OCR_STUB_SEED=str(seed),
+            **(env or {}),
+        )
+        self.process: Optional[subprocess.Popen] = None
+
+    async def start(self, timeout: float = 60.0) -> None:
+        import httpx
+
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=SERVICE_DIR,
+            env=self.env,
+        )
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(base_url=self.url, timeout=2.0) as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"樁服務啟動失敗（退出碼 {self.process.returncode}）")
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        self.stop()
+        raise RuntimeError("樁服務啟動超時")
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
@@ -0,0 +1,121 @@
+"""
+日誌開銷基準（python -m benchmark logging）
+在 asyncio 事件循環中模擬請求路徑上的日誌調用（帶請求上下文和 extra 字段），
+測量每次 logger 調用在調用方阻塞的時間，比較三種配置：
+
+- off: 級別高於 INFO，調用立即返回（調用本身的下限）
+- sync: StreamHandler + JSONFormatter 直接掛在根 logger 上（改造前的方式）
+- queue: structured_logging.setup_logging（隊列 + 後台寫出線程）
+
+--sink-delay-ms 模擬寫出變慢（stderr 被管道或容器日誌驅動反壓），
+此時 sync 的每次調用都要等待寫出，queue 只有入隊開銷。
+"""
+
+import asyncio
+import io
+import logging
+import time
+from typing import Any, Dict, List
+
+from benchmark.report import latency_summary
+
+MODES = ("off", "sync", "queue")
+
+
+class SlowSink(io.TextIOBase):
+    """丟棄寫入內容，每次寫入前等待 delay_s 秒"""
+
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        if self.delay_s > 0:
+            time.sleep(self.delay_s)
+        self.writes += 1
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _configure(mode: str, sink: SlowSink) -> None:
+    import structured_logging
+
+    structured_logging.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == "queue":
+        structured_logging.setup_logging(fmt="json", level="INFO", stream=sink)
+        return
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(structured_logging.JSONFormatter())
+    handler.addFilter(structured_logging.ContextFilter())
+    root.addHandler(handler)
+    root.setLevel(logging.WARNING if mode == "off" else logging.INFO)
+
+
+async def _simulate(calls: int, concurrency: int) -> List[float]:
+    """concurrency 個協程模擬請求，每個請求記錄兩條日誌（開始 / 完成），返回每次調用的微秒數"""
+    from structured_logging import bind_context
+
+    logger = logging.getLogger("main")
+    timings: List[float] = []
+    counter = iter(range(calls // 2))
+
+    async def request_loop() -> None:
+        for i in counter:
+            bind_context(request_id=f"bench-{i}", path="/ocr/raw", lane="interactive")
+            started = time.perf_counter()
+            logger.info(f"開始 OCR 識別（raw）: {1024 + i} 字節", extra={"bytes": 1024 + i})
+            timings.append((time.perf_counter() - started) * 1e6)
+            await asyncio.sleep(0)
+            started = time.perf_counter()
+            logger.info("OCR 識別完成: 12 行文字，總文字長度: 68 字符",
+                        extra={"source": "ocr", "lines": 12, "chars": 68})
+            timings.append((time.perf_counter() - started) * 1e6)
+
+    await asyncio.gather(*(asyncio.create_task(request_loop()) for _ in range(max(1, concurrency))))
+    return timings
+
+
+def measure_logging(calls: int = 20000, concurrency: int = 32, sink_delay_ms: float = 0.0,
+                    modes=MODES) -> Dict[str, Any]:
+    """
+    依次測量各配置
+
+    Args:
+        calls: 每種配置的日誌調用次數
+        concurrency: 同時進行的模擬請求數
+        sink_delay_ms: 每次寫出的模擬延遲（毫秒）
+        modes: 要測量的配置
+
+    Returns:
+        {mode: {"call_us": 延遲分佈, "calls_per_s": ..., "written": ..., "dropped": ...}}
+    """
+    import structured_logging
+
+    results = {}
+    try:
+        for mode in modes:
+            sink = SlowSink(sink_delay_ms / 1000.0)
+            _configure(mode, sink)
+            started = time.perf_counter()
+            timings = asyncio.run(_simulate(calls, concurrency))
+            elapsed = time.perf_counter() - started
+            stats = structured_logging.logging_stats() if mode == "queue" else {}
+            # 停止監聽線程時寫出隊列中剩餘的記錄，不計入調用方耗時
+            structured_logging.shutdown_logging()
+            results[mode] = {
+                "call_us": latency_summary(timings),
+                "calls_per_s": round(len(timings) / elapsed, 1) if elapsed else 0.0,
+                "written": sink.writes,
+                "dropped": stats.get("dropped_full", 0),
+            }
+    finally:
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        logging.basicConfig(level=logging.INFO)
+    return results
@@ -0,0 +1,216 @@
+"""
+壓測結果匯總與基線比較
+"""
+
+import json
+import os
+import platform
+import subprocess
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from benchmark.drivers import Sample
+
+# 與基線比較的指標：(路徑, 越大越好)
+COMPARED_METRICS: Tuple[Tuple[str, bool], ...] = (
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+    ("latency_ms.p99", False),
+    ("throughput_img_s", True),
+    ("resources.cpu_seconds_per_image", False),
+    ("resources.peak_rss_mb", False),
+)
+
+# 兩次結果可比較的前提
+COMPARABLE_KEYS = ("mode", "concurrency", "corpus_size", "workers")
+
+# 負載場景（python -m benchmark load）的比較指標和前提
+LOAD_COMPARED_METRICS: Tuple[Tuple[str, bool], ...] = (
+    ("summary.overall.latency_ms.p50", False),
+    ("summary.overall.latency_ms.p99", False),
+    ("summary.overall.goodput_rps", True),
+    ("summary.overall.ok_rate", True),
+)
+LOAD_COMPARABLE_KEYS = ("scenario", "rate", "duration_s", "workers", "stub_latency", "seed")
+
+# 日誌開銷（python -m benchmark logging）的比較指標和前提
+LOGGING_COMPARED_METRICS: Tuple[Tuple[str, bool], ...] = (
+    ("modes.queue.call_us.p50", False),
+    ("modes.queue.call_us.p99", False),
+)
+LOGGING_COMPARABLE_KEYS = ("calls", "concurrency", "sink_delay_ms")
+
+
+def latency_summary(latencies: Sequence[float]) -> Dict[str, float]:
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_meta(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """壓測參數加上運行環境（時間、提交、平台）"""
+    return dict(
+        meta,
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        git_commit=_git_commit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+    )
+
+
+def build_report(
+    samples: List[Sample],
+    elapsed_s: float,
+    meta: Dict[str, Any],
+    resources: Optional[Dict[str, Any]] = None,
+    service: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    匯總壓測結果
+
+    Args:
+        samples: run_load 的樣本
+        elapsed_s: 牆鐘時間
+        meta: 壓測參數（mode / concurrency / workers / corpus_size 等）
+        resources: ResourceSampler.report()
+        service: 驅動返回的服務端指標
+    """
+    ok = [s for s in samples if s.ok]
+    by_size: Dict[str, List[float]] = defaultdict(list)
+    by_language: Dict[str, List[float]] = defaultdict(list)
+    for s in ok:
+        by_size[s.size].append(s.latency_ms)
+        by_language[s.language].append(s.latency_ms)
+    labelled = [s.total_match for s in ok if s.total_match is not None]
+
+    if resources is not None and ok:
+        resources = dict(resources, cpu_seconds_per_image=round(resources["cpu_seconds"] / len(ok), 4))
+
+    errors: Dict[str, int] = defaultdict(int)
+    for s in samples:
+        if not s.ok:
+            errors[s.error or "unknown"] += 1
+
+    return {
+        "meta": run_meta(meta),
+        "requests": len(samples),
+        "errors": dict(errors),
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_img_s": round(len(ok) / elapsed_s, 3) if elapsed_s else 0.0,
+        "latency_ms": latency_summary([s.latency_ms for s in ok]),
+        "latency_ms_by_size": {key: latency_summary(values) for key, values in sorted(by_size.items())},
+        "latency_ms_by_language": {key: latency_summary(values) for key, values in sorted(by_language.items())},
+        "total_accuracy": round(sum(labelled) / len(labelled), 4) if labelled else None,
+        "resources": resources,
+        "service": service,
+    }
+
+
+def _lookup(report: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = report
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.1,
+    metrics: Sequence[Tuple[str, bool]] = COMPARED_METRICS,
+    keys: Sequence[str] = COMPARABLE_KEYS,
+) -> Dict[str, Any]:
+    """
+    與基線比較
+
+    Args:
+        tolerance: 允許的相對退化（0.1 = 10%）
+        metrics: 比較的指標 (路徑, 越大越好)
+        keys: meta 中必須一致的參數
+
+    Returns:
+        {"comparable": bool, "mismatched": [...], "metrics": [...], "regressions": [...]}
+    """
+    mismatched = [
+        key for key in keys
+        if current["meta"].get(key) != baseline.get("meta", {}).get(key)
+    ]
+    rows = []
+    for path, higher_is_better in metrics:
+        now, before = _lookup(current, path), _lookup(baseline, path)
+        if now is None or before is None or before == 0:
+            continue
+        change = (now - before) / before
+        regressed = -change > tolerance if higher_is_better else change > tolerance
+        rows.append({
+            "metric": path,
+            "baseline": before,
+            "current": now,
+            "change": round(change, 4),
+            "regressed": regressed,
+        })
+    return {
+        "comparable": not mismatched,
+        "mismatched": mismatched,
+        "tolerance": tolerance,
+        "metrics": rows,
+        "regressions": [row["metric"] for row in rows if row["regressed"]],
+    }
+
+
+def format_comparison(result: Dict[str, Any]) -> str:
+    lines = []
+    if result["mismatched"]:
+        lines.append(f"[WARN] 與基線的參數不同: {', '.join(result['mismatched'])}，比較結果僅供參考")
+    for row in result["metrics"]:
+        flag = "退化" if row["regressed"] else "ok"
+        lines.append(f"  {row['metric']:36s} {row['baseline']:>12} → {row['current']:>12} "
+                     f"({row['change']:+.1%}) {flag}")
+    return "\n".join(lines)
+
+
+def load_json(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: Dict[str, Any]) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def compare_any(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.1) -> Dict[str, Any]:
+    """按結果類型（run、load 或 logging）選擇比較指標"""
+    if current.get("meta", {}).get("benchmark") == "logging":
+        return compare(current, baseline, tolerance, LOGGING_COMPARED_METRICS, LOGGING_COMPARABLE_KEYS)
+    if current.get("meta", {}).get("scenario"):
+        return compare(current, baseline, tolerance, LOAD_COMPARED_METRICS, LOAD_COMPARABLE_KEYS)
+    return compare(current, baseline, tolerance)
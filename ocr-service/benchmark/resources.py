@@ -0,0 +1,154 @@
+"""
+進程樹資源採樣
+定期採樣被測進程及其子進程（OCR worker）的 CPU 時間和 RSS。
+優先使用 psutil（跨平台）；未安裝時在 Linux 上讀取 /proc，其他平台不採樣。
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# 可選依賴：未安裝時回退到 /proc
+try:
+    import psutil
+except ImportError:  # pragma: no cover - 取決於部署環境
+    psutil = None
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_children() -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(name))
+    return children
+
+
+def _proc_sample(pid: int) -> Optional[Tuple[float, int]]:
+    """(CPU 秒數, RSS 字節)"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm", "r") as f:
+            resident = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # fields 從 state（第 3 列）開始：utime / stime 為第 14、15 列
+    cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    return cpu, resident * _PAGE_SIZE
+
+
+def process_tree(pid: int) -> List[int]:
+    """pid 及其所有子孫進程"""
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            return [pid] + [child.pid for child in root.children(recursive=True)]
+        except psutil.Error:
+            return []
+    if not os.path.isdir("/proc"):
+        return []
+    children = _proc_children()
+    result, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        result.append(current)
+        stack.extend(children.get(current, []))
+    return result
+
+
+def sample_process(pid: int) -> Optional[Tuple[float, int]]:
+    """(CPU 秒數, RSS 字節)；進程不存在或平台不支持時返回 None"""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            times = process.cpu_times()
+            return times.user + times.system, process.memory_info().rss
+        except psutil.Error:
+            return None
+    if os.path.isdir("/proc"):
+        return _proc_sample(pid)
+    return None
+
+
+class ResourceSampler:
+    """
+    後台線程定期採樣進程樹
+
+    CPU 時間按每個進程的首末採樣差值累加（測試期間被回收的 worker 計到最後一次採樣為止）；
+    峰值 RSS 為採樣期間整棵進程樹 RSS 之和的最大值。
+
+    Args:
+        pid: 根進程（進程內模式為當前進程，HTTP 模式為服務進程）
+        interval: 採樣間隔（秒）
+    """
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self._first: Dict[int, float] = {}
+        self._last: Dict[int, float] = {}
+        self._peak_rss = 0
+        self._peak_by_pid: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self._elapsed = 0.0
+        self.supported = sample_process(pid) is not None
+
+    def _sample(self) -> None:
+        total_rss = 0
+        for pid in process_tree(self.pid):
+            sample = sample_process(pid)
+            if sample is None:
+                continue
+            cpu, rss = sample
+            self._first.setdefault(pid, cpu)
+            self._last[pid] = cpu
+            total_rss += rss
+            self._peak_by_pid[pid] = max(self._peak_by_pid.get(pid, 0), rss)
+        self._peak_rss = max(self._peak_rss, total_rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        if not self.supported:
+            return
+        self._started_at = time.perf_counter()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self.supported or self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        self._elapsed = time.perf_counter() - self._started_at
+
+    def report(self) -> Optional[Dict[str, Any]]:
+        if not self.supported:
+            return None
+        cpu_seconds = sum(self._last[pid] - self._first[pid] for pid in self._last)
+        return {
+            "cpu_seconds": round(cpu_seconds, 3),
+            # 平均佔用的核數（1.0 = 一個核滿載）
+            "cpu_cores": round(cpu_seconds / self._elapsed, 3) if self._elapsed else 0.0,
+            "peak_rss_mb": round(self._peak_rss / 1024 / 1024, 1),
+            "peak_rss_by_process_mb": {
+                str(pid): round(rss / 1024 / 1024, 1) for pid, rss in sorted(self._peak_by_pid.items())
+            },
+            "processes": len(self._peak_by_pid),
+        }
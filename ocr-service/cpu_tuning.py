@@ -0,0 +1,544 @@
+"""
+CPU 拓撲感知的 worker / 推理線程調優
+每個 worker 進程的 Paddle 推理默認按機器核數開線程，多個 worker 疊加後會嚴重超額訂閱 CPU。
+本模組讀取 CPU 拓撲（物理核、超線程、NUMA 節點、cgroup 配額），
+在 worker 數 × 每 worker 線程數 × 綁核方式的組合中實測吞吐量，選出最優佈局並按主機類型持久化。
+
+    # 離線校準（寫入 OCR_TUNING_FILE，之後啟動服務時自動應用）
+    python cpu_tuning.py --images bench-corpus --requests 30
+
+    # 只查看拓撲和候選佈局
+    python cpu_tuning.py --dry-run
+"""
+
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import platform
+import re
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 綁核方式：none 不綁定；core 每個 worker 獨佔若干物理核（含超線程）；numa 每個 worker 綁定一個 NUMA 節點
+PINNING_MODES = ("none", "core", "numa")
+
+DEFAULT_TUNING_FILE = os.path.join(os.path.expanduser("~"), ".cache", "ocr-service", "cpu_tuning.json")
+
+# 估算可啟動的 worker 數時，每個 PaddleOCR worker 預留的內存
+WORKER_MEMORY_MB = 1500
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """解析 "0-3,8,10-11" 格式的 CPU 列表"""
+    cpus: List[int] = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    """容器的 CPU 配額（核數）；未限制時返回 None"""
+    v2 = _read("/sys/fs/cgroup/cpu.max")
+    if v2:
+        quota, _, period = v2.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def _cpu_model() -> str:
+    cpuinfo = _read("/proc/cpuinfo") or ""
+    match = re.search(r"^model name\s*:\s*(.+)$", cpuinfo, re.MULTILINE)
+    return match.group(1).strip() if match else (platform.processor() or platform.machine())
+
+
+def available_memory_mb() -> Optional[int]:
+    """MemAvailable（MB）；非 Linux 返回 None"""
+    meminfo = _read("/proc/meminfo") or ""
+    match = re.search(r"^MemAvailable:\s*(\d+) kB", meminfo, re.MULTILINE)
+    return int(match.group(1)) // 1024 if match else None
+
+
+@dataclass
+class CPUTopology:
+    """
+    本進程可用的 CPU 拓撲
+
+    Args:
+        cpus: 可調度的邏輯 CPU（sched_getaffinity）
+        cores: 物理核，每項為該核上的邏輯 CPU（超線程兄弟）
+        nodes: NUMA 節點，每項為節點上的邏輯 CPU
+        model: CPU 型號
+        quota: cgroup CPU 配額（核數），None 表示不限
+    """
+
+    cpus: List[int]
+    cores: List[List[int]]
+    nodes: List[List[int]]
+    model: str
+    quota: Optional[float] = None
+
+    @property
+    def usable_cores(self) -> int:
+        """可用於推理的物理核數（受 cgroup 配額限制）"""
+        cores = len(self.cores)
+        if self.quota:
+            cores = min(cores, max(1, int(math.floor(self.quota))))
+        return max(1, cores)
+
+    def host_key(self) -> str:
+        """
+        主機類型標識：同一機型、同樣的 CPU 限制得到相同的 key，校準結果可在同類主機間共用
+        """
+        model = re.sub(r"[^a-z0-9]+", "-", self.model.lower()).strip("-")
+        threads = len(self.cpus) // max(1, len(self.cores))
+        key = f"{model}-{len(self.cores)}c{threads}t-{len(self.nodes)}n"
+        if self.quota:
+            key += f"-q{self.quota:g}"
+        return key
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "logical_cpus": len(self.cpus),
+            "physical_cores": len(self.cores),
+            "numa_nodes": len(self.nodes),
+            "quota": self.quota,
+            "usable_cores": self.usable_cores,
+        }
+
+
+def read_topology() -> CPUTopology:
+    """
+    讀取 CPU 拓撲
+
+    Linux 上讀取 /sys/devices/system/cpu 和 /sys/devices/system/node；
+    其他平台按每個邏輯 CPU 一個物理核、單個 NUMA 節點處理
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    allowed = set(cpus)
+
+    cores: Dict[Tuple[int, ...], List[int]] = {}
+    for cpu in cpus:
+        siblings = (_read(f"/sys/devices/system/cpu/cpu{cpu}/topology/core_cpus_list")
+                    or _read(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"))
+        group = tuple(c for c in parse_cpu_list(siblings) if c in allowed) if siblings else (cpu,)
+        cores.setdefault(group or (cpu,), [])
+    core_list = [list(group) for group in sorted(cores)]
+
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist"),
+                       key=lambda p: int(re.search(r"node(\d+)", p).group(1))):
+        node_cpus = [c for c in parse_cpu_list(_read(path) or "") if c in allowed]
+        if node_cpus:
+            nodes.append(node_cpus)
+
+    return CPUTopology(
+        cpus=cpus,
+        cores=core_list,
+        nodes=nodes or [cpus],
+        model=_cpu_model(),
+        quota=_cgroup_cpu_quota(),
+    )
+
+
+@dataclass
+class Layout:
+    """
+    worker 佈局
+
+    Args:
+        workers: worker 進程數
+        threads: 每個 worker 的推理線程數（0 表示不設置，沿用 Paddle 默認）
+        pinning: 綁核方式（PINNING_MODES）
+    """
+
+    workers: int
+    threads: int = 0
+    pinning: str = "none"
+
+    def __post_init__(self):
+        if self.pinning not in PINNING_MODES:
+            raise ValueError(f"未知綁核方式: {self.pinning}（可選 {', '.join(PINNING_MODES)}）")
+        self.workers = max(1, int(self.workers))
+        self.threads = max(0, int(self.threads))
+
+    def placements(self, topology: CPUTopology) -> List[Dict[str, Any]]:
+        """
+        每個 worker 槽位的 CPU 集合和線程數
+
+        core 綁核按 NUMA 節點順序分配連續的物理核，worker 數 × 線程數超過物理核數時循環複用
+        """
+        if self.pinning == "core":
+            ordered = sorted(topology.cores, key=lambda core: (_node_of(topology, core[0]), core[0]))
+            per_worker = self.threads or max(1, topology.usable_cores // self.workers)
+            cpu_sets = []
+            for slot in range(self.workers):
+                cores = [ordered[(slot * per_worker + i) % len(ordered)] for i in range(per_worker)]
+                cpu_sets.append(sorted({cpu for core in cores for cpu in core}))
+        elif self.pinning == "numa":
+            cpu_sets = [topology.nodes[slot % len(topology.nodes)] for slot in range(self.workers)]
+        else:
+            cpu_sets = [None] * self.workers
+        return [{"cpus": cpus, "threads": self.threads} for cpus in cpu_sets]
+
+    def describe(self, topology: Optional[CPUTopology] = None) -> str:
+        threads = self.threads or "默認"
+        text = f"{self.workers} worker × {threads} 線程，綁核 {self.pinning}"
+        if topology is not None and self.pinning != "none":
+            sets = [_format_cpus(p["cpus"]) for p in self.placements(topology)]
+            text += f"（{' | '.join(sets)}）"
+        return text
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _node_of(topology: CPUTopology, cpu: int) -> int:
+    for index, node in enumerate(topology.nodes):
+        if cpu in node:
+            return index
+    return 0
+
+
+def _format_cpus(cpus: Sequence[int]) -> str:
+    """[0, 1, 2, 5] -> "0-2,5" """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def _powers_of_two(limit: int) -> List[int]:
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+
+def candidate_layouts(topology: CPUTopology, max_workers: Optional[int] = None) -> List[Layout]:
+    """
+    候選佈局
+
+    線程數和 worker 數取 2 的冪（以及可用核數本身），只保留 worker × 線程 不超過可用核數、
+    且至少用到一半核的組合；每種組合再分別嘗試不綁核和綁核。
+    """
+    cores = topology.usable_cores
+    limit = max(1, min(cores, max_workers or cores))
+    pinnings = ["none"]
+    if len(topology.cpus) > 1:
+        pinnings.append("core")
+    if len(topology.nodes) > 1:
+        pinnings.append("numa")
+
+    layouts = []
+    for threads in _powers_of_two(cores):
+        for workers in _powers_of_two(min(limit, cores // threads)):
+            if workers * threads * 2 < cores:
+                continue
+            for pinning in pinnings:
+                if pinning == "numa" and workers < len(topology.nodes):
+                    continue
+                if pinning == "core" and workers * threads >= len(topology.cpus):
+                    # 綁定的集合就是全部 CPU，與不綁核相同
+                    continue
+                layouts.append(Layout(workers, threads, pinning))
+    return layouts
+
+
+def default_layout(topology: CPUTopology, workers: int) -> Layout:
+    """未校準時的佈局：按 worker 數平分可用核作為推理線程數，不綁核"""
+    return Layout(workers, max(1, topology.usable_cores // max(1, workers)), "none")
+
+
+def engine_key(engine_options: Dict[str, Any]) -> str:
+    """引擎標識：不同引擎（或不同模型參數）的最優佈局分開保存"""
+    if engine_options.get("engine") == "stub":
+        return "stub"
+    digest = hashlib.sha1(json.dumps(engine_options, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"paddle-{digest[:8]}"
+
+
+def load_tuning(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_tuning(path: str, key: str, entry: Dict[str, Any]) -> None:
+    """寫入一條校準結果（先寫臨時文件再替換，避免多個實例同時啟動時寫壞文件）"""
+    data = load_tuning(path)
+    data[key] = entry
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".cpu_tuning-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def tuning_key(topology: CPUTopology, engine_options: Dict[str, Any]) -> str:
+    return f"{topology.host_key()}/{engine_key(engine_options)}"
+
+
+async def measure_layout(
+    layout: Layout,
+    topology: CPUTopology,
+    engine_options: Dict[str, Any],
+    images: Sequence[str],
+    requests: int,
+) -> Dict[str, Any]:
+    """
+    測量一種佈局的吞吐量
+
+    每個 worker 先處理一張圖片（排除首次推理的初始化），之後以 worker 數的並發處理 requests 張
+
+    Returns:
+        {"layout", "throughput_img_s", "p50_ms", "p95_ms", "errors"}
+    """
+    from worker_pool import OCRWorkerPool, WorkerError
+
+    pool = OCRWorkerPool(layout.workers, engine_options, placements=layout.placements(topology))
+    await pool.start()
+    latencies: List[float] = []
+    errors = 0
+    try:
+        await asyncio.gather(*(pool.run(images[i % len(images)]) for i in range(layout.workers)),
+                             return_exceptions=True)
+        counter = iter(range(requests))
+
+        async def client() -> None:
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    await pool.run(images[i % len(images)])
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+                except WorkerError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(layout.workers)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await pool.close()
+
+    p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (0.0, 0.0)
+    return {
+        "layout": layout.to_dict(),
+        "throughput_img_s": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "errors": errors,
+    }
+
+
+def calibration_images(images_dir: Optional[str], work_dir: str) -> List[str]:
+    """
+    校準用圖片：指定目錄中的圖片，或生成一小組合成收據（短 / 中等長度 × 小 / 中尺寸）
+    """
+    if images_dir:
+        from benchmark.corpus import load_corpus
+
+        items = load_corpus(images_dir)
+        if not items:
+            raise ValueError(f"目錄中沒有圖片: {images_dir}")
+        return [os.path.join(images_dir, item.file) for item in items]
+
+    from benchmark.corpus import generate_corpus
+
+    items = generate_corpus(work_dir, per_combination=1, sizes=("small", "medium"),
+                            lengths=("short", "medium"), languages=("zh", "en"))
+    return [os.path.join(work_dir, item.file) for item in items]
+
+
+async def calibrate(
+    engine_options: Dict[str, Any],
+    topology: CPUTopology,
+    images_dir: Optional[str] = None,
+    requests: int = 0,
+    max_workers: Optional[int] = None,
+    layouts: Optional[List[Layout]] = None,
+) -> Dict[str, Any]:
+    """
+    逐個測量候選佈局，選出吞吐量最高者
+
+    吞吐量相差不到 3% 時選 p95 延遲較低的佈局（通常是 worker 較少、線程較多的一方）
+
+    Args:
+        engine_options: 傳給 ocr_engine.create_engine 的參數
+        topology: read_topology() 的結果
+        images_dir: 校準圖片目錄（默認生成合成收據）
+        requests: 每種佈局計時的請求數（0 表示按 worker 數自動選擇）
+        max_workers: worker 數上限（默認按可用內存估算）
+        layouts: 指定候選佈局（默認 candidate_layouts）
+
+    Returns:
+        保存到調優文件的條目 {"layout", "host", "engine", "calibrated_at", "results"}
+    """
+    if max_workers is None:
+        memory = available_memory_mb()
+        if memory and engine_options.get("engine") != "stub":
+            max_workers = max(1, memory // WORKER_MEMORY_MB)
+    layouts = layouts or candidate_layouts(topology, max_workers)
+    logger.info(f"開始 CPU 佈局校準: {len(layouts)} 種候選，拓撲 {topology.describe()}")
+
+    with tempfile.TemporaryDirectory(prefix="ocr-calibration-") as work_dir:
+        images = calibration_images(images_dir, work_dir)
+        results = []
+        for layout in layouts:
+            count = requests or max(16, 4 * layout.workers)
+            result = await measure_layout(layout, topology, engine_options, images, count)
+            logger.info(f"  {layout.describe()}: {result['throughput_img_s']} img/s, "
+                        f"p95 {result['p95_ms']}ms")
+            results.append(result)
+
+    best_throughput = max(r["throughput_img_s"] for r in results)
+    contenders = [r for r in results if r["throughput_img_s"] >= best_throughput * 0.97 and not r["errors"]]
+    best = min(contenders or results, key=lambda r: (r["p95_ms"], -r["throughput_img_s"]))
+    return {
+        "layout": best["layout"],
+        "host": topology.describe(),
+        "engine": engine_key(engine_options),
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": sorted(results, key=lambda r: -r["throughput_img_s"]),
+    }
+
+
+def layout_overrides() -> Dict[str, Any]:
+    """環境變數中顯式指定的佈局字段（OCR_WORKERS / OCR_CPU_THREADS / OCR_CPU_PINNING），優先於校準結果"""
+    overrides: Dict[str, Any] = {}
+    if os.getenv("OCR_WORKERS"):
+        overrides["workers"] = int(os.environ["OCR_WORKERS"])
+    if os.getenv("OCR_CPU_THREADS"):
+        overrides["threads"] = int(os.environ["OCR_CPU_THREADS"])
+    if os.getenv("OCR_CPU_PINNING"):
+        overrides["pinning"] = os.environ["OCR_CPU_PINNING"]
+    return overrides
+
+
+async def resolve_layout(
+    engine_options: Dict[str, Any],
+    topology: CPUTopology,
+    mode: str = "auto",
+    path: str = DEFAULT_TUNING_FILE,
+    overrides: Optional[Dict[str, Any]] = None,
+) -> Tuple[Layout, str]:
+    """
+    決定服務啟動時使用的佈局
+
+    Args:
+        mode: off（只用 OCR_WORKERS，不設置線程和綁核）/ auto（有校準結果則應用，否則按核數平分線程）/
+              calibrate（沒有校準結果時先校準）/ recalibrate（每次啟動都重新校準）
+        path: 調優文件
+        overrides: 顯式指定的字段，覆蓋校準結果
+
+    Returns:
+        (佈局, 來源說明)
+    """
+    overrides = overrides or {}
+    if mode == "off":
+        return Layout(overrides.get("workers", 1), overrides.get("threads", 0),
+                      overrides.get("pinning", "none")), "OCR_AUTOTUNE=off"
+    if mode not in ("auto", "calibrate", "recalibrate"):
+        raise ValueError(f"未知 OCR_AUTOTUNE: {mode}（可選 off, auto, calibrate, recalibrate）")
+
+    key = tuning_key(topology, engine_options)
+    entry = load_tuning(path).get(key)
+    if mode == "recalibrate" or (mode == "calibrate" and entry is None):
+        entry = await calibrate(engine_options, topology)
+        save_tuning(path, key, entry)
+        source = f"啟動時校準，已保存到 {path}"
+    elif entry is not None:
+        source = f"校準結果 {key}（{entry.get('calibrated_at')}）"
+    else:
+        source = "未校準，按可用核數平分線程"
+
+    if entry is not None:
+        layout = Layout(**entry["layout"])
+    else:
+        layout = default_layout(topology, overrides.get("workers", 1))
+    if overrides:
+        fields = dict(layout.to_dict(), **overrides)
+        if "workers" in overrides and "threads" not in overrides and entry is None:
+            fields["threads"] = default_layout(topology, fields["workers"]).threads
+        layout = Layout(**fields)
+        source += f"，環境變數覆蓋 {', '.join(sorted(overrides))}"
+    return layout, source
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="校準 OCR worker 數、推理線程數和綁核方式")
+    parser.add_argument("--images", help="校準圖片目錄（默認生成合成收據）")
+    parser.add_argument("--requests", type=int, default=0, help="每種佈局計時的請求數（默認按 worker 數）")
+    parser.add_argument("--max-workers", type=int, help="worker 數上限（默認按可用內存估算）")
+    parser.add_argument("--output", default=os.getenv("OCR_TUNING_FILE", DEFAULT_TUNING_FILE), help="調優文件")
+    parser.add_argument("--dry-run", action="store_true", help="只打印拓撲和候選佈局")
+    args = parser.parse_args()
+
+    from ocr_engine import engine_options_from_env
+
+    engine_options = engine_options_from_env()
+    topology = read_topology()
+    print(f"[INFO] 主機類型: {topology.host_key()}")
+    print(f"[INFO] 拓撲: {topology.describe()}")
+    layouts = candidate_layouts(topology, args.max_workers)
+    if args.dry_run:
+        for layout in layouts:
+            print(f"       {layout.describe(topology)}")
+        return 0
+
+    entry = asyncio.run(calibrate(engine_options, topology, args.images, args.requests, args.max_workers, layouts))
+    print(f"[INFO] {'佈局':32s} {'img/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s}")
+    for result in entry["results"]:
+        print(f"       {Layout(**result['layout']).describe():32s} {result['throughput_img_s']:>8} "
+              f"{result['p50_ms']:>8} {result['p95_ms']:>8}")
+    save_tuning(args.output, tuning_key(topology, engine_options), entry)
+    print(f"[INFO] 最優佈局: {Layout(**entry['layout']).describe(topology)}")
+    print(f"[INFO] 已寫入: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,387 @@
+"""
+OCR 引擎熱更新
+每一組引擎參數（模型版本、配置）對應一「代」worker 池。新一代在後台啟動並預熱完成後原子地接管流量，
+舊一代處理完手上的請求後關閉，釋放內存；worker 池預熱期間服務照常使用舊一代。
+也可以先以金絲雀方式按百分比分流，比較兩代的延遲和置信度後再全量切換或回滾。
+
+EngineManager 實現調度器所需的 acquire / execute / release 接口，可直接替代 OCRWorkerPool。
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from worker_pool import OCRWorkerPool, WorkerError
+
+logger = logging.getLogger(__name__)
+
+# 每一代保留的最近延遲 / 置信度樣本數
+STATS_WINDOW = 512
+
+# 保留的歷史代數（/admin/engine 展示）
+GENERATION_HISTORY = 10
+
+PoolFactory = Callable[[Dict[str, Any], int], OCRWorkerPool]
+SwitchCallback = Callable[["Generation"], None]
+
+
+class ReloadInProgress(Exception):
+    """已有一代正在加載"""
+
+
+class NoCanary(Exception):
+    """當前沒有金絲雀"""
+
+
+class Generation:
+    """
+    一代引擎
+
+    Args:
+        generation_id: 序號（從 1 開始遞增）
+        options: 引擎參數
+        size: worker 數
+    """
+
+    def __init__(self, generation_id: int, options: Dict[str, Any], size: int):
+        self.id = generation_id
+        self.options = options
+        self.size = size
+        self.pool: Optional[OCRWorkerPool] = None
+        self.state = "loading"  # loading / canary / active / draining / retired / failed
+        self.clear_caches = False  # 切換到此代時是否清空結果緩存（由調用方處理，見 on_switch）
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.activated_at: Optional[float] = None
+        self.retired_at: Optional[float] = None
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=STATS_WINDOW)
+        self.confidences: Deque[float] = deque(maxlen=STATS_WINDOW)
+
+    def record(self, elapsed: float, lines: List[Dict[str, Any]]) -> None:
+        self.requests += 1
+        self.latencies.append(elapsed)
+        if lines:
+            self.confidences.append(sum(line.get("confidence", 0.0) for line in lines) / len(lines))
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.asarray(self.latencies, dtype=np.float64)
+        p50, p95 = np.percentile(latencies, [50, 95]) if latencies.size else (0.0, 0.0)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": {"p50": round(float(p50) * 1000, 1), "p95": round(float(p95) * 1000, 1)},
+            "mean_confidence": round(float(np.mean(self.confidences)), 4) if self.confidences else None,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "options": self.options,
+            "workers": self.size,
+            "error": self.error,
+            "created_at": self.created_at,
+            "ready_at": self.ready_at,
+            "activated_at": self.activated_at,
+            "retired_at": self.retired_at,
+            "inflight": self.inflight,
+            **self.stats(),
+        }
+
+
+class EngineManager:
+    """
+    管理多代 worker 池：當前代（active）、可選的金絲雀代（canary），以及正在排空的舊代
+
+    Args:
+        pool_factory: (引擎參數, worker 數) -> 未啟動的 OCRWorkerPool
+        options: 初始引擎參數
+        size: 每一代的 worker 數
+        on_switch: 新一代接管流量時的回調
+    """
+
+    def __init__(self, pool_factory: PoolFactory, options: Dict[str, Any], size: int,
+                 on_switch: Optional[SwitchCallback] = None):
+        self.pool_factory = pool_factory
+        self.on_switch = on_switch
+        self.size = max(1, size)
+        self._ids = itertools.count(1)
+        self.active = Generation(next(self._ids), dict(options), self.size)
+        self.canary: Optional[Generation] = None
+        self.canary_percent = 0.0
+        self._canary_credit = 0.0
+        self.loading: Optional[Generation] = None
+        self.history: Deque[Generation] = deque([self.active], maxlen=GENERATION_HISTORY)
+        self._borrowed: Dict[int, Generation] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.switches_total = 0
+
+    async def start(self) -> None:
+        """啟動初始代（全部 worker 預熱完成後返回）"""
+        self._changed = asyncio.Event()
+        self.active.pool = self.pool_factory(self.active.options, self.active.size)
+        await self.active.pool.start()
+        self.active.state = "active"
+        self.active.ready_at = self.active.activated_at = time.time()
+
+    # ---- 調度器接口 ----
+
+    def _serving(self) -> List[Generation]:
+        """按本次請求的分流結果排序的服務中各代（首選在前）"""
+        if self.canary is None:
+            return [self.active]
+        # 平滑分流：每次累加百分比，滿 100 時分給金絲雀
+        self._canary_credit += self.canary_percent
+        if self._canary_credit >= 100.0:
+            self._canary_credit -= 100.0
+            return [self.canary, self.active]
+        return [self.active, self.canary]
+
+    async def acquire(self):
+        """
+        取得一個空閒 worker
+
+        首選代沒有空閒 worker 時使用另一代，避免金絲雀忙碌時阻塞主流量；
+        等待期間發生切換則重新選擇，切換後不再向舊代派發請求
+        """
+        while True:
+            serving = self._serving()
+            preferred = serving[0]
+            if preferred.pool.idle_count() > 0:
+                acquired = [(preferred, await preferred.pool.acquire())]
+            else:
+                acquired = await self._acquire_any(serving)
+            chosen: Optional[Tuple[Generation, Any]] = None
+            for generation, handle in acquired:
+                if chosen is None and generation.state in ("active", "canary"):
+                    chosen = (generation, handle)
+                else:
+                    generation.pool.release(handle)
+            if chosen is not None:
+                generation, handle = chosen
+                generation.inflight += 1
+                self._borrowed[id(handle)] = generation
+                return handle
+
+    async def _acquire_any(self, serving: List[Generation]) -> List[Tuple[Generation, Any]]:
+        """同時等待各代的空閒 worker 或切換事件；返回實際取得的 worker（可能不止一個）"""
+        self._changed.clear()
+        tasks = {asyncio.ensure_future(generation.pool.acquire()): generation for generation in serving}
+        changed = asyncio.ensure_future(self._changed.wait())
+        try:
+            await asyncio.wait([*tasks, changed], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            changed.cancel()
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        acquired = []
+        for generation in serving:
+            for task, owner in tasks.items():
+                if owner is generation and task.done() and not task.cancelled() and task.exception() is None:
+                    acquired.append((generation, task.result()))
+        return acquired
+
+    async def execute(self, handle, image: Union[str, np.ndarray]) -> Tuple[List[Dict[str, Any]], str]:
+        """在取得的 worker 上執行識別，並記錄所屬代的延遲和置信度"""
+        generation = self._borrowed.pop(id(handle))
+        started = time.monotonic()
+        try:
+            result = await generation.pool.execute(handle, image)
+        except WorkerError:
+            generation.errors += 1
+            raise
+        finally:
+            generation.inflight -= 1
+            self._maybe_close(generation)
+        generation.record(time.monotonic() - started, result[0])
+        return result
+
+    def release(self, handle) -> None:
+        generation = self._borrowed.pop(id(handle))
+        generation.inflight -= 1
+        generation.pool.release(handle)
+        self._maybe_close(generation)
+
+    # ---- 熱更新 ----
+
+    def reload(
+        self,
+        options: Dict[str, Any],
+        canary_percent: float = 0.0,
+        canary_workers: Optional[int] = None,
+    ) -> Generation:
+        """
+        在後台加載新一代引擎
+
+        Args:
+            options: 新的引擎參數
+            canary_percent: 0 表示預熱完成後全量切換；否則作為金絲雀接收該百分比的請求
+            canary_workers: 金絲雀的 worker 數（默認按百分比折算，至少 1 個）
+
+        Raises:
+            ReloadInProgress: 已有一代正在加載
+        """
+        if self.loading is not None:
+            raise ReloadInProgress(f"第 {self.loading.id} 代正在加載")
+        if not 0.0 <= canary_percent <= 100.0:
+            raise ValueError("canary_percent 必須在 0 到 100 之間")
+        if canary_percent:
+            size = canary_workers or max(1, round(self.size * canary_percent / 100.0))
+        else:
+            size = self.size
+        generation = Generation(next(self._ids), dict(options), size)
+        self.loading = generation
+        self.history.append(generation)
+        logger.info(f"開始加載第 {generation.id} 代引擎（{size} 個 worker，"
+                    f"{'金絲雀 ' + format(canary_percent, 'g') + '%' if canary_percent else '全量切換'}）: {options}")
+        self._tasks.append(asyncio.ensure_future(self._load(generation, canary_percent)))
+        return generation
+
+    async def _load(self, generation: Generation, canary_percent: float) -> None:
+        try:
+            generation.pool = self.pool_factory(generation.options, generation.size)
+            await generation.pool.start()
+        except Exception as e:
+            generation.state = "failed"
+            generation.error = f"{type(e).__name__}: {e}"
+            logger.error(f"第 {generation.id} 代引擎加載失敗，繼續使用第 {self.active.id} 代: {generation.error}")
+            if generation.pool is not None:
+                await generation.pool.close()
+                generation.pool = None
+            return
+        finally:
+            self.loading = None
+
+        generation.ready_at = time.time()
+        if canary_percent:
+            if self.canary is not None:
+                self._retire(self.canary)
+            generation.state = "canary"
+            self.canary = generation
+            self.canary_percent = canary_percent
+            self._canary_credit = 0.0
+            logger.info(f"第 {generation.id} 代引擎作為金絲雀上線: {canary_percent:g}% 流量")
+        else:
+            self._switch(generation)
+        self._changed.set()
+
+    def _switch(self, generation: Generation) -> None:
+        """原子切換：此後的請求都派發到新一代，舊一代（及同參數的金絲雀）排空後關閉"""
+        old = self.active
+        self.active = generation
+        generation.state = "active"
+        generation.activated_at = time.time()
+        self.switches_total += 1
+        if self.canary is not None and self.canary.options == generation.options:
+            self._retire(self.canary)
+            self.canary = None
+            self.canary_percent = 0.0
+        self._retire(old)
+        if self.on_switch is not None:
+            self.on_switch(generation)
+        logger.info(f"已切換到第 {generation.id} 代引擎，第 {old.id} 代排空中（{old.inflight} 個請求處理中）")
+
+    def promote(self) -> Generation:
+        """金絲雀全量上線：按金絲雀的參數加載完整的一代，就緒後切換"""
+        if self.canary is None:
+            raise NoCanary("當前沒有金絲雀")
+        if self.canary.size >= self.size:
+            canary = self.canary
+            self.canary = None
+            self.canary_percent = 0.0
+            self._switch(canary)
+            self._changed.set()
+            return canary
+        generation = self.reload(self.canary.options)
+        generation.clear_caches = self.canary.clear_caches
+        return generation
+
+    def rollback(self) -> Generation:
+        """下線金絲雀（排空後關閉）"""
+        if self.canary is None:
+            raise NoCanary("當前沒有金絲雀")
+        canary = self.canary
+        self.canary = None
+        self.canary_percent = 0.0
+        self._retire(canary)
+        self._changed.set()
+        logger.info(f"已回滾第 {canary.id} 代金絲雀")
+        return canary
+
+    def _retire(self, generation: Generation) -> None:
+        generation.state = "draining"
+        self._maybe_close(generation)
+
+    def _maybe_close(self, generation: Generation) -> None:
+        if generation.state == "draining" and generation.inflight == 0:
+            generation.state = "retired"
+            generation.retired_at = time.time()
+            self._tasks.append(asyncio.ensure_future(self._close_pool(generation)))
+
+    async def _close_pool(self, generation: Generation) -> None:
+        pool, generation.pool = generation.pool, None
+        if pool is not None:
+            await pool.close()
+            logger.info(f"第 {generation.id} 代引擎已關閉")
+
+    async def close(self) -> None:
+        """停止所有代"""
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+        pools = [g.pool for g in self.history if g.pool is not None]
+        for generation in self.history:
+            generation.pool = None
+        await asyncio.gather(*(pool.close() for pool in pools), return_exceptions=True)
+
+    # ---- 指標 ----
+
+    def comparison(self) -> Optional[Dict[str, Any]]:
+        """金絲雀相對當前代的延遲和置信度差異"""
+        if self.canary is None:
+            return None
+        active, canary = self.active.stats(), self.canary.stats()
+
+        def ratio(a: float, b: float) -> Optional[float]:
+            return round(b / a - 1.0, 4) if a else None
+
+        return {
+            "canary_percent": self.canary_percent,
+            "p50_change": ratio(active["latency_ms"]["p50"], canary["latency_ms"]["p50"]),
+            "p95_change": ratio(active["latency_ms"]["p95"], canary["latency_ms"]["p95"]),
+            "confidence_change": (
+                round(canary["mean_confidence"] - active["mean_confidence"], 4)
+                if active["mean_confidence"] is not None and canary["mean_confidence"] is not None else None
+            ),
+            "error_rate": {
+                "active": round(active["errors"] / max(1, active["requests"] + active["errors"]), 4),
+                "canary": round(canary["errors"] / max(1, canary["requests"] + canary["errors"]), 4),
+            },
+        }
+
+    def status(self) -> Dict[str, Any]:
+        """/admin/engine"""
+        return {
+            "active": self.active.id,
+            "canary": self.canary.id if self.canary else None,
+            "loading": self.loading.id if self.loading else None,
+            "switches_total": self.switches_total,
+            "comparison": self.comparison(),
+            "generations": [generation.snapshot() for generation in reversed(self.history)],
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """當前代的 worker 池指標（/metrics 的 pool 字段）"""
+        metrics = self.active.pool.metrics() if self.active.pool else {}
+        return dict(metrics, generation=self.active.id)
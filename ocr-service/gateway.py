@@ -0,0 +1,500 @@
+"""
+OCR 網關
+按圖片內容哈希一致性哈希到多個 ocr-service 實例：
+- 同一張圖片總是落到同一個實例，各實例的結果緩存（result_cache.py）保持有效
+- 每個實例在環上有多個虛擬節點，負載均勻；增刪實例時只有相鄰區間的圖片換實例
+- 後台健康檢查；延遲明顯高於其他實例的慢實例暫時摘除，冷卻後恢復
+- 連接失敗或實例過載（503）時順時針轉發到下一個實例
+
+用法：
+    # 轉發到已有實例
+    OCR_BACKENDS=http://10.0.0.2:8000,http://10.0.0.3:8000 python gateway.py
+
+    # 本機測試：在 8001..8003 啟動三個 main.py 實例並在 8100 提供網關
+    python gateway.py --spawn 3
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import hmac
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from result_cache import content_key
+from structured_logging import setup_logging
+from upload_guard import MULTIPART_OVERHEAD_BYTES, BodySizeLimit
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# 每個實例在哈希環上的虛擬節點數
+GATEWAY_VNODES = int(os.getenv("OCR_GATEWAY_VNODES", "160"))
+# 健康檢查間隔（秒）
+GATEWAY_HEALTH_INTERVAL = float(os.getenv("OCR_GATEWAY_HEALTH_INTERVAL", "2"))
+# 慢實例判定：延遲 EWMA 超過其他實例中位數的多少倍
+GATEWAY_SLOW_FACTOR = float(os.getenv("OCR_GATEWAY_SLOW_FACTOR", "3"))
+# 判定慢實例前至少需要的請求樣本數
+GATEWAY_SLOW_MIN_SAMPLES = int(os.getenv("OCR_GATEWAY_SLOW_MIN_SAMPLES", "20"))
+# 慢實例摘除後的冷卻時間（秒）
+GATEWAY_EJECT_SECONDS = float(os.getenv("OCR_GATEWAY_EJECT_SECONDS", "30"))
+# 單個請求最多嘗試的實例數（含首選實例）
+GATEWAY_MAX_ATTEMPTS = int(os.getenv("OCR_GATEWAY_MAX_ATTEMPTS", "2"))
+# 轉發超時（秒）；實際預算由 X-Request-Timeout 等頭傳遞給實例
+GATEWAY_TIMEOUT = float(os.getenv("OCR_GATEWAY_TIMEOUT", "120"))
+
+# 轉發的圖片大小上限（與 ocr-service 的 OCR_MAX_UPLOAD_BYTES 相同，0 表示不限）
+OCR_MAX_UPLOAD_BYTES = int(os.getenv("OCR_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+# 實例管理接口（/gateway/backends 的增刪）：設置 OCR_ADMIN_TOKEN 時要求 X-Admin-Token 頭一致，否則只允許本機訪問
+OCR_ADMIN_TOKEN = os.getenv("OCR_ADMIN_TOKEN")
+
+# 延遲 EWMA 的平滑係數
+LATENCY_ALPHA = 0.1
+
+# 轉發給實例的請求頭和返回給客戶端的響應頭
+FORWARD_REQUEST_HEADERS = ("accept", "accept-encoding", "x-request-timeout", "x-request-deadline", "x-ocr-lane")
+FORWARD_RESPONSE_HEADERS = ("content-type", "content-encoding", "vary", "retry-after")
+
+
+def _ring_position(value: str) -> int:
+    return int(hashlib.sha256(value.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    帶虛擬節點的一致性哈希環
+
+    Args:
+        vnodes: 每個節點的虛擬節點數
+    """
+
+    def __init__(self, vnodes: int = 160):
+        self.vnodes = max(1, vnodes)
+        self._positions: List[int] = []
+        self._owners: List[str] = []
+        self.nodes: List[str] = []
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            position = _ring_position(f"{node}#{i}")
+            index = bisect.bisect(self._positions, position)
+            self._positions.insert(index, position)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str) -> None:
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(p, o) for p, o in zip(self._positions, self._owners) if o != node]
+        self._positions = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def walk(self, key: str) -> Iterator[str]:
+        """從 key 的位置順時針依次返回不重複的節點（第一個為首選節點）"""
+        if not self._positions:
+            return
+        start = bisect.bisect(self._positions, int(key[:16], 16))
+        seen = set()
+        for offset in range(len(self._positions)):
+            owner = self._owners[(start + offset) % len(self._positions)]
+            if owner not in seen:
+                seen.add(owner)
+                yield owner
+                if len(seen) == len(self.nodes):
+                    return
+
+    def share(self) -> Dict[str, float]:
+        """每個節點負責的哈希空間比例"""
+        total = 1 << 64
+        shares = {node: 0 for node in self.nodes}
+        for index, position in enumerate(self._positions):
+            previous = self._positions[index - 1] if index else self._positions[-1] - total
+            shares[self._owners[index]] += position - previous
+        return {node: round(size / total, 4) for node, size in shares.items()}
+
+
+class Backend:
+    """單個 ocr-service 實例的狀態"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.samples = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def observe(self, elapsed: float) -> None:
+        self.samples += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = elapsed
+        else:
+            self.latency_ewma += LATENCY_ALPHA * (elapsed - self.latency_ewma)
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "ejected": now < self.ejected_until,
+            "ejected_for_s": round(max(0.0, self.ejected_until - now), 1),
+            "latency_ewma_s": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+        }
+
+
+class Gateway:
+    """
+    一致性哈希網關
+
+    Args:
+        backends: 實例地址列表
+        vnodes: 每個實例的虛擬節點數
+    """
+
+    def __init__(self, backends: List[str], vnodes: int = GATEWAY_VNODES):
+        self.ring = HashRing(vnodes)
+        self.backends: Dict[str, Backend] = {}
+        for url in backends:
+            self.add_backend(url)
+        self.client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self.requests_total = 0
+        self.failovers_total = 0
+
+    def add_backend(self, url: str) -> Backend:
+        url = url.rstrip("/")
+        if url not in self.backends:
+            self.backends[url] = Backend(url)
+            self.ring.add(url)
+            logger.info(f"加入 OCR 實例: {url}")
+        return self.backends[url]
+
+    def remove_backend(self, url: str) -> bool:
+        url = url.rstrip("/")
+        if self.backends.pop(url, None) is None:
+            return False
+        self.ring.remove(url)
+        logger.info(f"移除 OCR 實例: {url}")
+        return True
+
+    async def start(self) -> None:
+        self.client = httpx.AsyncClient(timeout=GATEWAY_TIMEOUT)
+        self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+        if self.client:
+            await self.client.aclose()
+
+    def candidates(self, key: str) -> List[Backend]:
+        """按環順序返回可用實例；全部不可用時退回健康實例（忽略慢實例摘除）"""
+        now = time.monotonic()
+        ordered = [self.backends[url] for url in self.ring.walk(key)]
+        available = [backend for backend in ordered if backend.available(now)]
+        return available or [backend for backend in ordered if backend.healthy]
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check(backend) for backend in list(self.backends.values())))
+            self._eject_slow()
+            await asyncio.sleep(GATEWAY_HEALTH_INTERVAL)
+
+    async def _check(self, backend: Backend) -> None:
+        try:
+            response = await self.client.get(f"{backend.url}/health", timeout=5.0)
+            healthy = response.status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != backend.healthy:
+            logger.warning(f"OCR 實例 {backend.url} {'恢復' if healthy else '不可用'}")
+        backend.healthy = healthy
+
+    def _eject_slow(self) -> None:
+        """
+        摘除慢實例
+
+        延遲 EWMA 超過其他可用實例中位數 GATEWAY_SLOW_FACTOR 倍時摘除 GATEWAY_EJECT_SECONDS 秒；
+        最多摘除一半實例，避免整體變慢時全部被摘除。冷卻結束後重置延遲估計重新觀察。
+        """
+        now = time.monotonic()
+        for backend in self.backends.values():
+            if backend.ejected_until and now >= backend.ejected_until:
+                backend.ejected_until = 0.0
+                backend.latency_ewma = None
+                backend.samples = 0
+                logger.info(f"OCR 實例 {backend.url} 冷卻結束，恢復轉發")
+
+        active = [b for b in self.backends.values() if b.available(now)]
+        max_ejected = len(self.backends) // 2
+        ejected = sum(1 for b in self.backends.values() if now < b.ejected_until)
+        for backend in sorted(active, key=lambda b: b.latency_ewma or 0.0, reverse=True):
+            if ejected >= max_ejected:
+                break
+            if backend.samples < GATEWAY_SLOW_MIN_SAMPLES:
+                continue
+            others = [b.latency_ewma for b in active if b is not backend and b.latency_ewma is not None]
+            if not others:
+                continue
+            baseline = statistics.median(others)
+            if backend.latency_ewma > GATEWAY_SLOW_FACTOR * baseline:
+                backend.ejected_until = now + GATEWAY_EJECT_SECONDS
+                backend.ejections += 1
+                ejected += 1
+                logger.warning(
+                    f"摘除慢實例 {backend.url}: {backend.latency_ewma:.2f}s > "
+                    f"{GATEWAY_SLOW_FACTOR:g} × {baseline:.2f}s"
+                )
+
+    async def forward(
+        self,
+        path: str,
+        content: bytes,
+        content_type: str,
+        request: Request,
+    ) -> Response:
+        """
+        按內容哈希轉發到實例
+
+        Args:
+            path: 實例上的端點路徑
+            content: 請求體（圖片字節）
+            content_type: 請求體的 Content-Type
+            request: 客戶端請求（轉發查詢參數和部分請求頭）
+        """
+        self.requests_total += 1
+        key = content_key(content)
+        candidates = self.candidates(key)
+        if not candidates:
+            raise HTTPException(status_code=503, detail="沒有可用的 OCR 實例", headers={"Retry-After": "1"})
+
+        headers = {name: request.headers[name] for name in FORWARD_REQUEST_HEADERS if name in request.headers}
+        headers["content-type"] = content_type
+        last_error = "沒有可用的 OCR 實例"
+        for attempt, backend in enumerate(candidates[:max(1, GATEWAY_MAX_ATTEMPTS)]):
+            if attempt:
+                self.failovers_total += 1
+            backend.requests += 1
+            started = time.monotonic()
+            try:
+                upstream = self.client.build_request(
+                    "POST", f"{backend.url}{path}", params=request.query_params, content=content, headers=headers
+                )
+                response = await self.client.send(upstream, stream=True)
+                try:
+                    # 保持實例的壓縮編碼原樣返回
+                    body = b"".join([chunk async for chunk in response.aiter_raw()])
+                finally:
+                    await response.aclose()
+            except httpx.TransportError as e:
+                backend.errors += 1
+                backend.healthy = False
+                last_error = f"{backend.url}: {type(e).__name__}"
+                logger.warning(f"轉發到 {backend.url} 失敗，嘗試下一個實例: {e}")
+                continue
+
+            if response.status_code == 503:
+                # 實例過載：換下一個實例（代價是該圖片在那裡沒有緩存）
+                last_error = f"{backend.url}: 503"
+                continue
+            if response.status_code < 500:
+                backend.observe(time.monotonic() - started)
+            else:
+                backend.errors += 1
+            response_headers = {
+                name: response.headers[name] for name in FORWARD_RESPONSE_HEADERS if name in response.headers
+            }
+            response_headers["X-OCR-Backend"] = backend.url
+            return Response(content=body, status_code=response.status_code, headers=response_headers)
+
+        raise HTTPException(status_code=503, detail=f"OCR 實例不可用（{last_error}）", headers={"Retry-After": "1"})
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        share = self.ring.share()
+        return {
+            "requests_total": self.requests_total,
+            "failovers_total": self.failovers_total,
+            "vnodes": self.ring.vnodes,
+            "backends": {
+                url: dict(backend.snapshot(now), ring_share=share.get(url, 0.0))
+                for url, backend in self.backends.items()
+            },
+        }
+
+
+gateway = Gateway([url.strip() for url in os.getenv("OCR_BACKENDS", "").split(",") if url.strip()])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await gateway.start()
+    yield
+    await gateway.close()
+
+
+app = FastAPI(title="OCR Gateway", version="1.0.0", lifespan=lifespan)
+
+# 網關先把圖片讀入內存再轉發：與 ocr-service 一樣在讀取前限制請求體大小
+app.add_middleware(
+    BodySizeLimit,
+    limits={
+        "/ocr": OCR_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES if OCR_MAX_UPLOAD_BYTES else 0,
+        "/ocr/raw": OCR_MAX_UPLOAD_BYTES,
+    },
+)
+
+
+class BackendRequest(BaseModel):
+    """實例地址"""
+    url: str
+
+
+@app.get("/health")
+async def health():
+    """至少有一個健康實例時返回 healthy"""
+    healthy = any(backend.healthy for backend in gateway.backends.values())
+    if not healthy:
+        raise HTTPException(status_code=503, detail="沒有可用的 OCR 實例")
+    return {"status": "healthy"}
+
+
+@app.get("/metrics")
+async def metrics():
+    """網關指標（各實例狀態、環上份額、轉發和故障轉移次數）"""
+    return gateway.metrics()
+
+
+@app.get("/gateway/backends")
+async def list_backends():
+    return gateway.metrics()["backends"]
+
+
+def require_admin(request: Request) -> None:
+    if OCR_ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get("x-admin-token", ""), OCR_ADMIN_TOKEN):
+            raise HTTPException(status_code=401, detail="X-Admin-Token 無效")
+        return
+    # 未配置令牌時只允許本機訪問
+    host = request.client.host if request.client else None
+    if host not in (None, "127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="實例管理接口只允許本機訪問（或設置 OCR_ADMIN_TOKEN）")
+
+
+@app.post("/gateway/backends")
+async def add_backend(request: Request, body: BackendRequest):
+    """加入實例（只有環上相鄰區間的圖片會改由新實例處理）"""
+    require_admin(request)
+    gateway.add_backend(body.url)
+    return gateway.metrics()["backends"]
+
+
+@app.delete("/gateway/backends")
+async def remove_backend(request: Request, url: str = Query(..., description="實例地址")):
+    """移除實例（該實例負責的圖片分散到環上的下一個實例）"""
+    require_admin(request)
+    if not gateway.remove_backend(url):
+        raise HTTPException(status_code=404, detail=f"未知實例: {url}")
+    return gateway.metrics()["backends"]
+
+
+@app.post("/ocr")
+async def ocr_image(request: Request) -> Response:
+    """
+    multipart 上傳（與 ocr-service 的 /ocr 兼容）
+
+    網關讀出圖片字節後以 raw body 轉發到實例的 /ocr/raw，查詢參數原樣傳遞。
+    """
+    form = await request.form()
+    upload = form.get("file")
+    if upload is None or not hasattr(upload, "read"):
+        raise HTTPException(status_code=400, detail="缺少 file 字段")
+    if not upload.content_type or not upload.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="文件必須是圖片格式")
+    content = await upload.read()
+    return await gateway.forward("/ocr/raw", content, upload.content_type, request)
+
+
+@app.post("/ocr/raw")
+async def ocr_raw(request: Request) -> Response:
+    """原始圖片字節（與 ocr-service 的 /ocr/raw 兼容）"""
+    content_type = request.headers.get("content-type", "application/octet-stream")
+    content = await request.body()
+    return await gateway.forward("/ocr/raw", content, content_type, request)
+
+
+def spawn_backends(count: int, base_port: int) -> Tuple[List[str], List[subprocess.Popen]]:
+    """在本機連續端口上啟動 main.py 實例（測試用）"""
+    urls, processes = [], []
+    service_dir = os.path.dirname(os.path.abspath(__file__))
+    for i in range(count):
+        port = base_port + i
+        env = dict(os.environ, OCR_SERVICE_HOST="127.0.0.1", OCR_SERVICE_PORT=str(port))
+        env.pop("OCR_SERVICE_UDS", None)
+        processes.append(subprocess.Popen([sys.executable, "main.py"], cwd=service_dir, env=env))
+        urls.append(f"http://127.0.0.1:{port}")
+    logger.info(f"已啟動 {count} 個本地 OCR 實例: {', '.join(urls)}")
+    return urls, processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR 一致性哈希網關")
+    parser.add_argument("--host", default=os.getenv("OCR_GATEWAY_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("OCR_GATEWAY_PORT", "8100")))
+    parser.add_argument("--backends", help="逗號分隔的實例地址（默認讀取 OCR_BACKENDS）")
+    parser.add_argument("--spawn", type=int, default=0, help="在本機啟動 N 個 main.py 實例")
+    parser.add_argument("--spawn-base-port", type=int, default=8001, help="--spawn 的起始端口")
+    args = parser.parse_args()
+
+    if args.backends:
+        for url in args.backends.split(","):
+            if url.strip():
+                gateway.add_backend(url.strip())
+
+    processes: List[subprocess.Popen] = []
+    if args.spawn:
+        urls, processes = spawn_backends(args.spawn, args.spawn_base_port)
+        for url in urls:
+            gateway.add_backend(url)
+
+    if not gateway.backends:
+        parser.error("需要通過 OCR_BACKENDS、--backends 或 --spawn 指定至少一個實例")
+
+    logger.info(f"啟動 OCR 網關: http://{args.host}:{args.port}")
+    try:
+        uvicorn.run(app, host=args.host, port=args.port, log_config=None)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(10)
+
+
+if __name__ == "__main__":
+    main()
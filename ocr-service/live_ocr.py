@@ -0,0 +1,306 @@
+"""
+相機實時預覽 OCR（WebSocket）
+客戶端持續發送相機幀（JPEG / PNG 二進制消息），服務只在畫面穩定且與上次識別相比有變化時才做 OCR：
+- 每幀先以 1/8 比例解碼成小灰度圖，與上一幀比較判斷是否在移動，與上次識別的幀比較判斷是否有變化
+- 連續 OCR_LIVE_STABLE_FRAMES 幀穩定才識別；識別進行中到達的幀直接丟棄
+- 識別結果與上次比較，只推送新增 / 消失的行，以及版面解析出的金額
+
+服務端 → 客戶端消息（JSON 文本）：
+    {"type": "status", "state": "moving" | "stable" | "busy"}      狀態變化時發送
+    {"type": "update", "frame": 12, "added": [...], "removed": [...],
+     "total": 123.0, "subtotal": 110.0, "service_charge": 11.0, "consistent": true}
+    {"type": "error", "detail": "..."}
+客戶端 → 服務端：二進制幀；或文本 {"type": "reset"} 清空已識別的行
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+from fastapi import WebSocket, WebSocketDisconnect
+
+from receipt_layout import parse_receipt_layout
+from scheduler import OCRScheduler, RequestShed
+from upload_guard import UploadRejected, inspect_image
+
+logger = logging.getLogger(__name__)
+
+# 幀差比較用的小圖尺寸
+DIFF_SIZE = (64, 48)
+
+
+@dataclass
+class FrameDecision:
+    """單幀的處理決定"""
+
+    action: str  # "ocr" 或 "skip"
+    reason: str  # moving / unchanged / busy / ocr
+    motion: float
+
+
+class FrameGate:
+    """
+    按幀差判斷是否值得識別
+
+    Args:
+        diff_threshold: 小灰度圖平均絕對差（0~255）低於此值視為畫面未變
+        stable_frames: 連續多少幀未變視為穩定
+    """
+
+    def __init__(self, diff_threshold: float = 6.0, stable_frames: int = 3):
+        self.diff_threshold = diff_threshold
+        self.stable_frames = max(1, stable_frames)
+        self._previous: Optional[np.ndarray] = None
+        self._last_ocr: Optional[np.ndarray] = None
+        self._stable_count = 0
+
+    @staticmethod
+    def thumbnail(content: bytes) -> Optional[np.ndarray]:
+        """以 1/8 比例解碼灰度小圖，並去掉整體亮度（自動曝光）的影響"""
+        gray = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if gray is None:
+            return None
+        small = cv2.resize(gray, DIFF_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+        return small - small.mean()
+
+    @staticmethod
+    def difference(a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.mean(np.abs(a - b)))
+
+    def observe(self, thumb: np.ndarray, busy: bool) -> FrameDecision:
+        motion = self.difference(thumb, self._previous) if self._previous is not None else float("inf")
+        self._previous = thumb
+        if motion < self.diff_threshold:
+            self._stable_count += 1
+        else:
+            self._stable_count = 0
+
+        if self._stable_count < self.stable_frames:
+            return FrameDecision("skip", "moving", motion)
+        if self._last_ocr is not None and self.difference(thumb, self._last_ocr) < self.diff_threshold:
+            return FrameDecision("skip", "unchanged", motion)
+        if busy:
+            return FrameDecision("skip", "busy", motion)
+        self._last_ocr = thumb
+        return FrameDecision("ocr", "ocr", motion)
+
+    def reset(self) -> None:
+        self._last_ocr = None
+
+
+@dataclass
+class LiveStats:
+    """所有實時會話的累計指標（/metrics）"""
+
+    sessions_active: int = 0
+    sessions_total: int = 0
+    frames_received: int = 0
+    frames_ocr: int = 0
+    updates_sent: int = 0
+    skipped: Counter = field(default_factory=Counter)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "sessions_active": self.sessions_active,
+            "sessions_total": self.sessions_total,
+            "frames_received": self.frames_received,
+            "frames_ocr": self.frames_ocr,
+            "ocr_ratio": round(self.frames_ocr / self.frames_received, 4) if self.frames_received else 0.0,
+            "updates_sent": self.updates_sent,
+            "frames_skipped": dict(self.skipped),
+        }
+
+
+def diff_lines(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]):
+    """
+    按文字比較兩次識別的行
+
+    Returns:
+        (新增的行, 消失的行文字)
+    """
+    before = Counter(line["text"] for line in previous)
+    after = Counter(line["text"] for line in current)
+    added_counts = after - before
+    added = []
+    for line in current:
+        if added_counts[line["text"]] > 0:
+            added_counts[line["text"]] -= 1
+            added.append(line)
+    removed = list((before - after).elements())
+    return added, removed
+
+
+class LiveSession:
+    """
+    單個 WebSocket 實時識別會話
+
+    Args:
+        websocket: 已 accept 的連接
+        scheduler: OCR 調度器
+        stats: 累計指標
+        lane: 優先級通道
+        gate: 幀差判斷
+        max_frame_bytes: 單幀大小上限
+        max_frame_pixels: 單幀像素上限（按文件頭檢查，0 表示不限）
+        frame_timeout: 單次識別的預算（秒），過期的幀由調度器丟棄
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        scheduler: OCRScheduler,
+        stats: LiveStats,
+        lane: Optional[str] = None,
+        gate: Optional[FrameGate] = None,
+        max_frame_bytes: int = 2 * 1024 * 1024,
+        max_frame_pixels: int = 0,
+        frame_timeout: float = 5.0,
+    ):
+        self.websocket = websocket
+        self.scheduler = scheduler
+        self.stats = stats
+        self.lane = lane
+        self.gate = gate or FrameGate()
+        self.max_frame_bytes = max_frame_bytes
+        self.max_frame_pixels = max_frame_pixels
+        self.frame_timeout = frame_timeout
+
+        self.frame_index = 0
+        self.lines: List[Dict[str, Any]] = []
+        self._state: Optional[str] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+        self.closed = False
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        if self.closed:
+            return
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(json.dumps(message, ensure_ascii=False, separators=(",", ":")))
+            except (WebSocketDisconnect, RuntimeError):
+                # 後台識別完成時客戶端可能已斷開
+                self.closed = True
+
+    async def set_state(self, state: str) -> None:
+        if state != self._state:
+            self._state = state
+            await self.send({"type": "status", "state": state})
+
+    async def run(self) -> None:
+        self.stats.sessions_active += 1
+        self.stats.sessions_total += 1
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await self.on_frame(message["bytes"])
+                elif message.get("text") is not None:
+                    await self.on_text(message["text"])
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            self.stats.sessions_active -= 1
+            if self._inflight and not self._inflight.done():
+                self._inflight.cancel()
+
+    async def on_text(self, text: str) -> None:
+        try:
+            command = json.loads(text)
+        except ValueError:
+            command = {}
+        if command.get("type") == "reset":
+            self.lines = []
+            self.gate.reset()
+        else:
+            await self.send({"type": "error", "detail": "未知命令"})
+
+    async def on_frame(self, content: bytes) -> None:
+        self.frame_index += 1
+        self.stats.frames_received += 1
+        if len(content) > self.max_frame_bytes:
+            self.stats.skipped["too_large"] += 1
+            await self.send({"type": "error", "detail": f"幀大小超過 {self.max_frame_bytes} 字節"})
+            return
+        # 文件頭檢查和小圖解碼都在線程池中執行，不阻塞事件循環（其他會話的幀和推送）
+        loop = asyncio.get_running_loop()
+        try:
+            thumb = await loop.run_in_executor(None, self.inspect_frame, content)
+        except UploadRejected as e:
+            self.stats.skipped["rejected"] += 1
+            await self.send({"type": "error", "detail": e.detail})
+            return
+        if thumb is None:
+            self.stats.skipped["undecodable"] += 1
+            await self.send({"type": "error", "detail": "無法解碼幀"})
+            return
+
+        busy = self._inflight is not None and not self._inflight.done()
+        decision = self.gate.observe(thumb, busy)
+        if decision.action == "skip":
+            self.stats.skipped[decision.reason] += 1
+            await self.set_state("moving" if decision.reason == "moving" else ("busy" if busy else "stable"))
+            return
+
+        self.stats.frames_ocr += 1
+        await self.set_state("busy")
+        # 識別在後台執行，接收循環繼續讀取（並丟棄）新幀，避免 socket 緩衝區積壓
+        self._inflight = asyncio.ensure_future(self.recognize(self.frame_index, content))
+
+    def inspect_frame(self, content: bytes) -> Optional[np.ndarray]:
+        """
+        檢查幀的文件頭並解碼幀差小圖（同步，在線程池中調用）
+
+        Returns:
+            FrameGate.thumbnail 的結果，無法解碼時為 None
+
+        Raises:
+            UploadRejected: 格式或像素數不符合要求
+        """
+        inspect_image(content, self.max_frame_bytes, self.max_frame_pixels)
+        return FrameGate.thumbnail(content)
+
+    async def recognize(self, frame: int, content: bytes) -> None:
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(None, cv2.imdecode, np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+        try:
+            lines, _ = await self.scheduler.submit(
+                image,
+                deadline=time.monotonic() + self.frame_timeout,
+                lane=self.lane,
+            )
+        except RequestShed as e:
+            self.stats.skipped[f"shed_{e.reason}"] += 1
+            self.gate.reset()
+            return
+        except Exception as e:
+            logger.error(f"實時 OCR 失敗: {e}")
+            self.gate.reset()
+            await self.send({"type": "error", "detail": "OCR 處理失敗"})
+            return
+
+        added, removed = diff_lines(self.lines, lines)
+        self.lines = lines
+        if added or removed:
+            receipt = parse_receipt_layout(lines)
+            self.stats.updates_sent += 1
+            await self.send({
+                "type": "update",
+                "frame": frame,
+                "added": added,
+                "removed": removed,
+                "total": receipt["total"],
+                "subtotal": receipt["subtotal"],
+                "service_charge": receipt["service_charge"],
+                "consistent": receipt["consistent"],
+            })
+        await self.set_state("stable")
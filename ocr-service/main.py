@@ -3,26 +3,157 @@ OCR Service for PartyBillCalculator
 使用 PaddleOCR 進行賬單圖片文字識別
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, WebSocket
+from fastapi.responses import Response
+from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from paddleocr import PaddleOCR
 import uvicorn
+import asyncio
+import hmac
 import os
 import tempfile
-from typing import Dict, List, Any, Optional, Tuple
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Set, Tuple, Union
 import logging
 import cv2
 import numpy as np
 from PIL import Image
 
-# 配置日誌
-logging.basicConfig(level=logging.INFO)
+from receipt_layout import parse_receipt_layout
+from response_format import BBOX_FORMATS, build_response, iter_fields, needs_receipt, parse_fields
+from cpu_tuning import DEFAULT_TUNING_FILE, layout_overrides, read_topology, resolve_layout
+from ocr_engine import engine_options_from_env
+from worker_pool import OCRWorkerPool, WorkerError
+from engine_manager import EngineManager, NoCanary, ReloadInProgress
+from result_cache import ResultCache, content_key
+from near_duplicate import NearDuplicateIndex, fingerprint
+from live_ocr import FrameGate, LiveSession, LiveStats
+from structured_logging import RequestContextMiddleware, bind_context, logging_stats, setup_logging
+from upload_guard import MULTIPART_OVERHEAD_BYTES, BodySizeLimit, UploadRejected, inspect_image, read_image_stream
+from scheduler import DEFAULT_LANES, ClientDisconnected, OCRScheduler, Overloaded, RequestShed
+
+# 配置日誌：JSON 格式，經隊列由後台線程寫出，不阻塞請求路徑（見 structured_logging.py）
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# OCR worker 池配置
+# 每個 worker 是獨立進程並持有自己的 PaddleOCR 實例；長時間運行的推理進程內存會增長，
+# 達到請求數或 RSS 上限時由池在後台預熱替代 worker 後優雅回收
+# worker 數、每個 worker 的推理線程數和綁核方式由 cpu_tuning 決定：
+# OCR_AUTOTUNE=auto 時應用本機型的校準結果（python cpu_tuning.py），未校準時按可用核數平分線程；
+# OCR_WORKERS / OCR_CPU_THREADS / OCR_CPU_PINNING 顯式設置時覆蓋對應字段
+OCR_AUTOTUNE = os.getenv("OCR_AUTOTUNE", "auto")
+OCR_TUNING_FILE = os.getenv("OCR_TUNING_FILE", DEFAULT_TUNING_FILE)
+OCR_WORKER_MAX_REQUESTS = int(os.getenv("OCR_WORKER_MAX_REQUESTS", "500"))
+OCR_WORKER_MAX_RSS_MB = int(os.getenv("OCR_WORKER_MAX_RSS_MB", "2048"))
+
+# 調度配置：最大排隊數（超過時丟棄），以及客戶端未提供截止時間時的默認超時（0 表示不限）
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "64"))
+OCR_DEFAULT_TIMEOUT_MS = int(os.getenv("OCR_DEFAULT_TIMEOUT_MS", "0"))
+
+# 優先級通道：name:weight:max_concurrency，第一個為默認通道
+# 交互式上傳（計算頁面）與批量回填分開排隊，避免回填任務餓死用戶請求
+OCR_LANES = os.getenv("OCR_LANES", DEFAULT_LANES)
+
+# 結果緩存：按圖片內容哈希緩存識別結果（0 表示禁用）
+OCR_RESULT_CACHE_SIZE = int(os.getenv("OCR_RESULT_CACHE_SIZE", "256"))
+result_cache = ResultCache(OCR_RESULT_CACHE_SIZE)
+
+# 近似重複檢測：同一張收據重拍時按感知哈希篩選、對齊比較後復用結果
+# 模式 off / reuse / verify；reuse 模式下按 OCR_PHASH_AUDIT_RATE 抽樣照常推理並核對
+near_duplicates = NearDuplicateIndex(
+    capacity=int(os.getenv("OCR_PHASH_CAPACITY", "256")),
+    max_distance=int(os.getenv("OCR_PHASH_MAX_DISTANCE", "20")),
+    max_mismatch=float(os.getenv("OCR_PHASH_MAX_MISMATCH", "0.02")),
+    mode=os.getenv("OCR_PHASH_MODE", "reuse"),
+    audit_rate=float(os.getenv("OCR_PHASH_AUDIT_RATE", "0.05")),
+)
+
+
+# 上傳限制：按塊讀取並限制字節數，從文件頭識別真實格式，完整解碼前按寬高拒絕超大圖片（解壓炸彈）
+OCR_MAX_UPLOAD_BYTES = int(os.getenv("OCR_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+OCR_MAX_IMAGE_PIXELS = int(os.getenv("OCR_MAX_IMAGE_PIXELS", "50000000"))
+OCR_MAX_IMAGE_SIDE = int(os.getenv("OCR_MAX_IMAGE_SIDE", "16384"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+# 相機實時預覽（/ocr/live）：幀差閾值、穩定幀數、單幀大小上限和單次識別預算
+OCR_LIVE_DIFF_THRESHOLD = float(os.getenv("OCR_LIVE_DIFF_THRESHOLD", "6"))
+OCR_LIVE_STABLE_FRAMES = int(os.getenv("OCR_LIVE_STABLE_FRAMES", "3"))
+OCR_LIVE_MAX_FRAME_BYTES = int(os.getenv("OCR_LIVE_MAX_FRAME_BYTES", str(2 * 1024 * 1024)))
+OCR_LIVE_FRAME_TIMEOUT_MS = int(os.getenv("OCR_LIVE_FRAME_TIMEOUT_MS", "5000"))
+live_stats = LiveStats()
+
+
+# 管理接口（/admin/engine）：設置 OCR_ADMIN_TOKEN 時要求 X-Admin-Token 頭一致，否則只允許本機訪問
+OCR_ADMIN_TOKEN = os.getenv("OCR_ADMIN_TOKEN")
+
+
+def on_engine_switch(generation) -> None:
+    """新一代引擎接管流量：按需清空按舊模型結果建立的緩存"""
+    if generation.clear_caches:
+        result_cache.clear()
+        near_duplicates.clear()
+        logger.info(f"已清空結果緩存和近似重複索引（第 {generation.id} 代引擎）")
+
+
+def find_near_duplicate(content: bytes):
+    """計算指紋並查找近似重複項（CPU 密集，在線程池中執行）"""
+    fp = fingerprint(content)
+    return fp, near_duplicates.lookup(fp)
+
+engines: Optional[EngineManager] = None
+scheduler: Optional[OCRScheduler] = None
+cpu_layout: Optional[Dict[str, Any]] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """啟動時創建並預熱 worker 池，關閉時停止所有 worker"""
+    global engines, scheduler, cpu_layout
+    engine_options = engine_options_from_env()
+    topology = read_topology()
+    layout, source = await resolve_layout(engine_options, topology, OCR_AUTOTUNE, OCR_TUNING_FILE, layout_overrides())
+    logger.info(f"CPU 拓撲: {topology.describe()}")
+    logger.info(f"CPU 佈局: {layout.describe(topology)}（{source}）")
+    cpu_layout = dict(layout.to_dict(), host=topology.host_key(), source=source)
+    placements = layout.placements(topology)
+
+    def create_pool(options: Dict[str, Any], size: int) -> OCRWorkerPool:
+        return OCRWorkerPool(
+            size=size,
+            engine_options=options,
+            max_requests=OCR_WORKER_MAX_REQUESTS,
+            max_rss_mb=OCR_WORKER_MAX_RSS_MB,
+            placements=placements,
+        )
+
+    engines = EngineManager(create_pool, engine_options, layout.workers, on_switch=on_engine_switch)
+    await engines.start()
+    scheduler = OCRScheduler(engines, max_queue=OCR_MAX_QUEUE, lanes=OCR_LANES)
+    await scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.close()
+        await engines.close()
+
+
 app = FastAPI(
     title="OCR Service",
     description="PaddleOCR-based OCR service for bill recognition",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+# 在 multipart 解析之前限制請求體大小（Content-Length 超限直接 413，分塊傳輸邊收邊計數）
+app.add_middleware(
+    BodySizeLimit,
+    limits={
+        "/ocr": OCR_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES if OCR_MAX_UPLOAD_BYTES else 0,
+        "/ocr/raw": OCR_MAX_UPLOAD_BYTES,
+    },
 )
 
 # 配置 CORS（允許 Node.js 後端調用）
@@ -34,12 +165,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化 PaddleOCR（支持中英文）
-# 注意：新版 PaddleOCR 已棄用 use_angle_cls、show_log 等參數
-# 這裡使用推薦的參數配置：lang='ch'（中英文）、use_textline_orientation=True（自動處理文字方向）
-logger.info("正在初始化 PaddleOCR...")
-ocr = PaddleOCR(lang="ch", use_textline_orientation=True)
-logger.info("PaddleOCR 初始化完成")
+# 最外層：為每個請求綁定 request_id（X-Request-ID），之後的日誌都帶上
+app.add_middleware(RequestContextMiddleware)
 
 
 # 暫時禁用透視矯正功能（因為發現結果更差）
@@ -193,6 +320,155 @@ def auto_rotate_image(image_path: str) -> Optional[str]:
         return None
 
 
+def request_deadline(request: Request, timeout_ms: Optional[int]) -> Optional[float]:
+    """
+    從請求中解析截止時間
+    
+    優先級：?timeout_ms= > X-Request-Timeout（相對毫秒）> X-Request-Deadline（Unix 毫秒時間戳）
+    > OCR_DEFAULT_TIMEOUT_MS
+    
+    Returns:
+        time.monotonic() 時間點；未指定時返回 None
+    """
+    try:
+        if timeout_ms is None and request.headers.get("x-request-timeout"):
+            timeout_ms = int(request.headers["x-request-timeout"])
+        if timeout_ms is None and request.headers.get("x-request-deadline"):
+            remaining_s = int(request.headers["x-request-deadline"]) / 1000.0 - time.time()
+            return time.monotonic() + remaining_s
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="X-Request-Timeout / X-Request-Deadline 必須是整數毫秒"
+        )
+    if timeout_ms is None and OCR_DEFAULT_TIMEOUT_MS > 0:
+        timeout_ms = OCR_DEFAULT_TIMEOUT_MS
+    if timeout_ms is None or timeout_ms <= 0:
+        return None
+    return time.monotonic() + timeout_ms / 1000.0
+
+
+def request_lane(request: Request, lane: Optional[str]) -> str:
+    """
+    解析請求的優先級通道（?lane= 或 X-OCR-Lane 頭），未指定時使用默認通道
+    
+    Raises:
+        HTTPException: 未知通道返回 400
+    """
+    lane = lane or request.headers.get("x-ocr-lane") or scheduler.default_lane
+    if lane not in scheduler.lanes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"未知通道: {lane}（可選: {', '.join(scheduler.lanes)}）"
+        )
+    return lane
+
+
+async def run_ocr(
+    image: Union[str, np.ndarray, Callable[[], Awaitable[np.ndarray]]],
+    structured: bool,
+    request: Request,
+    deadline: Optional[float] = None,
+    lane: Optional[str] = None,
+    content: Optional[bytes] = None,
+) -> Dict[str, Any]:
+    """
+    執行 OCR 並整理結果
+    
+    在各階段邊界（排隊前、出隊時、推理後）檢查客戶端是否已斷開，
+    已無法在截止時間前完成的請求在推理前丟棄。
+    
+    Args:
+        image: 圖片路徑，或已解碼的 BGR 圖像陣列（PaddleOCR 兩者皆支持）；
+               也可以是返回圖像陣列的協程函數，僅在緩存未命中時調用
+        structured: 是否附帶版面解析結果
+        request: 當前請求（用於檢查客戶端連接）
+        deadline: request_deadline 的結果
+        lane: request_lane 的結果
+        content: 圖片原始字節；提供時先查結果緩存和近似重複索引，命中則跳過推理
+        
+    Returns:
+        {"text", "lines", "raw_result"[, "receipt"]}
+        
+    Raises:
+        HTTPException: 請求被丟棄時返回 503（過載）/ 504（超時）/ 499（客戶端斷開）
+    """
+    bind_context(lane=lane)
+    cache_key = content_key(content) if content is not None else None
+    cached = result_cache.get(cache_key)
+    source = "cache" if cached is not None else "ocr"
+    fp = None
+    match = None
+    if cached is None and content is not None and near_duplicates.enabled:
+        loop = asyncio.get_running_loop()
+        fp, match = await loop.run_in_executor(None, find_near_duplicate, content)
+        if match is not None and not match.audit:
+            cached = match.value
+            result_cache.put(cache_key, cached)
+            source = "near_duplicate"
+            logger.info(f"復用近似重複圖片的結果: 漢明距離 {match.distance}，筆畫差異 {match.mismatch:.3f}",
+                        extra={"distance": match.distance, "mismatch": round(match.mismatch, 4)})
+    try:
+        if cached is not None:
+            lines, full_text = cached
+        else:
+            if await request.is_disconnected():
+                raise ClientDisconnected("客戶端已斷開")
+            if callable(image):
+                image = await image()
+            # 在 worker 進程中執行 OCR，不阻塞事件循環
+            lines, full_text = await scheduler.submit(
+                image,
+                deadline=deadline,
+                lane=lane,
+                is_disconnected=request.is_disconnected,
+            )
+            result_cache.put(cache_key, (lines, full_text))
+            near_duplicates.add(fp, (lines, full_text))
+            if match is not None:
+                false_reuse, similarity = near_duplicates.audit(match, (lines, full_text))
+                if false_reuse:
+                    logger.warning(f"近似重複誤判: 漢明距離 {match.distance}，全文相似度 {similarity:.2f}")
+        if await request.is_disconnected():
+            raise ClientDisconnected("客戶端已斷開")
+    except RequestShed as e:
+        logger.warning(f"OCR 請求已丟棄: {e.reason}", extra={"status": e.status_code})
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": "1"} if isinstance(e, Overloaded) else None,
+        )
+    logger.info(f"OCR 識別完成: {len(lines)} 行文字，總文字長度: {len(full_text)} 字符",
+                extra={"source": source, "lines": len(lines), "chars": len(full_text)})
+
+    payload = {
+        "text": full_text,
+        "lines": lines,
+        "raw_result": None  # 暫時不返回 raw_result，避免序列化問題
+    }
+    if structured:
+        payload["receipt"] = parse_receipt_layout(lines)
+        logger.info(f"版面解析完成: {len(payload['receipt']['items'])} 個菜品，"
+                    f"consistent={payload['receipt']['consistent']}")
+    return payload
+
+
+def parse_output_options(structured: bool, fields: Optional[str], bbox: str) -> Tuple[Optional[Set[str]], bool]:
+    """
+    校驗 /ocr 系列端點的輸出參數
+    
+    Returns:
+        (selected_fields, structured)；所選字段需要 receipt 時自動開啟 structured
+    """
+    if bbox not in BBOX_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"bbox 參數必須是 {' / '.join(BBOX_FORMATS)}"
+        )
+    selected = parse_fields(fields)
+    return selected, structured or needs_receipt(selected)
+
+
 @app.get("/")
 async def root():
     """健康檢查端點"""
@@ -209,13 +485,145 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """服務指標（worker 池狀態、回收次數及原因）"""
+    return {
+        "pool": engines.metrics() if engines else None,
+        "cpu_layout": cpu_layout,
+        "scheduler": scheduler.metrics() if scheduler else None,
+        "result_cache": result_cache.metrics(),
+        "near_duplicates": near_duplicates.metrics(),
+        "live": live_stats.metrics(),
+        "logging": logging_stats(),
+    }
+
+
+class EngineReloadRequest(BaseModel):
+    """引擎熱更新請求"""
+    options: Dict[str, Any] = {}
+    merge: bool = True  # True 時在當前代的參數上覆蓋 options，否則 options 即完整參數
+    canary_percent: float = 0.0  # 0 表示預熱完成後全量切換
+    canary_workers: Optional[int] = None
+    clear_caches: bool = False  # 切換時清空結果緩存和近似重複索引
+
+
+def require_admin(request: Request) -> None:
+    if OCR_ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get("x-admin-token", ""), OCR_ADMIN_TOKEN):
+            raise HTTPException(status_code=401, detail="X-Admin-Token 無效")
+        return
+    # 未配置令牌時只允許本機（含 Unix domain socket）訪問
+    host = request.client.host if request.client else None
+    if host not in (None, "127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="管理接口只允許本機訪問（或設置 OCR_ADMIN_TOKEN）")
+
+
+@app.get("/admin/engine")
+async def engine_status(request: Request):
+    """各代引擎的狀態、延遲和置信度，以及金絲雀對比"""
+    require_admin(request)
+    return engines.status()
+
+
+@app.post("/admin/engine/reload", status_code=202)
+async def engine_reload(request: Request, body: EngineReloadRequest):
+    """
+    在後台加載並預熱新一代引擎
+
+    預熱完成後原子切換（或作為金絲雀按百分比分流），舊一代處理完手上的請求後關閉。
+    加載失敗時繼續使用當前代，錯誤見 GET /admin/engine。
+    """
+    require_admin(request)
+    options = dict(engines.active.options, **body.options) if body.merge else dict(body.options)
+    if options.get("engine") == "stub":
+        import stub_engine
+
+        try:
+            stub_engine.validate_options(options.get("stub", {}))
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"樁引擎參數錯誤: {e}")
+    try:
+        generation = engines.reload(options, body.canary_percent, body.canary_workers)
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    generation.clear_caches = body.clear_caches
+    return generation.snapshot()
+
+
+@app.post("/admin/engine/promote")
+async def engine_promote(request: Request):
+    """金絲雀全量上線（worker 數不足時先按金絲雀參數加載完整的一代）"""
+    require_admin(request)
+    try:
+        generation = engines.promote()
+    except NoCanary as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return generation.snapshot()
+
+
+@app.post("/admin/engine/rollback")
+async def engine_rollback(request: Request):
+    """下線金絲雀"""
+    require_admin(request)
+    try:
+        generation = engines.rollback()
+    except NoCanary as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return generation.snapshot()
+
+
+async def iter_upload(file: UploadFile):
+    """按塊讀取 multipart 上傳的文件"""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def read_upload(chunks) -> bytes:
+    """
+    按塊讀取並校驗上傳的圖片
+
+    Raises:
+        HTTPException: 超過大小 / 像素上限（413）、格式不支持（415）、文件頭無法解析（400）
+    """
+    try:
+        content, inspector = await read_image_stream(
+            chunks, OCR_MAX_UPLOAD_BYTES, OCR_MAX_IMAGE_PIXELS, OCR_MAX_IMAGE_SIDE
+        )
+    except UploadRejected as e:
+        logger.warning(f"拒絕上傳: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return content
+
+
 @app.post("/ocr")
-async def ocr_image(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def ocr_image(
+    request: Request,
+    file: UploadFile = File(...),
+    structured: bool = Query(False, description="是否返回版面解析後的菜品表（receipt 字段）"),
+    fields: Optional[str] = Query(None, description=f"只返回指定字段（逗號分隔），可選: {', '.join(iter_fields())}"),
+    bbox: str = Query("nested", description="bbox 編碼：nested（四點座標）或 flat（列式 int32）"),
+    timeout_ms: Optional[int] = Query(None, description="請求預算（毫秒），也可用 X-Request-Timeout / X-Request-Deadline 頭傳遞"),
+    lane: Optional[str] = Query(None, description="優先級通道（如 interactive / backfill），也可用 X-OCR-Lane 頭傳遞"),
+) -> Response:
     """
     接收圖片文件，進行 OCR 識別
     
     Args:
         file: 上傳的圖片文件
+        structured: 為 True 時額外返回 receipt（行聚類、菜品 / 價格配對、小計 / 服務費 / 總額）
+        fields: 字段選擇，例如 "text,total"；receipt 子字段會提升到頂層
+        bbox: "flat" 時 lines 改為列式格式，bbox 為攤平的 int32 列表
+        
+    響應編碼：Accept 含 application/x-msgpack 時返回 msgpack（bbox 為 int32 bytes），
+    並按 Accept-Encoding 協商 br / gzip 壓縮
         
     Returns:
         {
@@ -223,7 +631,8 @@ async def ocr_image(file: UploadFile = File(...)) -> Dict[str, Any]:
             "lines": [
                 {"text": "文字內容", "confidence": 0.95, "bbox": [...]}
             ],
-            "raw_result": [...]  # PaddleOCR 原始結果
+            "raw_result": [...],  # PaddleOCR 原始結果
+            "receipt": {...}  # 僅 structured=true 時返回，見 receipt_layout.parse_receipt_layout
         }
     """
     if not file.content_type or not file.content_type.startswith('image/'):
@@ -231,18 +640,20 @@ async def ocr_image(file: UploadFile = File(...)) -> Dict[str, Any]:
             status_code=400,
             detail="文件必須是圖片格式"
         )
+    selected, structured = parse_output_options(structured, fields, bbox)
+    deadline = request_deadline(request, timeout_ms)
+    lane = request_lane(request, lane)
+    content = await read_upload(iter_upload(file))
     
     # 創建臨時文件保存上傳的圖片
     tmp_file_path = None
     corrected_path = None
     with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
         try:
-            # 讀取上傳的文件內容
-            content = await file.read()
             tmp_file.write(content)
             tmp_file_path = tmp_file.name
             
-            logger.info(f"開始 OCR 識別: {file.filename}")
+            logger.info(f"開始 OCR 識別: {file.filename}", extra={"bytes": len(content)})
 
             # 圖像預處理：透視矯正（暫時禁用，因為發現結果更差）
             # TODO: 未來可以改進透視矯正算法或提供開關選項
@@ -254,122 +665,11 @@ async def ocr_image(file: UploadFile = File(...)) -> Dict[str, Any]:
             processed_image_path = tmp_file_path
             corrected_path = None  # 暫時不使用透視矯正
 
-            # 執行 OCR（新版 PaddleOCR 的 predict 不再接受 cls 參數，方向處理已在初始化中啟用）
-            result = ocr.ocr(processed_image_path)
-            
-            # 處理結果
-            if not result:
-                return {
-                    "text": "",
-                    "lines": [],
-                    "raw_result": None
-                }
-
-            # 提取文字和置信度（兼容不同 PaddleOCR 返回格式）
-            lines = []
-            all_text = []
-
-            try:
-                first_page = result[0]
-            except Exception:
-                first_page = None
-
-            # 新格式：result[0] 是字典，包含 'rec_texts' 等字段
-            if isinstance(first_page, dict) and 'rec_texts' in first_page:
-                rec_texts = first_page.get('rec_texts', [])
-                rec_scores = first_page.get('rec_scores', [])
-                rec_polys = first_page.get('rec_polys', [])
-                
-                for i, text in enumerate(rec_texts):
-                    if text and isinstance(text, str):
-                        confidence = rec_scores[i] if i < len(rec_scores) else 0.0
-                        
-                        # 處理 bbox（rec_polys）
-                        bbox_list = []
-                        if i < len(rec_polys):
-                            poly = rec_polys[i]
-                            if hasattr(poly, 'tolist'):
-                                bbox_list = poly.tolist()
-                            elif isinstance(poly, (list, tuple)):
-                                bbox_list = list(poly)
-                        
-                        lines.append({
-                            "text": text,
-                            "confidence": float(confidence),
-                            "bbox": bbox_list
-                        })
-                        all_text.append(text)
-            
-            # 傳統格式：result[0] 為若干行，每行形如 [bbox, (text, score)]
-            elif isinstance(first_page, list):
-                for line in first_page:
-                    if len(line) >= 2:
-                        bbox = line[0]  # 邊界框座標（可能是 numpy.ndarray）
-                        text_info = line[1]  # (文字, 置信度)
-
-                        if isinstance(text_info, tuple) and len(text_info) >= 2:
-                            text = text_info[0]
-                            confidence = text_info[1]
-
-                            # 將 numpy.ndarray 轉換為 Python 列表，確保可以序列化
-                            if hasattr(bbox, 'tolist'):
-                                bbox_list = bbox.tolist()
-                            elif isinstance(bbox, (list, tuple)):
-                                bbox_list = list(bbox)
-                            else:
-                                bbox_list = []
-
-                            lines.append({
-                                "text": text,
-                                "confidence": float(confidence),
-                                "bbox": bbox_list
-                            })
-                            all_text.append(text)
-
-            # 如果沒有成功提取到行文字，嘗試更詳細的調試
-            if not all_text:
-                logger.warning("未能從標準格式提取文字，嘗試調試...")
-                logger.warning(f"Result type: {type(result)}")
-                logger.warning(f"Result length: {len(result) if isinstance(result, (list, tuple)) else 'N/A'}")
-                if isinstance(result, list) and len(result) > 0:
-                    logger.warning(f"First element type: {type(result[0])}")
-                    logger.warning(f"First element: {str(result[0])[:200]}")  # 只顯示前200字符
-                # 嘗試從原始結果中提取文字
-                try:
-                    # 如果 result 是列表，嘗試遞歸提取所有字符串
-                    def extract_texts(obj, texts_list):
-                        if isinstance(obj, str):
-                            if obj.strip():  # 只添加非空字符串
-                                texts_list.append(obj)
-                        elif isinstance(obj, (list, tuple)):
-                            for item in obj:
-                                extract_texts(item, texts_list)
-                        elif isinstance(obj, dict):
-                            for value in obj.values():
-                                extract_texts(value, texts_list)
-                    
-                    fallback_texts = []
-                    extract_texts(result, fallback_texts)
-                    if fallback_texts:
-                        full_text = "\n".join(fallback_texts)
-                        logger.info(f"從回退方案提取到 {len(fallback_texts)} 段文字")
-                    else:
-                        full_text = str(result)
-                        logger.warning("回退方案也無法提取文字，返回原始結果字符串")
-                except Exception as e:
-                    logger.error(f"回退方案提取失敗: {e}")
-                    full_text = str(result)
-            else:
-                full_text = "\n".join(all_text)
-
-            logger.info(f"OCR 識別完成: {len(lines)} 行文字，總文字長度: {len(full_text)} 字符")
-
-            return {
-                "text": full_text,
-                "lines": lines,
-                "raw_result": None  # 暫時不返回 raw_result，避免序列化問題
-            }
+            payload = await run_ocr(processed_image_path, structured, request, deadline, lane, content=content)
+            return build_response(payload, request, selected, bbox)
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"OCR 處理錯誤: {str(e)}")
             raise HTTPException(
@@ -387,11 +687,210 @@ async def ocr_image(file: UploadFile = File(...)) -> Dict[str, Any]:
                 logger.warning(f"無法刪除臨時文件（可能仍被佔用）: {e}")
 
 
+# 本機路徑引用允許的根目錄（os.pathsep 分隔）；未設置時禁用 /ocr/path
+LOCAL_PATH_ROOTS = [
+    os.path.realpath(root)
+    for root in os.getenv("OCR_LOCAL_PATH_ROOTS", "").split(os.pathsep)
+    if root.strip()
+]
+
+
+class PathReference(BaseModel):
+    """本機圖片引用（與 Node 後端在同一主機，可直接讀取上傳目錄或 /dev/shm 中的文件）"""
+    path: str
+
+
+def resolve_local_path(path: str) -> str:
+    """
+    校驗本機路徑引用，只允許 OCR_LOCAL_PATH_ROOTS 下的文件
+    
+    Raises:
+        HTTPException: 未啟用（403）、路徑不在允許目錄（403）或文件不存在（404）
+    """
+    if not LOCAL_PATH_ROOTS:
+        raise HTTPException(
+            status_code=403,
+            detail="本機路徑引用未啟用（請設置 OCR_LOCAL_PATH_ROOTS）"
+        )
+    real_path = os.path.realpath(path)
+    if not any(os.path.commonpath([real_path, root]) == root for root in LOCAL_PATH_ROOTS):
+        raise HTTPException(
+            status_code=403,
+            detail="路徑不在允許的目錄中"
+        )
+    if not os.path.isfile(real_path):
+        raise HTTPException(
+            status_code=404,
+            detail="圖片文件不存在"
+        )
+    return real_path
+
+
+def read_local_file(path: str) -> Optional[bytes]:
+    """
+    讀取本機圖片文件（同步，在線程池中調用）
+
+    Returns:
+        文件內容；超過 OCR_MAX_UPLOAD_BYTES 時為 None
+    """
+    with open(path, "rb") as f:
+        if not OCR_MAX_UPLOAD_BYTES:
+            return f.read()
+        # 多讀一個字節判斷是否超限，文件在讀取期間變大也不會整個讀進內存
+        content = f.read(OCR_MAX_UPLOAD_BYTES + 1)
+    return None if len(content) > OCR_MAX_UPLOAD_BYTES else content
+
+
+@app.post("/ocr/raw")
+async def ocr_raw(
+    request: Request,
+    structured: bool = Query(False, description="是否返回版面解析後的菜品表（receipt 字段）"),
+    fields: Optional[str] = Query(None, description="只返回指定字段（逗號分隔），同 /ocr"),
+    bbox: str = Query("nested", description="bbox 編碼：nested 或 flat，同 /ocr"),
+    timeout_ms: Optional[int] = Query(None, description="請求預算（毫秒），也可用 X-Request-Timeout / X-Request-Deadline 頭傳遞"),
+    lane: Optional[str] = Query(None, description="優先級通道（如 interactive / backfill），也可用 X-OCR-Lane 頭傳遞"),
+) -> Response:
+    """
+    接收原始圖片字節（application/octet-stream 或 image/*），跳過 multipart 編解碼
+    
+    圖片在內存中解碼後直接交給 PaddleOCR，不寫臨時文件。
+    參數和響應格式與 /ocr 相同。
+    """
+    content_type = request.headers.get("content-type", "")
+    if not (content_type.startswith("image/") or content_type.startswith("application/octet-stream")):
+        raise HTTPException(
+            status_code=415,
+            detail="Content-Type 必須是 application/octet-stream 或 image/*"
+        )
+    selected, structured = parse_output_options(structured, fields, bbox)
+    deadline = request_deadline(request, timeout_ms)
+    lane = request_lane(request, lane)
+
+    content = await read_upload(request.stream())
+
+    async def decode() -> np.ndarray:
+        # 全尺寸圖片解碼耗時較長，放到線程池中，不阻塞事件循環上的其他請求和 WebSocket
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(None, cv2.imdecode, np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise HTTPException(
+                status_code=400,
+                detail="無法解碼圖片"
+            )
+        return image
+
+    logger.info(f"開始 OCR 識別（raw）: {len(content)} 字節", extra={"bytes": len(content)})
+    try:
+        payload = await run_ocr(decode, structured, request, deadline, lane, content=content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"OCR 處理錯誤: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"OCR 處理失敗: {str(e)}"
+        )
+    return build_response(payload, request, selected, bbox)
+
+
+@app.post("/ocr/path")
+async def ocr_path(
+    request: Request,
+    reference: PathReference,
+    structured: bool = Query(False, description="是否返回版面解析後的菜品表（receipt 字段）"),
+    fields: Optional[str] = Query(None, description="只返回指定字段（逗號分隔），同 /ocr"),
+    bbox: str = Query("nested", description="bbox 編碼：nested 或 flat，同 /ocr"),
+    timeout_ms: Optional[int] = Query(None, description="請求預算（毫秒），也可用 X-Request-Timeout / X-Request-Deadline 頭傳遞"),
+    lane: Optional[str] = Query(None, description="優先級通道（如 interactive / backfill），也可用 X-OCR-Lane 頭傳遞"),
+) -> Response:
+    """
+    按本機路徑識別圖片（零上傳：服務直接讀取磁盤上已存在的文件）
+    
+    Body: {"path": "/abs/path/to/image.jpg"}，路徑必須位於 OCR_LOCAL_PATH_ROOTS 下。
+    共享內存可通過 /dev/shm 下的文件路徑傳遞。
+    """
+    selected, structured = parse_output_options(structured, fields, bbox)
+    deadline = request_deadline(request, timeout_ms)
+    lane = request_lane(request, lane)
+    image_path = resolve_local_path(reference.path)
+
+    # 讀盤在線程池中執行（大文件或網絡盤上的讀取不阻塞事件循環），與 /ocr/raw 的解碼相同
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(None, read_local_file, image_path)
+    if content is None:
+        raise HTTPException(status_code=413, detail=f"圖片超過大小上限 {OCR_MAX_UPLOAD_BYTES} 字節")
+    try:
+        inspect_image(content, OCR_MAX_UPLOAD_BYTES, OCR_MAX_IMAGE_PIXELS, OCR_MAX_IMAGE_SIDE)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    logger.info(f"開始 OCR 識別（path）: {image_path}")
+    try:
+        payload = await run_ocr(image_path, structured, request, deadline, lane, content=content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"OCR 處理錯誤: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"OCR 處理失敗: {str(e)}"
+        )
+    return build_response(payload, request, selected, bbox)
+
+
+@app.websocket("/ocr/live")
+async def ocr_live(websocket: WebSocket, lane: Optional[str] = None):
+    """
+    相機實時預覽：接收連續幀，畫面穩定且有變化時識別，推送增量行和金額
+
+    協議見 live_ocr.py。幀在識別進行中到達時直接丟棄，不會排隊。
+    """
+    if lane is not None and lane not in scheduler.lanes:
+        await websocket.close(code=1008, reason=f"未知通道: {lane}")
+        return
+    await websocket.accept()
+    session = LiveSession(
+        websocket,
+        scheduler,
+        live_stats,
+        lane=lane,
+        gate=FrameGate(OCR_LIVE_DIFF_THRESHOLD, OCR_LIVE_STABLE_FRAMES),
+        max_frame_bytes=OCR_LIVE_MAX_FRAME_BYTES,
+        max_frame_pixels=OCR_MAX_IMAGE_PIXELS,
+        frame_timeout=OCR_LIVE_FRAME_TIMEOUT_MS / 1000.0,
+    )
+    logger.info("實時識別會話開始")
+    await session.run()
+    logger.info(f"實時識別會話結束: {session.frame_index} 幀")
+
+
+async def serve(host: str, port: int, uds: Optional[str]) -> None:
+    """同時監聽 TCP 和（可選的）Unix domain socket，兩者共用同一個 app 和 OCR 引擎"""
+    # log_config=None：沿用 setup_logging 的隊列 handler，不讓 uvicorn 重新配置同步 handler
+    config = uvicorn.Config(app, host=host, port=port, log_config=None)
+    if not uds:
+        await uvicorn.Server(config).serve()
+        return
+    if os.path.exists(uds):
+        os.unlink(uds)
+    # 一個 Server 監聽兩個 socket：lifespan 只運行一次，只有一個 worker 池和調度器
+    sockets = [config.bind_socket(), uvicorn.Config(app, uds=uds, log_config=None).bind_socket()]
+    try:
+        await uvicorn.Server(config).serve(sockets=sockets)
+    finally:
+        for sock in sockets:
+            sock.close()
+        if os.path.exists(uds):
+            os.unlink(uds)
+
+
 if __name__ == "__main__":
     # 從環境變數讀取配置
     host = os.getenv("OCR_SERVICE_HOST", "0.0.0.0")
     port = int(os.getenv("OCR_SERVICE_PORT", "8000"))
+    uds = os.getenv("OCR_SERVICE_UDS")
     
     logger.info(f"啟動 OCR 服務: http://{host}:{port}")
-    uvicorn.run(app, host=host, port=port)
-
+    if uds:
+        logger.info(f"同時監聽 Unix domain socket: {uds}")
+    asyncio.run(serve(host, port, uds))
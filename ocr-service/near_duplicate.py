@@ -0,0 +1,281 @@
+"""
+近似重複圖片檢測
+同一張收據拍兩次（角度、曝光略有不同）時字節不同，result_cache 無法命中。
+
+兩階段匹配：
+1. 在縮略圖上計算感知哈希（DCT pHash，64 位），與最近圖片的哈希做向量化漢明距離比較，篩出候選
+2. 整張照片的 pHash 主要反映紙張輪廓，同一家店的不同收據也很接近，
+   因此用 ORB 特徵點估計單應性把候選對齊到當前圖片，比較二值化後的筆畫差異，差異足夠小才復用結果
+
+reuse 模式下按比例抽樣照常推理並與復用結果比對，統計誤復用率。
+"""
+
+import difflib
+import random
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from result_cache import OCRResultValue
+
+# 哈希邊長（8x8 = 64 位）與 DCT 輸入邊長
+HASH_SIDE = 8
+DCT_SIDE = 32
+
+# 對齊比較用縮略圖的最長邊（像素）
+THUMBNAIL_SIDE = 640
+ORB_FEATURES = 500
+# 估計單應性至少需要的特徵匹配數
+MIN_MATCHES = 8
+
+# 每個字節的 popcount 查找表，用於向量化計算漢明距離
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+MODES = ("off", "reuse", "verify")
+
+
+@dataclass
+class Fingerprint:
+    """圖片指紋：感知哈希 + 對齊比較所需的特徵點和筆畫圖"""
+
+    phash: np.ndarray  # 8 字節 uint8
+    points: np.ndarray  # (n, 2) float32
+    descriptors: Optional[np.ndarray]  # (n, 32) uint8
+    ink: np.ndarray  # packbits 後的筆畫二值圖
+    shape: Tuple[int, int]
+
+
+def _phash(gray: np.ndarray) -> np.ndarray:
+    small = cv2.resize(gray, (DCT_SIDE, DCT_SIDE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:HASH_SIDE, :HASH_SIDE].ravel()
+    # 直流分量只反映整體亮度，不參與中位數計算，降低曝光差異的影響
+    return np.packbits(low > np.median(low[1:]))
+
+
+def fingerprint(content: bytes) -> Optional[Fingerprint]:
+    """
+    計算圖片指紋
+
+    以 1/4 比例解碼灰度縮略圖（JPEG 可跳過大部分解碼工作），最長邊縮到 THUMBNAIL_SIDE。
+
+    Args:
+        content: 圖片原始字節
+
+    Returns:
+        Fingerprint；無法解碼時返回 None
+    """
+    gray = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    scale = THUMBNAIL_SIDE / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    keypoints, descriptors = cv2.ORB_create(ORB_FEATURES).detectAndCompute(gray, None)
+    ink = cv2.adaptiveThreshold(gray, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    return Fingerprint(
+        phash=_phash(gray),
+        points=np.float32([kp.pt for kp in keypoints]).reshape(-1, 2),
+        descriptors=descriptors,
+        ink=np.packbits(ink),
+        shape=gray.shape,
+    )
+
+
+def _unpack_ink(fp: Fingerprint) -> np.ndarray:
+    return np.unpackbits(fp.ink, count=fp.shape[0] * fp.shape[1]).reshape(fp.shape)
+
+
+def alignment_mismatch(query: Fingerprint, candidate: Fingerprint) -> float:
+    """
+    將候選圖片對齊到當前圖片後的筆畫差異
+
+    Returns:
+        互相未被對方（膨脹 1 像素後）覆蓋的筆畫像素比例（0~1）；無法對齊時返回 1.0
+    """
+    if query.descriptors is None or candidate.descriptors is None:
+        return 1.0
+    if len(query.descriptors) < 2 or len(candidate.descriptors) < 2:
+        return 1.0
+    pairs = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(candidate.descriptors, query.descriptors, k=2)
+    # Lowe 比值檢驗
+    good = [p[0] for p in pairs if len(p) == 2 and p[0].distance < 0.75 * p[1].distance]
+    if len(good) < MIN_MATCHES:
+        return 1.0
+    homography, _ = cv2.findHomography(
+        candidate.points[[m.queryIdx for m in good]],
+        query.points[[m.trainIdx for m in good]],
+        cv2.RANSAC,
+        5.0,
+    )
+    if homography is None:
+        return 1.0
+
+    query_ink = _unpack_ink(query)
+    warped = cv2.warpPerspective(_unpack_ink(candidate), homography, (query.shape[1], query.shape[0]))
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    missing = np.count_nonzero(query_ink & (cv2.dilate(warped, kernel) == 0))
+    extra = np.count_nonzero(warped & (cv2.dilate(query_ink, kernel) == 0))
+    total = np.count_nonzero(query_ink) + np.count_nonzero(warped)
+    return (missing + extra) / total if total else 1.0
+
+
+def text_similarity(a: str, b: str) -> float:
+    """兩次識別全文的相似度（0~1）"""
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+@dataclass
+class Match:
+    """索引中的近似重複項"""
+
+    distance: int  # pHash 漢明距離
+    mismatch: float  # 對齊後的筆畫差異
+    value: OCRResultValue
+    audit: bool  # 是否需要照常推理並與 value 比對
+
+
+class NearDuplicateIndex:
+    """
+    最近圖片指紋的環形索引
+
+    lookup 會做對齊比較（每個候選數毫秒 CPU），應在線程池中調用；add / audit 可在事件循環中調用。
+
+    Args:
+        capacity: 保留的最近圖片數
+        max_distance: pHash 候選的最大漢明距離（64 位中）
+        max_mismatch: 對齊後筆畫差異不超過此值才判定為同一張收據
+        top_k: 每次最多對齊比較的候選數
+        mode: off（禁用）/ reuse（復用結果，按 audit_rate 抽樣核對）/ verify（總是推理並核對，用於校準閾值）
+        audit_rate: reuse 模式下抽樣核對的比例
+        min_similarity: 核對時全文相似度低於此值記為誤復用
+    """
+
+    def __init__(
+        self,
+        capacity: int = 256,
+        max_distance: int = 20,
+        max_mismatch: float = 0.02,
+        top_k: int = 8,
+        mode: str = "reuse",
+        audit_rate: float = 0.05,
+        min_similarity: float = 0.9,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"近似重複檢測模式必須是 {' / '.join(MODES)}")
+        self.capacity = max(1, capacity)
+        self.max_distance = max_distance
+        self.max_mismatch = max_mismatch
+        self.top_k = max(1, top_k)
+        self.mode = mode
+        self.audit_rate = audit_rate
+        self.min_similarity = min_similarity
+
+        self._lock = threading.Lock()
+        self._hashes = np.zeros((self.capacity, HASH_SIDE * HASH_SIDE // 8), dtype=np.uint8)
+        self._entries: List[Optional[Tuple[Fingerprint, OCRResultValue]]] = [None] * self.capacity
+        self._size = 0
+        self._next = 0
+
+        self.lookups = 0
+        self.candidates = 0
+        self.rejected = 0
+        self.matches = 0
+        self.reused = 0
+        self.audited = 0
+        self.false_reuse = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def lookup(self, fp: Optional[Fingerprint]) -> Optional[Match]:
+        """查找同一張收據的最近識別結果"""
+        if not self.enabled or fp is None:
+            return None
+        with self._lock:
+            self.lookups += 1
+            if not self._size:
+                return None
+            distances = _POPCOUNT[np.bitwise_xor(self._hashes[:self._size], fp.phash)].sum(axis=1, dtype=np.int32)
+            order = np.argsort(distances, kind="stable")[:self.top_k]
+            shortlist = [
+                (int(distances[slot]), self._entries[slot])
+                for slot in order
+                if distances[slot] <= self.max_distance
+            ]
+
+        for distance, (candidate, value) in shortlist:
+            mismatch = alignment_mismatch(fp, candidate)
+            if mismatch <= self.max_mismatch:
+                break
+        else:
+            with self._lock:
+                if shortlist:
+                    self.candidates += 1
+                    self.rejected += 1
+            return None
+
+        audit = self.mode == "verify" or random.random() < self.audit_rate
+        with self._lock:
+            self.candidates += 1
+            self.matches += 1
+            if not audit:
+                self.reused += 1
+        return Match(distance, mismatch, value, audit)
+
+    def add(self, fp: Optional[Fingerprint], value: OCRResultValue) -> None:
+        """記錄新推理結果（覆蓋最舊的一項）"""
+        if not self.enabled or fp is None:
+            return
+        with self._lock:
+            self._hashes[self._next] = fp.phash
+            self._entries[self._next] = (fp, value)
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def audit(self, match: Match, value: OCRResultValue) -> Tuple[bool, float]:
+        """
+        將實際推理結果與近似重複項的結果比對
+
+        Returns:
+            (是否為誤復用, 全文相似度)
+        """
+        similarity = text_similarity(match.value[1], value[1])
+        false_reuse = similarity < self.min_similarity
+        with self._lock:
+            self.audited += 1
+            if false_reuse:
+                self.false_reuse += 1
+        return false_reuse, similarity
+
+    def clear(self) -> None:
+        """清空索引（引擎更換後舊結果不再可信時使用）"""
+        with self._lock:
+            self._entries = [None] * self.capacity
+            self._size = 0
+            self._next = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        """近似重複檢測指標（/metrics）"""
+        return {
+            "mode": self.mode,
+            "entries": self._size,
+            "capacity": self.capacity,
+            "max_distance": self.max_distance,
+            "max_mismatch": self.max_mismatch,
+            "lookups": self.lookups,
+            "candidates": self.candidates,
+            "rejected": self.rejected,
+            "matches": self.matches,
+            "match_rate": round(self.matches / self.lookups, 4) if self.lookups else 0.0,
+            "reused": self.reused,
+            "audited": self.audited,
+            "false_reuse": self.false_reuse,
+            "false_reuse_rate": round(self.false_reuse / self.audited, 4) if self.audited else 0.0,
+        }
@@ -0,0 +1,239 @@
+"""
+OCR 引擎封裝
+負責創建 PaddleOCR 實例、預熱，以及從識別結果中提取文字行。
+在 worker 進程中使用，main.py 不直接持有引擎。
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 默認引擎參數
+# 注意：新版 PaddleOCR 已棄用 use_angle_cls、show_log 等參數
+# 這裡使用推薦的參數配置：lang='ch'（中英文）、use_textline_orientation=True（自動處理文字方向）
+DEFAULT_ENGINE_OPTIONS: Dict[str, Any] = {
+    "lang": "ch",
+    "use_textline_orientation": True,
+}
+
+
+def engine_options_from_env() -> Dict[str, Any]:
+    """
+    按環境變數選擇引擎
+
+    OCR_ENGINE=stub 時使用 stub_engine.StubOCR（壓測用，參數見 stub_engine.stub_options_from_env），
+    否則使用 PaddleOCR 的默認參數
+    """
+    if os.getenv("OCR_ENGINE", "paddle").lower() == "stub":
+        import stub_engine
+
+        options = stub_engine.stub_options_from_env()
+        stub_engine.validate_options(options)
+        return {"engine": "stub", "stub": options}
+    return dict(DEFAULT_ENGINE_OPTIONS)
+
+
+# 各數學庫的線程數環境變數（必須在導入 paddle 之前設置）
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def apply_placement(options: Dict[str, Any], placement: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    在 worker 進程中應用 CPU 佈局（見 cpu_tuning.Layout.placements）
+
+    綁定 CPU 集合、限制 OpenMP / MKL / OpenCV 線程數，並把線程數傳給 PaddleOCR 的 cpu_threads
+
+    Args:
+        options: 引擎參數
+        placement: {"cpus": [...] 或 None, "threads": 線程數（0 表示不設置）}
+
+    Returns:
+        應用線程數後的引擎參數
+    """
+    if not placement:
+        return options
+    cpus = placement.get("cpus")
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    threads = placement.get("threads") or 0
+    if threads:
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(threads)
+        try:
+            import cv2
+
+            cv2.setNumThreads(threads)
+        except ImportError:
+            pass
+        if options.get("engine") != "stub":
+            options = dict(options, cpu_threads=threads)
+    return options
+
+
+def create_engine(options: Dict[str, Any]):
+    """
+    創建 OCR 引擎
+
+    Args:
+        options: PaddleOCR 初始化參數；{"engine": "stub", "stub": {...}} 時創建樁引擎
+
+    Returns:
+        PaddleOCR 實例（或實現相同 ocr() 接口的 StubOCR）
+    """
+    if options.get("engine") == "stub":
+        from stub_engine import StubOCR
+
+        logger.info(f"使用 OCR 樁引擎: {options['stub']}")
+        return StubOCR(**options["stub"])
+
+    from paddleocr import PaddleOCR
+
+    logger.info("正在初始化 PaddleOCR...")
+    engine = PaddleOCR(**options)
+    logger.info("PaddleOCR 初始化完成")
+    return engine
+
+
+def warm_up(engine) -> None:
+    """用一張空白小圖預熱引擎（觸發模型加載和首次推理的初始化開銷）"""
+    blank = np.full((64, 256, 3), 255, dtype=np.uint8)
+    try:
+        engine.ocr(blank)
+    except Exception as e:
+        logger.warning(f"引擎預熱失敗（不影響服務）: {e}")
+
+
+def recognize(engine, image: Union[str, np.ndarray]) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    執行 OCR 並提取文字行
+
+    Args:
+        engine: create_engine 創建的引擎
+        image: 圖片路徑，或已解碼的 BGR 圖像陣列
+
+    Returns:
+        (lines, full_text)
+    """
+    # 新版 PaddleOCR 的 predict 不再接受 cls 參數，方向處理已在初始化中啟用
+    result = engine.ocr(image)
+    if not result:
+        return [], ""
+    return extract_lines(result)
+
+
+def extract_lines(result: Any) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    從 PaddleOCR 結果中提取文字行（兼容不同 PaddleOCR 返回格式）
+    
+    Args:
+        result: ocr.ocr() 的返回值
+        
+    Returns:
+        (lines, full_text)
+    """
+    # 提取文字和置信度（兼容不同 PaddleOCR 返回格式）
+    lines = []
+    all_text = []
+
+    try:
+        first_page = result[0]
+    except Exception:
+        first_page = None
+
+    # 新格式：result[0] 是字典，包含 'rec_texts' 等字段
+    if isinstance(first_page, dict) and 'rec_texts' in first_page:
+        rec_texts = first_page.get('rec_texts', [])
+        rec_scores = first_page.get('rec_scores', [])
+        rec_polys = first_page.get('rec_polys', [])
+
+        for i, text in enumerate(rec_texts):
+            if text and isinstance(text, str):
+                confidence = rec_scores[i] if i < len(rec_scores) else 0.0
+
+                # 處理 bbox（rec_polys）
+                bbox_list = []
+                if i < len(rec_polys):
+                    poly = rec_polys[i]
+                    if hasattr(poly, 'tolist'):
+                        bbox_list = poly.tolist()
+                    elif isinstance(poly, (list, tuple)):
+                        bbox_list = list(poly)
+
+                lines.append({
+                    "text": text,
+                    "confidence": float(confidence),
+                    "bbox": bbox_list
+                })
+                all_text.append(text)
+
+    # 傳統格式：result[0] 為若干行，每行形如 [bbox, (text, score)]
+    elif isinstance(first_page, list):
+        for line in first_page:
+            if len(line) >= 2:
+                bbox = line[0]  # 邊界框座標（可能是 numpy.ndarray）
+                text_info = line[1]  # (文字, 置信度)
+
+                if isinstance(text_info, tuple) and len(text_info) >= 2:
+                    text = text_info[0]
+                    confidence = text_info[1]
+
+                    # 將 numpy.ndarray 轉換為 Python 列表，確保可以序列化
+                    if hasattr(bbox, 'tolist'):
+                        bbox_list = bbox.tolist()
+                    elif isinstance(bbox, (list, tuple)):
+                        bbox_list = list(bbox)
+                    else:
+                        bbox_list = []
+
+                    lines.append({
+                        "text": text,
+                        "confidence": float(confidence),
+                        "bbox": bbox_list
+                    })
+                    all_text.append(text)
+
+    # 如果沒有成功提取到行文字，嘗試更詳細的調試
+    if not all_text:
+        logger.warning(
+            "未能從標準格式提取文字，嘗試回退方案",
+            extra={
+                "result_type": type(result).__name__,
+                "result_length": len(result) if isinstance(result, (list, tuple)) else None,
+            },
+        )
+        # 原始結果轉儲只在 DEBUG 級別輸出並按 OCR_LOG_DEBUG_SAMPLE 抽樣；未啟用時不做 str() 轉換
+        if logger.isEnabledFor(logging.DEBUG) and isinstance(result, list) and len(result) > 0:
+            logger.debug("First element (%s): %.200s", type(result[0]).__name__, result[0])
+        # 嘗試從原始結果中提取文字
+        try:
+            # 如果 result 是列表，嘗試遞歸提取所有字符串
+            def extract_texts(obj, texts_list):
+                if isinstance(obj, str):
+                    if obj.strip():  # 只添加非空字符串
+                        texts_list.append(obj)
+                elif isinstance(obj, (list, tuple)):
+                    for item in obj:
+                        extract_texts(item, texts_list)
+                elif isinstance(obj, dict):
+                    for value in obj.values():
+                        extract_texts(value, texts_list)
+
+            fallback_texts = []
+            extract_texts(result, fallback_texts)
+            if fallback_texts:
+                full_text = "\n".join(fallback_texts)
+                logger.info(f"從回退方案提取到 {len(fallback_texts)} 段文字")
+            else:
+                full_text = str(result)
+                logger.warning("回退方案也無法提取文字，返回原始結果字符串")
+        except Exception as e:
+            logger.error(f"回退方案提取失敗: {e}")
+            full_text = str(result)
+    else:
+        full_text = "\n".join(all_text)
+
+    return lines, full_text
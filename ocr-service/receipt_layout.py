@@ -0,0 +1,256 @@
+"""
+賬單版面解析
+將 OCR 行按 y 軸重疊聚類成「行」，配對菜品名稱與價格，並識別小計、服務費、總額。
+輸出精簡的菜品表，讓 Node 端可跳過 LLM 或只送出更短的 prompt。
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 同一行判定：兩個文字框的垂直重疊 / 較矮文字框高度 >= 此比例
+ROW_OVERLAP_RATIO = 0.5
+
+# 金額容忍度（與 server.ts 的 postProcessTip 一致）
+AMOUNT_EPSILON = 0.5
+
+PRICE_PATTERN = re.compile(
+    r"^(?:HK\$|\$|¥|￥|RMB|HKD)?\s*(-?\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|-?\d+(?:\.\d{1,2})?)\s*(?:元)?$",
+    re.IGNORECASE,
+)
+QUANTITY_PATTERN = re.compile(r"^(?:[xX×*]\s*(\d{1,3})|(\d{1,3})\s*(?:[xX×]|份|個|个|件|杯|碗|位))$")
+DATE_PATTERN = re.compile(r"(20\d{2})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})")
+
+# 關鍵字順序很重要：「Sub Total」同時包含「Total」，必須先匹配小計
+SUBTOTAL_KEYWORDS = ("小計", "小计", "subtotal", "sub total", "sub-total")
+SERVICE_KEYWORDS = ("服務費", "服务费", "加一", "service charge", "service", "s.c.", "小費", "小费", "tip")
+TOTAL_KEYWORDS = ("總計", "总计", "合計", "合计", "總金額", "總金额", "总金额", "總額", "总额",
+                  "應付", "应付", "實收", "实收", "grand total", "total", "amount due")
+HEADER_KEYWORDS = ("品名", "數量", "数量", "單價", "单价", "金額", "金额", "qty", "item", "price", "amount")
+
+
+def _bbox_y_ranges(lines: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """
+    將每行的 bbox 轉為 (y_min, y_max, x_min) 陣列
+
+    Args:
+        lines: OCR 行列表（bbox 為四點座標）
+
+    Returns:
+        形狀為 (n, 3) 的 float 陣列；bbox 缺失時按行號放置，保持原始順序
+    """
+    ranges = np.zeros((len(lines), 3), dtype=np.float64)
+    for i, line in enumerate(lines):
+        bbox = line.get("bbox") or []
+        try:
+            pts = np.asarray(bbox, dtype=np.float64).reshape(-1, 2)
+        except (TypeError, ValueError):
+            pts = np.empty((0, 2))
+        if len(pts) == 0:
+            ranges[i] = (i * 100.0, i * 100.0 + 10.0, 0.0)
+        else:
+            ranges[i] = (pts[:, 1].min(), pts[:, 1].max(), pts[:, 0].min())
+    return ranges
+
+
+def group_rows(lines: Sequence[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    按 y 軸重疊將 OCR 行聚類成版面行
+
+    先按中心 y 排序，再以向量化方式計算相鄰文字框的重疊比例，
+    重疊不足處即為新行的起點；每行內按 x 由左至右排序。
+
+    Args:
+        lines: OCR 行列表
+
+    Returns:
+        版面行列表，每行是由左至右排列的 OCR 行
+    """
+    if not lines:
+        return []
+
+    ranges = _bbox_y_ranges(lines)
+    y_min, y_max, x_min = ranges[:, 0], ranges[:, 1], ranges[:, 2]
+    order = np.argsort((y_min + y_max) / 2.0, kind="stable")
+
+    lo, hi = y_min[order], y_max[order]
+    heights = np.maximum(hi - lo, 1e-6)
+    overlap = np.minimum(hi[1:], hi[:-1]) - np.maximum(lo[1:], lo[:-1])
+    ratio = overlap / np.minimum(heights[1:], heights[:-1])
+    breaks = np.concatenate(([0], (ratio < ROW_OVERLAP_RATIO).astype(np.int64)))
+    row_ids = np.cumsum(breaks)
+
+    rows: List[List[Dict[str, Any]]] = []
+    for row_id in range(int(row_ids[-1]) + 1):
+        members = order[row_ids == row_id]
+        members = members[np.argsort(x_min[members], kind="stable")]
+        rows.append([lines[int(i)] for i in members])
+    return rows
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """解析金額文字，無法解析時返回 None"""
+    match = PRICE_PATTERN.match(text.strip())
+    if not match:
+        return None
+    try:
+        return float(match.group(1).replace(",", ""))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def _latin_pattern(keywords: Tuple[str, ...]) -> Optional["re.Pattern[str]"]:
+    """
+    關鍵字組中英文關鍵字的整詞匹配正則，沒有英文關鍵字時為 None
+
+    前面不能緊挨字母或連字符（「Self-service」不是服務費），後面不能緊挨字母（「Multiple」不含「tip」）。
+    """
+    latin = [re.escape(keyword) for keyword in keywords if keyword.isascii()]
+    if not latin:
+        return None
+    return re.compile(r"(?<![a-z\-])(?:" + "|".join(latin) + r")(?![a-z])")
+
+
+def _remove_keywords(text: str, keywords: Tuple[str, ...]) -> str:
+    """去掉文字（轉小寫）中的關鍵字：中文關鍵字按子串，英文關鍵字按整詞"""
+    lowered = text.lower()
+    for keyword in keywords:
+        if not keyword.isascii():
+            lowered = lowered.replace(keyword, " ")
+    pattern = _latin_pattern(keywords)
+    return pattern.sub(" ", lowered) if pattern is not None else lowered
+
+
+def _match_keyword(text: str, keywords: Tuple[str, ...]) -> bool:
+    return _remove_keywords(text, keywords) != text.lower()
+
+
+def _is_column_header(label: str) -> bool:
+    """整行只由欄位名組成（「品名 數量 金額」「Item Qty Price」），「Special Price Set」這類菜名不算"""
+    return re.search(r"\w", _remove_keywords(label, HEADER_KEYWORDS)) is None
+
+
+def _split_row(row: Sequence[Dict[str, Any]]):
+    """
+    將版面行拆分為（標籤文字, 數量, 金額）
+
+    最右邊可解析為金額的文字框視為價格，其餘文字作為名稱。
+    """
+    texts = [str(cell.get("text", "")).strip() for cell in row]
+    price = None
+    price_index = None
+    for i in range(len(texts) - 1, -1, -1):
+        amount = parse_amount(texts[i])
+        if amount is not None:
+            price, price_index = amount, i
+            break
+
+    quantity = None
+    label_parts = []
+    for i, text in enumerate(texts):
+        if i == price_index or not text:
+            continue
+        qty_match = QUANTITY_PATTERN.match(text)
+        if qty_match and quantity is None:
+            quantity = int(qty_match.group(1) or qty_match.group(2))
+            continue
+        # 價格左邊的純數字（單價或數量列）不計入名稱
+        if price_index is not None and i < price_index and parse_amount(text) is not None:
+            if quantity is None and text.isdigit() and 0 < int(text) < 100:
+                quantity = int(text)
+            continue
+        label_parts.append(text)
+
+    return " ".join(label_parts).strip(), quantity, price
+
+
+def _close(a: float, b: float) -> bool:
+    return abs(a - b) <= AMOUNT_EPSILON
+
+
+def parse_receipt_layout(lines: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    解析賬單版面
+
+    Args:
+        lines: OCR 行列表（/ocr 返回的 lines）
+
+    Returns:
+        {
+            "header": ["餐廳名稱候選", ...],
+            "date": "YYYY-MM-DD" 或 "",
+            "items": [{"name": "菜品", "price": 38.0, "quantity": 1}],
+            "subtotal": 100.0 或 None,
+            "service_charge": 10.0 或 None,
+            "total": 110.0 或 None,
+            "consistent": True,  # 菜品與小計 / 總額能互相對上
+            "compact_text": "精簡後的文字（供 LLM 使用）"
+        }
+    """
+    rows = group_rows(lines)
+
+    header: List[str] = []
+    items: List[Dict[str, Any]] = []
+    subtotal = service_charge = total = None
+    date = ""
+
+    for row in rows:
+        label, quantity, price = _split_row(row)
+        row_text = " ".join(str(cell.get("text", "")) for cell in row)
+
+        date_match = DATE_PATTERN.search(row_text)
+        if date_match and not date:
+            year, month, day = date_match.groups()
+            date = f"{year}-{int(month):02d}-{int(day):02d}"
+
+        if price is None:
+            # 沒有金額的行：菜品開始之前視為表頭（餐廳名稱等），日期行除外
+            if not items and label and not date_match and not _is_column_header(label):
+                header.append(label)
+            continue
+
+        if _match_keyword(label, SUBTOTAL_KEYWORDS):
+            subtotal = price
+        elif _match_keyword(label, SERVICE_KEYWORDS):
+            service_charge = price
+        elif _match_keyword(label, TOTAL_KEYWORDS):
+            total = price
+        elif label and total is None and not _is_column_header(label):
+            item: Dict[str, Any] = {"name": label, "price": price}
+            if quantity is not None:
+                item["quantity"] = quantity
+            items.append(item)
+
+    items_sum = round(sum(item["price"] for item in items), 2)
+    consistent = False
+    if items:
+        if subtotal is not None:
+            consistent = _close(items_sum, subtotal)
+            if consistent and total is not None:
+                consistent = _close(subtotal + (service_charge or 0.0), total)
+        elif total is not None:
+            consistent = _close(items_sum + (service_charge or 0.0), total)
+
+    compact_lines = header[:2]
+    if date:
+        compact_lines.append(date)
+    for item in items:
+        qty = f" x{item['quantity']}" if "quantity" in item else ""
+        compact_lines.append(f"{item['name']}{qty} {item['price']:g}")
+    for name, value in (("小計", subtotal), ("服務費", service_charge), ("總計", total)):
+        if value is not None:
+            compact_lines.append(f"{name} {value:g}")
+
+    return {
+        "header": header,
+        "date": date,
+        "items": items,
+        "subtotal": subtotal,
+        "service_charge": service_charge,
+        "total": total,
+        "consistent": consistent,
+        "compact_text": "\n".join(compact_lines),
+    }
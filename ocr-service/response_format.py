@@ -0,0 +1,228 @@
+"""
+/ocr 響應格式
+支持字段選擇（?fields=text,total）、緊湊 bbox 編碼（flat int32）、
+msgpack 序列化，以及按 Accept-Encoding 協商 br / gzip 壓縮。
+"""
+
+import gzip
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+# 可選依賴：未安裝時回退到 JSON / gzip
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 取決於部署環境
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 取決於部署環境
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+# 小於此大小的響應不壓縮（壓縮收益低於 CPU 開銷）
+MIN_COMPRESS_SIZE = 1024
+
+TOP_LEVEL_FIELDS = {"text", "lines", "raw_result", "receipt"}
+RECEIPT_FIELDS = {"header", "date", "items", "subtotal", "service_charge", "total", "consistent", "compact_text"}
+LINE_FIELDS = {"text", "confidence", "bbox"}
+
+BBOX_FORMATS = ("nested", "flat")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """
+    解析 ?fields= 參數
+
+    Args:
+        fields: 逗號分隔的字段名，例如 "text,total" 或 "lines.text,lines.bbox"
+
+    Returns:
+        字段集合；未指定時返回 None（表示返回全部字段）
+
+    Raises:
+        HTTPException: 包含未知字段時返回 400
+    """
+    if not fields:
+        return None
+
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = []
+    for name in selected:
+        if name.startswith("lines."):
+            if name[len("lines."):] not in LINE_FIELDS:
+                unknown.append(name)
+        elif name not in TOP_LEVEL_FIELDS and name not in RECEIPT_FIELDS:
+            unknown.append(name)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"未知字段: {', '.join(sorted(unknown))}"
+        )
+    return selected
+
+
+def needs_receipt(selected: Optional[Set[str]]) -> bool:
+    """所選字段是否需要版面解析結果"""
+    if not selected:
+        return False
+    return "receipt" in selected or bool(selected & RECEIPT_FIELDS)
+
+
+def select_fields(payload: Dict[str, Any], selected: Optional[Set[str]]) -> Dict[str, Any]:
+    """
+    按所選字段裁剪響應
+
+    頂層字段（text / lines / raw_result / receipt）原樣保留；
+    receipt 子字段（如 total、items）提升到頂層；
+    lines.xxx 只保留每行的指定子字段。
+    """
+    if selected is None:
+        return payload
+
+    result: Dict[str, Any] = {}
+    receipt = payload.get("receipt") or {}
+    line_fields = {name[len("lines."):] for name in selected if name.startswith("lines.")}
+
+    for name in selected:
+        if name in TOP_LEVEL_FIELDS:
+            result[name] = payload.get(name)
+        elif name in RECEIPT_FIELDS:
+            result[name] = receipt.get(name)
+
+    if line_fields and "lines" not in selected:
+        result["lines"] = [
+            {key: line[key] for key in line_fields if key in line}
+            for line in payload.get("lines", [])
+        ]
+    return result
+
+
+def _bbox_array(lines: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """將所有行的 bbox 一次性轉為 (n, 8) int32 陣列；形狀不一致時返回 None"""
+    try:
+        boxes = np.asarray([line["bbox"] for line in lines], dtype=np.float32)
+    except (KeyError, ValueError, TypeError):
+        return None
+    if boxes.ndim != 3 or boxes.shape[1:] != (4, 2):
+        return None
+    return np.rint(boxes).astype(np.int32).reshape(len(lines), 8)
+
+
+def compact_lines(lines: List[Dict[str, Any]], binary: bool) -> Dict[str, Any]:
+    """
+    將行列表轉為列式緊湊格式
+
+    Returns:
+        {
+            "text": ["行1", ...],
+            "confidence": [0.95, ...],
+            "bbox": 每行 8 個 int32（x1,y1,...,x4,y4）攤平；
+                    binary=True 時為小端 int32 bytes，否則為 int 列表
+        }
+    """
+    columns: Dict[str, Any] = {}
+    if not lines:
+        return columns
+
+    if "text" in lines[0]:
+        columns["text"] = [line.get("text", "") for line in lines]
+    if "confidence" in lines[0]:
+        columns["confidence"] = [round(float(line.get("confidence", 0.0)), 4) for line in lines]
+    if "bbox" in lines[0]:
+        boxes = _bbox_array(lines)
+        if boxes is None:
+            # 非四點多邊形：逐行取整後攤平，用 -1 分隔
+            flat: List[int] = []
+            for line in lines:
+                flat.extend(int(round(v)) for v in np.asarray(line.get("bbox") or [], dtype=np.float32).ravel())
+                flat.append(-1)
+            columns["bbox"] = np.asarray(flat, dtype="<i4").tobytes() if binary else flat
+            columns["bbox_ragged"] = True
+        else:
+            columns["bbox"] = boxes.astype("<i4").tobytes() if binary else boxes.ravel().tolist()
+    return columns
+
+
+def _accepts(header: str, token: str) -> bool:
+    """檢查 Accept / Accept-Encoding 頭是否接受某個值（忽略 q=0）"""
+    for part in header.split(","):
+        pieces = [p.strip() for p in part.split(";")]
+        if pieces[0].lower() != token:
+            continue
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """按 Accept-Encoding 選擇壓縮方式（br 優先，其次 gzip）"""
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return "br"
+    if _accepts(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+
+def build_response(
+    payload: Dict[str, Any],
+    request: Request,
+    selected: Optional[Set[str]] = None,
+    bbox_format: str = "nested",
+) -> Response:
+    """
+    按請求參數和請求頭構建 /ocr 響應
+
+    Args:
+        payload: 完整的 OCR 結果
+        request: 當前請求（讀取 Accept / Accept-Encoding）
+        selected: parse_fields 的結果
+        bbox_format: "nested"（默認，與舊版一致）或 "flat"（列式 int32）
+
+    Returns:
+        已序列化並按需壓縮的 Response
+    """
+    body = select_fields(payload, selected)
+
+    use_msgpack = msgpack is not None and _accepts(request.headers.get("accept", ""), MSGPACK_MEDIA_TYPE)
+    if (bbox_format == "flat" or use_msgpack) and isinstance(body.get("lines"), list):
+        body = dict(body)
+        body["lines"] = compact_lines(body["lines"], binary=use_msgpack)
+
+    if use_msgpack:
+        content = msgpack.packb(body, use_bin_type=True)
+        media_type = MSGPACK_MEDIA_TYPE
+    else:
+        content = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        media_type = "application/json"
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding and len(content) >= MIN_COMPRESS_SIZE:
+        if encoding == "br":
+            content = brotli.compress(content, quality=4)
+        else:
+            content = gzip.compress(content, compresslevel=5)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def iter_fields() -> Iterable[str]:
+    """列出所有可選字段（用於 API 文檔）"""
+    yield from sorted(TOP_LEVEL_FIELDS)
+    yield from sorted(RECEIPT_FIELDS)
+    yield from (f"lines.{name}" for name in sorted(LINE_FIELDS))
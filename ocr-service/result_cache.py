@@ -0,0 +1,63 @@
+"""
+OCR 結果緩存
+按圖片內容的 SHA-256 緩存識別結果（LRU），同一張圖片重複上傳時不再推理。
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+OCRResultValue = Tuple[List[Dict[str, Any]], str]
+
+
+def content_key(content: bytes) -> str:
+    """圖片內容的緩存鍵（與 gateway.py 的一致性哈希使用同一個哈希）"""
+    return hashlib.sha256(content).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU 結果緩存
+
+    Args:
+        max_entries: 最大條目數（0 表示禁用緩存）
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, OCRResultValue]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Optional[str]) -> Optional[OCRResultValue]:
+        if not key or self.max_entries <= 0:
+            return None
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Optional[str], value: OCRResultValue) -> None:
+        if not key or self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空緩存（引擎更換後舊結果不再可信時使用）"""
+        self._entries.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,393 @@
+"""
+OCR 請求調度
+在 worker 池前排隊請求，支持截止時間（deadline）傳遞、過載丟棄和優先級通道：
+- 出隊時已無法在截止時間前完成的請求直接丟棄，不再推理
+- 客戶端已斷開的請求在各階段邊界取消
+- 隊列已滿時丟棄優先級最低、排隊最久的請求
+- 每個通道（如 interactive / backfill）有獨立隊列，按權重加權公平調度，並可限制並發數
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from worker_pool import OCRWorkerPool
+
+logger = logging.getLogger(__name__)
+
+# 服務時間估計的 EWMA 平滑係數
+SERVICE_TIME_ALPHA = 0.2
+
+# 完成多少個請求後才按耗時估計提前丟棄（此前估計不可靠，只丟棄已經過期的請求）
+SHED_MIN_SAMPLES = 5
+
+# 每個通道保留最近多少個排隊耗時樣本（計算 p50 / p95）
+QUEUE_TIME_SAMPLES = 1000
+
+# 默認通道：交互式上傳權重高且不限並發；批量回填權重低且最多佔用一個 worker
+DEFAULT_LANES = "interactive:8:0,backfill:1:1"
+
+
+class RequestShed(Exception):
+    """請求被調度器丟棄"""
+
+    status_code = 503
+    reason = "shed"
+
+
+class DeadlineExceeded(RequestShed):
+    """截止時間前無法完成"""
+
+    status_code = 504
+    reason = "deadline"
+
+
+class Overloaded(RequestShed):
+    """隊列已滿，請求被丟棄"""
+
+    status_code = 503
+    reason = "overload"
+
+
+class ClientDisconnected(RequestShed):
+    """客戶端已斷開（499 沿用 nginx 的約定，客戶端實際上收不到）"""
+
+    status_code = 499
+    reason = "disconnected"
+
+
+@dataclass
+class Job:
+    """排隊中的 OCR 請求"""
+
+    image: Union[str, np.ndarray]
+    deadline: Optional[float]  # time.monotonic() 時間點；None 表示不限
+    lane: "Lane"
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]]
+    future: "asyncio.Future"
+    enqueued_at: float = field(default_factory=time.monotonic)
+    seq: int = 0
+
+
+@dataclass
+class Lane:
+    """
+    優先級通道
+
+    Attributes:
+        name: 通道名稱
+        weight: 調度權重，同時作為過載丟棄時的優先級（越小越先丟棄）
+        max_concurrency: 同時佔用的 worker 上限（0 表示不限）
+    """
+
+    name: str
+    weight: int
+    max_concurrency: int = 0
+    queue: Deque[Job] = field(default_factory=deque)
+    inflight: int = 0
+    current_weight: int = 0  # 平滑加權輪詢的當前值
+    submitted: int = 0
+    completed: int = 0
+    shed: int = 0
+    queue_times: Deque[float] = field(default_factory=lambda: deque(maxlen=QUEUE_TIME_SAMPLES))
+
+    def eligible(self) -> bool:
+        return bool(self.queue) and (self.max_concurrency <= 0 or self.inflight < self.max_concurrency)
+
+    def metrics(self) -> Dict[str, Any]:
+        samples = sorted(self.queue_times)
+
+        def pct(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 3)
+
+        return {
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "queued": len(self.queue),
+            "inflight": self.inflight,
+            "submitted_total": self.submitted,
+            "completed_total": self.completed,
+            "shed_total": self.shed,
+            "queue_time_s": {
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "max": round(samples[-1], 3) if samples else 0.0,
+            },
+        }
+
+
+def parse_lanes(spec: str) -> List[Lane]:
+    """
+    解析通道配置
+
+    Args:
+        spec: 逗號分隔的 name:weight[:max_concurrency]，例如 "interactive:8:0,backfill:1:1"
+
+    Returns:
+        通道列表（第一個為默認通道）
+    """
+    lanes = []
+    for part in spec.split(","):
+        pieces = [p.strip() for p in part.split(":") if p.strip()]
+        if not pieces:
+            continue
+        name = pieces[0]
+        weight = int(pieces[1]) if len(pieces) > 1 else 1
+        max_concurrency = int(pieces[2]) if len(pieces) > 2 else 0
+        if weight <= 0:
+            raise ValueError(f"通道 {name} 的權重必須大於 0")
+        lanes.append(Lane(name=name, weight=weight, max_concurrency=max_concurrency))
+    if not lanes:
+        raise ValueError("至少需要配置一個通道")
+    return lanes
+
+
+class OCRScheduler:
+    """
+    OCR 請求調度器
+
+    Args:
+        pool: worker 池（或 EngineManager，需實現 acquire / execute / release）
+        max_queue: 所有通道合計的最大排隊數，超過時丟棄
+        lanes: 通道配置（parse_lanes 的格式），第一個為默認通道
+        initial_service_time: 初始的單次推理時間估計（秒），第一個請求完成後改用實際耗時
+    """
+
+    def __init__(
+        self,
+        pool: OCRWorkerPool,
+        max_queue: int = 64,
+        lanes: str = DEFAULT_LANES,
+        initial_service_time: float = 0.0,
+    ):
+        self.pool = pool
+        self.max_queue = max(1, max_queue)
+        self.service_time = initial_service_time
+
+        lane_list = parse_lanes(lanes)
+        self.default_lane = lane_list[0].name
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lane_list}
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._seq = itertools.count()
+
+        self.submitted_total = 0
+        self.completed_total = 0
+        self.shed_counts: Counter = Counter()
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.ensure_future(self._dispatch_loop())
+
+    async def close(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        for lane in self.lanes.values():
+            while lane.queue:
+                self._shed(lane.queue.popleft(), RequestShed("服務正在關閉"))
+
+    def queued(self) -> int:
+        return sum(len(lane.queue) for lane in self.lanes.values())
+
+    async def submit(
+        self,
+        image: Union[str, np.ndarray],
+        deadline: Optional[float] = None,
+        lane: Optional[str] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        提交請求並等待結果
+
+        Args:
+            image: 圖片路徑或圖像陣列
+            deadline: 截止時間（time.monotonic() 時間點）
+            lane: 通道名稱，None 時使用默認通道
+            is_disconnected: 檢查客戶端是否已斷開的協程函數
+
+        Raises:
+            KeyError: 未知通道
+            RequestShed: 請求被丟棄（過載 / 超時 / 客戶端斷開）
+        """
+        target = self.lanes[lane or self.default_lane]
+        if deadline is not None and self._too_late(deadline, self._rounds_ahead(target, len(target.queue))):
+            target.shed += 1
+            self.shed_counts[DeadlineExceeded.reason] += 1
+            raise DeadlineExceeded("截止時間前無法完成")
+
+        loop = asyncio.get_running_loop()
+        job = Job(image, deadline, target, is_disconnected, loop.create_future(), seq=next(self._seq))
+        self.submitted_total += 1
+        target.submitted += 1
+
+        if self.queued() >= self.max_queue:
+            victim = self._pick_victim(job)
+            if victim is job:
+                target.shed += 1
+                self.shed_counts[Overloaded.reason] += 1
+                raise Overloaded("服務繁忙，請稍後再試")
+            victim.lane.queue.remove(victim)
+            self._shed(victim, Overloaded("服務繁忙，請稍後再試"))
+
+        target.queue.append(job)
+        self._wakeup.set()
+        return await job.future
+
+    def _pick_victim(self, incoming: Job) -> Job:
+        """
+        過載時選出要丟棄的請求
+
+        優先丟棄按各自通道位置估計已趕不上截止時間的請求，其次是通道權重最低者，同通道取排隊最久者
+        """
+        candidates = [(job, position) for lane in self.lanes.values() for position, job in enumerate(lane.queue)]
+        candidates.append((incoming, len(incoming.lane.queue)))
+        hopeless = [
+            job for job, position in candidates
+            if job.deadline is not None and self._too_late(job.deadline, self._rounds_ahead(job.lane, position))
+        ]
+        return min(hopeless or [job for job, _ in candidates], key=lambda job: (job.lane.weight, job.seq))
+
+    def _rounds_ahead(self, lane: Lane, position: int) -> float:
+        """
+        排在通道 lane 第 position 位的請求開始推理前要等待的推理輪數（每輪耗時約 service_time）
+
+        加權輪詢下，本通道每出隊一個請求，其他通道按權重比例出隊，但不超過它們的排隊數；
+        因此 interactive 的請求不會因為 backfill 排了幾百張圖而被估計為趕不上。
+        通道有並發上限時，本通道的請求最多同時佔用 max_concurrency 個 worker。
+        """
+        others = sum(
+            min(len(other.queue), math.ceil((position + 1) * other.weight / lane.weight))
+            for other in self.lanes.values()
+            if other is not lane
+        )
+        workers = max(1, getattr(self.pool, "size", 1))
+        parallel = workers if lane.max_concurrency <= 0 else min(workers, lane.max_concurrency)
+        return max((position + others) / workers, position / parallel)
+
+    def _too_late(self, deadline: float, rounds_ahead: float = 0.0) -> bool:
+        """
+        預計無法在截止時間前完成：前面 rounds_ahead 輪推理的等待時間加上一次推理
+
+        完成 SHED_MIN_SAMPLES 個請求之前只丟棄已經過期的請求，避免估計未收斂時把短預算的請求全部拒絕
+        """
+        remaining = deadline - time.monotonic()
+        if self.completed_total < SHED_MIN_SAMPLES:
+            return remaining <= 0
+        return remaining < self.service_time * (1 + rounds_ahead)
+
+    def _shed(self, job: Job, error: RequestShed) -> None:
+        job.lane.shed += 1
+        self.shed_counts[error.reason] += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _pick_lane(self) -> Optional[Lane]:
+        """
+        平滑加權輪詢（nginx 的 smooth weighted round-robin）
+
+        只在有排隊且未達並發上限的通道之間選擇，
+        權重 8:1 時每 9 次調度中 interactive 佔 8 次且均勻分佈。
+        """
+        eligible = [lane for lane in self.lanes.values() if lane.eligible()]
+        if not eligible:
+            return None
+        total = sum(lane.weight for lane in eligible)
+        for lane in eligible:
+            lane.current_weight += lane.weight
+        best = max(eligible, key=lambda lane: lane.current_weight)
+        best.current_weight -= total
+        return best
+
+    async def _next_job(self) -> Job:
+        """取出下一個仍值得執行的請求（階段邊界：出隊時檢查截止時間和客戶端連接）"""
+        while True:
+            lane = self._pick_lane()
+            if lane is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job = lane.queue.popleft()
+            if await self._worth_running(job):
+                return job
+
+    async def _worth_running(self, job: Job) -> bool:
+        """請求是否仍需執行；已超時或客戶端已斷開的請求在這裡丟棄"""
+        if job.future.done():
+            return False
+        if job.deadline is not None and self._too_late(job.deadline):
+            self._shed(job, DeadlineExceeded("截止時間前無法完成"))
+            return False
+        if job.is_disconnected is not None and await job.is_disconnected():
+            self._shed(job, ClientDisconnected("客戶端已斷開"))
+            return False
+        return True
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            # 先取請求再取 worker：空閒時不預先佔用 worker，
+            # 熱更新後舊一代可以立即排空，之後的請求都派發到新一代
+            job = await self._next_job()
+            job.lane.inflight += 1
+            try:
+                handle = await self.pool.acquire()
+            except asyncio.CancelledError:
+                job.lane.inflight -= 1
+                self._shed(job, RequestShed("服務正在關閉"))
+                raise
+            # 等待 worker 期間可能已超時或斷開
+            if not await self._worth_running(job):
+                job.lane.inflight -= 1
+                self.pool.release(handle)
+                self._wakeup.set()
+                continue
+            job.lane.queue_times.append(time.monotonic() - job.enqueued_at)
+            asyncio.ensure_future(self._execute(handle, job))
+
+    async def _execute(self, handle, job: Job) -> None:
+        started = time.monotonic()
+        try:
+            result = await self.pool.execute(handle, job.image)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        finally:
+            # 釋放通道並發名額，喚醒可能因上限而等待的調度
+            job.lane.inflight -= 1
+            self._wakeup.set()
+        elapsed = time.monotonic() - started
+        if self.completed_total == 0:
+            self.service_time = elapsed
+        else:
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+        self.completed_total += 1
+        job.lane.completed += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def metrics(self) -> Dict[str, Any]:
+        """調度器指標（/metrics）"""
+        return {
+            "queued": self.queued(),
+            "max_queue": self.max_queue,
+            "submitted_total": self.submitted_total,
+            "completed_total": self.completed_total,
+            "shed_total": dict(self.shed_counts),
+            "service_time_s": round(self.service_time, 3),
+            "default_lane": self.default_lane,
+            "lanes": {name: lane.metrics() for name, lane in self.lanes.items()},
+        }
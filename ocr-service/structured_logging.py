@@ -0,0 +1,277 @@
+"""
+結構化異步日誌
+請求路徑上的 logger 調用只把記錄放入有界隊列，JSON 序列化和寫出由後台線程（QueueListener）完成，
+stderr 或日誌收集端變慢時不會阻塞事件循環；隊列已滿時丟棄並計數，而不是等待。
+
+- 每條日誌附帶當前請求的上下文字段（request_id、路徑、通道等，見 bind_context）
+- DEBUG 級別的結果轉儲按比例抽樣（OCR_LOG_DEBUG_SAMPLE），避免高負載時日誌量隨請求數線性增長
+- setup_logging 在主進程和每個 worker 進程中各調用一次（配置從環境變數讀取，子進程繼承）
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+# 日誌格式：json（每行一個 JSON 對象）或 text（開發時閱讀）
+OCR_LOG_FORMAT = os.getenv("OCR_LOG_FORMAT", "json")
+OCR_LOG_LEVEL = os.getenv("OCR_LOG_LEVEL", "INFO")
+# DEBUG 記錄的保留比例（僅在 OCR_LOG_LEVEL=DEBUG 時生效）
+OCR_LOG_DEBUG_SAMPLE = float(os.getenv("OCR_LOG_DEBUG_SAMPLE", "0.01"))
+# 隊列容量；寫出跟不上時超出的記錄被丟棄
+OCR_LOG_QUEUE_SIZE = int(os.getenv("OCR_LOG_QUEUE_SIZE", "10000"))
+
+# LogRecord 的標準屬性；其餘屬性（logger.info(..., extra={...}) 傳入的）作為結構化字段輸出
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context"}
+
+_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+
+def bind_context(**fields: Any) -> contextvars.Token:
+    """
+    為當前請求（asyncio 任務）追加上下文字段，之後的日誌都會帶上
+
+    Returns:
+        可傳給 reset_context 的 token
+    """
+    return _context.set({**_context.get(), **fields})
+
+
+def reset_context(token: contextvars.Token) -> None:
+    _context.reset(token)
+
+
+def current_context() -> Dict[str, Any]:
+    return _context.get()
+
+
+class ContextFilter(logging.Filter):
+    """在調用線程中把請求上下文附加到記錄上（進入隊列後就讀不到 contextvars 了）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _context.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """
+    按比例保留 DEBUG 記錄，其他級別全部保留
+
+    Args:
+        rate: 保留比例（0 ~ 1）
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if self.rate > 0 and random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class JSONFormatter(logging.Formatter):
+    """每條記錄輸出一行 JSON：時間、級別、logger、消息、進程，以及上下文和 extra 字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "context", None) or {})
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """開發用的文本格式，上下文字段以 key=value 附在行尾"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            line += " " + " ".join(f"{key}={value}" for key, value in context.items())
+        return line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    隊列已滿時丟棄記錄並計數（默認實現會拋出 queue.Full 並打印堆棧）
+
+    prepare 只在調用線程中合併消息參數（參數可能是之後會被修改的對象），
+    JSON 序列化留給後台線程。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class _State:
+    handler: Optional[NonBlockingQueueHandler] = None
+    listener: Optional[logging.handlers.QueueListener] = None
+    sampler: Optional[DebugSampler] = None
+    lock = threading.Lock()
+
+
+def make_formatter(fmt: str) -> logging.Formatter:
+    if fmt == "json":
+        return JSONFormatter()
+    if fmt == "text":
+        return TextFormatter()
+    raise ValueError(f"未知日誌格式: {fmt}（可選 json, text）")
+
+
+def setup_logging(
+    fmt: Optional[str] = None,
+    level: Optional[str] = None,
+    debug_sample: Optional[float] = None,
+    queue_size: Optional[int] = None,
+    stream=None,
+) -> None:
+    """
+    配置根 logger：隊列 handler + 後台寫出線程
+
+    重複調用時先停止之前的監聽線程。參數為 None 時使用對應的環境變數。
+
+    Args:
+        fmt: json 或 text
+        level: 根 logger 級別
+        debug_sample: DEBUG 記錄保留比例
+        queue_size: 隊列容量
+        stream: 寫出目標（默認 stderr）
+    """
+    fmt = fmt or OCR_LOG_FORMAT
+    level = (level or OCR_LOG_LEVEL).upper()
+    debug_sample = OCR_LOG_DEBUG_SAMPLE if debug_sample is None else debug_sample
+    queue_size = OCR_LOG_QUEUE_SIZE if queue_size is None else queue_size
+
+    with _State.lock:
+        shutdown_logging()
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(make_formatter(fmt))
+        log_queue: queue.Queue = queue.Queue(maxsize=max(0, queue_size))
+        handler = NonBlockingQueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+        sampler = DebugSampler(debug_sample)
+        handler.addFilter(sampler)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        # uvicorn 自帶 handler，改為傳給根 logger，統一格式並經過隊列
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+        listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        listener.start()
+        _State.handler, _State.listener, _State.sampler = handler, listener, sampler
+
+
+def shutdown_logging() -> None:
+    """停止後台線程並寫出隊列中剩餘的記錄"""
+    if _State.listener is not None:
+        _State.listener.stop()
+        _State.listener = None
+    if _State.handler is not None:
+        logging.getLogger().removeHandler(_State.handler)
+        _State.handler = None
+
+
+atexit.register(shutdown_logging)
+
+
+def logging_stats() -> Dict[str, Any]:
+    """隊列深度、已入隊 / 丟棄數和被抽樣丟棄的 DEBUG 記錄數（/metrics）"""
+    handler = _State.handler
+    if handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "queued": handler.queue.qsize(),
+        "enqueued": handler.enqueued,
+        "dropped_full": handler.dropped,
+        "debug_sampled_out": _State.sampler.dropped if _State.sampler else 0,
+    }
+
+
+class RequestContextMiddleware:
+    """
+    ASGI 中間件：為每個 HTTP / WebSocket 請求綁定 request_id 和路徑
+
+    request_id 優先使用客戶端傳入的 X-Request-ID（便於與 Node 後端的日誌關聯），
+    否則隨機生成，並在響應頭中回傳。
+    """
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == self.header:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        token = bind_context(request_id=request_id, path=scope.get("path"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            reset_context(token)
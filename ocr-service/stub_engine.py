@@ -0,0 +1,186 @@
+"""
+OCR 樁引擎
+代替 PaddleOCR 的 ocr.ocr()：按配置的延遲分佈等待，返回預設的識別結果。
+用於在任何 Linux 機器上數秒內壓測調度、緩存和背壓行為，不需要模型文件。
+
+啟用方式：OCR_ENGINE=stub（見 ocr_engine.engine_options_from_env）
+"""
+
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+# 默認的預設結果：一張簡單的茶餐廳收據（與 receipt_layout 的關鍵字對應）
+DEFAULT_OUTPUTS: List[List[Dict[str, Any]]] = [[
+    {"text": "好運茶餐廳", "bbox": [[120, 20], [360, 20], [360, 60], [120, 60]]},
+    {"text": "日期: 2025-06-20", "bbox": [[40, 80], [300, 80], [300, 110], [40, 110]]},
+    {"text": "乾炒牛河", "bbox": [[40, 140], [200, 140], [200, 170], [40, 170]]},
+    {"text": "68.00", "bbox": [[380, 141], [460, 141], [460, 171], [380, 171]]},
+    {"text": "凍檸茶", "bbox": [[40, 180], [180, 180], [180, 210], [40, 210]]},
+    {"text": "22.00", "bbox": [[380, 181], [460, 181], [460, 211], [380, 211]]},
+    {"text": "小計", "bbox": [[40, 240], [120, 240], [120, 270], [40, 270]]},
+    {"text": "90.00", "bbox": [[380, 241], [460, 241], [460, 271], [380, 271]]},
+    {"text": "服務費", "bbox": [[40, 280], [140, 280], [140, 310], [40, 310]]},
+    {"text": "9.00", "bbox": [[380, 281], [460, 281], [460, 311], [380, 311]]},
+    {"text": "總計", "bbox": [[40, 320], [120, 320], [120, 350], [40, 350]]},
+    {"text": "99.00", "bbox": [[380, 321], [460, 321], [460, 351], [380, 351]]},
+]]
+
+
+class LatencyDistribution:
+    """
+    延遲分佈（毫秒）
+
+    規格字符串：
+        fixed:200              固定 200ms
+        uniform:100:300        均勻分佈
+        normal:200:30          正態分佈（均值, 標準差），截斷到 >= 0
+        lognormal:200:0.5      對數正態（中位數, sigma），長尾
+        bimodal:0.9:150:1500   90% 取 150ms、10% 取 1500ms（各自 ±10% 抖動）
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal", "bimodal")
+
+    def __init__(self, spec: str = "fixed:0"):
+        parts = spec.split(":")
+        self.kind = parts[0]
+        if self.kind not in self.KINDS:
+            raise ValueError(f"未知延遲分佈: {spec}（可選 {', '.join(self.KINDS)}）")
+        try:
+            self.params = [float(p) for p in parts[1:]]
+        except ValueError:
+            raise ValueError(f"延遲分佈參數必須是數字: {spec}")
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "bimodal": 3}[self.kind]
+        if len(self.params) != expected:
+            raise ValueError(f"{self.kind} 需要 {expected} 個參數: {spec}")
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = p[0] * float(np.exp(rng.gauss(0.0, p[1])))
+        else:
+            base = p[1] if rng.random() < p[0] else p[2]
+            value = base * rng.uniform(0.9, 1.1)
+        return max(0.0, value)
+
+
+def load_outputs(path: Optional[str]) -> List[List[Dict[str, Any]]]:
+    """
+    讀取預設結果
+
+    JSON 文件：列表，每項為一張圖片的行列表 [{"text", "bbox", "confidence"?}, ...]；
+    也可以直接使用 /ocr 響應中的 lines。
+    """
+    if not path:
+        return DEFAULT_OUTPUTS
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "lines" in data:
+        data = [data["lines"]]
+    if not data or not isinstance(data, list):
+        raise ValueError(f"預設結果文件格式錯誤: {path}")
+    return data
+
+
+class StubOCR:
+    """
+    PaddleOCR 的替身，實現 ocr(image) 接口
+
+    同一張圖片（按路徑或像素內容）總是返回同一個預設結果；延遲按種子確定，
+    同一 worker 以相同順序處理相同請求時完全可重現。
+
+    Args:
+        latency: LatencyDistribution 規格
+        ms_per_megapixel: 每百萬像素額外增加的延遲（模擬大圖更慢）
+        error_rate: 拋出異常的比例（測試錯誤處理）
+        cpu_bound: True 時忙等消耗 CPU（模擬推理佔滿核心），否則 sleep
+        outputs: 預設結果文件路徑
+        seed: 隨機種子（每個 worker 各自從該種子開始，延遲序列只取決於處理順序）
+    """
+
+    def __init__(
+        self,
+        latency: str = "fixed:0",
+        ms_per_megapixel: float = 0.0,
+        error_rate: float = 0.0,
+        cpu_bound: bool = False,
+        outputs: Optional[str] = None,
+        seed: int = 0,
+    ):
+        self.latency = LatencyDistribution(latency)
+        self.ms_per_megapixel = ms_per_megapixel
+        self.error_rate = error_rate
+        self.cpu_bound = cpu_bound
+        self.outputs = load_outputs(outputs)
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def _image_key(self, image: Union[str, np.ndarray]) -> bytes:
+        if isinstance(image, str):
+            return image.encode("utf-8")
+        # 取稀疏採樣的像素，避免為大圖計算完整哈希
+        flat = np.ascontiguousarray(image).reshape(-1)
+        return flat[:: max(1, flat.size // 4096)].tobytes()
+
+    def _megapixels(self, image: Union[str, np.ndarray]) -> float:
+        if isinstance(image, np.ndarray):
+            return image.shape[0] * image.shape[1] / 1e6
+        if self.ms_per_megapixel and os.path.exists(image):
+            import cv2
+            decoded = cv2.imread(image, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            return decoded.shape[0] * decoded.shape[1] * 64 / 1e6 if decoded is not None else 0.0
+        return 0.0
+
+    def _wait(self, seconds: float) -> None:
+        if not self.cpu_bound:
+            time.sleep(seconds)
+            return
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def ocr(self, image: Union[str, np.ndarray]) -> List[Dict[str, Any]]:
+        self.calls += 1
+        delay_ms = self.latency.sample(self.rng) + self.ms_per_megapixel * self._megapixels(image)
+        self._wait(delay_ms / 1000.0)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise RuntimeError("stub engine: injected failure")
+
+        digest = hashlib.sha256(self._image_key(image)).digest()
+        lines = self.outputs[int.from_bytes(digest[:4], "little") % len(self.outputs)]
+        # 與 PaddleOCR 3.x 的 predict 結果格式一致
+        return [{
+            "rec_texts": [line["text"] for line in lines],
+            "rec_scores": [float(line.get("confidence", 0.99)) for line in lines],
+            "rec_polys": [np.asarray(line.get("bbox") or [], dtype=np.int16) for line in lines],
+        }]
+
+
+def stub_options_from_env() -> Dict[str, Any]:
+    """從環境變數讀取樁引擎參數"""
+    return {
+        "latency": os.getenv("OCR_STUB_LATENCY", "lognormal:300:0.3"),
+        "ms_per_megapixel": float(os.getenv("OCR_STUB_MS_PER_MEGAPIXEL", "0")),
+        "error_rate": float(os.getenv("OCR_STUB_ERROR_RATE", "0")),
+        "cpu_bound": os.getenv("OCR_STUB_CPU_BOUND", "0").lower() in ("1", "true", "yes"),
+        "outputs": os.getenv("OCR_STUB_OUTPUTS") or None,
+        "seed": int(os.getenv("OCR_STUB_SEED", "0")),
+    }
+
+
+def validate_options(options: Dict[str, Any]) -> None:
+    """檢查參數（在父進程中提前報錯，而不是等 worker 啟動失敗）"""
+    LatencyDistribution(options.get("latency", "fixed:0"))
+    load_outputs(options.get("outputs"))
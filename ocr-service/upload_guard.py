@@ -0,0 +1,343 @@
+"""
+上傳圖片的流式校驗
+按塊讀取請求體並限制總字節數；從最初的字節識別真實格式（不信任客戶端聲明的 Content-Type），
+並在完整解碼前從文件頭讀出寬高，拒絕像素數過大的圖片（解壓炸彈：幾十 KB 的 PNG 可聲明 10 萬 × 10 萬像素）。
+
+- ImageInspector: 逐塊餵入字節，盡早判定格式、尺寸和大小是否合法
+- read_image_stream: 從異步字節流讀取並校驗（/ocr/raw 直接讀 request.stream()）
+- BodySizeLimit: ASGI 中間件，在 multipart 解析前限制請求體大小（/ocr 的 UploadFile 由 Starlette 先行緩衝）
+"""
+
+import io
+import logging
+import struct
+from typing import AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from starlette.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# 支持的格式（OpenCV 和 PaddleOCR 都能處理）
+SUPPORTED_FORMATS = ("jpeg", "png", "webp", "bmp", "tiff")
+
+# 識別格式所需的最少字節數
+SNIFF_BYTES = 16
+
+# multipart 的邊界和字段頭開銷（/ocr 的請求體上限 = 圖片上限 + 此值）
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# JPEG 的尺寸（SOF 段）必須出現在前 1MB 內；EXIF / ICC 段再長也不會超過這個範圍
+HEADER_LIMIT = 1024 * 1024
+
+# JPEG 的 SOF 標記（不含 DHT / JPG / DAC）
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UploadRejected(Exception):
+    """
+    上傳的圖片不合法
+
+    Args:
+        status_code: 建議的 HTTP 狀態碼（413 過大 / 415 格式不支持 / 400 無法解析）
+        detail: 錯誤說明
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """按魔數識別圖片格式"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            raise UploadRejected(400, "JPEG 文件頭損壞")
+        marker = data[i + 1]
+        if marker == 0xFF:  # 填充字節
+            i += 1
+            continue
+        if marker in (0x01,) or 0xD0 <= marker <= 0xD8:  # 無長度字段的標記
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise UploadRejected(400, "JPEG 缺少尺寸信息（SOF）")
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _JPEG_SOF:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 24:
+        return None
+    if data[12:16] != b"IHDR":
+        raise UploadRejected(400, "PNG 文件頭損壞")
+    return struct.unpack(">II", data[16:24])
+
+
+def _webp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    raise UploadRejected(400, "WebP 文件頭損壞")
+
+
+def _bmp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 26:
+        return None
+    header_size = struct.unpack("<I", data[14:18])[0]
+    if header_size == 12:  # BITMAPCOREHEADER
+        return struct.unpack("<HH", data[18:22])
+    width, height = struct.unpack("<ii", data[18:26])
+    return abs(width), abs(height)
+
+
+def _tiff_size(data: bytes) -> Optional[Tuple[int, int]]:
+    order = "<" if data[:2] == b"II" else ">"
+    offset = struct.unpack(order + "I", data[4:8])[0]
+    if offset + 2 > len(data):
+        return None  # IFD 可能位於文件末尾
+    count = struct.unpack(order + "H", data[offset:offset + 2])[0]
+    if offset + 2 + count * 12 > len(data):
+        return None
+    size: Dict[int, int] = {}
+    for index in range(count):
+        entry = offset + 2 + index * 12
+        tag, kind = struct.unpack(order + "HH", data[entry:entry + 4])
+        if tag in (256, 257):
+            fmt = "H" if kind == 3 else "I"
+            size[tag] = struct.unpack(order + fmt, data[entry + 8:entry + 8 + struct.calcsize(fmt)])[0]
+    if 256 in size and 257 in size:
+        return size[256], size[257]
+    raise UploadRejected(400, "TIFF 缺少尺寸信息")
+
+
+_PARSERS = {"jpeg": _jpeg_size, "png": _png_size, "webp": _webp_size, "bmp": _bmp_size, "tiff": _tiff_size}
+
+
+class ImageInspector:
+    """
+    逐塊校驗上傳的圖片
+
+    Args:
+        max_bytes: 最大字節數（0 表示不限）
+        max_pixels: 最大像素數（寬 × 高，0 表示不限）
+        max_side: 最長邊上限（0 表示不限）
+        formats: 允許的格式
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_pixels: int,
+        max_side: int = 0,
+        formats: Sequence[str] = SUPPORTED_FORMATS,
+    ):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_side = max_side
+        self.formats = tuple(formats)
+        self.buffer = bytearray()
+        self.format: Optional[str] = None
+        self.size: Optional[Tuple[int, int]] = None
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        追加一塊數據；格式、尺寸或大小不合法時立即拋出 UploadRejected
+
+        Raises:
+            UploadRejected
+        """
+        if self.max_bytes and len(self.buffer) + len(chunk) > self.max_bytes:
+            raise UploadRejected(413, f"圖片超過大小上限 {self.max_bytes} 字節")
+        self.buffer += chunk
+        if self.format is None and len(self.buffer) >= SNIFF_BYTES:
+            self._sniff()
+        if self.format is not None and self.size is None and len(self.buffer) - len(chunk) < HEADER_LIMIT:
+            size = _PARSERS[self.format](bytes(self.buffer[:HEADER_LIMIT]))
+            if size is not None:
+                self._check_size(size)
+            elif self.format == "jpeg" and len(self.buffer) >= HEADER_LIMIT:
+                raise UploadRejected(400, "JPEG 文件頭過長（前 1MB 內沒有尺寸信息）")
+
+    def _sniff(self) -> None:
+        kind = sniff_format(bytes(self.buffer[:SNIFF_BYTES]))
+        if kind is None or kind not in self.formats:
+            raise UploadRejected(415, f"不支持的圖片格式（支持 {', '.join(self.formats)}）")
+        self.format = kind
+
+    def _check_size(self, size: Tuple[int, int]) -> None:
+        width, height = size
+        if width <= 0 or height <= 0:
+            raise UploadRejected(400, "圖片尺寸無效")
+        if self.max_side and max(width, height) > self.max_side:
+            raise UploadRejected(413, f"圖片尺寸 {width}x{height} 超過最長邊上限 {self.max_side}")
+        if self.max_pixels and width * height > self.max_pixels:
+            raise UploadRejected(413, f"圖片尺寸 {width}x{height} 超過像素上限 {self.max_pixels}")
+        self.size = (width, height)
+
+    def finish(self) -> bytes:
+        """
+        數據讀完：確認格式和尺寸都已校驗，返回完整內容
+
+        Raises:
+            UploadRejected
+        """
+        if not self.buffer:
+            raise UploadRejected(400, "圖片為空")
+        if self.format is None:
+            self._sniff()
+        if self.size is None:
+            self._check_size(self._pil_size())
+        content = bytes(self.buffer)
+        self.buffer = bytearray()
+        return content
+
+    def _pil_size(self) -> Tuple[int, int]:
+        """自帶解析器讀不出尺寸時（例如 IFD 在文件末尾的 TIFF），用 PIL 只讀文件頭"""
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(bytes(self.buffer))) as image:
+                return image.size
+        except Exception as e:
+            raise UploadRejected(400, f"無法解析圖片尺寸: {e}")
+
+
+def inspect_image(content: bytes, max_bytes: int, max_pixels: int, max_side: int = 0) -> ImageInspector:
+    """校驗已在內存中的圖片（/ocr/path、實時預覽幀）"""
+    inspector = ImageInspector(max_bytes, max_pixels, max_side)
+    inspector.feed(content)
+    inspector.finish()
+    return inspector
+
+
+async def read_image_stream(
+    chunks: AsyncIterator[bytes],
+    max_bytes: int,
+    max_pixels: int,
+    max_side: int = 0,
+) -> Tuple[bytes, ImageInspector]:
+    """
+    從異步字節流讀取圖片，邊讀邊校驗；不合法時立即停止讀取
+
+    Returns:
+        (完整內容, 校驗結果)
+
+    Raises:
+        UploadRejected
+    """
+    inspector = ImageInspector(max_bytes, max_pixels, max_side)
+    async for chunk in chunks:
+        if chunk:
+            inspector.feed(chunk)
+    content = inspector.finish()
+    return content, inspector
+
+
+class BodyTooLarge(HTTPException):
+    """
+    請求體超限（HTTPException 子類：FastAPI 解析 multipart 時捕獲其他異常會改報 400，
+    HTTPException 則原樣拋出，由異常處理器返回 413）
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"請求體超過大小上限 {limit} 字節")
+
+
+class BodySizeLimit:
+    """
+    ASGI 中間件：限制指定路徑的請求體大小
+
+    Content-Length 超限時直接返回 413（不讀取請求體）；分塊傳輸時邊接收邊計數，
+    超限即中斷並返回 413，避免 multipart 解析把整個上傳緩衝到內存或臨時文件。
+
+    Args:
+        app: ASGI 應用
+        limits: {路徑: 最大字節數}
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = {path: limit for path, limit in limits.items() if limit > 0}
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    await self._reject(send, limit)
+                    return
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise BodyTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except BodyTooLarge:
+            if started:
+                raise
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        body = f'{{"detail":"請求體超過大小上限 {limit} 字節"}}'.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,370 @@
+"""
+OCR worker 進程池
+每個 worker 是獨立進程，持有自己的 OCR 引擎；按請求數或 RSS 閾值優雅回收：
+先在後台啟動並預熱替代 worker，就緒後再讓舊 worker 處理完手上的請求並退出。
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 保留最近的回收事件數量（/metrics 展示）
+RECYCLE_EVENT_HISTORY = 50
+
+
+class WorkerError(Exception):
+    """worker 處理請求失敗（引擎異常）"""
+
+
+class WorkerCrashed(WorkerError):
+    """worker 進程意外退出"""
+
+
+def current_rss_bytes() -> int:
+    """
+    當前進程的常駐內存（RSS）
+
+    Linux 讀取 /proc/self/statm；其他平台返回 0（即不按 RSS 回收）
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def _worker_main(conn, engine_options: Dict[str, Any], placement: Optional[Dict[str, Any]] = None) -> None:
+    """
+    worker 進程入口：應用 CPU 佈局，創建並預熱引擎，然後循環處理請求
+
+    協議（Pipe）：
+        父 → 子: (job_id, image) 或 None（退出）
+        子 → 父: ("ready", pid, rss) / ("ok", job_id, (lines, text), rss) / ("error", job_id, message, rss)
+    """
+    import ocr_engine
+    from structured_logging import setup_logging
+
+    setup_logging()
+    engine_options = ocr_engine.apply_placement(engine_options, placement)
+    engine = ocr_engine.create_engine(engine_options)
+    ocr_engine.warm_up(engine)
+    conn.send(("ready", os.getpid(), current_rss_bytes()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        job_id, image = message
+        try:
+            result = ocr_engine.recognize(engine, image)
+            conn.send(("ok", job_id, result, current_rss_bytes()))
+        except Exception as e:
+            conn.send(("error", job_id, f"{type(e).__name__}: {e}", current_rss_bytes()))
+    conn.close()
+
+
+class WorkerHandle:
+    """
+    父進程中對單個 worker 進程的引用（所有方法都是阻塞的，需在線程中調用）
+
+    Args:
+        slot: 槽位序號（替代 worker 沿用舊 worker 的槽位和 CPU 佈局）
+        placement: CPU 佈局 {"cpus", "threads"}
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, ctx, engine_options: Dict[str, Any], slot: int = 0,
+                 placement: Optional[Dict[str, Any]] = None):
+        self.worker_id = next(self._ids)
+        self.slot = slot
+        self.placement = placement
+        self._ctx = ctx
+        self._engine_options = engine_options
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, engine_options, placement),
+            name=f"ocr-worker-{self.worker_id}",
+            daemon=True,
+        )
+        self._child_conn = child_conn
+        self.pid: Optional[int] = None
+        self.requests = 0
+        self.rss_bytes = 0
+        self.started_at = 0.0
+        self.retiring = False
+        self.dead = False
+        self._job_ids = itertools.count(1)
+
+    def start(self, ready_timeout: float) -> "WorkerHandle":
+        """啟動進程並等待引擎預熱完成"""
+        self.process.start()
+        self._child_conn.close()
+        if not self.conn.poll(ready_timeout):
+            self.kill()
+            raise WorkerError(f"worker {self.worker_id} 在 {ready_timeout:.0f}s 內未就緒")
+        try:
+            status, pid, rss = self.conn.recv()
+        except EOFError:
+            self.dead = True
+            raise WorkerCrashed(f"worker {self.worker_id} 啟動時退出（exitcode={self.process.exitcode}）")
+        self.pid, self.rss_bytes = pid, rss
+        self.started_at = time.time()
+        logger.info(f"OCR worker {self.worker_id} 就緒: pid={pid}, rss={rss / 1024 / 1024:.0f}MB")
+        return self
+
+    def call(self, image: Union[str, np.ndarray]) -> Tuple[List[Dict[str, Any]], str]:
+        """在 worker 中執行一次識別"""
+        job_id = next(self._job_ids)
+        try:
+            self.conn.send((job_id, image))
+            status, reply_id, payload, rss = self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError):
+            self.dead = True
+            raise WorkerCrashed(f"worker {self.worker_id} 已退出（exitcode={self.process.exitcode}）")
+        if reply_id != job_id:
+            # 回覆與請求錯位（例如上一個請求超時後的遲到回覆）：之後的結果都不可信，終止並回收該 worker
+            self.dead = True
+            self.kill()
+            raise WorkerCrashed(f"worker {self.worker_id} 回覆錯位（請求 {job_id}，收到 {reply_id}）")
+        self.requests += 1
+        self.rss_bytes = rss
+        if status == "error":
+            raise WorkerError(payload)
+        return payload
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """通知 worker 退出；超時則強制終止"""
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "slot": self.slot,
+            "pid": self.pid,
+            "cpus": (self.placement or {}).get("cpus"),
+            "threads": (self.placement or {}).get("threads") or None,
+            "requests": self.requests,
+            "rss_mb": round(self.rss_bytes / 1024 / 1024, 1),
+            "uptime_s": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "retiring": self.retiring,
+        }
+
+
+class OCRWorkerPool:
+    """
+    OCR worker 進程池
+
+    Args:
+        size: worker 數量
+        engine_options: 傳給 ocr_engine.create_engine 的參數
+        max_requests: 每個 worker 處理多少請求後回收（0 表示不限）
+        max_rss_mb: worker RSS 超過多少 MB 後回收（0 表示不限）
+        ready_timeout: 等待 worker 預熱完成的超時（秒）
+        placements: 每個槽位的 CPU 佈局（cpu_tuning.Layout.placements），None 表示不綁核、不限線程
+    """
+
+    def __init__(
+        self,
+        size: int,
+        engine_options: Dict[str, Any],
+        max_requests: int = 0,
+        max_rss_mb: int = 0,
+        ready_timeout: float = 300.0,
+        placements: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.size = max(1, size)
+        self.placements = placements
+        self.engine_options = dict(engine_options)
+        self.max_requests = max_requests
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.ready_timeout = ready_timeout
+
+        self._ctx = multiprocessing.get_context("spawn")
+        # 每個 worker 同時只處理一個請求，加上回收時的啟動 / 停止任務
+        self._executor = ThreadPoolExecutor(max_workers=self.size * 2 + 2, thread_name_prefix="ocr-pool")
+        self._idle: Optional["asyncio.Queue[WorkerHandle]"] = None
+        self._workers: Dict[int, WorkerHandle] = {}
+        self._closed = False
+
+        self.recycle_counts: Counter = Counter()
+        self.recycle_events: Deque[Dict[str, Any]] = deque(maxlen=RECYCLE_EVENT_HISTORY)
+        self.requests_total = 0
+        self.errors_total = 0
+
+    async def _spawn(self, slot: int) -> WorkerHandle:
+        placement = self.placements[slot % len(self.placements)] if self.placements else None
+        handle = WorkerHandle(self._ctx, self.engine_options, slot, placement)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, handle.start, self.ready_timeout)
+        self._workers[handle.worker_id] = handle
+        return handle
+
+    async def start(self) -> None:
+        """並行啟動所有 worker，全部預熱完成後返回"""
+        self._idle = asyncio.Queue()
+        handles = await asyncio.gather(*(self._spawn(slot) for slot in range(self.size)))
+        for handle in handles:
+            self._idle.put_nowait(handle)
+        logger.info(f"OCR worker 池已啟動: {self.size} 個 worker")
+
+    def idle_count(self) -> int:
+        """空閒 worker 數"""
+        return self._idle.qsize() if self._idle else 0
+
+    async def acquire(self) -> WorkerHandle:
+        """取得一個空閒 worker（已被替代的 worker 在此處退出）"""
+        while True:
+            handle = await self._idle.get()
+            if handle.retiring and handle.worker_id not in self._workers:
+                await self._stop(handle)
+                continue
+            return handle
+
+    def release(self, handle: WorkerHandle) -> None:
+        """歸還 worker，並檢查是否需要回收"""
+        if handle.dead:
+            self._workers.pop(handle.worker_id, None)
+            self._schedule_recycle(handle, "crashed")
+            return
+        if handle.retiring and handle.worker_id not in self._workers:
+            # 替代 worker 已就緒：舊 worker 處理完最後一個請求，直接退出
+            asyncio.ensure_future(self._stop(handle))
+            return
+
+        reason = self._recycle_reason(handle)
+        if reason and not handle.retiring:
+            handle.retiring = True
+            self._schedule_recycle(handle, reason)
+        # 替代 worker 就緒前，舊 worker 繼續服務，避免容量下降
+        self._idle.put_nowait(handle)
+
+    def _recycle_reason(self, handle: WorkerHandle) -> Optional[str]:
+        if self.max_requests and handle.requests >= self.max_requests:
+            return "max_requests"
+        if self.max_rss_bytes and handle.rss_bytes >= self.max_rss_bytes:
+            return "max_rss"
+        return None
+
+    def _schedule_recycle(self, handle: WorkerHandle, reason: str) -> None:
+        if self._closed:
+            return
+        self.recycle_counts[reason] += 1
+        self.recycle_events.append({
+            "time": time.time(),
+            "reason": reason,
+            "worker_id": handle.worker_id,
+            "pid": handle.pid,
+            "requests": handle.requests,
+            "rss_mb": round(handle.rss_bytes / 1024 / 1024, 1),
+        })
+        logger.info(
+            f"回收 OCR worker {handle.worker_id}（pid={handle.pid}）: reason={reason}, "
+            f"requests={handle.requests}, rss={handle.rss_bytes / 1024 / 1024:.0f}MB"
+        )
+        asyncio.ensure_future(self._replace(handle, reason))
+
+    async def _replace(self, old: WorkerHandle, reason: str) -> None:
+        """啟動並預熱替代 worker，就緒後原子地替換舊 worker"""
+        try:
+            new = await self._spawn(old.slot)
+        except WorkerError as e:
+            logger.error(f"替代 worker 啟動失敗: {e}")
+            self.recycle_counts["spawn_failed"] += 1
+            if reason == "crashed":
+                # 沒有可用的舊 worker，稍後重試以恢復容量
+                await asyncio.sleep(5)
+                asyncio.ensure_future(self._replace(old, reason))
+            else:
+                old.retiring = False
+            return
+
+        self._workers.pop(old.worker_id, None)
+        self._idle.put_nowait(new)
+        if old.dead or self._take_idle(old):
+            await self._stop(old)
+        # 舊 worker 若正在處理請求，會在 release 時退出
+
+    def _take_idle(self, handle: WorkerHandle) -> bool:
+        """若 worker 正在空閒隊列中則將其取出（在事件循環線程中執行，無需加鎖）"""
+        remaining = []
+        found = False
+        while not self._idle.empty():
+            item = self._idle.get_nowait()
+            if item is handle:
+                found = True
+            else:
+                remaining.append(item)
+        for item in remaining:
+            self._idle.put_nowait(item)
+        return found
+
+    async def _stop(self, handle: WorkerHandle) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, handle.stop)
+
+    async def execute(self, handle: WorkerHandle, image: Union[str, np.ndarray]) -> Tuple[List[Dict[str, Any]], str]:
+        """在已取得的 worker 上執行識別，完成後歸還 worker"""
+        loop = asyncio.get_running_loop()
+        try:
+            self.requests_total += 1
+            return await loop.run_in_executor(self._executor, handle.call, image)
+        except WorkerError:
+            self.errors_total += 1
+            raise
+        finally:
+            self.release(handle)
+
+    async def run(self, image: Union[str, np.ndarray]) -> Tuple[List[Dict[str, Any]], str]:
+        """在空閒 worker 上執行識別"""
+        handle = await self.acquire()
+        return await self.execute(handle, image)
+
+    async def close(self) -> None:
+        """停止所有 worker"""
+        self._closed = True
+        handles = list(self._workers.values())
+        self._workers.clear()
+        await asyncio.gather(*(self._stop(handle) for handle in handles), return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        """worker 池指標（/metrics）"""
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle else 0,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "max_requests": self.max_requests,
+            "max_rss_mb": self.max_rss_bytes // (1024 * 1024),
+            "workers": [handle.snapshot() for handle in self._workers.values()],
+            "recycles_total": dict(self.recycle_counts),
+            "recycle_events": list(self.recycle_events),
+        }
@@ -20,6 +20,7 @@ const tarPath = path.join(food101Dir, "food-101.tar.gz");
 async function extractFood101() {
   console.log("📦 開始解壓 Food-101 數據集...");
   console.log(`   文件: ${tarPath}`);
+  console.log("   提示：Python 訓練也可以不解壓，直接從壓縮包讀取（見 food-recognition-service 的 --pipeline tar）");
 
   // 檢查文件是否存在
   if (!(await fs.pathExists(tarPath))) {
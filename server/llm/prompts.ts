@@ -2,6 +2,7 @@
  * 賬單解析 Prompt 模板
  * 用於快速迭代和測試不同的 prompt 版本
  */
+import { DEFAULT_CURRENCY } from "./types.js";
 
 export interface PromptConfig {
   name: string;
@@ -24,7 +25,7 @@ ${ocrText}
 請以 JSON 格式返回，格式如下：
 ${format}
 
-只返回 JSON，不要其他文字。**重要：所有文字內容（如餐廳名稱、菜品名稱等）必須使用繁體中文返回。**如果某些信息無法確定，請使用合理的默認值（例如：currency 默認為 "HKD"，tip 如果沒有明確標示則為 0）。
+只返回 JSON，不要其他文字。**重要：所有文字內容（如餐廳名稱、菜品名稱等）必須使用繁體中文返回。**如果某些信息無法確定，請使用合理的默認值（例如：currency 默認為 "${DEFAULT_CURRENCY}"，tip 如果沒有明確標示則為 0）。
 
 關於服務費 / 小費（tip）的處理，請遵守以下規則：
 1. 如果賬單中有明確標註百分比（例如「服務費 10%」「Service Charge 10%」），請直接使用該百分比，並根據小計 subtotal * 百分比 計算 tip 金額。
@@ -61,7 +62,7 @@ ${format}
 4. **小計（subtotal）**：從文本中明確標示的「小計」「合計」「總金额」等欄位提取，如果找不到則計算所有 items 的 price 總和。
 5. **服務費/小費（tip）**：從「服務费」「小費」「服務費」等欄位提取，如果找不到則設為 0。
 6. **總額（total）**：從「總金额」「合計」「總計」等欄位提取，如果找不到則計算 subtotal + tip。
-7. **貨幣（currency）**：從文本中推斷（如「HKD」「USD」「CNY」），如果無法確定則默認為 "HKD"。
+7. **貨幣（currency）**：從文本中推斷（如「HKD」「USD」「CNY」），如果無法確定則默認為 "${DEFAULT_CURRENCY}"。
 
 【輸出要求】
 - 只返回 JSON 對象，不要任何其他文字、說明或註釋
@@ -4,6 +4,9 @@
  */
 import { object, string, number, array, optional } from "cast.ts";
 
+/** 無法從賬單判斷貨幣時的默認值（LLM 解析和 OCR 版面解析共用） */
+export const DEFAULT_CURRENCY = "HKD";
+
 export const BillResponseFormat = `
 {
   restaurant: string
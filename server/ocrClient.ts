@@ -10,41 +10,138 @@ import axios from "axios";
 
 const OCR_SERVICE_URL = process.env.OCR_SERVICE_URL || "http://localhost:8000";
 
+/**
+ * 同主機部署時可改用 Unix domain socket（對應 OCR 服務的 OCR_SERVICE_UDS）
+ * 設置後 OCR_SERVICE_URL 只用於組成請求路徑，不再走 TCP
+ */
+const OCR_SERVICE_SOCKET = process.env.OCR_SERVICE_SOCKET || "";
+
+/**
+ * 圖片傳輸方式：
+ * - multipart（默認）：multipart/form-data 上傳
+ * - raw：以 application/octet-stream 直接發送文件字節，跳過 multipart 編解碼
+ * - path：只發送本機路徑，OCR 服務直接讀取磁盤（需配置 OCR_LOCAL_PATH_ROOTS）
+ */
+type OCRTransport = "multipart" | "raw" | "path";
+const OCR_TRANSPORT = (process.env.OCR_TRANSPORT || "multipart") as OCRTransport;
+
+const socketOptions = OCR_SERVICE_SOCKET ? { socketPath: OCR_SERVICE_SOCKET } : {};
+
+/**
+ * 單次 OCR 請求的超時（毫秒）
+ * 同時通過 X-Request-Timeout 傳給 OCR 服務：客戶端放棄後，服務不會再為排隊中的請求做推理
+ */
+const OCR_TIMEOUT_MS = parseInt(process.env.OCR_TIMEOUT_MS || "30000", 10);
+
 export interface OCRLine {
   text: string;
   confidence: number;
   bbox: number[][];
 }
 
+export interface OCRReceiptItem {
+  name: string;
+  price: number;
+  quantity?: number;
+}
+
+/**
+ * OCR 服務的版面解析結果（structured 模式）
+ * consistent 為 true 表示菜品金額與小計 / 總額能互相對上，可直接使用
+ */
+export interface OCRReceipt {
+  header: string[];
+  date: string;
+  items: OCRReceiptItem[];
+  subtotal: number | null;
+  service_charge: number | null;
+  total: number | null;
+  consistent: boolean;
+  compact_text: string;
+}
+
 export interface OCRResult {
   text: string;
   lines: OCRLine[];
   raw_result: any;
+  receipt?: OCRReceipt;
+}
+
+export interface OCROptions {
+  /** 是否請求版面解析（返回 receipt 字段） */
+  structured?: boolean;
+  /** 只返回指定字段（例如 ["text", "receipt"]），減少序列化和傳輸量 */
+  fields?: string[];
+  /** 優先級通道：用戶上傳使用 interactive（默認），批量重處理使用 backfill */
+  lane?: "interactive" | "backfill";
 }
 
 /**
  * 呼叫 OCR 服務識別圖片
  * @param imagePath 圖片文件路徑
+ * @param options 可選參數（structured: 返回版面解析結果）
  * @returns OCR 識別結果
  */
-export async function ocrImage(imagePath: string): Promise<OCRResult> {
+export async function ocrImage(
+  imagePath: string,
+  options: OCROptions = {}
+): Promise<OCRResult> {
   if (!fs.existsSync(imagePath)) {
     throw new Error(`圖片文件不存在: ${imagePath}`);
   }
 
-  const form = new FormData();
-  const fileStream = fs.createReadStream(imagePath);
-  const filename = path.basename(imagePath);
-
-  form.append("file", fileStream, filename);
+  const params = {
+    ...(options.structured ? { structured: true } : {}),
+    ...(options.fields?.length ? { fields: options.fields.join(",") } : {}),
+  };
+  const requestOptions = {
+    params,
+    timeout: OCR_TIMEOUT_MS,
+    ...socketOptions,
+  };
+  const deadlineHeaders: Record<string, string> = {
+    "X-Request-Timeout": String(OCR_TIMEOUT_MS),
+    ...(options.lane ? { "X-OCR-Lane": options.lane } : {}),
+  };
 
   try {
-    const response = await axios.post(`${OCR_SERVICE_URL}/ocr`, form, {
-      headers: {
-        ...form.getHeaders(),
-      },
-      maxBodyLength: Infinity,
-    });
+    let response;
+    if (OCR_TRANSPORT === "path") {
+      response = await axios.post(
+        `${OCR_SERVICE_URL}/ocr/path`,
+        { path: path.resolve(imagePath) },
+        { ...requestOptions, headers: deadlineHeaders }
+      );
+    } else if (OCR_TRANSPORT === "raw") {
+      response = await axios.post(
+        `${OCR_SERVICE_URL}/ocr/raw`,
+        fs.createReadStream(imagePath),
+        {
+          headers: {
+            ...deadlineHeaders,
+            "Content-Type": "application/octet-stream",
+            "Content-Length": fs.statSync(imagePath).size,
+          },
+          maxBodyLength: Infinity,
+          ...requestOptions,
+        }
+      );
+    } else {
+      const form = new FormData();
+      const fileStream = fs.createReadStream(imagePath);
+      const filename = path.basename(imagePath);
+
+      form.append("file", fileStream, filename);
+
+      response = await axios.post(`${OCR_SERVICE_URL}/ocr`, form, {
+        headers: {
+          ...deadlineHeaders,
+          ...form.getHeaders(),
+        },
+        maxBodyLength: Infinity,
+        ...requestOptions,
+      });
+    }
 
     return response.data as OCRResult;
   } catch (error) {
@@ -61,12 +158,11 @@ export async function ocrImage(imagePath: string): Promise<OCRResult> {
  */
 export async function checkOCRService(): Promise<boolean> {
   try {
-    const response = await fetch(`${OCR_SERVICE_URL}/health`);
-    if (response.ok) {
-      const data = await response.json();
-      return data.status === "healthy";
-    }
-    return false;
+    const response = await axios.get(`${OCR_SERVICE_URL}/health`, {
+      timeout: 5000,
+      ...socketOptions,
+    });
+    return response.data?.status === "healthy";
   } catch (error) {
     return false;
   }
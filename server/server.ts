@@ -18,9 +18,9 @@ import { messageManager } from "./messageManager.js";
 import { MessageHelper } from "./messageHelper.js";
 import { overdueReminderService } from "./overdueReminderService.js";
 import type { User, BillRecord, Participant } from "./types.js";
-import { ocrImage, checkOCRService } from "./ocrClient.js";
+import { ocrImage, checkOCRService, type OCRReceipt } from "./ocrClient.js";
 import { parseBillFromOCR } from "./llm/billParser.js";
-import type { ParsedBill } from "./llm/types.js";
+import { DEFAULT_CURRENCY, type ParsedBill } from "./llm/types.js";
 import {
   saveFoodImage,
   getFoodImagesByBillId,
@@ -673,6 +673,26 @@ app.post(
   }
 );
 
+/**
+ * 將 OCR 服務的版面解析結果轉換為 ParsedBill（無需 LLM）
+ */
+function billFromReceipt(receipt: OCRReceipt): ParsedBill {
+  const subtotal =
+    receipt.subtotal ??
+    Math.round(receipt.items.reduce((sum, item) => sum + item.price, 0) * 100) /
+      100;
+  const tip = receipt.service_charge ?? 0;
+  return {
+    restaurant: receipt.header[0] || "",
+    date: receipt.date,
+    items: receipt.items,
+    subtotal,
+    tip,
+    total: receipt.total ?? Math.round((subtotal + tip) * 100) / 100,
+    currency: DEFAULT_CURRENCY,
+  };
+}
+
 /**
  * 對 LLM 返回的賬單進行 tip 後處理：
  * - 嘗試判斷 tip 是「百分比」還是「金額」
@@ -875,7 +895,11 @@ app.post(
       // 2. 調用 OCR 服務識別圖片
       let ocrResult;
       try {
-        ocrResult = await ocrImage(imagePath);
+        // 只需要完整文字和版面解析結果，不傳輸逐行 bbox
+        ocrResult = await ocrImage(imagePath, {
+          structured: true,
+          fields: ["text", "receipt"],
+        });
       } catch (error) {
         console.error("OCR 識別失敗:", error);
         return res.status(500).json({
@@ -890,10 +914,20 @@ app.post(
         });
       }
 
-      // 3. 使用 LLM 解析 OCR 文本為結構化數據
+      // 3. 解析為結構化數據
+      // 版面解析結果自洽時直接使用，跳過 LLM；否則用精簡後的菜品表作為 LLM 輸入，減少 token
+      const receipt = ocrResult.receipt;
       let parsedBill: ParsedBill;
       try {
-        parsedBill = await parseBillFromOCR(ocrResult.text, userId);
+        if (receipt && receipt.consistent) {
+          parsedBill = billFromReceipt(receipt);
+        } else {
+          const llmInput =
+            receipt && receipt.items.length > 0
+              ? receipt.compact_text
+              : ocrResult.text;
+          parsedBill = await parseBillFromOCR(llmInput, userId);
+        }
       } catch (error) {
         console.error("LLM 解析失敗:", error);
         // 即使 LLM 解析失敗，也返回 OCR 文本，讓用戶手動輸入